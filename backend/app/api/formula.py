@@ -195,7 +195,7 @@ async def generate_formula(request: FormulaRequest):
             )
         else:
             # v10.0.5: Pass reference sheet data for cross-sheet VLOOKUP
-            result = ai_service.process_formula_request(
+            result = await ai_service.process_formula_request(
                 query=request.query,
                 column_names=request.column_names,
                 sheet_data=request.sheet_data,
@@ -97,7 +97,7 @@ async def generate_formula(request: FormulaRequest):
             )
         else:
             # v6.2.0: Use AI Code Executor with optional custom_context
-            result = ai_service.process_formula_request(
+            result = await ai_service.process_formula_request(
                 query=request.query,
                 column_names=request.column_names,
                 sheet_data=request.sheet_data,
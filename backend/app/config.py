@@ -35,6 +35,86 @@ class Settings(BaseSettings):
     APP_VERSION: str = "6.2.8"
     DEBUG: bool = False
 
+    # LLM response cache (v11.9.0)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_BACKEND: str = "memory"  # memory | sqlite
+    LLM_CACHE_PATH: str = "data/llm_cache.sqlite3"
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_MAX_TEMPERATURE: float = 0.0  # auto-cache only deterministic calls
+    LLM_CACHE_BYPASS_TENANTS: str = ""  # comma-separated telegram user ids
+
+    # Sandbox for GPT-generated code (v11.10.0)
+    CODE_SANDBOX_ENABLED: bool = True
+    CODE_SANDBOX_WORKERS: int = 0  # 0 = min(4, cpu_count)
+    CODE_SANDBOX_TIMEOUT: float = 15.0  # wall-clock seconds, worker is killed after
+    CODE_SANDBOX_CPU_SECONDS: float = 10.0  # RLIMIT_CPU per job
+    CODE_SANDBOX_MEMORY_MB: int = 2048  # RLIMIT_AS per worker
+
+    # Shared LLM gateway: HTTP pool + per-model concurrency (v11.11.0)
+    LLM_MAX_CONNECTIONS: int = 32
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    LLM_KEEPALIVE_EXPIRY: float = 60.0  # seconds an idle connection is kept open
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_REQUEST_TIMEOUT: float = 60.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_DEFAULT_CONCURRENCY: int = 8  # in-flight requests per model
+    LLM_MODEL_CONCURRENCY: str = "gpt-4o=8,gpt-4o-mini=16"  # model=limit, comma-separated
+
+    # Speculative Python path next to SmartGPT (v11.12.0), opt-in
+    SPECULATIVE_EXECUTION_ENABLED: bool = False
+
+    # Row-level batch endpoint /api/v1/formula/batch (v11.14.0)
+    BATCH_MODEL: str = "gpt-4o-mini"
+    BATCH_MAX_ROWS: int = 2000
+    BATCH_ROWS_PER_PROMPT: int = 25  # unique rows packed into one LLM prompt
+    BATCH_MAX_PROMPT_CHARS: int = 12000
+    BATCH_CONCURRENCY: int = 4  # prompts in flight per batch
+    BATCH_MAX_TOKENS_PER_ROW: int = 120
+
+    # Token budget for SmartGPT data sections (v11.15.0)
+    PROMPT_DATA_TOKEN_BUDGET: int = 16000  # role + history + reference + schema + table + JSON rows
+
+    # Zero-LLM fast path: local detectors before SmartGPT (v11.18.0)
+    LOCAL_FAST_PATH_ENABLED: bool = True
+    LOCAL_FAST_PATH_MIN_CONFIDENCE: float = 0.85  # below this the query goes to the LLM
+
+    # Local pandas answers for simple aggregations (v11.19.0)
+    LOCAL_QUERY_ENGINE_ENABLED: bool = True
+    LOCAL_QUERY_ENGINE_MIN_CERTAINTY: float = 0.9  # IntentParser certainty required to skip the LLM
+
+    # Generated-code plans keyed by query + schema fingerprint (v11.20.0)
+    CODE_PLAN_CACHE_ENABLED: bool = True
+    CODE_PLAN_CACHE_BACKEND: str = "memory"  # memory | sqlite
+    CODE_PLAN_CACHE_PATH: str = "data/code_plan_cache.sqlite3"
+    CODE_PLAN_CACHE_MAX_ENTRIES: int = 500
+    CODE_PLAN_CACHE_TTL_SECONDS: int = 604800  # 7 days
+
+    # Generated code sees copy-on-write views instead of df.copy() (v11.22.0).
+    # Opt-in: mode.copy_on_write is a process-wide pandas option
+    CODE_EXEC_COPY_ON_WRITE: bool = False
+    CODE_EXEC_TRACE_MEMORY: bool = False  # tracemalloc peak per attempt (slows every allocation)
+
+    # Optional DuckDB engine: one SQL query instead of exec'd pandas code (v11.23.0)
+    SQL_ENGINE_DEFAULT: str = "pandas"  # pandas | sql; a request can override it with "engine"
+    SQL_ENGINE_THREADS: int = 0  # 0 = DuckDB default (all cores)
+    SQL_ENGINE_TIMEOUT: float = 15.0  # seconds, the query is interrupted after
+
+    # Function definitions sent to the LLM are packed under a token budget (v11.25.0)
+    TOOL_CATALOG_TOKEN_BUDGET: int = 6000  # 0 = no limit (the whole catalog is ~15k tokens)
+
+    # Local key join for cross-sheet VLOOKUP / merge_by_key (v11.28.0)
+    JOIN_REFERENCE_SAMPLE_ROWS: int = 5  # reference rows shown to the LLM next to its schema
+    JOIN_DUPLICATE_POLICY: str = "first"  # first | last | concat | error - repeated keys in the reference
+
+    # Batch forecasting for forecast queries instead of generated code (v11.29.0)
+    FORECAST_ENGINE_ENABLED: bool = True
+    FORECAST_MODEL: str = "gpt-4o-mini"  # picks only key column, horizon and method
+    FORECAST_DEFAULT_METHOD: str = "auto"  # auto | linear | seasonal_naive | exp_smoothing
+    FORECAST_MAX_HORIZON: int = 12
+    FORECAST_SEASON_LENGTH: int = 12  # periods per season (months)
+    FORECAST_SMOOTHING_ALPHA: float = 0.5
+
     # Telegram Bot
     TELEGRAM_BOT_TOKEN: str = ""
     TELEGRAM_ADMIN_ID: int = 517682186
@@ -24,16 +24,18 @@ from dotenv import load_dotenv
 load_dotenv()  # Load .env file FIRST
 
 from fastapi import FastAPI, HTTPException, Header, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
-from app.schemas.requests import FormulaRequest
-from app.schemas.responses import FormulaResponse
+from typing import Any, Optional
+from app.schemas.requests import FormulaRequest, FormulaBatchRequest
+from app.schemas.responses import FormulaResponse, FormulaBatchResponse
 from app.config import settings
 from app.api.telegram import router as telegram_router
 from app.api.yookassa import router as yookassa_router
 import logging
 from datetime import datetime, timezone
+import asyncio
+import json
 import os
 import threading
 import math
@@ -160,6 +162,12 @@ async def startup_event():
     logger.info("")
     logger.info("="*60)
 
+    # v11.10.0: Прогрев sandbox-воркеров для выполнения сгенерированного кода
+    from app.services.code_sandbox import get_code_sandbox
+    sandbox = get_code_sandbox()
+    if sandbox is not None:
+        threading.Thread(target=sandbox.start, daemon=True).start()
+
     # Запускаем Telegram бота в отдельном потоке
     if settings.TELEGRAM_BOT_TOKEN:
         bot_thread = threading.Thread(target=start_telegram_bot, daemon=True)
@@ -177,6 +185,15 @@ async def startup_event():
         logger.info("Support bot disabled (no token)")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop sandbox workers, close pooled LLM connections"""
+    from app.services.code_sandbox import shutdown_code_sandbox
+    from app.services.llm_gateway import get_llm_gateway
+    shutdown_code_sandbox()
+    await get_llm_gateway().aclose()
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -205,6 +222,14 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    from app.services.schema_extractor import get_schema_extractor
+    from app.services.llm_cache import get_llm_cache
+    from app.services.code_plan_cache import get_code_plan_cache
+    from app.services.code_sandbox import get_code_sandbox
+    from app.services.llm_gateway import get_llm_gateway
+    from app.services.simple_gpt_processor import get_simple_gpt_processor
+    from app.services.tool_catalog import get_tool_catalog
+    sandbox = get_code_sandbox()
     return {
         "status": "healthy",
         "version": "9.1.0",
@@ -218,7 +243,33 @@ async def health_check():
             "self_correction": "enabled",
             "max_retries": 3,
             "expected_accuracy": "98-99%"
-        }
+        },
+        # v11.7.0: Cache counters
+        "caches": {
+            "schema": get_schema_extractor().cache_stats(),
+            "llm": get_llm_cache().stats(),
+            # v11.20.0: Переиспользование кода по схеме листа
+            "code_plan": get_code_plan_cache().stats()
+        },
+        "sandbox": sandbox.stats() if sandbox is not None else {"enabled": False},
+        # v11.11.0: Пул соединений и очереди по моделям
+        "llm_gateway": get_llm_gateway().stats(),
+        # v11.12.0: Эффективность спекулятивного режима
+        "speculation": get_simple_gpt_processor().speculation_stats.to_dict(),
+        # v11.18.0: Hit rate локальных детекторов и сэкономленная латентность
+        "fast_path": get_simple_gpt_processor().local_dispatcher.stats.to_dict(),
+        # v11.19.0: Агрегации, посчитанные локально (без LLM)
+        "local_engine": get_simple_gpt_processor().local_engine.stats.to_dict(),
+        # v11.22.0: Память выполнения сгенерированного кода (copy-on-write вместо df.copy())
+        "execution_memory": get_simple_gpt_processor().execution_memory.to_dict(),
+        # v11.23.0: Движок sql (DuckDB): ответы, fallback в pandas, время SQL
+        "sql_engine": get_simple_gpt_processor().sql_engine.stats.to_dict(),
+        # v11.25.0: Каталог function definitions: токены и мемоизированные подмножества
+        "tool_catalog": get_tool_catalog().stats(),
+        # v11.28.0: Локальный join для VLOOKUP / merge_by_key: совпадения, дубликаты ключей
+        "key_join": get_simple_gpt_processor().join_engine.stats.to_dict(),
+        # v11.29.0: Пакетный прогноз: позиции, методы, отказы в Python-путь
+        "forecast": get_simple_gpt_processor().forecast_engine.stats.to_dict()
     }
 
 
@@ -231,448 +282,411 @@ async def privacy_policy():
     else:
         raise HTTPException(status_code=404, detail="Privacy policy not found")
 
-@app.post("/api/v1/formula", response_model=FormulaResponse)
-async def process_formula(
-    request: FormulaRequest,
-    x_api_token: Optional[str] = Header(None, alias="X-API-Token"),
-    x_license_key: Optional[str] = Header(None, alias="X-License-Key")
-):
-    """
-    Main endpoint v9.0.0 - Hybrid Intelligence Architecture
-    - Schema-aware processing (точные типы колонок)
-    - Smart classification (SIMPLE/MEDIUM/COMPLEX)
-    - Self-correction loop (до 3 попыток)
-    - Expected 98-99% accuracy
-    """
-    try:
-        # Log incoming request
-        logger.info("="*60)
-        logger.info(f"[REQUEST v10.0.0] Query: {request.query}")
-        logger.info(f"[DATA] Shape: {len(request.sheet_data)} rows x {len(request.column_names)} columns")
-        logger.info(f"[DATA] Headers: {request.column_names}")
-        if request.sheet_data:
-            logger.info(f"[DATA] First row: {request.sheet_data[0] if request.sheet_data else 'empty'}")
-            # Check for row length mismatches
-            for i, row in enumerate(request.sheet_data[:3]):
-                if len(row) != len(request.column_names):
-                    logger.warning(f"[DATA] ⚠️ Row {i} has {len(row)} cols, expected {len(request.column_names)}")
-
-        from app.services.simple_gpt_processor import get_simple_gpt_processor
-        import pandas as pd
-
-        logger.info("[ENGINE v10.0.0] Using SimpleGPT Processor (no patterns, full GPT)")
-
-        # Создаем DataFrame из данных (pad rows to match header length)
-        padded_data = []
-        num_cols = len(request.column_names)
-        for row in request.sheet_data:
-            if len(row) < num_cols:
-                row = list(row) + [None] * (num_cols - len(row))
-            padded_data.append(row[:num_cols])
-
-        df = pd.DataFrame(padded_data, columns=request.column_names)
-
-        # v9.1.0: Check subscription limits BEFORE processing
-        user_info = None
-        if x_license_key or x_api_token:
-            try:
-                from app.core.database import AsyncSessionLocal
-                from sqlalchemy import select
-                from app.models.telegram_user import TelegramUser
-                async with AsyncSessionLocal() as db:
-                    user = None
-                    if x_license_key:
-                        result = await db.execute(
-                            select(TelegramUser).where(TelegramUser.license_key == x_license_key.strip().upper())
-                        )
-                        user = result.scalar_one_or_none()
-                    if not user and x_api_token:
-                        result = await db.execute(
-                            select(TelegramUser).where(TelegramUser.api_token == x_api_token)
+
+def _log_formula_request(request: FormulaRequest) -> None:
+    """Логирует входящий запрос /api/v1/formula"""
+    logger.info("="*60)
+    logger.info(f"[REQUEST v10.0.0] Query: {request.query}")
+    logger.info(f"[DATA] Shape: {len(request.sheet_data)} rows x {len(request.column_names)} columns")
+    logger.info(f"[DATA] Headers: {request.column_names}")
+    if request.sheet_data:
+        logger.info(f"[DATA] First row: {request.sheet_data[0] if request.sheet_data else 'empty'}")
+        # Check for row length mismatches
+        for i, row in enumerate(request.sheet_data[:3]):
+            if len(row) != len(request.column_names):
+                logger.warning(f"[DATA] ⚠️ Row {i} has {len(row)} cols, expected {len(request.column_names)}")
+
+
+async def _check_query_limits(x_license_key: Optional[str], x_api_token: Optional[str]) -> Optional[dict]:
+    """v9.1.0: Check subscription limits BEFORE processing (429 if the daily limit is exhausted)"""
+    user_info = None
+    if x_license_key or x_api_token:
+        try:
+            from app.core.database import AsyncSessionLocal
+            from sqlalchemy import select
+            from app.models.telegram_user import TelegramUser
+            async with AsyncSessionLocal() as db:
+                user = None
+                if x_license_key:
+                    result = await db.execute(
+                        select(TelegramUser).where(TelegramUser.license_key == x_license_key.strip().upper())
+                    )
+                    user = result.scalar_one_or_none()
+                if not user and x_api_token:
+                    result = await db.execute(
+                        select(TelegramUser).where(TelegramUser.api_token == x_api_token)
+                    )
+                    user = result.scalar_one_or_none()
+
+                if user:
+                    # Check premium expiration
+                    if user.subscription_tier == "premium" and user.premium_until:
+                        if datetime.now(timezone.utc) > user.premium_until:
+                            logger.info(f"[SUBSCRIPTION] Premium expired for user {user.telegram_user_id}")
+                            user.subscription_tier = "free"
+                            user.queries_limit = 10
+                            await db.commit()
+
+                    # Check if can make query
+                    if not user.can_make_query():
+                        logger.warning(f"[LIMIT] User {user.telegram_user_id} exceeded limit: {user.queries_used_today}/{user.queries_limit}")
+                        raise HTTPException(
+                            status_code=429,
+                            detail={
+                                "error": "daily_limit_exceeded",
+                                "message": f"Дневной лимит исчерпан ({user.queries_used_today}/{user.queries_limit}). Обновите план до PRO.",
+                                "queries_used": user.queries_used_today,
+                                "queries_limit": user.queries_limit
+                            }
                         )
-                        user = result.scalar_one_or_none()
-
-                    if user:
-                        # Check premium expiration
-                        if user.subscription_tier == "premium" and user.premium_until:
-                            if datetime.now(timezone.utc) > user.premium_until:
-                                logger.info(f"[SUBSCRIPTION] Premium expired for user {user.telegram_user_id}")
-                                user.subscription_tier = "free"
-                                user.queries_limit = 10
-                                await db.commit()
-
-                        # Check if can make query
-                        if not user.can_make_query():
-                            logger.warning(f"[LIMIT] User {user.telegram_user_id} exceeded limit: {user.queries_used_today}/{user.queries_limit}")
-                            raise HTTPException(
-                                status_code=429,
-                                detail={
-                                    "error": "daily_limit_exceeded",
-                                    "message": f"Дневной лимит исчерпан ({user.queries_used_today}/{user.queries_limit}). Обновите план до PRO.",
-                                    "queries_used": user.queries_used_today,
-                                    "queries_limit": user.queries_limit
-                                }
-                            )
-
-                        user_info = {
-                            "user_id": user.telegram_user_id,
-                            "tier": user.subscription_tier,
-                            "used": user.queries_used_today,
-                            "limit": user.queries_limit
-                        }
-                        logger.info(f"[AUTH] User {user.telegram_user_id} (tier: {user.subscription_tier}, used: {user.queries_used_today}/{user.queries_limit})")
-            except HTTPException:
-                raise
-            except Exception as e:
-                logger.warning(f"[AUTH] Error checking limits: {e}")
-
-        # v9.0.0: Schema-aware processing handles type conversion automatically
-        # Auto-convert numeric columns (Google Sheets returns everything as strings)
-        # v9.2.1: Skip columns that should stay as text (phones, IDs, codes, etc.)
-        SKIP_CONVERT_PATTERNS = [
-            'телефон', 'phone', 'тел', 'mobile', 'моб',
-            'id', 'код', 'code', 'артикул', 'sku', 'article',
-            'инн', 'огрн', 'кпп', 'снилс', 'паспорт', 'passport',
-            'индекс', 'zip', 'postal',
-            'номер', 'number', 'num', '№',
-            'счет', 'счёт', 'account', 'card', 'карт',
-            'серия', 'series',
-        ]
-        
-        def should_skip_convert(col_name: str) -> bool:
-            """Check if column should NOT be converted to numeric."""
-            col_lower = col_name.lower()
-            for pattern in SKIP_CONVERT_PATTERNS:
-                if pattern in col_lower:
-                    return True
-            return False
-
-        def convert_russian_number(val):
-            """Convert Russian number format to float.
-            Russian: "11 838 336,22" -> 11838336.22
-            - Space is thousands separator
-            - Comma is decimal separator
-            """
-            if pd.isna(val):
-                return None
-            s = str(val).strip()
-            if not s:
-                return None
-            # Remove spaces (thousands separator)
-            s = s.replace(' ', '').replace('\u00a0', '')  # regular space and non-breaking space
-            # Replace comma with dot (decimal separator)
-            s = s.replace(',', '.')
-            try:
-                return float(s)
-            except ValueError:
-                return None
-
-        for col in df.columns:
-            if should_skip_convert(col):
-                # v9.2.2: FORCE phone/ID columns to STRING to prevent any calculations
-                df[col] = df[col].astype(str)
-                logger.info(f"[AUTO-CONVERT] 🔒 '{col}' → FORCED to string (phone/ID/code)")
-                continue
-            # v11.0.2: Try Russian number format first, then standard
-            converted = df[col].apply(convert_russian_number)
-            if converted.notna().sum() > len(df) * 0.5:
-                df[col] = converted
-                logger.info(f"[AUTO-CONVERT] ✅ '{col}' → numeric (ru format)")
-            else:
-                # Fallback to standard pandas conversion
-                converted = pd.to_numeric(df[col], errors='coerce')
-                if converted.notna().sum() > len(df) * 0.5:
-                    df[col] = converted
-                    logger.info(f"[AUTO-CONVERT] ✅ '{col}' → numeric")
-
-        # v9.2.0: Create reference DataFrame for cross-sheet VLOOKUP
-        reference_df = None
-        if request.reference_sheet_data and request.reference_sheet_headers:
-            logger.info(f"[VLOOKUP] Reference sheet: {request.reference_sheet_name}")
-            logger.info(f"[VLOOKUP] Reference headers: {request.reference_sheet_headers}")
-            logger.info(f"[VLOOKUP] Reference rows: {len(request.reference_sheet_data)}")
-            
-            # Pad reference data rows
-            ref_num_cols = len(request.reference_sheet_headers)
-            ref_padded_data = []
-            for row in request.reference_sheet_data:
-                if len(row) < ref_num_cols:
-                    row = list(row) + [None] * (ref_num_cols - len(row))
-                ref_padded_data.append(row[:ref_num_cols])
-            
-            reference_df = pd.DataFrame(ref_padded_data, columns=request.reference_sheet_headers)
-            
-            # Auto-convert numeric columns in reference (skip phones, IDs, etc.)
-            for col in reference_df.columns:
-                if should_skip_convert(col):
-                    # v9.2.2: FORCE to string in reference too
-                    reference_df[col] = reference_df[col].astype(str)
-                    logger.info(f"[AUTO-CONVERT] 🔒 ref:'{col}' → FORCED to string")
-                    continue
-                # v11.0.2: Try Russian number format first
-                converted = reference_df[col].apply(convert_russian_number)
-                if converted.notna().sum() > len(reference_df) * 0.5:
-                    reference_df[col] = converted
-                else:
-                    converted = pd.to_numeric(reference_df[col], errors='coerce')
-                    if converted.notna().sum() > len(reference_df) * 0.5:
-                        reference_df[col] = converted
 
-        # v10.0.0: Use SimpleGPT Processor (no patterns, full GPT)
-        processor = get_simple_gpt_processor()
-        result = await processor.process(
-            query=request.query,
-            df=df,
-            column_names=request.column_names,
-            custom_context=request.custom_context,
-            history=request.history or [],
-            reference_df=reference_df,
-            reference_sheet_name=request.reference_sheet_name
+                    user_info = {
+                        "user_id": user.telegram_user_id,
+                        "tier": user.subscription_tier,
+                        "used": user.queries_used_today,
+                        "limit": user.queries_limit
+                    }
+                    logger.info(f"[AUTH] User {user.telegram_user_id} (tier: {user.subscription_tier}, used: {user.queries_used_today}/{user.queries_limit})")
+                    # v11.9.0: Tenant for LLM cache bypass (LLM_CACHE_BYPASS_TENANTS)
+                    from app.services.llm_cache import set_cache_tenant
+                    set_cache_tenant(user.telegram_user_id)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.warning(f"[AUTH] Error checking limits: {e}")
+    return user_info
+
+
+def _build_request_frames(request: FormulaRequest):
+    """DataFrame листа и справочника (VLOOKUP) + статистика загрузки"""
+    # Создаем DataFrame из данных (pad rows to match header length)
+    # v11.6.0: Single-pass ingestion (no per-row padded copies)
+    from app.utils.sheet_ingest import rows_to_frame, log_ingest_stats
+    df, ingest_stats = rows_to_frame(request.sheet_data, request.column_names)
+    log_ingest_stats(ingest_stats)
+    ref_ingest_stats = None
+
+    # v11.21.0: Профиль колонок на весь запрос (числа, пропуски, уникальные, даты) -
+    # auto-convert, схема, SmartGPT и детекторы читают его, а не сканируют колонки заново
+    from app.utils.sheet_profile import get_sheet_profile
+
+    # v9.0.0: Schema-aware processing handles type conversion automatically
+    # Auto-convert numeric columns (Google Sheets returns everything as strings)
+    # v9.2.1: Skip columns that should stay as text (phones, IDs, codes, etc.)
+    # v11.5.0: Vectorized column coercion (one pass per column, no per-cell apply)
+    from app.utils.type_coercion import auto_convert_numeric_columns
+    auto_convert_numeric_columns(df, profile=get_sheet_profile(df))
+
+    # v9.2.0: Create reference DataFrame for cross-sheet VLOOKUP
+    reference_df = None
+    if request.reference_sheet_data and request.reference_sheet_headers:
+        logger.info(f"[VLOOKUP] Reference sheet: {request.reference_sheet_name}")
+        logger.info(f"[VLOOKUP] Reference headers: {request.reference_sheet_headers}")
+        logger.info(f"[VLOOKUP] Reference rows: {len(request.reference_sheet_data)}")
+
+        # Pad reference data rows
+        reference_df, ref_ingest_stats = rows_to_frame(
+            request.reference_sheet_data, request.reference_sheet_headers
         )
+        log_ingest_stats(ref_ingest_stats, label="reference")
+
+        # Auto-convert numeric columns in reference (skip phones, IDs, etc.)
+        auto_convert_numeric_columns(reference_df, log_prefix="ref:", profile=get_sheet_profile(reference_df))
+
+    return df, reference_df, ingest_stats, ref_ingest_stats
+
+
+def _build_formula_response(result: dict, reference_df, ingest_stats, ref_ingest_stats) -> dict:
+    """Результат SimpleGPT -> dict в формате FormulaResponse (+ служебные поля)"""
+    # DEBUG: Log full result immediately after processor
+    logger.info(f"[DEBUG] Processor result keys: {list(result.keys())}")
+    logger.info(f"[DEBUG] Processor result action_type: {result.get('action_type')}")
+    logger.info(f"[DEBUG] Processor result has pivot_data: {'pivot_data' in result}")
+    if 'pivot_data' in result:
+        logger.info(f"[DEBUG] pivot_data: {result['pivot_data']}")
+    logger.info(f"[DEBUG] Processor result has chart_spec: {'chart_spec' in result}")
+    if 'chart_spec' in result:
+        logger.info(f"[DEBUG] chart_spec value: {result['chart_spec']}")
+
+
+    # v10.0.1: Handle processing errors gracefully (don't throw 422)
+    # v9.1.1: Errors do NOT count towards usage limit
+    is_error = not result.get("success", True) or result.get("response_type") == "error"
+    if is_error:
+        error_msg = result.get("error", "Не удалось обработать запрос")
+        logger.warning(f"[PROCESSOR ERROR] {error_msg} - NOT counting towards usage")
+        # Return a friendly error response instead of 422
+        return {
+            "formula": None,
+            "explanation": "",
+            "target_cell": None,
+            "confidence": 0.0,
+            "response_type": "error",
+            "insights": [],
+            "suggested_actions": None,
+            "summary": f"❌ Ошибка обработки: {error_msg}\n\nПопробуйте переформулировать запрос или проверьте данные.",
+            "methodology": None,
+            "key_findings": [],
+            "function_used": None,
+            "parameters": None,
+            "error": error_msg,
+            "processing_time": result.get("processing_time", "0s"),
+            "processor_version": "10.0.1",
+            "_error_not_counted": True
+        }
 
-        # DEBUG: Log full result immediately after processor
-        logger.info(f"[DEBUG] Processor result keys: {list(result.keys())}")
-        logger.info(f"[DEBUG] Processor result action_type: {result.get('action_type')}")
-        logger.info(f"[DEBUG] Processor result has pivot_data: {'pivot_data' in result}")
-        if 'pivot_data' in result:
-            logger.info(f"[DEBUG] pivot_data: {result['pivot_data']}")
-        logger.info(f"[DEBUG] Processor result has chart_spec: {'chart_spec' in result}")
-        if 'chart_spec' in result:
-            logger.info(f"[DEBUG] chart_spec value: {result['chart_spec']}")
-
-
-        # v10.0.1: Handle processing errors gracefully (don't throw 422)
-        # v9.1.1: Errors do NOT count towards usage limit
-        is_error = not result.get("success", True) or result.get("response_type") == "error"
-        if is_error:
-            error_msg = result.get("error", "Не удалось обработать запрос")
-            logger.warning(f"[PROCESSOR ERROR] {error_msg} - NOT counting towards usage")
-            # Return a friendly error response instead of 422
-            return {
-                "formula": None,
-                "explanation": "",
-                "target_cell": None,
-                "confidence": 0.0,
-                "response_type": "error",
-                "insights": [],
-                "suggested_actions": None,
-                "summary": f"❌ Ошибка обработки: {error_msg}\n\nПопробуйте переформулировать запрос или проверьте данные.",
-                "methodology": None,
-                "key_findings": [],
-                "function_used": None,
-                "parameters": None,
-                "error": error_msg,
-                "processing_time": result.get("processing_time", "0s"),
-                "processor_version": "10.0.1",
-                "_error_not_counted": True
-            }
+    logger.info(f"[SUCCESS] SimpleGPT processing completed")
+    logger.info(f"[PROCESSOR] {result.get('processor', 'N/A')}")
+    logger.info(f"[TIME] {result.get('processing_time', 'N/A')}")
+
+    # Log result summary
+    if result.get("summary"):
+        logger.info(f"[RESULT] {result['summary'][:100]}...")
+    if result.get("function_used"):
+        logger.info(f"[FUNCTION] Used: {result['function_used']}")
+    if result.get("python_executed"):
+        logger.info("[EXECUTION] Python code executed")
+    if result.get("retry_count", 0) > 0:
+        logger.info(f"[RETRY] Self-correction used: {result['retry_count']} retries")
+
+    # Ensure all required fields are present
+    response = FormulaResponse(
+        formula=result.get("formula"),
+        explanation=result.get("explanation", ""),
+        target_cell=result.get("target_cell"),
+        confidence=result.get("confidence", 0.98),  # v9.0.0: Higher confidence with hybrid approach
+        response_type=result.get("response_type", "analysis"),
+        insights=result.get("insights", []),
+        suggested_actions=result.get("suggested_actions"),
+        summary=result.get("summary"),
+        methodology=result.get("methodology"),
+        key_findings=result.get("key_findings", []),
+        function_used=result.get("function_used"),
+        parameters=result.get("parameters")
+    )
+
+    # Convert to dict to add extra fields
+    response_dict = response.model_dump()
+
+    # Add structured_data for table/chart creation
+    if "structured_data" in result:
+        response_dict["structured_data"] = result["structured_data"]
+
+    # v11.23.0: Движок Python-пути (pandas | sql)
+    if "engine" in result:
+        response_dict["engine"] = result["engine"]
+
+    # Add highlighting data
+    if "highlight_rows" in result:
+        response_dict["highlight_rows"] = result["highlight_rows"]
+    if "highlight_color" in result:
+        response_dict["highlight_color"] = result["highlight_color"]
+    if "highlight_message" in result:
+        response_dict["highlight_message"] = result["highlight_message"]
+    if "action_type" in result:
+        response_dict["action_type"] = result["action_type"]
+    # v11.0.1: Chat message for GPT responses
+    if "message" in result:
+        response_dict["message"] = result["message"]
+    if "value" in result:
+        response_dict["value"] = result["value"]
+    # v11.1.0: add_formula fields
+    if "formula_template" in result:
+        response_dict["formula_template"] = result["formula_template"]
+    if "column_name" in result:
+        response_dict["column_name"] = result["column_name"]
+    if "source_columns" in result:
+        response_dict["source_columns"] = result["source_columns"]
+    if "row_count" in result:
+        response_dict["row_count"] = result["row_count"]
+    # v9.3.2: VLOOKUP write_data fields
+    if "write_data" in result:
+        response_dict["write_data"] = result["write_data"]
+    if "write_headers" in result:
+        response_dict["write_headers"] = result["write_headers"]
+    # v11.28.0: Ключ слияния и статистика локального join
+    if "merge_by_key" in result:
+        response_dict["merge_by_key"] = result["merge_by_key"]
+    if "join_stats" in result:
+        response_dict["join_stats"] = result["join_stats"]
+    # v11.29.0: Параметры локального прогноза (метод, горизонт, периоды)
+    if "forecast" in result:
+        response_dict["forecast"] = result["forecast"]
+    # v9.3.3: Clean data fields
+    if "cleaned_data" in result:
+        response_dict["cleaned_data"] = result["cleaned_data"]
+    if "original_rows" in result:
+        response_dict["original_rows"] = result["original_rows"]
+    if "final_rows" in result:
+        response_dict["final_rows"] = result["final_rows"]
+    if "operations" in result:
+        response_dict["operations"] = result["operations"]
+    if "changes" in result:
+        response_dict["changes"] = result["changes"]
+
+    # Add sorting data
+    if "sort_column" in result:
+        response_dict["sort_column"] = result["sort_column"]
+    if "sort_column_index" in result:
+        response_dict["sort_column_index"] = result["sort_column_index"]
+    if "sort_order" in result:
+        response_dict["sort_order"] = result["sort_order"]
+
+    # Add freeze data
+    if "freeze_rows" in result:
+        response_dict["freeze_rows"] = result["freeze_rows"]
+    if "freeze_columns" in result:
+        response_dict["freeze_columns"] = result["freeze_columns"]
+
+    # Add format data
+    if "format_type" in result:
+        response_dict["format_type"] = result["format_type"]
+    if "target_row" in result:
+        response_dict["target_row"] = result["target_row"]
+    if "bold" in result:
+        response_dict["bold"] = result["bold"]
+    if "background_color" in result:
+        response_dict["background_color"] = result["background_color"]
+
+    # Add pivot table data
+    logger.info(f"[PIVOT DEBUG] result keys before adding: {list(result.keys())}")
+    logger.info(f"[PIVOT DEBUG] pivot_data in result: {'pivot_data' in result}")
+    if "pivot_data" in result:
+        logger.info(f"[PIVOT DEBUG] Adding pivot_data to response_dict")
+        response_dict["pivot_data"] = result["pivot_data"]
+        response_dict["group_column"] = result.get("group_column")
+        response_dict["value_column"] = result.get("value_column")
+        response_dict["agg_func"] = result.get("agg_func")
+    else:
+        logger.warning(f"[PIVOT DEBUG] NO pivot_data in result!")
+
+    # Add chart data
+    logger.info(f"[DEBUG] Checking for chart_spec in result keys: {list(result.keys())}")
+    logger.info(f"[DEBUG] chart_spec in result? {'chart_spec' in result}")
+    if "chart_spec" in result:
+        logger.info(f"[DEBUG] Adding chart_spec: {result['chart_spec']}")
+        response_dict["chart_spec"] = result["chart_spec"]
+    else:
+        logger.warning(f"[DEBUG] chart_spec NOT found in result!")
+
+    # Add color scale data
+    if "rule" in result and result.get("action_type") == "color_scale":
+        logger.info(f"[DEBUG] Adding color_scale rule: {result['rule']}")
+        response_dict["color_scale_rule"] = result["rule"]
+
+    # Add conditional format rule (for non-color-scale conditional formatting)
+    if "rule" in result and result.get("action_type") == "conditional_format":
+        response_dict["conditional_rule"] = result["rule"]
+
+    # Add convert to numbers rule
+    if "rule" in result and result.get("action_type") == "convert_to_numbers":
+        response_dict["convert_rule"] = result["rule"]
+
+    # v9.0.0: Add hybrid processor metadata
+    response_dict["processor_version"] = result.get("processor_version", "9.0.0")
+    response_dict["complexity"] = result.get("complexity")
+    response_dict["strategy"] = result.get("strategy")
+    response_dict["processing_time"] = result.get("processing_time")
+    response_dict["retry_count"] = result.get("retry_count", 0)
+    # v10.0.9: Debug marker - shows if reference_df was received
+    response_dict["_debug_ref_df_received"] = reference_df is not None
+    response_dict["_debug_ref_df_rows"] = len(reference_df) if reference_df is not None else 0
+    # v11.6.0: Ingestion stats (time + bytes per request)
+    response_dict["_debug_ingest"] = {
+        "sheet": ingest_stats.to_dict(),
+        "reference": ref_ingest_stats.to_dict() if ref_ingest_stats else None,
+    }
 
-        logger.info(f"[SUCCESS] SimpleGPT processing completed")
-        logger.info(f"[PROCESSOR] {result.get('processor', 'N/A')}")
-        logger.info(f"[TIME] {result.get('processing_time', 'N/A')}")
-
-        # Log result summary
-        if result.get("summary"):
-            logger.info(f"[RESULT] {result['summary'][:100]}...")
-        if result.get("function_used"):
-            logger.info(f"[FUNCTION] Used: {result['function_used']}")
-        if result.get("python_executed"):
-            logger.info("[EXECUTION] Python code executed")
-        if result.get("retry_count", 0) > 0:
-            logger.info(f"[RETRY] Self-correction used: {result['retry_count']} retries")
-
-        # Ensure all required fields are present
-        response = FormulaResponse(
-            formula=result.get("formula"),
-            explanation=result.get("explanation", ""),
-            target_cell=result.get("target_cell"),
-            confidence=result.get("confidence", 0.98),  # v9.0.0: Higher confidence with hybrid approach
-            response_type=result.get("response_type", "analysis"),
-            insights=result.get("insights", []),
-            suggested_actions=result.get("suggested_actions"),
-            summary=result.get("summary"),
-            methodology=result.get("methodology"),
-            key_findings=result.get("key_findings", []),
-            function_used=result.get("function_used"),
-            parameters=result.get("parameters")
-        )
+    # Debug fields
+    response_dict["code_generated"] = result.get("code_generated")
+    response_dict["python_executed"] = result.get("python_executed", False)
+    response_dict["function_used"] = result.get("function_used")
+    response_dict["parameters"] = result.get("parameters")
+
+    return response_dict
+
+
+async def _increment_usage(response_dict: dict, x_license_key: Optional[str], x_api_token: Optional[str]) -> None:
+    """v9.3.1: Increment usage after successful processing (adds _usage to response_dict)"""
+    logger.info(f"[USAGE] Headers - License: {x_license_key[:12] + '...' if x_license_key else 'None'}")
+    if x_license_key or x_api_token:
+        try:
+            from app.core.database import AsyncSessionLocal
+            from sqlalchemy import select
+            from app.models.telegram_user import TelegramUser
+            async with AsyncSessionLocal() as db:
+                user = None
+                if x_license_key:
+                    license_upper = x_license_key.strip().upper()
+                    logger.info(f"[USAGE] Looking up license: {license_upper}")
+                    db_result = await db.execute(
+                        select(TelegramUser).where(TelegramUser.license_key == license_upper)
+                    )
+                    user = db_result.scalar_one_or_none()
+                    logger.info(f"[USAGE] User found: {user.telegram_user_id if user else 'NOT FOUND'}")
+                if not user and x_api_token:
+                    db_result = await db.execute(
+                        select(TelegramUser).where(TelegramUser.api_token == x_api_token)
+                    )
+                    user = db_result.scalar_one_or_none()
+
+                if user:
+                    old_used = user.queries_used_today
+                    user.queries_used_today += 1
+                    user.total_queries += 1
+                    user.last_query_at = datetime.now(timezone.utc)
+                    await db.commit()
+                    logger.info(f"[USAGE] Incremented {old_used} -> {user.queries_used_today}")
+
+                    # Add usage info to response
+                    response_dict["_usage"] = {
+                        "queries_used": user.queries_used_today,
+                        "queries_limit": user.queries_limit,
+                        "queries_remaining": -1 if user.queries_limit == -1 else max(0, user.queries_limit - user.queries_used_today)
+                    }
+                    logger.info(f"[USAGE] User {user.telegram_user_id}: {user.queries_used_today}/{user.queries_limit}")
+                else:
+                    logger.warning(f"[USAGE] User NOT found for license/token")
+        except Exception as e:
+            logger.error(f"[USAGE] Failed to increment: {e}", exc_info=True)
+    else:
+        logger.warning("[USAGE] No license key provided - usage not tracked")
 
-        # Convert to dict to add extra fields
-        response_dict = response.model_dump()
-
-        # Add structured_data for table/chart creation
-        if "structured_data" in result:
-            response_dict["structured_data"] = result["structured_data"]
-
-        # Add highlighting data
-        if "highlight_rows" in result:
-            response_dict["highlight_rows"] = result["highlight_rows"]
-        if "highlight_color" in result:
-            response_dict["highlight_color"] = result["highlight_color"]
-        if "highlight_message" in result:
-            response_dict["highlight_message"] = result["highlight_message"]
-        if "action_type" in result:
-            response_dict["action_type"] = result["action_type"]
-        # v11.0.1: Chat message for GPT responses
-        if "message" in result:
-            response_dict["message"] = result["message"]
-        if "value" in result:
-            response_dict["value"] = result["value"]
-        # v11.1.0: add_formula fields
-        if "formula_template" in result:
-            response_dict["formula_template"] = result["formula_template"]
-        if "column_name" in result:
-            response_dict["column_name"] = result["column_name"]
-        if "source_columns" in result:
-            response_dict["source_columns"] = result["source_columns"]
-        if "row_count" in result:
-            response_dict["row_count"] = result["row_count"]
-        # v9.3.2: VLOOKUP write_data fields
-        if "write_data" in result:
-            response_dict["write_data"] = result["write_data"]
-        if "write_headers" in result:
-            response_dict["write_headers"] = result["write_headers"]
-        # v9.3.3: Clean data fields
-        if "cleaned_data" in result:
-            response_dict["cleaned_data"] = result["cleaned_data"]
-        if "original_rows" in result:
-            response_dict["original_rows"] = result["original_rows"]
-        if "final_rows" in result:
-            response_dict["final_rows"] = result["final_rows"]
-        if "operations" in result:
-            response_dict["operations"] = result["operations"]
-        if "changes" in result:
-            response_dict["changes"] = result["changes"]
-
-        # Add sorting data
-        if "sort_column" in result:
-            response_dict["sort_column"] = result["sort_column"]
-        if "sort_column_index" in result:
-            response_dict["sort_column_index"] = result["sort_column_index"]
-        if "sort_order" in result:
-            response_dict["sort_order"] = result["sort_order"]
-
-        # Add freeze data
-        if "freeze_rows" in result:
-            response_dict["freeze_rows"] = result["freeze_rows"]
-        if "freeze_columns" in result:
-            response_dict["freeze_columns"] = result["freeze_columns"]
-
-        # Add format data
-        if "format_type" in result:
-            response_dict["format_type"] = result["format_type"]
-        if "target_row" in result:
-            response_dict["target_row"] = result["target_row"]
-        if "bold" in result:
-            response_dict["bold"] = result["bold"]
-        if "background_color" in result:
-            response_dict["background_color"] = result["background_color"]
-
-        # Add pivot table data
-        logger.info(f"[PIVOT DEBUG] result keys before adding: {list(result.keys())}")
-        logger.info(f"[PIVOT DEBUG] pivot_data in result: {'pivot_data' in result}")
-        if "pivot_data" in result:
-            logger.info(f"[PIVOT DEBUG] Adding pivot_data to response_dict")
-            response_dict["pivot_data"] = result["pivot_data"]
-            response_dict["group_column"] = result.get("group_column")
-            response_dict["value_column"] = result.get("value_column")
-            response_dict["agg_func"] = result.get("agg_func")
-        else:
-            logger.warning(f"[PIVOT DEBUG] NO pivot_data in result!")
-
-        # Add chart data
-        logger.info(f"[DEBUG] Checking for chart_spec in result keys: {list(result.keys())}")
-        logger.info(f"[DEBUG] chart_spec in result? {'chart_spec' in result}")
-        if "chart_spec" in result:
-            logger.info(f"[DEBUG] Adding chart_spec: {result['chart_spec']}")
-            response_dict["chart_spec"] = result["chart_spec"]
-        else:
-            logger.warning(f"[DEBUG] chart_spec NOT found in result!")
-
-        # Add color scale data
-        if "rule" in result and result.get("action_type") == "color_scale":
-            logger.info(f"[DEBUG] Adding color_scale rule: {result['rule']}")
-            response_dict["color_scale_rule"] = result["rule"]
-
-        # Add conditional format rule (for non-color-scale conditional formatting)
-        if "rule" in result and result.get("action_type") == "conditional_format":
-            response_dict["conditional_rule"] = result["rule"]
-
-        # Add convert to numbers rule
-        if "rule" in result and result.get("action_type") == "convert_to_numbers":
-            response_dict["convert_rule"] = result["rule"]
-
-        # v9.0.0: Add hybrid processor metadata
-        response_dict["processor_version"] = result.get("processor_version", "9.0.0")
-        response_dict["complexity"] = result.get("complexity")
-        response_dict["strategy"] = result.get("strategy")
-        response_dict["processing_time"] = result.get("processing_time")
-        response_dict["retry_count"] = result.get("retry_count", 0)
-        # v10.0.9: Debug marker - shows if reference_df was received
-        response_dict["_debug_ref_df_received"] = reference_df is not None
-        response_dict["_debug_ref_df_rows"] = len(reference_df) if reference_df is not None else 0
-
-        # Debug fields
-        response_dict["code_generated"] = result.get("code_generated")
-        response_dict["python_executed"] = result.get("python_executed", False)
-        response_dict["function_used"] = result.get("function_used")
-        response_dict["parameters"] = result.get("parameters")
-
-        # v9.3.1: Increment usage after successful processing
-        logger.info(f"[USAGE] Headers - License: {x_license_key[:12] + '...' if x_license_key else 'None'}")
-        if x_license_key or x_api_token:
-            try:
-                from app.core.database import AsyncSessionLocal
-                from sqlalchemy import select
-                from app.models.telegram_user import TelegramUser
-                async with AsyncSessionLocal() as db:
-                    user = None
-                    if x_license_key:
-                        license_upper = x_license_key.strip().upper()
-                        logger.info(f"[USAGE] Looking up license: {license_upper}")
-                        db_result = await db.execute(
-                            select(TelegramUser).where(TelegramUser.license_key == license_upper)
-                        )
-                        user = db_result.scalar_one_or_none()
-                        logger.info(f"[USAGE] User found: {user.telegram_user_id if user else 'NOT FOUND'}")
-                    if not user and x_api_token:
-                        db_result = await db.execute(
-                            select(TelegramUser).where(TelegramUser.api_token == x_api_token)
-                        )
-                        user = db_result.scalar_one_or_none()
-
-                    if user:
-                        old_used = user.queries_used_today
-                        user.queries_used_today += 1
-                        user.total_queries += 1
-                        user.last_query_at = datetime.now(timezone.utc)
-                        await db.commit()
-                        logger.info(f"[USAGE] Incremented {old_used} -> {user.queries_used_today}")
-
-                        # Add usage info to response
-                        response_dict["_usage"] = {
-                            "queries_used": user.queries_used_today,
-                            "queries_limit": user.queries_limit,
-                            "queries_remaining": -1 if user.queries_limit == -1 else max(0, user.queries_limit - user.queries_used_today)
-                        }
-                        logger.info(f"[USAGE] User {user.telegram_user_id}: {user.queries_used_today}/{user.queries_limit}")
-                    else:
-                        logger.warning(f"[USAGE] User NOT found for license/token")
-            except Exception as e:
-                logger.error(f"[USAGE] Failed to increment: {e}", exc_info=True)
-        else:
-            logger.warning("[USAGE] No license key provided - usage not tracked")
 
-        logger.info("[COMPLETE] Response sent successfully")
-        logger.info("="*60)
+async def _run_formula_pipeline(request: FormulaRequest, progress=None) -> dict:
+    """
+    Ingestion -> SimpleGPT -> формирование ответа.
+    v11.13.0: Общая часть /api/v1/formula и /api/v1/formula/stream.
+    """
+    from app.services.simple_gpt_processor import get_simple_gpt_processor
 
-        # Sanitize NaN/Infinity values before JSON serialization
-        return sanitize_for_json(response_dict)
+    logger.info("[ENGINE v10.0.0] Using SimpleGPT Processor (no patterns, full GPT)")
+
+    df, reference_df, ingest_stats, ref_ingest_stats = _build_request_frames(request)
+
+    # v10.0.0: Use SimpleGPT Processor (no patterns, full GPT)
+    processor = get_simple_gpt_processor()
+    result = await processor.process(
+        query=request.query,
+        df=df,
+        column_names=request.column_names,
+        custom_context=request.custom_context,
+        history=request.history or [],
+        reference_df=reference_df,
+        reference_sheet_name=request.reference_sheet_name,
+        progress=progress,
+        engine=request.engine
+    )
 
-    except ValueError as e:
+    return _build_formula_response(result, reference_df, ingest_stats, ref_ingest_stats)
+
+
+def _processing_http_error(e: Exception) -> HTTPException:
+    """Исключение обработки запроса -> HTTPException с понятным сообщением"""
+    if isinstance(e, ValueError):
         # Ошибки валидации данных
         logger.warning(f"[VALIDATION ERROR] {str(e)}")
-        raise HTTPException(
+        return HTTPException(
             status_code=422,
             detail={
                 "error_type": "validation_error",
@@ -681,10 +695,10 @@ async def process_formula(
                 "retryable": False
             }
         )
-    except TimeoutError as e:
+    if isinstance(e, TimeoutError):
         # Таймаут выполнения
         logger.error(f"[TIMEOUT] Request timed out: {str(e)}")
-        raise HTTPException(
+        return HTTPException(
             status_code=504,
             detail={
                 "error_type": "timeout",
@@ -693,10 +707,10 @@ async def process_formula(
                 "retryable": True
             }
         )
-    except ConnectionError as e:
+    if isinstance(e, ConnectionError):
         # Ошибки соединения с AI API
         logger.error(f"[CONNECTION ERROR] AI service unavailable: {str(e)}")
-        raise HTTPException(
+        return HTTPException(
             status_code=503,
             detail={
                 "error_type": "service_unavailable",
@@ -705,24 +719,180 @@ async def process_formula(
                 "retryable": True
             }
         )
+    error_msg = str(e)
+    logger.error(f"[ERROR] Processing failed: {error_msg}")
+    logger.exception(e)
+
+    # Классифицируем ошибку для более понятного сообщения
+    error_response = classify_backend_error(error_msg)
+
+    return HTTPException(
+        status_code=error_response["status_code"],
+        detail={
+            "error_type": error_response["error_type"],
+            "message": error_msg,
+            "user_message": error_response["user_message"],
+            "retryable": error_response["retryable"]
+        }
+    )
+
+@app.post("/api/v1/formula", response_model=FormulaResponse)
+async def process_formula(
+    request: FormulaRequest,
+    x_api_token: Optional[str] = Header(None, alias="X-API-Token"),
+    x_license_key: Optional[str] = Header(None, alias="X-License-Key")
+):
+    """
+    Main endpoint v9.0.0 - Hybrid Intelligence Architecture
+    - Schema-aware processing (точные типы колонок)
+    - Smart classification (SIMPLE/MEDIUM/COMPLEX)
+    - Self-correction loop (до 3 попыток)
+    - Expected 98-99% accuracy
+    """
+    try:
+        _log_formula_request(request)
+        await _check_query_limits(x_license_key, x_api_token)
+
+        response_dict = await _run_formula_pipeline(request)
+        # v10.0.1: Processing errors are returned as a friendly response, not counted
+        if response_dict.get("_error_not_counted"):
+            return response_dict
+
+        await _increment_usage(response_dict, x_license_key, x_api_token)
+
+        logger.info("[COMPLETE] Response sent successfully")
+        logger.info("="*60)
+
+        # Sanitize NaN/Infinity values before JSON serialization
+        return sanitize_for_json(response_dict)
+
     except Exception as e:
-        error_msg = str(e)
-        logger.error(f"[ERROR] Processing failed: {error_msg}")
-        logger.exception(e)
+        raise _processing_http_error(e)
 
-        # Классифицируем ошибку для более понятного сообщения
-        error_response = classify_backend_error(error_msg)
 
-        raise HTTPException(
-            status_code=error_response["status_code"],
-            detail={
-                "error_type": error_response["error_type"],
-                "message": error_msg,
-                "user_message": error_response["user_message"],
-                "retryable": error_response["retryable"]
-            }
+def _sse_event(event: str, data: Any) -> str:
+    """Одно событие Server-Sent Events"""
+    payload = json.dumps(sanitize_for_json(data), ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@app.post("/api/v1/formula/stream")
+async def process_formula_stream(
+    request: FormulaRequest,
+    x_api_token: Optional[str] = Header(None, alias="X-API-Token"),
+    x_license_key: Optional[str] = Header(None, alias="X-License-Key")
+):
+    """
+    v11.13.0: Потоковая версия /api/v1/formula (Server-Sent Events).
+
+    События: started, schema, action, token (фрагменты ответа LLM с полем stage),
+    code, execution, validation и final - payload как у /api/v1/formula
+    (FormulaResponse). При ошибке вместо final приходит error
+    с {"status_code", "detail"}. Лимит тарифа проверяется до открытия потока (429).
+    """
+    _log_formula_request(request)
+    await _check_query_limits(x_license_key, x_api_token)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def progress(event: str, data: dict) -> None:
+        queue.put_nowait((event, data))
+
+    async def run_pipeline() -> None:
+        try:
+            response_dict = await _run_formula_pipeline(request, progress=progress)
+            if not response_dict.get("_error_not_counted"):
+                await _increment_usage(response_dict, x_license_key, x_api_token)
+            # Тот же JSON, что отдаёт /api/v1/formula через response_model
+            final = FormulaResponse.model_validate(sanitize_for_json(response_dict)).model_dump(mode="json")
+            queue.put_nowait(("final", final))
+        except Exception as e:
+            error = _processing_http_error(e)
+            queue.put_nowait(("error", {"status_code": error.status_code, "detail": error.detail}))
+        finally:
+            queue.put_nowait(None)
+
+    async def event_stream():
+        yield _sse_event("started", {"rows": len(request.sheet_data), "columns": len(request.column_names)})
+        task = asyncio.create_task(run_pipeline())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield _sse_event(*item)
+        finally:
+            # Клиент отключился - останавливаем обработку
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+
+
+@app.post("/api/v1/formula/batch", response_model=FormulaBatchResponse)
+async def process_formula_batch(
+    request: FormulaBatchRequest,
+    x_api_token: Optional[str] = Header(None, alias="X-API-Token"),
+    x_license_key: Optional[str] = Header(None, alias="X-License-Key")
+):
+    """
+    v11.14.0: Один запрос к каждой строке диапазона за один HTTP вызов.
+
+    Заменяет цикл UrlFetchApp в Code.gs::processBatchQuery (по запросу на строку).
+    Одинаковые строки обрабатываются один раз, уникальные упаковываются
+    по несколько в один промпт, пакеты идут параллельно (BATCH_CONCURRENCY).
+    Батч считается одним запросом в дневном лимите.
+    """
+    from app.services.batch_processor import get_batch_processor
+
+    logger.info(f"[BATCH] Query: {request.query} | rows: {len(request.rows)}")
+    try:
+        await _check_query_limits(x_license_key, x_api_token)
+
+        started = datetime.now(timezone.utc)
+        batch = await get_batch_processor().process(
+            query=request.query,
+            column_names=request.column_names,
+            rows=request.rows,
+            context_rows=request.context_data,
+            custom_context=request.custom_context
         )
 
+        row_numbers = request.row_numbers or list(range(len(request.rows)))
+        results = []
+        for item in batch["results"]:
+            duplicate_of = item["duplicate_of"]
+            results.append({
+                "row": row_numbers[item["index"]],
+                "success": item["success"],
+                "summary": item.get("answer"),
+                "error": item.get("error"),
+                "duplicate_of": row_numbers[duplicate_of] if duplicate_of is not None else None
+            })
+        succeeded = sum(1 for r in results if r["success"])
+
+        response_dict = {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+            "stats": batch["stats"],
+            "processing_time": round((datetime.now(timezone.utc) - started).total_seconds(), 3)
+        }
+        if succeeded:
+            await _increment_usage(response_dict, x_license_key, x_api_token)
+        return sanitize_for_json(response_dict)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise _processing_http_error(e)
 
 def classify_backend_error(error_msg: str) -> dict:
     """Классификация ошибок для понятных сообщений пользователю"""
@@ -864,7 +1034,7 @@ async def test_endpoint():
             ["Tovar 2", "OOO Kosmos", 5000, 2, 10000],
         ]
 
-        result = executor.process_with_code(
+        result = await executor.process_with_code(
             query="srednyaya tsena",
             column_names=["A", "B", "C", "D", "E"],
             sheet_data=test_data,
@@ -51,7 +51,7 @@ async def process_formula(request: FormulaRequest):
 
         # Используем AI Code Executor
         executor = get_ai_executor()
-        result = executor.process_with_code(
+        result = await executor.process_with_code(
             query=request.query,
             column_names=request.column_names,
             sheet_data=request.sheet_data,
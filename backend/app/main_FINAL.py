@@ -99,7 +99,7 @@ async def process_formula(request: FormulaRequest):
         ai_service = get_ai_service()
 
         # Process the request
-        result = ai_service.process_formula_request(
+        result = await ai_service.process_formula_request(
             query=request.query,
             column_names=request.column_names,
             sheet_data=request.sheet_data,
@@ -19,6 +19,9 @@ class FormulaRequest(BaseModel):
     reference_sheet_headers: Optional[List[str]] = Field(None, description="Заголовки референсного листа")
     reference_sheet_data: Optional[List[List[Any]]] = Field(None, description="Данные референсного листа")
 
+    # v11.23.0: Движок Python-пути: pandas-код или SQL в DuckDB (None - SQL_ENGINE_DEFAULT)
+    engine: Optional[str] = Field(None, pattern="^(pandas|sql)$", description="Движок выполнения: pandas или sql")
+
     @field_validator('query')
     @classmethod
     def validate_query(cls, v: str) -> str:
@@ -122,6 +125,46 @@ class FormulaRequest(BaseModel):
         }
 
 
+
+class FormulaBatchRequest(BaseModel):
+    """v11.14.0: Один запрос к каждой строке диапазона (/api/v1/formula/batch)"""
+    query: str = Field(..., min_length=1, max_length=2000, description="Запрос, применяемый к каждой строке")
+    column_names: List[str] = Field(..., min_length=1, max_length=100, description="Названия колонок в таблице")
+    rows: List[List[Any]] = Field(..., min_length=1, description="Строки для обработки")
+    row_numbers: Optional[List[int]] = Field(None, description="Номера строк в листе (1-indexed), для ответа")
+    context_data: Optional[List[List[Any]]] = Field(None, description="Первые строки листа для контекста")
+    custom_context: Optional[str] = Field(None, max_length=2000, description="Персонализированная роль AI")
+
+    @field_validator('query')
+    @classmethod
+    def validate_query(cls, v: str) -> str:
+        v = ' '.join(v.split())
+        if len(v) < 2:
+            raise ValueError('Запрос слишком короткий')
+        return v
+
+    @model_validator(mode='after')
+    def validate_rows(self):
+        """Ограничение размера батча и согласованность row_numbers"""
+        from app.config import settings
+        if len(self.rows) > settings.BATCH_MAX_ROWS:
+            raise ValueError(f'Слишком много строк в батче: {len(self.rows)} (максимум {settings.BATCH_MAX_ROWS})')
+        if self.row_numbers is not None and len(self.row_numbers) != len(self.rows):
+            raise ValueError('row_numbers должен содержать по номеру на каждую строку')
+        if self.context_data:
+            self.context_data = self.context_data[:10]
+        return self
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "query": "Определи тональность отзыва",
+                "column_names": ["Клиент", "Отзыв"],
+                "rows": [["Иванов", "Всё отлично"], ["Петров", "Долгая доставка"]],
+                "row_numbers": [2, 3]
+            }
+        }
+
 class AnalyzeRequest(BaseModel):
     """Запрос на анализ данных"""
     query: str = Field(..., description="Аналитический вопрос")
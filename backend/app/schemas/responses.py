@@ -66,6 +66,10 @@ class FormulaResponse(BaseModel):
     write_data: Optional[List[List[Any]]] = Field(None, description="Данные для записи в текущий лист (VLOOKUP)")
     write_headers: Optional[List[str]] = Field(None, description="Заголовки для записываемых данных")
     merge_by_key: Optional[str] = Field(None, description="Ключевая колонка для слияния данных (добавить колонку справа вместо перезаписи)")
+    # v11.28.0: Локальный join по ключу (VLOOKUP / merge_by_key)
+    join_stats: Optional[dict] = Field(None, description="Совпадения ключей, дубликаты в справочнике, политика дубликатов")
+    # v11.29.0: Пакетный прогноз (ForecastEngine)
+    forecast: Optional[dict] = Field(None, description="Метод, горизонт, колонки периодов и методы по позициям")
     # v9.3.3: Clean data fields
     cleaned_data: Optional[dict] = Field(None, description="Очищенные данные {headers, rows}")
     original_rows: Optional[int] = Field(None, description="Количество строк до очистки")
@@ -78,6 +82,8 @@ class FormulaResponse(BaseModel):
     strategy: Optional[str] = Field(None, description="Стратегия обработки")
     processing_time: Optional[str] = Field(None, description="Время обработки")
     retry_count: Optional[int] = Field(None, description="Количество повторов")
+    # v11.23.0: Движок Python-пути
+    engine: Optional[str] = Field(None, description="Движок выполнения: pandas или sql")
     # Debug fields
     code_generated: Optional[str] = Field(None, description="Сгенерированный Python код")
     python_executed: Optional[bool] = Field(None, description="Был ли выполнен Python код")
@@ -94,6 +100,25 @@ class FormulaResponse(BaseModel):
         }
 
 
+
+class BatchRowResult(BaseModel):
+    """v11.14.0: Результат обработки одной строки батча"""
+    row: int = Field(..., description="Номер строки в листе (или индекс строки в батче)")
+    success: bool = Field(..., description="Строка обработана")
+    summary: Optional[str] = Field(None, description="Ответ для строки")
+    error: Optional[str] = Field(None, description="Ошибка обработки строки")
+    duplicate_of: Optional[int] = Field(None, description="Номер строки с такими же значениями (ответ переиспользован)")
+
+
+class FormulaBatchResponse(BaseModel):
+    """v11.14.0: Ответ /api/v1/formula/batch - результаты по строкам + статистика батча"""
+    total: int = Field(..., description="Количество строк в запросе")
+    succeeded: int = Field(..., description="Успешно обработано строк")
+    failed: int = Field(..., description="Строк с ошибкой")
+    results: List[BatchRowResult] = Field(..., description="Результаты в порядке строк запроса")
+    stats: dict = Field(..., description="Уникальные строки, вызовы LLM, токены, стоимость, строк/сек")
+    processing_time: float = Field(..., description="Время обработки в секундах")
+
 class AnalyzeResponse(BaseModel):
     """Ответ с анализом данных"""
     answer: str = Field(..., description="Детальный ответ на вопрос")
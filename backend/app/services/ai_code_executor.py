@@ -9,13 +9,17 @@ AI + Python Executor Service
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from app.config import settings
+from app.utils.sheet_ingest import rows_to_frame, log_ingest_stats
+from app.services.code_sandbox import get_code_sandbox
+from app.services.llm_gateway import get_llm_gateway
 import json
 import traceback
 from io import StringIO
 import sys
 import re
+import multiprocessing
+import pickle
+import types
 
 
 class SafeStringIO(StringIO):
@@ -33,6 +37,76 @@ class SafeStringIO(StringIO):
             # Преобразуем в строку и пытаемся снова
             return super().write(str(s))
 
+def _is_transferable(value) -> bool:
+    """Можно ли передать значение из sandbox-процесса (модули, функции, генераторы - нет)."""
+    if isinstance(value, (types.ModuleType, types.FunctionType, types.BuiltinFunctionType, type)):
+        return False
+    try:
+        pickle.dumps(value, protocol=5, buffer_callback=lambda buffer: None)
+        return True
+    except Exception:
+        return False
+
+
+def run_wrapped_code(wrapper_code: str, df: pd.DataFrame, ref_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    """
+    Выполняет обёрнутый AI код. v11.10.0: функция уровня модуля - выполняется в
+    sandbox-процессе (app.services.code_sandbox).
+
+    Returns:
+        {'locals': переменные кода, 'output': stdout кода,
+         'df': df после выполнения (только если код не создал result)}
+    """
+    # Создаем безопасное окружение для выполнения
+    safe_globals = {
+        'df': df,
+        'ref_df': ref_df,  # v10.0.6: Reference sheet DataFrame for cross-sheet operations
+        'pd': pd,
+        'np': np,
+        'len': len,
+        'sum': sum,
+        'min': min,
+        'max': max,
+        'abs': abs,
+        'round': round,
+        'str': str,
+        'int': int,
+        'float': float,
+        'list': list,
+        'dict': dict,
+        'enumerate': enumerate,
+        'zip': zip,
+        'sorted': sorted,
+        'print': print  # Для отладки
+    }
+
+    safe_locals = {}
+
+    # Перехватываем stdout кода (UTF-8 safe для Windows)
+    old_stdout = sys.stdout
+    sys.stdout = code_stdout = SafeStringIO()
+    try:
+        try:
+            exec(wrapper_code, safe_globals, safe_locals)
+        except UnicodeEncodeError as ue:
+            # Windows encoding fix - перекомпилируем код с UTF-8
+            print(f"[ENCODING FIX] Caught UnicodeEncodeError during exec: {ue}")
+            code_obj = compile(wrapper_code, '<string>', 'exec', dont_inherit=True)
+            exec(code_obj, safe_globals, safe_locals)
+    finally:
+        sys.stdout = old_stdout
+
+    if multiprocessing.parent_process() is not None:
+        # В sandbox-процессе: возвращаем только то, что можно передать родителю
+        safe_locals = {name: value for name, value in safe_locals.items() if _is_transferable(value)}
+
+    return {
+        'locals': safe_locals,
+        'output': code_stdout.getvalue(),
+        'df': safe_globals['df'] if safe_locals.get('result') is None else None,
+    }
+
+
 # Опциональный импорт веб-поиска (если ddgs не установлен, работаем без него)
 try:
     from app.services.web_search import get_web_search_service
@@ -43,7 +117,8 @@ except ImportError:
 
 class AICodeExecutor:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        # v11.11.0: AsyncOpenAI из общего LLM gateway - вызовы GPT больше не блокируют event loop
+        self.client = get_llm_gateway().client
         self.model = "gpt-4o"  # Лучшая модель для генерации кода
 
     def _sanitize_custom_context(self, custom_context: Optional[str]) -> Optional[str]:
@@ -81,7 +156,7 @@ class AICodeExecutor:
 
         return sanitized
 
-    def process_with_code(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]] = None, custom_context: Optional[str] = None, reference_sheet_name: Optional[str] = None, reference_sheet_headers: Optional[List[str]] = None, reference_sheet_data: Optional[List[List[Any]]] = None) -> Dict[str, Any]:
+    async def process_with_code(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]] = None, custom_context: Optional[str] = None, reference_sheet_name: Optional[str] = None, reference_sheet_headers: Optional[List[str]] = None, reference_sheet_data: Optional[List[List[Any]]] = None) -> Dict[str, Any]:
         """
         Основная функция - генерирует и выполняет Python код для точных расчетов
         v10.0.6: Added reference_sheet support for cross-sheet operations (VLOOKUP, merge, etc.)
@@ -125,26 +200,29 @@ class AICodeExecutor:
                 if any(kw in query_lower for kw in table_keywords):
                     print(f"[AI_TABLE_GEN] Detected empty data + table keywords, generating from knowledge")
                     print(f"[AI_TABLE_GEN] sheet_data = {sheet_data}")
-                    return self._generate_table_from_knowledge(query, safe_custom_context)
+                    return await self._generate_table_from_knowledge(query, safe_custom_context)
 
             # Шаг 1: Создаем DataFrame
-            df = pd.DataFrame(sheet_data, columns=column_names)
+            # v11.6.0: Single-pass ingestion (строки разной длины дополняются None)
+            df, ingest_stats = rows_to_frame(sheet_data, column_names)
+            log_ingest_stats(ingest_stats)
 
             # v10.0.6: Создаем reference DataFrame если есть данные из другого листа
             ref_df = None
             if reference_sheet_data and reference_sheet_headers:
-                ref_df = pd.DataFrame(reference_sheet_data, columns=reference_sheet_headers)
+                ref_df, ref_ingest_stats = rows_to_frame(reference_sheet_data, reference_sheet_headers)
+                log_ingest_stats(ref_ingest_stats, label="reference")
                 print(f"📊 Created ref_df with shape: {ref_df.shape}")
 
             # Шаг 2: AI генерирует Python код
-            generated_code = self._generate_python_code(query, df, safe_custom_context, history, ref_df, reference_sheet_name)
+            generated_code = await self._generate_python_code(query, df, safe_custom_context, history, ref_df, reference_sheet_name)
 
             # Шаг 3: Выполняем код безопасно
-            result = self._execute_python_code(generated_code, df, ref_df)
+            result = await self._execute_python_code(generated_code, df, ref_df)
 
             # Шаг 4: Форматируем ответ
             print(f"🔍 DEBUG: Before _format_response, safe_custom_context = {safe_custom_context}")
-            final_response = self._format_response(result, generated_code, query, sheet_data, safe_custom_context, df)
+            final_response = await self._format_response(result, generated_code, query, sheet_data, safe_custom_context, df)
             print(f"🔍 DEBUG: After _format_response, professional_insights = {final_response.get('professional_insights')}")
             return final_response
 
@@ -166,7 +244,7 @@ class AICodeExecutor:
                 "response_type": "error"
             }
 
-    def _generate_python_code(self, query: str, df: pd.DataFrame, custom_context: Optional[str] = None, history: List[Dict[str, Any]] = None, ref_df: Optional[pd.DataFrame] = None, reference_sheet_name: Optional[str] = None) -> str:
+    async def _generate_python_code(self, query: str, df: pd.DataFrame, custom_context: Optional[str] = None, history: List[Dict[str, Any]] = None, ref_df: Optional[pd.DataFrame] = None, reference_sheet_name: Optional[str] = None) -> str:
         """
         AI генерирует Python код для решения задачи
         С опциональным custom_context для персонализации
@@ -507,7 +585,7 @@ Return ONLY the Python code, no explanations."""
         else:
             full_system_prompt = base_system_prompt + "Generate clean, working code that analyzes REAL data only."
 
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=[
                 {"role": "system", "content": full_system_prompt},
@@ -585,10 +663,11 @@ Return ONLY the Python code, no explanations."""
                     f"Code:\n{code[:500]}"
                 )
 
-    def _execute_python_code(self, code: str, df: pd.DataFrame, ref_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    async def _execute_python_code(self, code: str, df: pd.DataFrame, ref_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
         """
         Безопасно выполняет Python код и возвращает результат
         v10.0.6: Added ref_df support for cross-sheet operations
+        v11.10.1: async - ожидание sandbox-процесса не блокирует event loop
         """
         print("\n" + "="*80)
         print("[TRACE 3] _execute_python_code() CALLED")
@@ -610,31 +689,6 @@ Return ONLY the Python code, no explanations."""
             print(f"[TRACE 4] ✗ Validation FAILED: {validation_error}")
             raise  # Re-raise to maintain original behavior
 
-        # Создаем безопасное окружение для выполнения
-        safe_globals = {
-            'df': df,
-            'ref_df': ref_df,  # v10.0.6: Reference sheet DataFrame for cross-sheet operations
-            'pd': pd,
-            'np': np,
-            'len': len,
-            'sum': sum,
-            'min': min,
-            'max': max,
-            'abs': abs,
-            'round': round,
-            'str': str,
-            'int': int,
-            'float': float,
-            'list': list,
-            'dict': dict,
-            'enumerate': enumerate,
-            'zip': zip,
-            'sorted': sorted,
-            'print': print  # Для отладки
-        }
-
-        safe_locals = {}
-
         # Перехватываем stdout для отладки (UTF-8 safe для Windows)
         old_stdout = sys.stdout
         sys.stdout = mystdout = SafeStringIO()
@@ -659,22 +713,24 @@ confidence = 0.95
             print("="*80 + "\n")
 
             # Выполняем обёрнутый код
+            # v11.10.0: exec в sandbox-процессе (лимиты CPU/памяти, kill по таймауту)
             print("[TRACE 6] Executing wrapper code with exec()...")
-            try:
-                exec(wrapper_code, safe_globals, safe_locals)
-                print("[TRACE 6] ✓ exec() COMPLETED successfully")
-            except UnicodeEncodeError as ue:
-                # Windows encoding fix - перекомпилируем код с UTF-8
-                print(f"[ENCODING FIX] Caught UnicodeEncodeError during exec: {ue}")
-                print(f"[ENCODING FIX] Attempting to fix encoding...")
-                # Компилируем код в UTF-8
-                code_obj = compile(wrapper_code, '<string>', 'exec', dont_inherit=True)
-                exec(code_obj, safe_globals, safe_locals)
-                print("[TRACE 6] ✓ exec() COMPLETED with encoding fix")
+            sandbox = get_code_sandbox()
+            if sandbox is not None:
+                # На время await stdout не перехватываем - иначе в буфер попадёт вывод других запросов
+                sys.stdout = old_stdout
+                try:
+                    exec_state = await sandbox.run(run_wrapped_code, wrapper_code, df, ref_df)
+                finally:
+                    sys.stdout = mystdout
+            else:
+                exec_state = run_wrapped_code(wrapper_code, df, ref_df)
+            safe_locals = exec_state['locals']
+            print("[TRACE 6] ✓ exec() COMPLETED successfully")
 
             # Восстанавливаем stdout
             sys.stdout = old_stdout
-            output = mystdout.getvalue()
+            output = mystdout.getvalue() + exec_state['output']
 
             # Извлекаем результаты
             result = safe_locals.get('result', None)
@@ -694,9 +750,9 @@ confidence = 0.95
                         result = var_value
                         print(f"[FALLBACK] Using '{var_name}' as result (AI forgot to create 'result')")
                         break
-                # Если ничего не нашли, используем весь df
-                if result is None and 'df' in safe_globals:
-                    result = safe_globals['df']
+                # Если ничего не нашли, используем весь df (после изменений кода)
+                if result is None:
+                    result = exec_state['df'] if exec_state['df'] is not None else df
                     print(f"[FALLBACK] Using entire 'df' as result (AI didn't filter anything)")
             summary = safe_locals.get('summary', 'Результат вычислен')
             methodology = safe_locals.get('methodology', 'Python анализ данных')
@@ -761,7 +817,7 @@ confidence = 0.95
                 'output': ''
             }
 
-    def _generate_fallback_code(self, df: pd.DataFrame, failed_code: str, error: str) -> Optional[str]:
+    async def _generate_fallback_code(self, df: pd.DataFrame, failed_code: str, error: str) -> Optional[str]:
         """
         Генерирует исправленный код если первая попытка не удалась
         """
@@ -779,7 +835,7 @@ DataFrame structure:
 Generate CORRECTED code that will work. Return ONLY the Python code."""
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.1,
@@ -826,7 +882,7 @@ Generate CORRECTED code that will work. Return ONLY the Python code."""
 
         return '\n'.join(analysis)
 
-    def _format_response(self, exec_result: Dict[str, Any], code: str, query: str, sheet_data: List[List[Any]], custom_context: Optional[str] = None, original_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+    async def _format_response(self, exec_result: Dict[str, Any], code: str, query: str, sheet_data: List[List[Any]], custom_context: Optional[str] = None, original_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
         """
         Форматирует финальный ответ
         С опциональными профессиональными инсайтами (если custom_context был указан)
@@ -1101,7 +1157,7 @@ Generate CORRECTED code that will work. Return ONLY the Python code."""
         context_to_use = custom_context or "You are a data analyst. Provide brief, actionable insights."
         print(f"🎯 Generating professional insights (custom={bool(custom_context)})...")
         try:
-            insights_data = self._generate_professional_insights(
+            insights_data = await self._generate_professional_insights(
                 query, result_dict, exec_result.get('summary', ''), context_to_use
             )
             response["professional_insights"] = insights_data.get('professional_insights')
@@ -1290,7 +1346,7 @@ Generate CORRECTED code that will work. Return ONLY the Python code."""
             traceback.print_exc()
             return None
 
-    def _generate_table_from_knowledge(self, query: str, custom_context: Optional[str] = None) -> Dict[str, Any]:
+    async def _generate_table_from_knowledge(self, query: str, custom_context: Optional[str] = None) -> Dict[str, Any]:
         """
         v7.4.0: Генерирует таблицу из знаний AI + веб-поиск через DuckDuckGo
         Используется когда пользователь просит "создай таблицу со странами Европы" или "найди в интернете информацию о LLM моделях"
@@ -1383,7 +1439,7 @@ Return ONLY valid JSON with "headers", "rows", and "summary" fields. No markdown
 Return ONLY valid JSON with "headers", "rows", and "summary" fields. No markdown, no explanations."""
 
             # Вызываем OpenAI API
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -1765,7 +1821,7 @@ Return ONLY valid JSON with "headers", "rows", and "summary" fields. No markdown
             traceback.print_exc()
             return None
 
-    def _generate_professional_insights(self, query: str, result_data: Any, summary: str, custom_context: str) -> Dict[str, Any]:
+    async def _generate_professional_insights(self, query: str, result_data: Any, summary: str, custom_context: str) -> Dict[str, Any]:
         """
         Генерирует профессиональные инсайты на основе результатов расчета
         Вызывается отдельно ПОСЛЕ основного расчета
@@ -1794,7 +1850,7 @@ Return ONLY valid JSON with "headers", "rows", and "summary" fields. No markdown
 }}"""
 
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "Ты профессиональный аналитик. Предоставляй краткие, практичные инсайты НА РУССКОМ ЯЗЫКЕ."},
@@ -13,9 +13,11 @@ import json
 import os
 import time
 from typing import Any, Dict, List, Optional
-from openai import AsyncOpenAI
+from app.services.llm_gateway import get_llm_gateway
 
+from app.config import settings
 from .function_registry import FunctionRegistry
+from .tool_catalog import get_tool_catalog
 from app.utils.query_classifier import QueryClassifier
 from app.utils.metrics import metrics_collector
 from .query_complexity_classifier import classify_query_complexity
@@ -45,7 +47,7 @@ class AIFunctionCaller:
     """
 
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_gateway().client  # v11.11.0: общий пул соединений
         self.registry = FunctionRegistry()
         self.classifier = QueryClassifier()  # v7.5.0: Query classification
         self.model = "gpt-4o"
@@ -500,13 +502,11 @@ class AIFunctionCaller:
         if self.use_two_stage:
             try:
                 print(f"[TWO-STAGE v8.0.0] Starting two-stage processing...")
-                all_function_defs = self.registry.get_function_definitions()
-
+                # v11.25.0: подмножество функций берётся из каталога по намерению
                 two_stage_result = await self.two_stage_processor.process(
                     query=query,
                     df=df,
-                    column_names=column_names,
-                    all_functions=all_function_defs
+                    column_names=column_names
                 )
 
                 if two_stage_result:
@@ -569,19 +569,21 @@ class AIFunctionCaller:
             print(f"[CLASSIFIER v7.5.0] Categories: {categories}")
             print(f"[CLASSIFIER v7.5.0] Functions: {len(relevant_functions)}/100 ({len(relevant_functions)/100*100:.0f}%)")
 
-            # Получаем только релевантные function definitions
-            all_function_defs = self.registry.get_function_definitions()
-            filtered_function_defs = [
-                func_def for func_def in all_function_defs
-                if func_def["name"] in relevant_functions
-            ]
+            # v11.25.0: Релевантные definitions из каталога, не больше бюджета токенов
+            catalog = get_tool_catalog()
+            budget = settings.TOOL_CATALOG_TOKEN_BUDGET
+            relevant_in_order = [entry.name for entry in catalog.select(relevant_functions)]
+            filtered_function_defs = catalog.pack(relevant_in_order, budget=budget)
+            # Retry: сначала релевантные, затем остальные функции каталога под тот же бюджет
+            all_function_defs = catalog.pack(relevant_in_order, budget=budget, fill=True)
 
-            # Fallback: если classifier ничего не нашел - используем все функции
+            # Fallback: если classifier ничего не нашел - используем все функции (под бюджет)
             if not filtered_function_defs:
                 print("[CLASSIFIER v7.5.0] No matches - using all functions (fallback)")
                 filtered_function_defs = all_function_defs
 
-            print(f"[CLASSIFIER v7.5.0] Sending {len(filtered_function_defs)} functions to GPT-4o")
+            print(f"[CLASSIFIER v7.5.0] Sending {len(filtered_function_defs)} functions "
+                  f"(~{catalog.tokens_for(filtered_function_defs)} tokens) to GPT-4o")
 
             # Шаг 4: Вызываем GPT-4o с отфильтрованными функциями
             response = await self.client.chat.completions.create(
@@ -638,7 +640,7 @@ class AIFunctionCaller:
                             {"role": "system", "content": system_prompt},
                             {"role": "user", "content": query}
                         ],
-                        functions=all_function_defs,  # ВСЕ 100 функций
+                        functions=all_function_defs,  # v11.25.0: весь каталог под бюджет токенов
                         function_call="auto",
                         temperature=0.1
                     )
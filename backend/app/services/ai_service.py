@@ -2,14 +2,13 @@
 
 import re
 from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
-from app.config import settings
 import pandas as pd
 from app.services.ai_code_executor import get_ai_executor
+from app.services.llm_gateway import get_llm_gateway
 
 class AIService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_llm_gateway().client  # v11.11.0: async клиент из общего пула
         self.model = "gpt-4o"
 
     def _detect_aggregation_need(self, query: str) -> Tuple[bool, str, str]:
@@ -143,7 +142,7 @@ class AIService:
         except Exception as e:
             return {"error": str(e)}
 
-    def process_formula_request(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]], custom_context: Optional[str] = None, reference_sheet_name: Optional[str] = None, reference_sheet_headers: Optional[List[str]] = None, reference_sheet_data: Optional[List[List[Any]]] = None) -> Dict[str, Any]:
+    async def process_formula_request(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]], custom_context: Optional[str] = None, reference_sheet_name: Optional[str] = None, reference_sheet_headers: Optional[List[str]] = None, reference_sheet_data: Optional[List[List[Any]]] = None) -> Dict[str, Any]:
         """
         v5.1.0: Uses AI Code Executor for 99% accuracy
         Supports ANY query: top products, averages, sums, counts, etc.
@@ -223,7 +222,7 @@ class AIService:
 
             # Use AI Code Executor for ALL other queries
             executor = get_ai_executor()
-            result = executor.process_with_code(
+            result = await executor.process_with_code(
                 query=query,
                 column_names=column_names,
                 sheet_data=sheet_data,
@@ -255,7 +254,7 @@ class AIService:
                 {"role": "system", "content": context},
                 {"role": "user", "content": query}
             ]
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
@@ -6,8 +6,7 @@ Fixed aggregation with Python calculations
 import json
 import re
 from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
-from app.config import settings
+from app.services.llm_gateway import get_llm_gateway
 import pandas as pd
 import numpy as np
 import logging
@@ -18,7 +17,7 @@ logger = logging.getLogger(__name__)
 
 class AIService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_llm_gateway().client  # v11.11.0: async клиент из общего пула
         self.model = "gpt-4o"
         logger.info("AI Service v3.0 initialized")
 
@@ -236,7 +235,7 @@ IMPORTANT:
 """
         return context
 
-    def process_formula_request(self,
+    async def process_formula_request(self,
                                query: str,
                                column_names: List[str],
                                sheet_data: List[List[Any]],
@@ -275,7 +274,7 @@ IMPORTANT:
                 {"role": "user", "content": query}
             ]
 
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
@@ -2,13 +2,12 @@
 
 import re
 from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
-from app.config import settings
+from app.services.llm_gateway import get_llm_gateway
 import pandas as pd
 
 class AIService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_llm_gateway().client  # v11.11.0: async клиент из общего пула
         self.model = "gpt-4o"
 
     def _detect_aggregation_need(self, query: str) -> Tuple[bool, str]:
@@ -79,7 +78,7 @@ class AIService:
         except Exception as e:
             return {"error": str(e)}
 
-    def process_formula_request(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    async def process_formula_request(self, query: str, column_names: List[str], sheet_data: List[List[Any]], history: List[Dict[str, Any]]) -> Dict[str, Any]:
         needs_agg, _ = self._detect_aggregation_need(query)
 
         if needs_agg:
@@ -94,7 +93,7 @@ class AIService:
                 {"role": "system", "content": context},
                 {"role": "user", "content": query}
             ]
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
@@ -0,0 +1,392 @@
+"""
+Batch Row Processor v1.0.0 - один запрос к N строкам листа за один HTTP вызов
+
+Раньше Code.gs::processBatchQuery вызывал /api/v1/formula на каждую выделенную
+строку последовательно: 500 строк = 500 HTTP запросов и 500 вызовов LLM,
+каждый раз с полным контекстом листа.
+
+Здесь:
+- одинаковые строки отправляются в LLM один раз (дедупликация)
+- уникальные строки упаковываются в один промпт (BATCH_ROWS_PER_PROMPT строк,
+  не больше BATCH_MAX_PROMPT_CHARS символов), модель отвечает JSON по id строки
+- пакеты выполняются параллельно, не больше BATCH_CONCURRENCY одновременно
+  (поверх лимитов LLM gateway на модель)
+- строки, которых нет в ответе (или пакет упал), повторяются по одной
+- статистика батча: строки, уникальные строки, вызовы LLM, токены, стоимость,
+  строк в секунду
+
+Использование:
+    processor = get_batch_processor()
+    result = await processor.process(query, column_names, rows)
+    result["results"]  # по одному элементу на входную строку, в исходном порядке
+    result["stats"]
+"""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.config import settings
+from app.services.llm_cache import get_llm_cache
+from app.services.llm_gateway import get_llm_gateway
+
+logger = logging.getLogger(__name__)
+
+
+# USD за 1M токенов (prompt, completion) - для оценки стоимости батча
+MODEL_PRICES_PER_1M: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+SYSTEM_PROMPT = """Ты помощник для Google Sheets. Пользователь применяет один запрос к каждой строке таблицы отдельно.
+Ответь на запрос для КАЖДОЙ строки, опираясь только на значения этой строки (и контекст листа, если он дан).
+Ответ - короткий текст на языке запроса, без пояснений к формату.
+
+Верни ТОЛЬКО JSON вида:
+{"results": [{"id": <id строки>, "answer": "<ответ>"}]}
+По одному элементу на каждый id из входных данных."""
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Оценка стоимости по MODEL_PRICES_PER_1M (None - цена модели неизвестна)"""
+    prices = MODEL_PRICES_PER_1M.get(model)
+    if prices is None:
+        return None
+    prompt_price, completion_price = prices
+    return round((prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000, 6)
+
+
+def _cell_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _row_key(row: Sequence[Any]) -> Tuple[str, ...]:
+    """Ключ дедупликации: значения ячеек как текст, без хвостовых пустых ячеек"""
+    cells = [_cell_text(v) for v in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return tuple(cells)
+
+
+def _format_row(row_id: int, cells: Tuple[str, ...], column_names: List[str]) -> str:
+    pairs = []
+    for i, value in enumerate(cells):
+        if not value:
+            continue
+        name = column_names[i] if i < len(column_names) else f"Колонка_{i + 1}"
+        pairs.append(f"{name}: {value}")
+    return f"[{row_id}] " + ("; ".join(pairs) if pairs else "(пустая строка)")
+
+
+def parse_batch_answer(content: Optional[str]) -> Dict[int, str]:
+    """JSON ответа модели -> {id строки: ответ}; некорректные элементы пропускаются"""
+    if not content:
+        return {}
+    text = _CODE_FENCE.sub("", content.strip())
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # Модель могла обернуть JSON текстом - берём первый объект
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return {}
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+
+    items = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return {}
+
+    answers = {}
+    for item in items:
+        if not isinstance(item, dict) or "answer" not in item:
+            continue
+        try:
+            row_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        answer = item["answer"]
+        answers[row_id] = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False)
+    return answers
+
+
+class BatchStats:
+    """Счётчики одного батча"""
+
+    def __init__(self, model: str, rows: int, unique_rows: int):
+        self.model = model
+        self.rows = rows
+        self.unique_rows = unique_rows
+        self.llm_calls = 0
+        self.packed_prompts = 0
+        self.fallback_calls = 0
+        self.cache_hits = 0
+        self.failed_rows = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self.elapsed_ms = 0.0
+
+    def add_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+        self.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+    def finish(self) -> None:
+        self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        seconds = self.elapsed_ms / 1000
+        return {
+            "model": self.model,
+            "rows": self.rows,
+            "unique_rows": self.unique_rows,
+            "duplicate_rows": self.rows - self.unique_rows,
+            "failed_rows": self.failed_rows,
+            "llm_calls": self.llm_calls,
+            "packed_prompts": self.packed_prompts,
+            "fallback_calls": self.fallback_calls,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "cost_usd": estimate_cost_usd(self.model, self.prompt_tokens, self.completion_tokens),
+            "elapsed_ms": round(self.elapsed_ms, 1),
+            "rows_per_second": round(self.rows / seconds, 2) if seconds > 0 else None,
+        }
+
+
+class BatchRowProcessor:
+    """Применяет один запрос к каждой строке: дедупликация, упаковка строк в промпт, параллельные пакеты"""
+
+    def __init__(
+        self,
+        client=None,
+        model: str = "gpt-4o-mini",
+        rows_per_prompt: int = 25,
+        max_prompt_chars: int = 12000,
+        concurrency: int = 4,
+        max_tokens_per_row: int = 120,
+        llm_cache=None,
+    ):
+        self.client = client or get_llm_gateway().client
+        self.model = model
+        self.rows_per_prompt = max(1, int(rows_per_prompt))
+        self.max_prompt_chars = max(1000, int(max_prompt_chars))
+        self.concurrency = max(1, int(concurrency))
+        self.max_tokens_per_row = max(16, int(max_tokens_per_row))
+        self.llm_cache = llm_cache if llm_cache is not None else get_llm_cache()
+
+    # --- Подготовка ---
+
+    @staticmethod
+    def deduplicate(rows: Sequence[Sequence[Any]]) -> Tuple[List[Tuple[str, ...]], List[int]]:
+        """
+        Returns:
+            (уникальные строки в порядке первого появления, индекс уникальной строки для каждой входной)
+        """
+        unique: List[Tuple[str, ...]] = []
+        positions: Dict[Tuple[str, ...], int] = {}
+        mapping = []
+        for row in rows:
+            key = _row_key(row)
+            pos = positions.get(key)
+            if pos is None:
+                pos = positions[key] = len(unique)
+                unique.append(key)
+            mapping.append(pos)
+        return unique, mapping
+
+    def pack(self, lines: List[str]) -> List[List[int]]:
+        """Индексы строк -> пакеты по rows_per_prompt строк и max_prompt_chars символов"""
+        chunks: List[List[int]] = []
+        current: List[int] = []
+        size = 0
+        for i, line in enumerate(lines):
+            if current and (len(current) >= self.rows_per_prompt or size + len(line) > self.max_prompt_chars):
+                chunks.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += len(line) + 1
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _build_messages(
+        self,
+        query: str,
+        column_names: List[str],
+        lines: List[str],
+        context: Optional[str],
+        custom_context: Optional[str],
+    ) -> List[Dict[str, str]]:
+        system = SYSTEM_PROMPT
+        if custom_context:
+            system = f"{custom_context}\n\n{system}"
+        parts = [f"Запрос: {query}", f"Колонки: {', '.join(column_names)}"]
+        if context:
+            parts.append(f"Контекст листа (первые строки):\n{context}")
+        parts.append("Строки:\n" + "\n".join(lines))
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ]
+
+    @staticmethod
+    def _format_context(column_names: List[str], context_rows: Optional[List[List[Any]]]) -> Optional[str]:
+        if not context_rows:
+            return None
+        return "\n".join(
+            _format_row(i + 1, _row_key(row), column_names) for i, row in enumerate(context_rows[:10])
+        )
+
+    # --- Вызовы LLM ---
+
+    async def _complete(self, messages: List[Dict[str, str]], max_tokens: int, stats: BatchStats) -> str:
+        """chat.completions (temperature 0) через кэш ответов LLM"""
+        use_cache = self.llm_cache.should_cache(0.0)
+        if use_cache:
+            cached = self.llm_cache.get(self.model, messages, 0.0, max_tokens)
+            if cached is not None:
+                stats.cache_hits += 1
+                return cached
+
+        stats.llm_calls += 1
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.0,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+        )
+        stats.add_usage(getattr(response, "usage", None))
+        content = response.choices[0].message.content
+        if use_cache and content:
+            self.llm_cache.set(self.model, messages, 0.0, max_tokens, content)
+        return content
+
+    async def _run_chunk(
+        self,
+        chunk: List[int],
+        lines: List[str],
+        build,
+        stats: BatchStats,
+        semaphore: asyncio.Semaphore,
+    ) -> Dict[int, Any]:
+        """Пакет строк -> {индекс строки: ответ | Exception}"""
+        max_tokens = min(4096, 50 + self.max_tokens_per_row * len(chunk))
+        messages = build([lines[i] for i in chunk])
+        error: Optional[Exception] = None
+        answers: Dict[int, str] = {}
+        async with semaphore:
+            if len(chunk) > 1:
+                stats.packed_prompts += 1
+            try:
+                answers = parse_batch_answer(await self._complete(messages, max_tokens, stats))
+            except Exception as e:
+                error = e
+                logger.warning(f"[BATCH] Chunk of {len(chunk)} rows failed: {e}")
+
+        # id в промпте - индекс строки + 1
+        results: Dict[int, Any] = {i: answers[i + 1] for i in chunk if (i + 1) in answers}
+        missing = [i for i in chunk if i not in results]
+        if not missing:
+            return results
+
+        if len(chunk) == 1:
+            results[chunk[0]] = error or ValueError("Модель не вернула ответ для строки")
+            return results
+
+        # Недостающие строки - по одной (параллельно, в пределах того же лимита)
+        logger.info(f"[BATCH] Retrying {len(missing)}/{len(chunk)} rows one by one")
+        stats.fallback_calls += len(missing)
+        singles = await asyncio.gather(*(
+            self._run_chunk([i], lines, build, stats, semaphore) for i in missing
+        ))
+        for single in singles:
+            results.update(single)
+        return results
+
+    async def process(
+        self,
+        query: str,
+        column_names: List[str],
+        rows: List[List[Any]],
+        context_rows: Optional[List[List[Any]]] = None,
+        custom_context: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Returns:
+            {"results": [{"index", "success", "answer" | "error", "duplicate_of"}], "stats": {...}}
+        """
+        unique, mapping = self.deduplicate(rows)
+        stats = BatchStats(self.model, len(rows), len(unique))
+        lines = [_format_row(i + 1, cells, column_names) for i, cells in enumerate(unique)]
+        context = self._format_context(column_names, context_rows)
+
+        def build(chunk_lines: List[str]) -> List[Dict[str, str]]:
+            return self._build_messages(query, column_names, chunk_lines, context, custom_context)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = self.pack(lines)
+        logger.info(
+            f"[BATCH] {len(rows)} rows -> {len(unique)} unique -> {len(chunks)} prompts "
+            f"(concurrency {self.concurrency}, model {self.model})"
+        )
+
+        answers: Dict[int, Any] = {}
+        for chunk_result in await asyncio.gather(*(
+            self._run_chunk(chunk, lines, build, stats, semaphore) for chunk in chunks
+        )):
+            answers.update(chunk_result)
+
+        results = []
+        first_seen: Dict[int, int] = {}
+        for index, pos in enumerate(mapping):
+            item: Dict[str, Any] = {"index": index, "duplicate_of": first_seen.get(pos)}
+            first_seen.setdefault(pos, index)
+            answer = answers.get(pos)
+            if isinstance(answer, Exception):
+                item.update(success=False, error=str(answer) or type(answer).__name__)
+                stats.failed_rows += 1
+            else:
+                item.update(success=True, answer=answer)
+            results.append(item)
+
+        stats.finish()
+        stats_dict = stats.to_dict()
+        logger.info(f"[BATCH] Done: {stats_dict}")
+        return {"results": results, "stats": stats_dict}
+
+
+# Singleton instance
+_batch_processor = None
+_batch_lock = threading.Lock()
+
+def get_batch_processor() -> BatchRowProcessor:
+    """Возвращает singleton instance BatchRowProcessor."""
+    global _batch_processor
+    with _batch_lock:
+        if _batch_processor is None:
+            _batch_processor = BatchRowProcessor(
+                model=settings.BATCH_MODEL,
+                rows_per_prompt=int(settings.BATCH_ROWS_PER_PROMPT),
+                max_prompt_chars=int(settings.BATCH_MAX_PROMPT_CHARS),
+                concurrency=int(settings.BATCH_CONCURRENCY),
+                max_tokens_per_row=int(settings.BATCH_MAX_TOKENS_PER_ROW),
+            )
+    return _batch_processor
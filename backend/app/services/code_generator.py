@@ -10,7 +10,8 @@ import logging
 import pandas as pd
 import re
 from typing import Any, Dict, List
-from openai import AsyncOpenAI
+
+from app.services.llm_gateway import get_llm_gateway
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +26,8 @@ if env_path.exists():
                 os.environ["OPENAI_API_KEY"] = api_key
                 break
 
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# v11.11.0: общий клиент LLM gateway (пул соединений, лимиты на модель)
+client = get_llm_gateway().client
 
 
 def extract_code_from_response(response_text: str) -> str:
@@ -0,0 +1,200 @@
+"""
+Code Plan Cache v1.0.0 - кэш сгенерированного pandas-кода по схеме листа
+
+Код, который пишет _generate_code, зависит от запроса и структуры листа, но не
+от значений в ячейках. LLMResponseCache его не переиспользует: в prompt входят
+примеры значений и статистика, поэтому обновление того же отчёта на чуть
+изменившемся листе каждый раз шло в gpt-4o (SmartGPT + генерация + валидация).
+
+Ключ плана: нормализованный запрос + (название, тип) каждой колонки листа (и
+справочника для VLOOKUP) + роль пользователя + вопросы из истории. Значения
+ячеек и число строк в ключ не входят. Тип - kind из SheetProfile (numeric |
+date | text | empty), а не полная схема SchemaExtractor: ключ считается до
+SmartGPT на каждом pandas-запросе.
+
+Политика:
+- сохраняется только код, который выполнился и прошёл пост-валидацию (OK)
+- при попадании код выполняется на новых данных без LLM; если он упал,
+  план удаляется и код генерируется заново (fallback)
+- LRU в памяти или SQLite на диске (backends из llm_cache), TTL на запись
+- метрики hit rate, fallbacks и сэкономленная латентность для /health
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from .llm_cache import InMemoryLRUBackend, SQLiteBackend
+
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_TRAILING = re.compile(r"[\s.!?…]+$")
+
+
+class CodePlanCache:
+    """
+    Кэш планов (валидированного pandas-кода) по отпечатку схемы.
+
+    Usage:
+        key = cache.make_key(query, schema)
+        plan = cache.get(key)            # {"code", "cost_ms", "created_at"} или None
+        ...
+        cache.store(key, code, cost_ms)  # после успешного выполнения и валидации
+    """
+
+    def __init__(self, backend=None, ttl_seconds: int = 604800, enabled: bool = True):
+        self.backend = backend if backend is not None else InMemoryLRUBackend(max_entries=500)
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.fallbacks = 0
+        self.saved_ms = 0.0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Регистр, ё/е, пробелы и финальная пунктуация не меняют план"""
+        text = _SPACES.sub(" ", query.lower().replace("ё", "е")).strip()
+        return _TRAILING.sub("", text)
+
+    @staticmethod
+    def schema_fingerprint(schema: Dict[str, Any]) -> List[List[str]]:
+        """Названия и типы колонок - без значений, статистики и числа строк"""
+        return [[str(col["name"]), str(col.get("type"))] for col in schema.get("columns", [])]
+
+    def make_key(
+        self,
+        query: str,
+        schema: Dict[str, Any],
+        reference_schema: Optional[Dict[str, Any]] = None,
+        custom_context: Optional[str] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        # Ответы из истории содержат значения прошлых расчётов - в ключ идут только вопросы
+        history_queries = [
+            self.normalize_query(str(item.get("query", "")))
+            for item in (history or [])[-5:]
+            if item.get("query")
+        ]
+        payload = json.dumps(
+            {
+                "query": self.normalize_query(query),
+                "columns": self.schema_fingerprint(schema),
+                "reference": self.schema_fingerprint(reference_schema) if reference_schema else None,
+                "context": (custom_context or "").strip(),
+                "history": history_queries,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"[CODE-PLAN] Backend read error: {e}")
+            entry = None
+
+        if entry is not None and entry[1] < time.time():
+            self.backend.delete(key)
+            with self._lock:
+                self.expired += 1
+            entry = None
+
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"[CODE-PLAN] HIT ({key[:10]})")
+        return json.loads(entry[0])
+
+    def store(self, key: str, code: str, cost_ms: float) -> None:
+        """Сохраняет код, который выполнился и прошёл валидацию; cost_ms - латентность LLM-пути"""
+        if not self.enabled or not code:
+            return
+        plan = {"code": code, "cost_ms": round(cost_ms, 1), "created_at": time.time()}
+        try:
+            self.backend.set(key, json.dumps(plan, ensure_ascii=False), time.time() + self.ttl_seconds)
+            with self._lock:
+                self.stores += 1
+        except Exception as e:
+            logger.warning(f"[CODE-PLAN] Backend write error: {e}")
+
+    def record_reuse(self, plan: Dict[str, Any], elapsed_ms: float) -> None:
+        """План отработал на новых данных: экономия = латентность LLM-пути минус повторный запуск"""
+        with self._lock:
+            self.saved_ms += max(0.0, float(plan.get("cost_ms", 0.0)) - elapsed_ms)
+
+    def record_fallback(self, key: str) -> None:
+        """Код из кэша упал на новых данных - план удаляется, код генерируется заново"""
+        with self._lock:
+            self.fallbacks += 1
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.warning(f"[CODE-PLAN] Backend delete error: {e}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "expired": self.expired,
+                "fallbacks": self.fallbacks,
+                "saved_ms_total": round(self.saved_ms, 1),
+                "evictions": self.backend.evictions,
+                "entries": self.backend.size(),
+            }
+
+
+def _create_cache_from_settings() -> CodePlanCache:
+    backend_name = str(settings.CODE_PLAN_CACHE_BACKEND).lower()
+    max_entries = int(settings.CODE_PLAN_CACHE_MAX_ENTRIES)
+    backend = None
+    if backend_name == "sqlite":
+        try:
+            backend = SQLiteBackend(settings.CODE_PLAN_CACHE_PATH, max_entries=max_entries, table="code_plans")
+        except Exception as e:
+            logger.warning(f"[CODE-PLAN] SQLite backend unavailable ({e}), using memory")
+    if backend is None:
+        backend = InMemoryLRUBackend(max_entries=max_entries)
+
+    return CodePlanCache(
+        backend=backend,
+        ttl_seconds=int(settings.CODE_PLAN_CACHE_TTL_SECONDS),
+        enabled=bool(settings.CODE_PLAN_CACHE_ENABLED),
+    )
+
+
+# Singleton instance
+_code_plan_cache = None
+
+def get_code_plan_cache() -> CodePlanCache:
+    """Возвращает singleton instance CodePlanCache."""
+    global _code_plan_cache
+    if _code_plan_cache is None:
+        _code_plan_cache = _create_cache_from_settings()
+    return _code_plan_cache
@@ -0,0 +1,405 @@
+"""
+Code Sandbox v1.0.0 - выполнение сгенерированного GPT кода в отдельных процессах
+
+Раньше exec(code) выполнялся прямо в потоке event loop: один медленный
+сниппет (вложенный iterrows, бесконечный цикл) блокировал все запросы воркера.
+
+Архитектура:
++------------------------------------------------------+
+|  API process (asyncio)                               |
+|    await sandbox.run(func, df, ...)                  |
+|      -> поток из executor ждёт ответа (loop свободен)|
++-----------------------+------------------------------+
+                        | Pipe (pickle protocol 5,
+                        | out-of-band буферы NumPy)
++-----------------------v------------------------------+
+|  Worker processes (pre-warmed, pandas/numpy загружены)|
+|    - RLIMIT_CPU на каждую задачу                     |
+|    - RLIMIT_AS (память) на процесс                   |
+|    - таймаут -> kill + новый воркер                  |
++------------------------------------------------------+
+
+DataFrame передаётся без промежуточной копии в pickle-поток: блоки NumPy
+уходят в Pipe как отдельные буферы (pickle.PickleBuffer) и на стороне
+воркера оборачиваются без копирования. Object-колонки (строки) сериализуются обычно.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource  # Unix only
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+class SandboxError(Exception):
+    """Базовая ошибка sandbox (воркер недоступен, упал и т.п.)"""
+
+
+class SandboxTimeoutError(SandboxError):
+    """Код выполнялся дольше таймаута - воркер убит"""
+
+
+class SandboxCrashedError(SandboxError):
+    """Воркер завершился во время выполнения (лимит CPU/памяти, segfault)"""
+
+
+class SandboxExecutionError(SandboxError):
+    """Исключение из кода, которое нельзя передать между процессами как есть"""
+
+
+# ==================== SERIALIZATION ====================
+
+def _send(conn, obj: Any) -> None:
+    """Отправляет объект: заголовок pickle + out-of-band буферы (без копии в поток)."""
+    buffers: List[pickle.PickleBuffer] = []
+    header = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    conn.send_bytes(len(buffers).to_bytes(4, "little"))
+    conn.send_bytes(header)
+    for buffer in buffers:
+        conn.send_bytes(buffer.raw())
+
+
+def _recv(conn) -> Any:
+    count = int.from_bytes(conn.recv_bytes(), "little")
+    header = conn.recv_bytes()
+    buffers = [conn.recv_bytes() for _ in range(count)]
+    return pickle.loads(header, buffers=buffers)
+
+
+# ==================== WORKER ====================
+
+def _set_cpu_limit(cpu_seconds: Optional[float]) -> None:
+    """Мягкий RLIMIT_CPU = уже потраченное CPU + лимит задачи (SIGXCPU завершит процесс)."""
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + int(cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _set_memory_limit(memory_mb: Optional[int]) -> None:
+    if resource is None or not memory_mb:
+        return
+    limit = int(memory_mb) * 1024 * 1024
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ValueError, OSError) as e:
+        print(f"[SANDBOX] Could not set memory limit: {e}", file=sys.stderr)
+
+
+def _worker_main(conn, memory_mb: Optional[int], preload: Tuple[str, ...]) -> None:
+    """Цикл воркера: получает (func, args, kwargs, cpu_seconds), возвращает результат."""
+    for module_name in preload:
+        try:
+            __import__(module_name)
+        except Exception as e:
+            print(f"[SANDBOX] Preload {module_name} failed: {e}", file=sys.stderr)
+    _set_memory_limit(memory_mb)
+    _send(conn, ("ready", os.getpid()))
+
+    while True:
+        try:
+            job = _recv(conn)
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        func, args, kwargs, cpu_seconds = job
+        _set_cpu_limit(cpu_seconds)
+        try:
+            result = func(*args, **kwargs)
+            message = ("ok", result)
+        except BaseException as e:  # noqa: B902 - передаём любую ошибку кода в родителя
+            message = ("error", e, traceback.format_exc(limit=5))
+
+        try:
+            _send(conn, message)
+        except Exception as e:
+            # Результат или исключение не сериализуются (генератор, lambda и т.п.)
+            if message[0] == "ok":
+                error = SandboxExecutionError(f"Результат нельзя передать из sandbox: {type(e).__name__}: {e}")
+            else:
+                original = message[1]
+                error = SandboxExecutionError(f"{type(original).__name__}: {original}")
+            _send(conn, ("error", error, ""))
+
+
+class _Worker:
+    """Процесс-воркер и его конец Pipe"""
+
+    def __init__(self, ctx, memory_mb: Optional[int], preload: Tuple[str, ...]):
+        self.conn, child_conn = ctx.Pipe(duplex=True)
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, memory_mb, preload),
+            daemon=True,
+            name="sheetgpt-sandbox",
+        )
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def wait_ready(self, timeout: float) -> None:
+        if not self.conn.poll(timeout):
+            raise SandboxError("Sandbox worker did not start in time")
+        status, _pid = _recv(self.conn)
+        if status != "ready":
+            raise SandboxError(f"Sandbox worker failed to start: {status}")
+
+    def kill(self) -> None:
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        try:
+            _send(self.conn, None)
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+
+# ==================== POOL ====================
+
+class CodeSandbox:
+    """
+    Пул процессов для выполнения сгенерированного кода.
+
+    Usage:
+        sandbox = get_code_sandbox()
+        result = await sandbox.run(run_generated_code, code, df, reference_df)
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 15.0,
+        cpu_seconds: Optional[float] = 10.0,
+        memory_mb: Optional[int] = 2048,
+        max_jobs_per_worker: int = 200,
+        preload: Tuple[str, ...] = ("pandas", "numpy"),
+        start_method: Optional[str] = None
+    ):
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.preload = tuple(preload)
+        self._ctx = multiprocessing.get_context(start_method or self._default_start_method())
+        if self._ctx.get_start_method() == "forkserver":
+            # forkserver один раз импортирует pandas/numpy, воркеры форкаются уже "тёплыми"
+            self._ctx.set_forkserver_preload(list(self.preload))
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.stats_counters = {
+            "jobs": 0, "errors": 0, "timeouts": 0, "crashes": 0, "respawns": 0, "total_ms": 0.0,
+        }
+
+    @staticmethod
+    def _default_start_method() -> str:
+        # fork из процесса с потоками (uvicorn, telegram-боты) небезопасен
+        methods = multiprocessing.get_all_start_methods()
+        return "forkserver" if "forkserver" in methods else "spawn"
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._stats_lock:
+            self.stats_counters[name] += value
+
+    def _spawn_worker(self) -> _Worker:
+        worker = _Worker(self._ctx, self.memory_mb, self.preload)
+        try:
+            worker.wait_ready(timeout=60)
+        except Exception:
+            worker.kill()
+            raise
+        return worker
+
+    def start(self) -> None:
+        """Запускает (прогревает) воркеры. Повторный вызов ничего не делает."""
+        with self._lock:
+            if self._started:
+                return
+            if self._closed:
+                raise SandboxError("Sandbox is closed")
+            # Один поток BLAS на воркер: параллелизм даёт пул процессов
+            # (переменные читаются при импорте numpy в новых процессах, текущий процесс не затрагивается)
+            for var in ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+                os.environ.setdefault(var, "1")
+            for _ in range(self.size):
+                self._idle.put(self._spawn_worker())
+            self._started = True
+            logger.info(
+                f"[SANDBOX] Started {self.size} workers ({self._ctx.get_start_method()}), "
+                f"timeout={self.timeout}s, cpu={self.cpu_seconds}s, memory={self.memory_mb}MB"
+            )
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.kill()
+        if self._closed:
+            return
+        self._count("respawns")
+        try:
+            self._idle.put(self._spawn_worker())
+        except Exception as e:
+            logger.error(f"[SANDBOX] Failed to respawn worker: {e}")
+
+    def run_sync(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Выполняет func(*args, **kwargs) в воркере и ждёт результат (блокирует поток).
+        Исключение из кода пробрасывается как есть (KeyError, ValueError, ...).
+        """
+        if not self._started:
+            self.start()
+        timeout = self.timeout if timeout is None else timeout
+
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SandboxTimeoutError(f"Нет свободного sandbox-воркера за {timeout:.0f}с")
+
+        start = time.perf_counter()
+        self._count("jobs")
+        try:
+            _send(worker.conn, (func, args, kwargs, self.cpu_seconds))
+            if not worker.conn.poll(timeout):
+                self._count("timeouts")
+                logger.warning(f"[SANDBOX] Job exceeded {timeout}s - killing worker {worker.process.pid}")
+                self._replace(worker)
+                worker = None
+                raise SandboxTimeoutError(f"Код выполнялся дольше {timeout:.0f} секунд и был остановлен")
+            message = _recv(worker.conn)
+        except (EOFError, OSError):
+            # Воркер умер во время задачи (SIGXCPU, OOM killer, segfault)
+            self._count("crashes")
+            worker.process.join(timeout=1)
+            exitcode = worker.process.exitcode
+            self._replace(worker)
+            worker = None
+            raise SandboxCrashedError(self._describe_exit(exitcode))
+        finally:
+            self._count("total_ms", (time.perf_counter() - start) * 1000)
+            if worker is not None:
+                worker.jobs += 1
+                if worker.jobs >= self.max_jobs_per_worker:
+                    # Периодически обновляем воркер (утечки памяти в сгенерированном коде)
+                    worker.stop()
+                    self._replace(worker)
+                else:
+                    self._idle.put(worker)
+
+        if message[0] == "ok":
+            return message[1]
+
+        self._count("errors")
+        error = message[1]
+        if isinstance(error, BaseException):
+            raise error
+        raise SandboxExecutionError(str(error))
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Async-обёртка: ожидание результата в потоке executor, event loop свободен."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.run_sync(func, *args, timeout=timeout, **kwargs))
+
+    @staticmethod
+    def _describe_exit(exitcode: Optional[int]) -> str:
+        import signal
+        if exitcode is not None and exitcode < 0:
+            sig = -exitcode
+            if sig == getattr(signal, "SIGXCPU", None):
+                return "Код превысил лимит процессорного времени"
+            if sig == signal.SIGKILL:
+                return "Процесс выполнения кода был остановлен (вероятно, лимит памяти)"
+            return f"Процесс выполнения кода завершился по сигналу {sig}"
+        return f"Процесс выполнения кода завершился (код {exitcode})"
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    self._idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+            self._started = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            counters = dict(self.stats_counters)
+        jobs = counters["jobs"]
+        counters["avg_ms"] = round(counters.pop("total_ms") / jobs, 1) if jobs else 0.0
+        counters.update({
+            "enabled": True,
+            "started": self._started,
+            "workers": self.size,
+            "idle": self._idle.qsize(),
+            "start_method": self._ctx.get_start_method(),
+        })
+        return counters
+
+
+# Singleton instance
+_code_sandbox = None
+_sandbox_lock = threading.Lock()
+
+def get_code_sandbox() -> Optional[CodeSandbox]:
+    """
+    Возвращает singleton CodeSandbox или None, если sandbox выключен
+    (CODE_SANDBOX_ENABLED=false) - тогда код выполняется в процессе, как раньше.
+    """
+    global _code_sandbox
+    if not settings.CODE_SANDBOX_ENABLED:
+        return None
+    with _sandbox_lock:
+        if _code_sandbox is None:
+            _code_sandbox = CodeSandbox(
+                workers=settings.CODE_SANDBOX_WORKERS or min(4, os.cpu_count() or 1),
+                timeout=settings.CODE_SANDBOX_TIMEOUT,
+                cpu_seconds=settings.CODE_SANDBOX_CPU_SECONDS,
+                memory_mb=settings.CODE_SANDBOX_MEMORY_MB,
+                preload=("pandas", "numpy", "app.services.simple_gpt_processor", "app.services.ai_code_executor"),
+            )
+    return _code_sandbox
+
+
+def shutdown_code_sandbox() -> None:
+    global _code_sandbox
+    with _sandbox_lock:
+        if _code_sandbox is not None:
+            _code_sandbox.close()
+            _code_sandbox = None
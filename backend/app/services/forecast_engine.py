@@ -0,0 +1,429 @@
+"""
+Forecast Engine v1.0.0 - пакетный прогноз по всем строкам листа (NumPy)
+
+Запросы "прогноз", "forecast" принудительно шли в Python-путь: модель каждый
+раз писала новый скрипт прогноза (iterrows по строкам), а результат затем
+перекладывался в write_data + merge_by_key (FORECAST FIX).
+
+ForecastEngine:
+- колонки периодов (месяцы, кварталы, годы в названии) находятся локально и
+  разбираются в матрицу позиций x периодов (SheetProfile.numeric)
+- LLM (FORECAST_MODEL, ответ кэшируется) выбирает только ключевую колонку,
+  горизонт и метод - в промпте схема, без данных; без ответа LLM параметры
+  берутся из запроса ("на 3 месяца", "с учётом сезонности")
+- модели считаются сразу для всех строк операциями над матрицей:
+  linear        - линейный тренд (МНК по наблюдённым периодам строки)
+  seasonal_naive- значение того же периода сезон назад (FORECAST_SEASON_LENGTH)
+  exp_smoothing - простое экспоненциальное сглаживание (FORECAST_SMOOTHING_ALPHA)
+  auto          - для каждой строки метод с наименьшей ошибкой на последнем
+                  периоде (модели обучены без него)
+
+Ответ - write_data + merge_by_key + write_headers (та же форма, что у FORECAST FIX).
+Если периоды не найдены, запрос уходит в прежний Python-путь.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+from app.utils.column_index import get_column_index
+from app.utils.sheet_profile import get_sheet_profile
+from app.utils.type_coercion import parse_numeric_series
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("linear", "seasonal_naive", "exp_smoothing")
+METHOD_LABELS = {
+    "linear": "линейный тренд",
+    "seasonal_naive": "сезонный наивный",
+    "exp_smoothing": "экспоненциальное сглаживание",
+    "auto": "автовыбор по ошибке на последнем периоде",
+}
+MIN_PERIODS = 2
+
+MONTHS = ["Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+          "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"]
+# Месяц в названии колонки: "Янв", "январь", "Января 2024", "Jan", "March" (но не "Маркетинг")
+_MONTH_PATTERNS = [
+    r"янв(?:арь|аря)?|jan(?:uary)?", r"фев(?:раль|раля)?|feb(?:ruary)?", r"мар(?:т|та)?|mar(?:ch)?",
+    r"апр(?:ель|еля)?|apr(?:il)?", r"ма[йя]|may", r"июн[ья]?|june?", r"июл[ья]?|july?",
+    r"авг(?:уст|уста)?|aug(?:ust)?", r"сен(?:тябрь|тября)?|sep(?:t|tember)?", r"окт(?:ябрь|ября)?|oct(?:ober)?",
+    r"ноя(?:брь|бря)?|nov(?:ember)?", r"дек(?:абрь|абря)?|dec(?:ember)?",
+]
+_MONTHS_RE = [re.compile(rf"(?<![а-яёa-z])(?:{p})(?![а-яёa-z])", re.IGNORECASE) for p in _MONTH_PATTERNS]
+_PERIOD_NAME = re.compile(
+    r"\bq[1-4]\b|\b[1-4]\s*кв|квартал|\b(?:19|20)\d{2}\b|\b\d{4}-\d{2}\b", re.IGNORECASE
+)
+# Ключ строки: сначала идентификаторы, затем названия позиций
+_KEY_NAMES = (
+    re.compile(r"артикул|sku|\bid\b|код|key", re.IGNORECASE),
+    re.compile(r"наименован|товар|назван|позиц|product|item", re.IGNORECASE),
+)
+_HORIZON = re.compile(r"(\d+)\s*(?:мес|период|кварт|month|period|quarter|нед|week|год|year)", re.IGNORECASE)
+_METHOD_STEMS = (
+    ("seasonal_naive", ("сезон", "season")),
+    ("exp_smoothing", ("сглаж", "экспоненц", "smooth")),
+    ("linear", ("тренд", "линейн", "trend", "linear")),
+)
+
+PARAMS_PROMPT = """Пользователь просит прогноз по таблице. Выбери параметры прогноза.
+
+Запрос: {query}
+Колонки: {columns}
+Колонки периодов (по порядку): {periods}
+
+Методы: linear (тренд), seasonal_naive (сезонность, нужен полный сезон {season} периодов),
+exp_smoothing (сглаживание шума), auto (для каждой строки лучший по последнему периоду).
+
+Верни только JSON:
+{{"key_column": "колонка с идентификатором строки (артикул, товар)", "horizon": 1, "method": "auto"}}"""
+
+
+# --- Модели: матрица позиций x периодов (NaN - нет значения) ---
+
+def _last_observed(values: np.ndarray) -> np.ndarray:
+    """Последнее наблюдённое значение каждой строки (NaN - строка пустая)"""
+    observed = ~np.isnan(values)
+    last = values.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1)
+    out = values[np.arange(len(values)), last]
+    out[~observed.any(axis=1)] = np.nan
+    return out
+
+
+def linear_trend(values: np.ndarray, horizon: int) -> np.ndarray:
+    """МНК-прямая по наблюдённым периодам строки, продолженная на horizon периодов"""
+    n, periods = values.shape
+    observed = ~np.isnan(values)
+    count = observed.sum(axis=1)
+    t = np.broadcast_to(np.arange(periods, dtype=float), values.shape)
+    y = np.where(observed, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_mean = np.where(observed, t, 0.0).sum(axis=1) / count
+        y_mean = y.sum(axis=1) / count
+        dt = np.where(observed, t - t_mean[:, None], 0.0)
+        denominator = (dt * dt).sum(axis=1)
+        slope = np.where(denominator > 0, (dt * (y - y_mean[:, None])).sum(axis=1) / denominator, 0.0)
+    future = periods - 1 + np.arange(1, horizon + 1, dtype=float)
+    return (y_mean - slope * t_mean)[:, None] + slope[:, None] * future
+
+
+def seasonal_naive(values: np.ndarray, horizon: int, season: int) -> np.ndarray:
+    """Значение того же периода сезон назад; короче сезона или пропуск - последнее значение"""
+    n, periods = values.shape
+    last = _last_observed(values)
+    if periods < season:
+        return np.repeat(last[:, None], horizon, axis=1)
+    columns = periods - season + np.arange(horizon) % season
+    forecast = values[:, columns]
+    return np.where(np.isnan(forecast), last[:, None], forecast)
+
+
+def exp_smoothing(values: np.ndarray, horizon: int, alpha: float) -> np.ndarray:
+    """Простое экспоненциальное сглаживание: цикл по периодам, векторно по строкам"""
+    level = np.full(len(values), np.nan)
+    for column in values.T:
+        seen = ~np.isnan(column)
+        first = seen & np.isnan(level)
+        level = np.where(first, column, level)
+        update = seen & ~first
+        level[update] = alpha * column[update] + (1 - alpha) * level[update]
+    return np.repeat(level[:, None], horizon, axis=1)
+
+
+def _run(method: str, values: np.ndarray, horizon: int) -> np.ndarray:
+    if method == "linear":
+        return linear_trend(values, horizon)
+    if method == "seasonal_naive":
+        return seasonal_naive(values, horizon, int(settings.FORECAST_SEASON_LENGTH))
+    return exp_smoothing(values, horizon, float(settings.FORECAST_SMOOTHING_ALPHA))
+
+
+def batch_forecast(values: np.ndarray, horizon: int, method: str = "auto") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Прогноз для всех строк матрицы.
+
+    Returns:
+        (прогноз n x horizon, индекс метода в METHODS для каждой строки)
+    """
+    if method != "auto":
+        return _run(method, values, horizon), np.full(len(values), METHODS.index(method))
+
+    forecasts = np.stack([_run(m, values, horizon) for m in METHODS])
+    if values.shape[1] < 3:
+        return forecasts[0], np.zeros(len(values), dtype=int)
+    # Ошибка каждого метода на последнем периоде (модель обучена без него)
+    history, actual = values[:, :-1], values[:, -1]
+    errors = np.stack([np.abs(_run(m, history, 1)[:, 0] - actual) for m in METHODS])
+    errors[np.isnan(errors)] = np.inf
+    chosen = np.argmin(errors, axis=0)  # при равенстве и без последнего значения - linear
+    return np.take_along_axis(forecasts, chosen[None, :, None], axis=0)[0], chosen
+
+
+@dataclass
+class ForecastResult:
+    """Прогноз в форме write_data: строка на строку листа"""
+    key_column: Any
+    period_columns: List[Any]
+    headers: List[str]
+    rows: List[List[Any]]
+    method: str
+    horizon: int
+    methods_used: Dict[str, int]
+    fit_ms: float
+
+
+class ForecastStats:
+    """
+    v11.29.0: Счётчики пакетного прогноза (для /health).
+
+    - checked / answered: прогнозные запросы / посчитанные движком
+    - rejected: ушли в Python-путь (by_reason: нет периодов, нет ключа...)
+    - series: строк (позиций), спрогнозированных за всё время
+    - param_fallbacks: параметры взяты из запроса - ответ LLM не разобран
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.answered = 0
+        self.series = 0
+        self.fit_ms = 0.0
+        self.param_fallbacks = 0
+        self.by_method: Dict[str, int] = {}
+        self.by_reason: Dict[str, int] = {}
+
+    def record_answer(self, result: ForecastResult) -> None:
+        with self._lock:
+            self.checked += 1
+            self.answered += 1
+            self.series += len(result.rows)
+            self.fit_ms += result.fit_ms
+            for method, count in result.methods_used.items():
+                self.by_method[method] = self.by_method.get(method, 0) + count
+
+    def record_reject(self, reason: str) -> None:
+        with self._lock:
+            self.checked += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+    def record_param_fallback(self) -> None:
+        with self._lock:
+            self.param_fallbacks += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": bool(settings.FORECAST_ENGINE_ENABLED),
+                "checked": self.checked,
+                "answered": self.answered,
+                "rejected": self.checked - self.answered,
+                "series": self.series,
+                "fit_ms_avg": round(self.fit_ms / self.answered, 2) if self.answered else 0.0,
+                "param_fallbacks": self.param_fallbacks,
+                "by_method": dict(sorted(self.by_method.items())),
+                "by_reason": dict(sorted(self.by_reason.items())),
+            }
+
+
+class ForecastEngine:
+    """
+    Прогноз по колонкам периодов для всех строк листа.
+
+    processor - SimpleGPTProcessor (_chat для выбора параметров).
+    """
+
+    def __init__(self, processor: Any):
+        self.processor = processor
+        self.stats = ForecastStats()
+
+    # --- Колонки и параметры ---
+
+    @staticmethod
+    def period_columns(df: pd.DataFrame) -> List[Any]:
+        """Колонки периодов в порядке листа (по названию: месяц, квартал, год)"""
+        return [
+            col for col in df.columns
+            if isinstance(col, str) and (_PERIOD_NAME.search(col) or any(m.search(col) for m in _MONTHS_RE))
+        ]
+
+    @staticmethod
+    def key_column(df: pd.DataFrame, periods: List[Any], requested: Any = None) -> Optional[Any]:
+        """Ключ строки: выбор LLM, иначе колонка-идентификатор, иначе первая не-период"""
+        candidates = [col for col in df.columns if col not in periods]
+        if not candidates:
+            return None
+        if isinstance(requested, str) and requested:
+            found, _ = get_column_index(candidates).resolve(requested)
+            if found is not None:
+                return found
+        for pattern in _KEY_NAMES:
+            for col in candidates:
+                if isinstance(col, str) and pattern.search(col):
+                    return col
+        return candidates[0]
+
+    @staticmethod
+    def query_params(query: str) -> Dict[str, Any]:
+        """Горизонт и метод из текста запроса (без LLM)"""
+        query_lower = query.lower()
+        match = _HORIZON.search(query_lower)
+        method = str(settings.FORECAST_DEFAULT_METHOD)
+        for name, stems in _METHOD_STEMS:
+            if any(stem in query_lower for stem in stems):
+                method = name
+                break
+        return {"key_column": None, "horizon": int(match.group(1)) if match else 1, "method": method}
+
+    async def choose_params(self, query: str, df: pd.DataFrame, periods: List[Any]) -> Dict[str, Any]:
+        """Ключ, горизонт и метод от LLM (схема без данных); при ошибке - из запроса"""
+        params = self.query_params(query)
+        prompt = PARAMS_PROMPT.format(
+            query=query,
+            columns=[str(c) for c in df.columns],
+            periods=[str(c) for c in periods],
+            season=int(settings.FORECAST_SEASON_LENGTH),
+        )
+        try:
+            content = await self.processor._chat(
+                model=settings.FORECAST_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=100,
+                cache=True,
+            )
+            chosen = json.loads(re.search(r"\{.*\}", content, re.DOTALL).group())
+        except Exception as e:
+            logger.info(f"[Forecast] LLM params unavailable ({type(e).__name__}), using query params")
+            self.stats.record_param_fallback()
+            return params
+
+        if isinstance(chosen.get("key_column"), str):
+            params["key_column"] = chosen["key_column"]
+        try:
+            params["horizon"] = int(chosen.get("horizon", params["horizon"]))
+        except (TypeError, ValueError):
+            pass
+        if chosen.get("method") in METHODS + ("auto",):
+            params["method"] = chosen["method"]
+        return params
+
+    # --- Расчёт ---
+
+    @staticmethod
+    def _labels(periods: List[Any], horizon: int) -> List[str]:
+        """Заголовки: следующие месяцы, если последний период - месяц"""
+        last = str(periods[-1])
+        month = next((i for i, pattern in enumerate(_MONTHS_RE) if pattern.search(last)), None)
+        if month is not None:
+            return [f"Прогноз {MONTHS[(month + k) % 12]}" for k in range(1, horizon + 1)]
+        if horizon == 1:
+            return ["Прогноз"]
+        return [f"Прогноз +{k}" for k in range(1, horizon + 1)]
+
+    def forecast(self, df: pd.DataFrame, key: Any, periods: List[Any], horizon: int, method: str) -> ForecastResult:
+        start = time.perf_counter()
+        profile = get_sheet_profile(df)
+        columns = []
+        for col in periods:
+            position = profile.position(col)
+            series = profile.numeric(position) if position is not None else parse_numeric_series(df[col])
+            columns.append(series.to_numpy(dtype=float))
+        values = np.column_stack(columns)
+
+        predicted, chosen = batch_forecast(values, horizon, method)
+        observed = ~np.isnan(values)
+        if (values[observed] >= 0).all():
+            predicted = np.maximum(predicted, 0)  # продажи/остатки не уходят в минус
+        if np.array_equal(values[observed], np.round(values[observed])):
+            predicted = np.round(predicted)
+        else:
+            predicted = np.round(predicted, 2)
+
+        cells = predicted.astype(object)
+        cells[~observed.any(axis=1)] = ""  # у строки нет ни одного значения
+        cells[np.isnan(predicted)] = ""
+        rows = np.column_stack([df[key].to_numpy(dtype=object), cells]).tolist()
+        used = np.bincount(chosen[observed.any(axis=1)], minlength=len(METHODS))
+        return ForecastResult(
+            key_column=key,
+            period_columns=list(periods),
+            headers=[str(key), *self._labels(periods, horizon)],
+            rows=rows,
+            method=method,
+            horizon=horizon,
+            methods_used={m: int(c) for m, c in zip(METHODS, used) if c},
+            fit_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    @staticmethod
+    def _response(result: ForecastResult) -> Dict[str, Any]:
+        from .simple_gpt_processor import format_data_for_sheets
+        methods = ", ".join(f"{METHOD_LABELS[m]}: {c}" for m, c in result.methods_used.items())
+        periods = f"{result.period_columns[0]} … {result.period_columns[-1]}"
+        explanation = (
+            f"Прогноз на {result.horizon} период(а) для {len(result.rows)} позиций\n\n"
+            f"Исходные данные: {len(result.period_columns)} периодов ({periods})\n"
+            f"Метод: {METHOD_LABELS[result.method]}\n"
+            f"Позиций по методам: {methods}"
+        )
+        return {
+            "success": True,
+            "action_type": "write_data",
+            "result_type": "action",
+            "merge_by_key": str(result.key_column),
+            "write_headers": result.headers,
+            "write_data": format_data_for_sheets(result.rows),
+            "summary": f"📊 Добавил колонку прогноза ({', '.join(result.headers[1:])}). "
+                       f"Метод: {METHOD_LABELS[result.method]}.",
+            "explanation": explanation,
+            "confidence": 0.9,
+            "response_type": "analysis",
+            "forecast": {
+                "method": result.method,
+                "horizon": result.horizon,
+                "periods": [str(p) for p in result.period_columns],
+                "methods_used": result.methods_used,
+                "fit_ms": round(result.fit_ms, 2),
+            },
+        }
+
+    async def answer(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        reference_df: Optional[pd.DataFrame] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Ответ write_data с прогнозом или None (запрос идёт в Python-путь)"""
+        if not settings.FORECAST_ENGINE_ENABLED:
+            return None
+        if df is None or len(df) == 0 or reference_df is not None:
+            self.stats.record_reject("input")
+            return None
+
+        periods = self.period_columns(df)
+        if len(periods) < MIN_PERIODS:
+            self.stats.record_reject("periods")
+            return None
+
+        params = await self.choose_params(query, df, periods)
+        key = self.key_column(df, periods, params["key_column"])
+        if key is None:
+            self.stats.record_reject("key_column")
+            return None
+        horizon = min(max(params["horizon"], 1), int(settings.FORECAST_MAX_HORIZON))
+
+        result = self.forecast(df, key, periods, horizon, params["method"])
+        self.stats.record_answer(result)
+        logger.info(
+            f"[Forecast] {len(result.rows)} rows x {len(periods)} periods, key={key!r}, "
+            f"horizon={horizon}, method={result.method} {result.methods_used}, {result.fit_ms:.1f} ms"
+        )
+        return self._response(result)
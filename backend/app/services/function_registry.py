@@ -5,10 +5,15 @@ Function Registry для SheetGPT v7.0.0
 
 import pandas as pd
 import numpy as np
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import re
 from datetime import datetime, timedelta
 
+from app.utils.type_coercion import parse_numeric_series
+from app.utils.sheet_profile import SheetProfile, get_sheet_profile, positions_mask
+from app.utils.column_index import get_column_index
+from app.services.tool_catalog import ToolCatalog
+
 
 class FunctionRegistry:
     """Реестр функций с проверенной реализацией"""
@@ -146,7 +151,16 @@ class FunctionRegistry:
         }
 
     def get_function_definitions(self) -> List[Dict[str, Any]]:
-        """Возвращает OpenAI function calling definitions"""
+        """
+        Возвращает OpenAI function calling definitions
+
+        v11.25.0: из каталога, собранного при импорте (определения общие - не изменять)
+        """
+        return list(TOOL_CATALOG.definitions)
+
+    @staticmethod
+    def _function_definitions() -> List[Dict[str, Any]]:
+        """Исходный список definitions - вызывается один раз для TOOL_CATALOG"""
         return [
             # ========== БАЗОВЫЕ ОПЕРАЦИИ ==========
             {
@@ -1561,75 +1575,188 @@ class FunctionRegistry:
         Умный поиск колонки: если точное совпадение не найдено, ищет похожую
         Например: "Сумма" найдет "Заказали на сумму" или "Сумма продаж"
         """
-        # Точное совпадение
-        if column_name in df.columns:
-            return column_name
-
-        # Case-insensitive поиск
-        for col in df.columns:
-            if col.lower() == column_name.lower():
-                return col
-
-        # Частичное совпадение (колонка содержит искомое слово)
-        column_lower = column_name.lower()
-        matches = [col for col in df.columns if column_lower in col.lower()]
-        if len(matches) == 1:
-            return matches[0]
-        elif len(matches) > 1:
-            # Если несколько совпадений, выбираем самое короткое (наиболее точное)
-            return min(matches, key=len)
-
-        # Обратное совпадение (искомое слово содержит название колонки)
-        reverse_matches = [col for col in df.columns if col.lower() in column_lower]
-        if reverse_matches:
-            return max(reverse_matches, key=len)
+        # v11.26.0: точное -> без регистра -> содержит (самое короткое) -> содержится (самое длинное)
+        column = get_column_index(df.columns).find(column_name)
+        if column is not None:
+            return column
 
         # Не найдено - возвращаем исходное название для ошибки
         raise ValueError(f"Колонка '{column_name}' не найдена. Доступные: {', '.join(df.columns)}")
 
-    def _parse_numeric_column(self, series: pd.Series) -> pd.Series:
+    def _parse_numeric_column(self, series: pd.Series, df: Optional[pd.DataFrame] = None) -> pd.Series:
         """
         Преобразует строковые числа в numeric
-        Примеры: "р.857 765" -> 857765, "100 000" -> 100000, "$1,234.56" -> 1234.56, "12,6" -> 12.6
+        Примеры: "100 000" -> 100000, "$1,234.56" -> 1234.56, "12,6" -> 12.6
+        v11.5.0: Векторизовано (app.utils.type_coercion), нераспознанные значения -> NaN
+        v11.21.0: df - лист запроса; разбор берётся из его SheetProfile (один раз на колонку)
+        """
+        profile = get_sheet_profile(df, create=False) if df is not None else None
+        position = profile.position(series.name) if profile is not None else None
+        if position is not None:
+            return profile.numeric(position, mode="auto")
+        return parse_numeric_series(series, mode="auto")
+
+    # v11.27.0: Индексы строк листа запроса (SheetProfile) - хеш для ==/IN/VLOOKUP,
+    # отсортированные позиции для диапазонов и топ N, коды строк для поиска.
+    # Строятся при первом обращении и переиспользуются всеми вызовами запроса;
+    # для промежуточных фреймов (без профиля) колонка сканируется как раньше.
+    def _indexed(self, df: pd.DataFrame, column: str) -> Tuple[Optional[SheetProfile], Optional[int]]:
+        profile = get_sheet_profile(df, create=False)
+        position = profile.position(column) if profile is not None else None
+        return (profile, position) if position is not None else (None, None)
+
+    def _indexed_condition(self, df: pd.DataFrame, column: str, operator: str, value: Any) -> Optional[pd.Series]:
+        """Маска column <operator> value по индексу (None - индекс не применим)"""
+        profile, position = self._indexed(df, column)
+        if profile is None:
+            return None
+
+        if operator == "contains":
+            mask = profile.contains_mask(position, str(value))
+        elif operator in ("==", "!="):
+            positions = profile.equal_positions(position, [value])
+            if positions is None:
+                return None
+            mask = positions_mask(len(df), positions)
+            if operator == "!=":
+                mask = ~mask
+        elif operator in ("<", ">", "<=", ">="):
+            if isinstance(value, str):
+                if re.match(r'\d{4}-\d{2}-\d{2}|\d{2}-\d{2}-\d{4}', value):
+                    return None  # сравнение дат
+                try:
+                    value = float(re.sub(r'[^\d.-]', '', value)) if value else 0
+                except ValueError:
+                    return None
+            if operator in (">", ">="):
+                positions = profile.range_positions(position, low=value, low_inclusive=operator == ">=")
+            else:
+                positions = profile.range_positions(position, high=value, high_inclusive=operator == "<=")
+            if positions is None:
+                return None
+            mask = positions_mask(len(df), positions)
+        else:
+            return None
+        return pd.Series(mask, index=df.index, name=column)
+
+    def _indexed_top(self, df: pd.DataFrame, column: str, n: int, largest: bool,
+                     condition: Optional[Dict]) -> Optional[pd.DataFrame]:
+        """filter_top_n / filter_bottom_n по отсортированному индексу числовой колонки"""
+        profile, position = self._indexed(df, column)
+        if profile is None or not profile.numeric_dtype(position):
+            return None
+        mask = np.asarray(self._rows_mask(df, **condition), dtype=bool) if condition else None
+        positions = profile.top_positions(position, n, largest=largest, mask=mask)
+        return df.take(positions)
+
+    def _indexed_filter(self, func_name: str, df: pd.DataFrame, column: str, params: Dict[str, Any]) -> Optional[pd.Series]:
+        """filter_between / filter_in_list / filter_not_in_list по индексу"""
+        if func_name not in ("filter_between", "filter_in_list", "filter_not_in_list"):
+            return None
+        profile, position = self._indexed(df, column)
+        if profile is None:
+            return None
+        if func_name == "filter_between":
+            if not profile.numeric_dtype(position):
+                return None
+            positions = profile.range_positions(position, low=params["min_value"], high=params["max_value"])
+        else:
+            values = params["values"]
+            if not isinstance(values, (list, tuple)):
+                return None
+            positions = profile.equal_positions(position, list(values))
+        if positions is None:
+            return None
+        mask = positions_mask(len(df), positions)
+        if func_name == "filter_not_in_list":
+            mask = ~mask
+        return pd.Series(mask, index=df.index, name=column)
+
+    # v11.24.0: Фильтры как маски - общие для filter_* и ленивого плана (RegistryPipeline)
+    FILTER_FUNCTIONS = (
+        "filter_rows", "search_rows", "filter_multiple", "filter_null", "filter_not_null",
+        "filter_between", "filter_in_list", "filter_not_in_list", "filter_regex", "filter_by_date_range",
+    )
+
+    def filter_mask(self, func_name: str, df: pd.DataFrame, **params) -> pd.Series:
+        """Булева маска фильтра func_name по строкам df (без выборки строк)"""
+        if func_name == "filter_rows":
+            return self._rows_mask(df, **params)
+        if func_name == "filter_multiple":
+            return self._multiple_mask(df, **params)
+        if func_name == "search_rows":
+            column = params["column"]
+            if column not in df.columns:
+                raise ValueError(f"Колонка '{column}' не найдена")
+            profile, position = self._indexed(df, column)
+            if profile is not None:
+                mask = profile.contains_mask(position, params["search_term"], params.get("case_sensitive", False))
+                return pd.Series(mask, index=df.index, name=column)
+            return df[column].astype(str).str.contains(
+                params["search_term"], case=params.get("case_sensitive", False), na=False
+            )
+        if func_name == "filter_by_date_range":
+            column = df[params["date_column"]]
+            return (column >= params["start_date"]) & (column <= params["end_date"])
+        if func_name not in self.FILTER_FUNCTIONS:
+            raise ValueError(f"Функция {func_name} не является фильтром")
+
+        name = self._find_column(df, params["column"])
+        indexed = self._indexed_filter(func_name, df, name, params)
+        if indexed is not None:
+            return indexed
+        column = df[name]
+        if func_name == "filter_null":
+            return column.isnull()
+        if func_name == "filter_not_null":
+            return column.notnull()
+        if func_name == "filter_between":
+            return (column >= params["min_value"]) & (column <= params["max_value"])
+        if func_name == "filter_in_list":
+            return column.isin(params["values"])
+        if func_name == "filter_not_in_list":
+            return ~column.isin(params["values"])
+        return column.astype(str).str.contains(params["pattern"], regex=True, na=False)  # filter_regex
+
+    def execute_plan(self, df: pd.DataFrame, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        def parse_value(val):
-            if pd.isna(val):
-                return val
-            if isinstance(val, (int, float)):
-                return val
-
-            # Преобразуем в строку
-            val_str = str(val)
-
-            # ИСПРАВЛЕНИЕ: Заменяем запятую на точку для десятичных чисел (европейский формат)
-            # Если есть только одна запятая и она между цифрами - это десятичный разделитель
-            if ',' in val_str and val_str.count(',') == 1:
-                # Проверяем, что это десятичная запятая (не разделитель тысяч)
-                parts = val_str.split(',')
-                if len(parts) == 2 and len(parts[1].replace(' ', '').replace('.', '')) <= 2:
-                    # Максимум 2 цифры после запятой - это десятичный разделитель
-                    val_str = val_str.replace(',', '.')
-
-            # Убираем все кроме цифр, точки и минуса
-            cleaned = re.sub(r'[^\d.-]', '', val_str)
-
-            try:
-                # Пытаемся преобразовать в float
-                return float(cleaned) if cleaned else 0
-            except:
-                # Если не получилось, возвращаем исходное значение
-                return val
-
-        return series.apply(parse_value)
+        v11.24.0: Выполнить цепочку функций одним ленивым планом (RegistryPipeline):
+        фильтры сливаются и переносятся раньше сортировок/группировок, строки
+        материализуются один раз.
+        steps: [{"function": "filter_rows", "params": {...}}, ...]
+        """
+        from .registry_pipeline import RegistryPipeline
+
+        pipeline = RegistryPipeline(self, steps)
+        try:
+            result = pipeline.execute(df)
+        except Exception as e:
+            return {"success": False, "error": str(e), "function_used": "pipeline", "parameters": {"steps": pipeline.steps}}
+        return {
+            "success": True,
+            "result": result,
+            "function_used": "pipeline",
+            "parameters": {"steps": pipeline.steps},
+            "plan": pipeline.explain(),
+            "materializations": pipeline.materializations,
+        }
 
     # ========== РЕАЛИЗАЦИЯ ФУНКЦИЙ ==========
 
     # Базовые операции
     def filter_rows(self, df: pd.DataFrame, column: str, operator: str, value: Union[str, int, float]) -> pd.DataFrame:
         """Фильтрация строк с умным поиском колонок и преобразованием строковых чисел"""
+        return df[self._rows_mask(df, column, operator, value)]
+
+    def _rows_mask(self, df: pd.DataFrame, column: str, operator: str, value: Union[str, int, float]) -> pd.Series:
+        """Маска filter_rows"""
         # Умный поиск колонки
         column = self._find_column(df, column)
 
+        indexed = self._indexed_condition(df, column, operator, value)
+        if indexed is not None:
+            return indexed
+
         if operator == "contains":
             mask = df[column].astype(str).str.contains(str(value), case=False, na=False)
         else:
@@ -1651,7 +1778,7 @@ class FunctionRegistry:
                         column_data = df[column]
                 else:
                     # Конвертируем в числа для сравнения чисел
-                    column_data = self._parse_numeric_column(df[column])
+                    column_data = self._parse_numeric_column(df[column], df)
                     # Преобразуем value тоже, если это строка
                     if isinstance(value, str):
                         value = float(re.sub(r'[^\d.-]', '', value)) if value else 0
@@ -1668,7 +1795,7 @@ class FunctionRegistry:
             }
             mask = ops[operator](column_data, value)
 
-        return df[mask]
+        return mask
 
     def sort_data(self, df: pd.DataFrame, columns: List[str], ascending: bool = True) -> pd.DataFrame:
         """Сортировка данных"""
@@ -1680,11 +1807,7 @@ class FunctionRegistry:
 
     def search_rows(self, df: pd.DataFrame, column: str, search_term: str, case_sensitive: bool = False) -> pd.DataFrame:
         """Поиск строк"""
-        if column not in df.columns:
-            raise ValueError(f"Колонка '{column}' не найдена")
-
-        mask = df[column].astype(str).str.contains(search_term, case=case_sensitive, na=False)
-        return df[mask]
+        return df[self.filter_mask("search_rows", df, column=column, search_term=search_term, case_sensitive=case_sensitive)]
 
     def highlight_rows(self, df: pd.DataFrame, column: str, operator: str, value: Union[str, int, float], color: str = "yellow") -> Dict[str, Any]:
         """Выделение строк с умным поиском колонок и преобразованием строковых чисел"""
@@ -1693,7 +1816,7 @@ class FunctionRegistry:
 
         # Для числовых операторов пытаемся преобразовать колонку в числа
         if operator in ['<', '>', '<=', '>=']:
-            column_data = self._parse_numeric_column(df[column])
+            column_data = self._parse_numeric_column(df[column], df)
             # Преобразуем value тоже, если это строка
             if isinstance(value, str):
                 value = float(re.sub(r'[^\d.-]', '', value)) if value else 0
@@ -2029,17 +2152,26 @@ class FunctionRegistry:
     # Filtering Advanced (NEW)
     def filter_multiple(self, df: pd.DataFrame, conditions: List[Dict], logic: str = "AND") -> pd.DataFrame:
         """Множественная фильтрация с AND/OR"""
+        return df[self._multiple_mask(df, conditions, logic)]
+
+    def _multiple_mask(self, df: pd.DataFrame, conditions: List[Dict], logic: str = "AND") -> pd.Series:
+        """Маска filter_multiple"""
         masks = []
         for cond in conditions:
             column = self._find_column(df, cond["column"])
             operator = cond["operator"]
             value = cond["value"]
 
+            indexed = self._indexed_condition(df, column, operator, value)
+            if indexed is not None:
+                masks.append(indexed)
+                continue
+
             if operator == "contains":
                 mask = df[column].astype(str).str.contains(str(value), case=False, na=False)
             else:
                 if operator in ['<', '>', '<=', '>=']:
-                    column_data = self._parse_numeric_column(df[column])
+                    column_data = self._parse_numeric_column(df[column], df)
                     if isinstance(value, str):
                         value = float(re.sub(r'[^\d.-]', '', value)) if value else 0
                 else:
@@ -2066,42 +2198,40 @@ class FunctionRegistry:
             for mask in masks[1:]:
                 combined_mask = combined_mask | mask
 
-        return df[combined_mask]
+        return combined_mask
 
     def filter_null(self, df: pd.DataFrame, column: str) -> pd.DataFrame:
         """Фильтр пустых значений"""
-        column = self._find_column(df, column)
-        return df[df[column].isnull()]
+        return df[self.filter_mask("filter_null", df, column=column)]
 
     def filter_not_null(self, df: pd.DataFrame, column: str) -> pd.DataFrame:
         """Фильтр непустых значений"""
-        column = self._find_column(df, column)
-        return df[df[column].notnull()]
+        return df[self.filter_mask("filter_not_null", df, column=column)]
 
     def filter_between(self, df: pd.DataFrame, column: str, min_value: float, max_value: float) -> pd.DataFrame:
         """Фильтр значений в диапазоне"""
-        column = self._find_column(df, column)
-        return df[(df[column] >= min_value) & (df[column] <= max_value)]
+        return df[self.filter_mask("filter_between", df, column=column, min_value=min_value, max_value=max_value)]
 
     def filter_in_list(self, df: pd.DataFrame, column: str, values: List[Union[str, int, float]]) -> pd.DataFrame:
         """Фильтр значений из списка"""
-        column = self._find_column(df, column)
-        return df[df[column].isin(values)]
+        return df[self.filter_mask("filter_in_list", df, column=column, values=values)]
 
     def filter_not_in_list(self, df: pd.DataFrame, column: str, values: List[Union[str, int, float]]) -> pd.DataFrame:
         """Исключить значения из списка"""
-        column = self._find_column(df, column)
-        return df[~df[column].isin(values)]
+        return df[self.filter_mask("filter_not_in_list", df, column=column, values=values)]
 
     def filter_regex(self, df: pd.DataFrame, column: str, pattern: str) -> pd.DataFrame:
         """Фильтр по регулярному выражению"""
-        column = self._find_column(df, column)
-        return df[df[column].astype(str).str.contains(pattern, regex=True, na=False)]
+        return df[self.filter_mask("filter_regex", df, column=column, pattern=pattern)]
 
     def filter_top_n(self, df: pd.DataFrame, column: str, n: int, condition: Optional[Dict] = None) -> pd.DataFrame:
         """Топ N значений"""
         column = self._find_column(df, column)
 
+        indexed = self._indexed_top(df, column, n, largest=True, condition=condition)
+        if indexed is not None:
+            return indexed
+
         # v7.8.6 FIX: Apply condition filter BEFORE selecting top N
         # Example: "топ 3 оплаченных заказа" → filter by status FIRST, then get top 3
         if condition:
@@ -2116,6 +2246,10 @@ class FunctionRegistry:
         """Худшие N значений"""
         column = self._find_column(df, column)
 
+        indexed = self._indexed_top(df, column, n, largest=False, condition=condition)
+        if indexed is not None:
+            return indexed
+
         # v7.8.6 FIX: Apply condition filter BEFORE selecting bottom N
         # Example: "5 самых дешевых оплаченных" → filter by status FIRST, then get bottom 5
         if condition:
@@ -2287,8 +2421,7 @@ class FunctionRegistry:
 
     def filter_by_date_range(self, df: pd.DataFrame, date_column: str, start_date: str, end_date: str) -> pd.DataFrame:
         """Фильтрация по диапазону дат"""
-        mask = (df[date_column] >= start_date) & (df[date_column] <= end_date)
-        return df[mask]
+        return df[self.filter_mask("filter_by_date_range", df, date_column=date_column, start_date=start_date, end_date=end_date)]
 
     # Date Operations Advanced (NEW)
     def extract_year(self, df: pd.DataFrame, column: str) -> pd.Series:
@@ -2518,6 +2651,12 @@ class FunctionRegistry:
         if lookup_column not in df.columns or return_column not in df.columns:
             raise ValueError("Колонка не найдена")
 
+        # v11.27.0: повторные VLOOKUP по колонке - поиск по хешу вместо прохода
+        profile, position = self._indexed(df, lookup_column)
+        positions = profile.equal_positions(position, [lookup_value]) if profile is not None else None
+        if positions is not None:
+            return df[return_column].iloc[positions[0]] if len(positions) else None
+
         mask = df[lookup_column] == lookup_value
         result = df.loc[mask, return_column]
 
@@ -2566,3 +2705,7 @@ class FunctionRegistry:
             return (df[column] - mean) / std
 
         return df[column]
+
+
+# v11.25.0: Каталог definitions (JSON + токены на функцию), собирается один раз
+TOOL_CATALOG = ToolCatalog(FunctionRegistry._function_definitions())
@@ -30,7 +30,7 @@ Hybrid Processor v9.0.0 - Гибридная архитектура обрабо
 import pandas as pd
 import numpy as np
 from typing import Dict, Any, List, Optional
-from openai import AsyncOpenAI
+from app.services.llm_gateway import get_llm_gateway
 from pathlib import Path
 import os
 import time
@@ -77,7 +77,7 @@ class HybridProcessor:
     MAX_RETRIES = 2  # Количество retry при ошибке
 
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_llm_gateway().client  # v11.11.0: общий пул соединений
         self.schema_extractor = get_schema_extractor()
         self.classifier = get_smart_classifier()
         self.pandas_generator = get_pandas_generator(self.client)
@@ -107,8 +107,7 @@ class HybridProcessor:
         try:
             # ===== STEP 1: Schema Extraction =====
             logger.info(f"[HYBRID v9] Processing: {query[:50]}...")
-            schema = self.schema_extractor.extract_schema(df)
-            schema_prompt = self.schema_extractor.schema_to_prompt(schema)
+            schema, schema_prompt = self.schema_extractor.get_schema_and_prompt(df)
             logger.info(f"[HYBRID v9] Schema extracted: {schema['column_count']} columns, {schema['row_count']} rows")
 
             # ===== STEP 2: Query Classification =====
@@ -335,6 +335,17 @@ class IntentParser:
         if best_match:
             return best_match, best_score
 
+        # ШАГ 2.5 (v11.19.0): Падежные формы - "выручки" -> "Выручка",
+        # "по сумме" -> "Сумма". Сравниваем основы без последней буквы.
+        for word in words:
+            word_stem = word.strip(".,!?:;")[:-1]
+            if len(word_stem) < 4:
+                continue
+            for col_name in column_names:
+                col_stem = col_name.lower()[:-1]
+                if len(col_stem) >= 4 and (col_stem.startswith(word_stem) or word_stem.startswith(col_stem)):
+                    return col_name, 0.90
+
         # ШАГ 3: Не нашли - возвращаем None с очень низкой certainty
         return None, 0.2
 
@@ -0,0 +1,438 @@
+"""
+Join Engine v1.0.0 - локальный VLOOKUP / merge_by_key векторизованным hash join
+
+Cross-sheet VLOOKUP раньше вставлял в промпт до REFERENCE_MAX_ROWS строк
+справочника (to_string()), а gpt-4o возвращал только key_column/value_column -
+сам поиск делал фронтенд по всему справочнику. Латентность и токены росли
+с размером справочного листа, а ключи сопоставлялись только trim + lower.
+
+KeyJoinEngine:
+- колонки ключа/значений - выбор LLM (через ColumnIndex) или локальный
+  детектор: пара колонок с наибольшим пересечением ключей и колонка
+  значения, упомянутая в запросе
+- нормализация ключей по уникальным значениям (factorize): trim, casefold,
+  числа-текстом и числа приводятся к одному виду ("123", 123, 123.0, " 123 ");
+  коды с ведущими нулями ("007") остаются текстом
+- дубликаты ключей в справочнике - политика first | last | concat | error
+- сам join - pd.Index.get_indexer по всем строкам листа (без цикла по строкам)
+
+Результат - write_data с merge_by_key (как у FORECAST FIX): одна строка на
+уникальный ключ листа, ключ - исходное значение из листа, чтобы фронтенд
+(appendColumnByKey) сопоставил его со строками таблицы.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+from app.utils.column_index import get_column_index
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("first", "last", "concat", "error")
+CONCAT_SEPARATOR = ", "
+DETECT_SAMPLE_ROWS = 2000  # строк на колонку при поиске пары ключей
+DETECT_MIN_OVERLAP = 0.3   # доля ключей листа, найденных в справочнике
+QUERY_WORD_MIN = 4         # слова запроса короче не сравниваются с колонками
+QUERY_WORD_THRESHOLD = 0.75  # "цену" -> "Цена", но не случайные слова запроса
+
+_NUMERIC_KEY = re.compile(r"^[+-]?(?:\d+(?:[.,]\d*)?|[.,]\d+)$")
+_LEADING_ZERO = re.compile(r"^[+-]?0\d")
+_INTEGER_KEY = re.compile(r"^[+-]?\d+$")
+
+
+class JoinError(ValueError):
+    """Join невозможен: нет колонок или дубликаты ключей при политике error"""
+
+
+def _number_key(number: float) -> Optional[str]:
+    if not np.isfinite(number):
+        return None
+    return str(int(number)) if float(number).is_integer() else repr(float(number))
+
+
+def _text_key(text: str) -> Optional[str]:
+    text = text.strip()
+    if not text:
+        return None
+    if text.isdigit():
+        # Цифры без ведущего нуля уже в каноническом виде; "007" - код, остаётся текстом
+        return text
+    first = text[0]
+    if (first.isdigit() or first in "+-.,") and _NUMERIC_KEY.match(text) and not _LEADING_ZERO.match(text):
+        if _INTEGER_KEY.match(text):
+            return str(int(text))  # без float - длинные коды не теряют точность
+        return _number_key(float(text.replace(",", ".")))
+    return text.casefold()
+
+
+def normalize_key(value: Any) -> Optional[str]:
+    """Ключ для сравнения: None - пустой ключ (не участвует в join)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return _text_key(value)
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return _number_key(value)
+    return _text_key(str(value))
+
+
+def _unique_keys(uniques: Any) -> np.ndarray:
+    """normalize_key для уникальных значений колонки (числовые колонки - векторно)"""
+    dtype = getattr(uniques, "dtype", None)
+    if pd.api.types.is_integer_dtype(dtype):
+        return np.asarray(uniques).astype(str).astype(object)
+    if pd.api.types.is_float_dtype(dtype):
+        numbers = np.asarray(uniques, dtype=float)
+        out = np.full(len(numbers), None, dtype=object)
+        integral = np.isfinite(numbers) & (np.floor(numbers) == numbers) & (np.abs(numbers) < 2 ** 53)
+        out[integral] = numbers[integral].astype(np.int64).astype(str)
+        for i in np.flatnonzero(~integral):
+            out[i] = _number_key(numbers[i])
+        return out
+    out = np.empty(len(uniques), dtype=object)
+    out[:] = [_text_key(value) if value.__class__ is str else normalize_key(value) for value in uniques]
+    return out
+
+
+def normalize_keys(values: pd.Series) -> np.ndarray:
+    """Нормализованные ключи колонки: работа только по уникальным значениям"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    normalized = np.append(_unique_keys(uniques), None)
+    return normalized[codes]  # код -1 (NaN) -> последний элемент, None
+
+
+def _concat(values: pd.Series) -> str:
+    """Значения повторяющегося ключа через запятую (без пустых и повторов)"""
+    texts = []
+    for value in values:
+        if pd.isna(value) or value == "":
+            continue
+        if isinstance(value, (float, np.floating)) and float(value).is_integer():
+            value = int(value)
+        texts.append(str(value))
+    return CONCAT_SEPARATOR.join(dict.fromkeys(texts))
+
+
+@dataclass
+class JoinResult:
+    """Результат join: строки write_data по уникальным ключам листа"""
+    key_column: Any
+    reference_key: Any
+    value_columns: List[Any]
+    rows: List[List[Any]]
+    matched: int
+    unmatched: int
+    duplicates: int
+    policy: str
+    detected: bool = False
+    join_ms: float = 0.0
+    unmatched_keys: List[Any] = field(default_factory=list)
+
+    @property
+    def headers(self) -> List[Any]:
+        return [self.key_column, *self.value_columns]
+
+    def to_action(self, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+        """Поля ответа в формате write_data + merge_by_key"""
+        source = f" из листа \"{sheet_name}\"" if sheet_name else ""
+        summary = (
+            f"✅ Подтянуто {', '.join(map(str, self.value_columns))}{source} по ключу "
+            f"\"{self.key_column}\": найдено {self.matched} из {self.matched + self.unmatched}"
+        )
+        if self.duplicates:
+            summary += f" (дубликатов ключа в справочнике: {self.duplicates}, правило: {self.policy})"
+        return {
+            "action_type": "write_data",
+            "merge_by_key": str(self.key_column),
+            "write_data": self.rows,
+            "write_headers": [str(h) for h in self.headers],
+            "summary": summary,
+            "join_stats": {
+                "matched": self.matched,
+                "unmatched": self.unmatched,
+                "duplicates": self.duplicates,
+                "policy": self.policy,
+                "detected_columns": self.detected,
+                "join_ms": round(self.join_ms, 1),
+            },
+        }
+
+
+class JoinEngineStats:
+    """
+    Счётчики join (для /health).
+
+    - joins: выполненные join, rows - строк листа через них
+    - matched / unmatched: уникальные ключи листа, найденные / не найденные
+    - duplicate_keys: лишние строки справочника с тем же ключом
+    - detected: колонки выбраны локальным детектором (LLM не указал/не угадал)
+    - failures: join не выполнен - ответ остался прежним (по причинам)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.joins = 0
+        self.rows = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.duplicate_keys = 0
+        self.detected = 0
+        self.join_ms = 0.0
+        self.failures: Dict[str, int] = {}
+
+    def record(self, result: JoinResult, rows: int) -> None:
+        with self._lock:
+            self.joins += 1
+            self.rows += rows
+            self.matched += result.matched
+            self.unmatched += result.unmatched
+            self.duplicate_keys += result.duplicates
+            self.detected += int(result.detected)
+            self.join_ms += result.join_ms
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.matched + self.unmatched
+            return {
+                "duplicate_policy": str(settings.JOIN_DUPLICATE_POLICY),
+                "joins": self.joins,
+                "rows": self.rows,
+                "match_rate": round(self.matched / total, 3) if total else 0.0,
+                "duplicate_keys": self.duplicate_keys,
+                "detected_columns": self.detected,
+                "failures": dict(self.failures),
+                "join_ms_avg": round(self.join_ms / self.joins, 1) if self.joins else 0.0,
+            }
+
+
+class KeyJoinEngine:
+    """
+    VLOOKUP листа по справочнику.
+
+    Usage:
+        engine = KeyJoinEngine()
+        result = engine.lookup(df, reference_df, key_column="Артикул", value_columns="Октябрь")
+        response.update(result.to_action("Справочник"))
+    """
+
+    def __init__(self):
+        self.stats = JoinEngineStats()
+
+    # --- Выбор колонок ---
+
+    @staticmethod
+    def _resolve(columns: Sequence[Any], name: Any) -> Optional[Any]:
+        """Колонка по названию от LLM: точное/нечёткое совпадение через ColumnIndex"""
+        if name is None or name == "":
+            return None
+        index = get_column_index(columns)
+        if not isinstance(name, str):
+            return index.find(name)
+        return index.resolve(name)[0]
+
+    @staticmethod
+    def detect_keys(df: pd.DataFrame, reference_df: pd.DataFrame) -> Optional[Tuple[Any, Any]]:
+        """
+        Пара (колонка листа, колонка справочника) с наибольшей долей ключей листа,
+        найденных в справочнике. Одноимённые колонки важнее: у мелких чисел
+        (количество, цена) пересечение бывает случайно высоким.
+        """
+        left_keys = {}
+        for col in df.columns:
+            keys = set(normalize_keys(df[col].head(DETECT_SAMPLE_ROWS))) - {None}
+            if keys:
+                left_keys[col] = keys
+        best, best_score = None, (False, 0.0)
+        for ref_col in reference_df.columns:
+            right = set(normalize_keys(reference_df[ref_col].head(DETECT_SAMPLE_ROWS))) - {None}
+            if not right:
+                continue
+            for col, left in left_keys.items():
+                same_name = str(col).strip().lower() == str(ref_col).strip().lower()
+                overlap = len(left & right) / len(left)
+                score = (same_name, overlap)
+                if overlap >= DETECT_MIN_OVERLAP and score > best_score:
+                    best, best_score = (col, ref_col), score
+        return best
+
+    def resolve_columns(
+        self,
+        df: pd.DataFrame,
+        reference_df: pd.DataFrame,
+        key_column: Any = None,
+        value_columns: Any = None,
+        query: str = "",
+    ) -> Tuple[Any, Any, List[Any], bool]:
+        """(ключ листа, ключ справочника, колонки значений, detected)"""
+        detected = False
+        left_key = self._resolve(list(df.columns), key_column)
+        right_key = self._resolve(list(reference_df.columns), key_column)
+        if left_key is not None and right_key is None:
+            right_key = self._resolve(list(reference_df.columns), left_key)
+        if left_key is None or right_key is None:
+            pair = self.detect_keys(df, reference_df)
+            if pair is None:
+                raise JoinError(f"Не найдена общая колонка-ключ листа и справочника (key_column={key_column!r})")
+            left_key, right_key = pair
+            detected = True
+
+        if value_columns is None or isinstance(value_columns, str):
+            value_columns = [value_columns]
+        values: List[Any] = []
+        for name in value_columns:
+            col = self._resolve(list(reference_df.columns), name)
+            if col is not None and col != right_key and col not in values:
+                values.append(col)
+        if not values and query:
+            # Колонка, названная в запросе ("подтяни октябрь", "подтяни цену")
+            candidates = [c for c in reference_df.columns if c != right_key]
+            index = get_column_index(candidates)
+            pos = index.mentioned(query)
+            found = candidates[pos] if pos is not None else None
+            for word in query.lower().split() if found is None else []:
+                if len(word) >= QUERY_WORD_MIN:
+                    found, method = index.resolve(word, threshold=QUERY_WORD_THRESHOLD)
+                    if method in ("exact", "fuzzy", "stem"):
+                        break
+                    found = None
+            if found is not None:
+                values.append(found)
+                detected = True
+        if not values:
+            raise JoinError(f"Не найдена колонка справочника для подтягивания (value_column={value_columns!r})")
+        return left_key, right_key, values, detected
+
+    # --- Join ---
+
+    def join(
+        self,
+        df: pd.DataFrame,
+        reference_df: pd.DataFrame,
+        key_column: Any,
+        reference_key: Any,
+        value_columns: List[Any],
+        policy: Optional[str] = None,
+        fill_value: Any = "",
+    ) -> JoinResult:
+        """Hash join уникальных ключей листа со справочником по нормализованному ключу"""
+        start = time.perf_counter()
+        policy = policy or str(settings.JOIN_DUPLICATE_POLICY)
+        if policy not in POLICIES:
+            raise JoinError(f"Неизвестная политика дубликатов: {policy} (ожидается {', '.join(POLICIES)})")
+
+        # Справочник: значения по позициям (названия могут совпадать с ключом)
+        right = pd.DataFrame(
+            {i: reference_df[col].to_numpy(dtype=object) for i, col in enumerate(value_columns)}
+        )
+        right["__key"] = normalize_keys(reference_df[reference_key])
+        right = right[right["__key"].notna()]
+        repeated = right["__key"].duplicated(keep="first")
+        duplicates = int(repeated.sum())
+        if duplicates and policy == "error":
+            sample = right.loc[repeated, "__key"].unique()[:5].tolist()
+            raise JoinError(f"В справочнике повторяются ключи {sample} ({duplicates} лишних строк)")
+        if duplicates and policy == "concat":
+            right = right.groupby("__key", sort=False).agg(_concat).reset_index()
+        elif duplicates:
+            right = right.drop_duplicates("__key", keep="last" if policy == "last" else "first")
+
+        # Лист: уникальные ключи в порядке появления - исходное значение + нормализованное
+        _, left_uniques = pd.factorize(df[key_column], use_na_sentinel=True)
+        originals = np.asarray(left_uniques, dtype=object)
+        normalized = _unique_keys(left_uniques)
+        keep = np.array([k is not None for k in normalized], dtype=bool)
+        originals, normalized = originals[keep], normalized[keep]
+
+        positions = pd.Index(right["__key"]).get_indexer(normalized)
+        hit = positions >= 0
+        taken = np.full((len(normalized), len(value_columns)), fill_value, dtype=object)
+        if hit.any():
+            taken[hit] = right[list(range(len(value_columns)))].to_numpy(dtype=object)[positions[hit]]
+            taken[pd.isna(taken)] = fill_value
+
+        return JoinResult(
+            key_column=key_column,
+            reference_key=reference_key,
+            value_columns=list(value_columns),
+            rows=np.column_stack([originals, taken]).tolist(),
+            matched=int(hit.sum()),
+            unmatched=int((~hit).sum()),
+            duplicates=duplicates,
+            policy=policy,
+            join_ms=(time.perf_counter() - start) * 1000,
+            unmatched_keys=originals[~hit][:10].tolist(),
+        )
+
+    def lookup(
+        self,
+        df: pd.DataFrame,
+        reference_df: pd.DataFrame,
+        key_column: Any = None,
+        value_columns: Any = None,
+        query: str = "",
+        policy: Optional[str] = None,
+    ) -> JoinResult:
+        """VLOOKUP: колонки (LLM или детектор) + join по всем строкам листа"""
+        try:
+            left_key, right_key, values, detected = self.resolve_columns(
+                df, reference_df, key_column, value_columns, query
+            )
+            result = self.join(df, reference_df, left_key, right_key, values, policy=policy)
+            if result.matched == 0 and not detected:
+                # Ключ от LLM не совпал ни разу - пробуем пару с наибольшим пересечением
+                pair = self.detect_keys(df, reference_df)
+                if pair is not None and pair != (left_key, right_key):
+                    left_key, right_key = pair
+                    values = [v for v in values if v != right_key] or values
+                    result = self.join(df, reference_df, left_key, right_key, values, policy=policy)
+                    detected = True
+        except JoinError as e:
+            self.stats.record_failure("duplicates" if "повторяются" in str(e) else "columns")
+            raise
+        result.detected = detected
+        self.stats.record(result, len(df))
+        logger.info(
+            f"[JoinEngine] {left_key!r} <- {right_key!r} {values}: matched {result.matched}, "
+            f"unmatched {result.unmatched}, duplicates {result.duplicates} ({result.policy}), "
+            f"{result.join_ms:.1f} ms"
+        )
+        return result
+
+    def merge_rows(
+        self,
+        df: pd.DataFrame,
+        key_column: Any,
+        headers: List[Any],
+        rows: List[List[Any]],
+        policy: Optional[str] = None,
+    ) -> JoinResult:
+        """
+        Выравнивает готовые строки write_data (например, прогноз) по ключам листа:
+        ключ в ответе - значение из листа, поэтому "123" и 123.0 сопоставятся.
+        """
+        sheet_key = self._resolve(list(df.columns), key_column)
+        if sheet_key is None or len(headers) < 2 or not rows:
+            self.stats.record_failure("columns")
+            raise JoinError(f"Колонка-ключ write_data не найдена на листе (merge_by_key={key_column!r})")
+        width = len(headers)
+        data = pd.DataFrame(
+            [list(row[:width]) + [""] * (width - len(row)) for row in rows], columns=range(width), dtype=object
+        )
+        result = self.join(df, data, sheet_key, 0, list(range(1, width)), policy=policy)
+        result.value_columns = list(headers[1:])
+        self.stats.record(result, len(df))
+        return result
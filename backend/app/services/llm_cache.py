@@ -0,0 +1,369 @@
+"""
+LLM Response Cache v1.0.0 - кэш ответов OpenAI для SheetGPT
+
+Одинаковый запрос к одинаковому листу (обновление дашборда, пересчёт =GPT(),
+повторная попытка пользователя) раньше каждый раз шёл в gpt-4o: секунды
+ожидания и деньги. Кэш стоит перед chat.completions.create и хранит текст ответа.
+
+Ключ: model + нормализованные messages + temperature + max_tokens (blake2b).
+
+Backends:
+- memory: LRU в процессе (по умолчанию)
+- sqlite: файл на диске, переживает рестарт и общий для воркеров
+
+Политика:
+- Детерминированные вызовы (temperature <= LLM_CACHE_MAX_TEMPERATURE, по умолчанию 0)
+  кэшируются автоматически, остальные - только явно (cache=True)
+- TTL на каждую запись
+- Bypass для тенанта: LLM_CACHE_BYPASS_TENANTS или bypass_llm_cache() на запрос
+- Метрики hit/miss для /health
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Тенант текущего запроса и флаг bypass (contextvars: у каждого запроса свои значения)
+_current_tenant: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_cache_tenant", default=None)
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+# Ключ последнего закэшированного ответа (для invalidate после неудачного выполнения кода)
+_last_key: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_cache_last_key", default=None)
+
+
+class InMemoryLRUBackend:
+    """LRU-кэш в памяти процесса: key -> (value, expires_at)"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    Кэш в SQLite: переживает рестарт и общий для нескольких воркеров uvicorn.
+    Вытеснение по last_access при превышении max_entries.
+    table - имя таблицы (v11.20.0: тот же backend хранит кэш планов кода).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 10000, table: str = "llm_cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self.evictions = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_access ON {table}(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def _normalize_text(text: str) -> str:
+    """Нормализация prompt: переводы строк, хвостовые пробелы строк, пробелы по краям."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+class LLMResponseCache:
+    """
+    Кэш ответов chat.completions (хранится только текст ответа).
+
+    Usage:
+        cached = cache.get(model, messages, temperature, max_tokens)
+        if cached is None:
+            content = ... вызов OpenAI ...
+            cache.set(model, messages, temperature, max_tokens, content)
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl_seconds: int = 3600,
+        max_temperature: float = 0.0,
+        enabled: bool = True,
+        bypass_tenants: Optional[List[str]] = None
+    ):
+        self.backend = backend if backend is not None else InMemoryLRUBackend()
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+        self.bypass_tenants = set(bypass_tenants or [])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.bypassed = 0
+        self.invalidated = 0
+        self._per_model: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: Optional[int]) -> str:
+        """Ключ: model + нормализованные messages + temperature + max_tokens."""
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": [
+                    {"role": m.get("role"), "content": _normalize_text(str(m.get("content", "")))}
+                    for m in messages
+                ],
+                "temperature": round(float(temperature), 3),
+                "max_tokens": max_tokens,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def should_cache(self, temperature: float, cache: Optional[bool] = None) -> bool:
+        """Кэшировать ли вызов: явный флаг или детерминированная temperature; учитывает bypass."""
+        _last_key.set(None)
+        if not self.enabled:
+            return False
+        if _bypass.get() or (_current_tenant.get() in self.bypass_tenants):
+            with self._lock:
+                self.bypassed += 1
+            return False
+        if cache is not None:
+            return cache
+        return temperature <= self.max_temperature
+
+    def _count(self, model: str, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+            model_stats = self._per_model.setdefault(model, {"hits": 0, "misses": 0})
+            if field in model_stats:
+                model_stats[field] += 1
+
+    def get(self, model: str, messages: List[Dict[str, Any]], temperature: float, max_tokens: Optional[int]) -> Optional[str]:
+        key = self.make_key(model, messages, temperature, max_tokens)
+        _last_key.set(key)
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"[LLM-CACHE] Backend read error: {e}")
+            entry = None
+
+        if entry is None:
+            self._count(model, "misses")
+            return None
+
+        value, expires_at = entry
+        if expires_at < time.time():
+            self.backend.delete(key)
+            with self._lock:
+                self.expired += 1
+            self._count(model, "misses")
+            return None
+
+        self._count(model, "hits")
+        logger.info(f"[LLM-CACHE] HIT {model} ({key[:10]})")
+        return value
+
+    def set(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        content: str,
+        ttl_seconds: Optional[int] = None
+    ) -> None:
+        if content is None:
+            return
+        key = self.make_key(model, messages, temperature, max_tokens)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        try:
+            self.backend.set(key, content, time.time() + ttl)
+            with self._lock:
+                self.stores += 1
+        except Exception as e:
+            logger.warning(f"[LLM-CACHE] Backend write error: {e}")
+        _last_key.set(key)
+
+    def invalidate(self, key: Optional[str]) -> None:
+        """Удаляет запись (например, сгенерированный код упал при выполнении)."""
+        if not key:
+            return
+        try:
+            self.backend.delete(key)
+            with self._lock:
+                self.invalidated += 1
+        except Exception as e:
+            logger.warning(f"[LLM-CACHE] Backend delete error: {e}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "expired": self.expired,
+                "bypassed": self.bypassed,
+                "invalidated": self.invalidated,
+                "evictions": self.backend.evictions,
+                "entries": self.backend.size(),
+                "by_model": {model: dict(counts) for model, counts in self._per_model.items()},
+            }
+
+
+def last_cache_key() -> Optional[str]:
+    """Ключ последнего вызова через кэш в текущем запросе (None, если вызов не кэшировался)."""
+    return _last_key.get()
+
+
+def set_cache_tenant(tenant_id: Optional[Any]) -> None:
+    """Привязывает текущий запрос к тенанту (для LLM_CACHE_BYPASS_TENANTS)."""
+    _current_tenant.set(str(tenant_id) if tenant_id is not None else None)
+
+
+@contextmanager
+def bypass_llm_cache(enabled: bool = True):
+    """Отключает кэш внутри блока (для текущего запроса/задачи)."""
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _parse_list_setting(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part.strip() for part in str(value).split(",") if part.strip()]
+
+
+def _create_cache_from_settings() -> LLMResponseCache:
+    backend_name = str(settings.LLM_CACHE_BACKEND).lower()
+    max_entries = int(settings.LLM_CACHE_MAX_ENTRIES)
+    backend = None
+    if backend_name == "sqlite":
+        try:
+            backend = SQLiteBackend(settings.LLM_CACHE_PATH, max_entries=max_entries)
+        except Exception as e:
+            logger.warning(f"[LLM-CACHE] SQLite backend unavailable ({e}), using memory")
+    if backend is None:
+        backend = InMemoryLRUBackend(max_entries=max_entries)
+
+    return LLMResponseCache(
+        backend=backend,
+        ttl_seconds=int(settings.LLM_CACHE_TTL_SECONDS),
+        max_temperature=float(settings.LLM_CACHE_MAX_TEMPERATURE),
+        enabled=bool(settings.LLM_CACHE_ENABLED),
+        bypass_tenants=_parse_list_setting(settings.LLM_CACHE_BYPASS_TENANTS),
+    )
+
+
+# Singleton instance
+_llm_cache = None
+
+def get_llm_cache() -> LLMResponseCache:
+    """Возвращает singleton instance LLMResponseCache."""
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = _create_cache_from_settings()
+    return _llm_cache
@@ -0,0 +1,333 @@
+"""
+LLM Gateway v1.0.0 - общий AsyncOpenAI клиент для всех сервисов SheetGPT
+
+Раньше каждый сервис создавал свой клиент (SimpleGPTProcessor, AIFunctionCaller,
+HybridProcessor, code_generator, query_complexity_classifier), а AICodeExecutor и
+ai_service* - синхронный OpenAI, который блокировал event loop на всё время ответа.
+У каждого клиента свой httpx-пул, TLS-рукопожатия не переиспользуются, а всплеск
+запросов открывает столько сокетов, сколько пришло запросов.
+
+Здесь один AsyncOpenAI поверх httpx.AsyncClient с настроенным пулом:
+- LLM_MAX_CONNECTIONS / LLM_MAX_KEEPALIVE_CONNECTIONS / LLM_KEEPALIVE_EXPIRY
+- таймауты LLM_CONNECT_TIMEOUT / LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES
+
+Лимит параллельных запросов на модель (asyncio.Semaphore):
+- LLM_MODEL_CONCURRENCY="gpt-4o=8,gpt-4o-mini=16", остальные модели - LLM_DEFAULT_CONCURRENCY
+- лишние запросы ждут в очереди, а не открывают новые сокеты
+
+httpx-пул и семафоры привязаны к event loop, поэтому состояние создаётся
+на каждый loop (обычно он один - loop uvicorn).
+
+Использование:
+    client = get_llm_gateway().client
+    response = await client.chat.completions.create(model=..., messages=...)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelStats:
+    """Счётчики запросов одной модели"""
+
+    __slots__ = ("calls", "errors", "in_flight", "waiting", "wait_ms_total", "wait_ms_max")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.wait_ms_total / self.calls, 2) if self.calls else 0.0,
+            "max_wait_ms": round(self.wait_ms_max, 2),
+        }
+
+
+class _LoopState:
+    """Клиент и семафоры одного event loop"""
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class _SlotStream:
+    """
+    Поток chunk'ов (stream=True): слот модели занят, пока поток не
+    дочитан, не упал или не закрыт - иначе лимит не ограничивал бы стриминг.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        if self._release is None:
+            return
+        release, self._release = self._release, None
+        release()
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            await close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _Completions:
+    def __init__(self, gateway: "LLMGateway"):
+        self._gateway = gateway
+
+    async def create(self, **kwargs):
+        return await self._gateway.create_chat_completion(**kwargs)
+
+
+class _Chat:
+    def __init__(self, gateway: "LLMGateway"):
+        self.completions = _Completions(gateway)
+
+
+class GatewayClient:
+    """
+    Совместим с AsyncOpenAI в части chat.completions.create - сервисы
+    получают его вместо своего клиента. Остальные атрибуты (embeddings и т.п.)
+    берутся у общего AsyncOpenAI текущего loop без лимитов.
+    """
+
+    def __init__(self, gateway: "LLMGateway"):
+        self._gateway = gateway
+        self.chat = _Chat(gateway)
+
+    def __getattr__(self, name: str):
+        return getattr(self._gateway.raw_client(), name)
+
+
+class LLMGateway:
+    """Общий AsyncOpenAI клиент с пулом соединений и лимитами на модель"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 5.0,
+        request_timeout: float = 60.0,
+        max_retries: int = 2,
+        default_concurrency: int = 8,
+        model_concurrency: Optional[Dict[str, int]] = None,
+    ):
+        self._api_key = api_key
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.default_concurrency = max(1, int(default_concurrency))
+        self.model_concurrency = {k: max(1, int(v)) for k, v in (model_concurrency or {}).items()}
+
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _ModelStats] = {}
+        self.clients_created = 0
+        self.client = GatewayClient(self)
+
+    # --- Клиент и пул ---
+
+    def _resolve_api_key(self) -> Optional[str]:
+        # Ключ читается при создании клиента: сервисы догружают .env в os.environ при импорте
+        return self._api_key or settings.OPENAI_API_KEY or os.environ.get("OPENAI_API_KEY")
+
+    def _build_client(self) -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+        )
+        self.clients_created += 1
+        return AsyncOpenAI(
+            api_key=self._resolve_api_key(),
+            http_client=http_client,
+            max_retries=self.max_retries,
+        )
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._states.get(loop)
+            if state is None:
+                state = _LoopState(self._build_client())
+                self._states[loop] = state
+            return state
+
+    def raw_client(self) -> AsyncOpenAI:
+        """AsyncOpenAI текущего event loop (без лимитов на модель)"""
+        return self._state().client
+
+    def limit_for(self, model: str) -> int:
+        return self.model_concurrency.get(model, self.default_concurrency)
+
+    def _semaphore(self, state: _LoopState, model: str) -> asyncio.Semaphore:
+        semaphore = state.semaphores.get(model)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limit_for(model))
+            state.semaphores[model] = semaphore
+        return semaphore
+
+    def _model_stats(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(model, _ModelStats())
+        return stats
+
+    # --- Вызовы ---
+
+    async def create_chat_completion(self, **kwargs):
+        """
+        chat.completions.create через общий пул с лимитом на модель.
+        Аргументы те же, что у AsyncOpenAI.chat.completions.create.
+        v11.13.0: stream=True - слот держится до конца потока (_SlotStream).
+        """
+        model = kwargs.get("model") or "unknown"
+        state = self._state()
+        semaphore = self._semaphore(state, model)
+        stats = self._model_stats(model)
+
+        stats.waiting += 1
+        wait_start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+        wait_ms = (time.perf_counter() - wait_start) * 1000
+        stats.calls += 1
+        stats.wait_ms_total += wait_ms
+        stats.wait_ms_max = max(stats.wait_ms_max, wait_ms)
+        if wait_ms > 1000:
+            logger.info(f"[LLM-GATEWAY] {model}: waited {wait_ms:.0f} ms for a slot (limit {self.limit_for(model)})")
+
+        stats.in_flight += 1
+
+        def release():
+            stats.in_flight -= 1
+            semaphore.release()
+
+        try:
+            response = await state.client.chat.completions.create(**kwargs)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                stats.errors += 1
+            release()
+            raise
+
+        if kwargs.get("stream"):
+            return _SlotStream(response, release)
+        release()
+        return response
+
+    async def aclose(self) -> None:
+        """Закрывает клиент текущего event loop (keep-alive соединения)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._states.pop(loop, None)
+        if state is not None:
+            await state.client.close()
+
+    # --- Метрики ---
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool": {
+                "max_connections": self.max_connections,
+                "max_keepalive_connections": self.max_keepalive_connections,
+                "keepalive_expiry": self.keepalive_expiry,
+            },
+            "clients_created": self.clients_created,
+            "default_concurrency": self.default_concurrency,
+            "models": {
+                model: dict(stats.to_dict(), limit=self.limit_for(model))
+                for model, stats in sorted(self._stats.items())
+            },
+        }
+
+
+def _parse_model_limits(value: Any) -> Dict[str, int]:
+    """'gpt-4o=8,gpt-4o-mini=16' -> {'gpt-4o': 8, 'gpt-4o-mini': 16}"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return {str(k): int(v) for k, v in value.items()}
+    limits = {}
+    for part in str(value).split(","):
+        model, sep, limit = part.partition("=")
+        if not sep or not model.strip():
+            continue
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"[LLM-GATEWAY] Bad concurrency limit '{part.strip()}', ignored")
+    return limits
+
+
+def _create_gateway_from_settings() -> LLMGateway:
+    return LLMGateway(
+        max_connections=int(settings.LLM_MAX_CONNECTIONS),
+        max_keepalive_connections=int(settings.LLM_MAX_KEEPALIVE_CONNECTIONS),
+        keepalive_expiry=float(settings.LLM_KEEPALIVE_EXPIRY),
+        connect_timeout=float(settings.LLM_CONNECT_TIMEOUT),
+        request_timeout=float(settings.LLM_REQUEST_TIMEOUT),
+        max_retries=int(settings.LLM_MAX_RETRIES),
+        default_concurrency=int(settings.LLM_DEFAULT_CONCURRENCY),
+        model_concurrency=_parse_model_limits(settings.LLM_MODEL_CONCURRENCY),
+    )
+
+
+# Singleton instance
+_llm_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Возвращает singleton instance LLMGateway."""
+    global _llm_gateway
+    with _gateway_lock:
+        if _llm_gateway is None:
+            _llm_gateway = _create_gateway_from_settings()
+    return _llm_gateway
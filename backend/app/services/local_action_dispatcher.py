@@ -0,0 +1,288 @@
+"""
+Local Action Dispatcher v1.0.0 - zero-LLM fast path для простых команд
+
+В SimpleGPTProcessor ~3000 строк локальных детекторов (_detect_sort_action,
+_detect_freeze_action, _detect_format_action, _detect_pivot_action, ...), но до
+round trip в gpt-4o вызывался только _detect_csv_split_action. "Отсортируй по
+сумме" или "закрепи шапку" ждали ответа LLM несколько секунд.
+
+Здесь детекторы запускаются до SmartGPT:
+- кандидаты отбираются по тегам скомпилированного индекса ключевых слов
+  (QUERY_KEYWORDS) - детектор без своих ключевых слов в запросе не вызывается
+- у каждого детектора базовая уверенность; она снижается, если сработало
+  несколько разных действий, запрос составной ("... и ...", части через
+  запятую), длинный, вопрос ("?", "какой", "сколько", "сравни") или про
+  диаграмму; сортировка без колонки сразу после "по"/"by" локально не решается
+- действие возвращается без LLM, если уверенность >= LOCAL_FAST_PATH_MIN_CONFIDENCE
+- разговорные, аналитические и прогнозные запросы, а также VLOOKUP со вторым
+  листом всегда идут в LLM
+
+FastPathStats (для /health): hit rate, срабатывания ниже порога и экономия
+латентности по типам действий. Экономия = средняя наблюдаемая латентность
+SmartGPT минус время локального детектора.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class LocalDetector:
+    """Описание локального детектора SimpleGPTProcessor"""
+    action: str                          # action_type результата
+    method: str                          # имя метода процессора
+    tags: Tuple[str, ...]                # теги QUERY_KEYWORDS, без которых детектор не вызывается
+    confidence: float                    # базовая уверенность
+    args: str = "full"                   # query | columns | full (query, column_names, df)
+    shadowed_by: Tuple[str, ...] = ()    # не запускается, если эти действия уже найдены
+
+
+# Порядок = приоритет (как в старой цепочке детекторов: color_scale раньше
+# conditional_format, highlight раньше filter)
+LOCAL_DETECTORS: List[LocalDetector] = [
+    LocalDetector("freeze", "_detect_freeze_action", ("FREEZE_KEYWORDS", "UNFREEZE_KEYWORDS"), 0.95, args="query"),
+    LocalDetector("sort", "_detect_sort_action", ("SORT_KEYWORDS",), 0.9, args="columns"),
+    LocalDetector("csv_split", "_detect_csv_split_action", ("CSV_SPLIT_KEYWORDS",), 0.9),
+    LocalDetector("convert_to_numbers", "_detect_convert_to_numbers_action", ("CONVERT_TO_NUMBERS_KEYWORDS",), 0.9),
+    LocalDetector("color_scale", "_detect_color_scale_action", ("COLOR_SCALE_KEYWORDS",), 0.85),
+    LocalDetector("clean_data", "_detect_clean_action", ("CLEAN_KEYWORDS",), 0.8),
+    LocalDetector("conditional_format", "_detect_conditional_format_action", ("CONDITIONAL_FORMAT_KEYWORDS",), 0.75,
+                  shadowed_by=("color_scale",)),
+    LocalDetector("data_validation", "_detect_validation_action", ("VALIDATION_KEYWORDS",), 0.7),
+    # "по менеджеру"/"по месяцу" из PIVOT_KEYWORDS - обычная часть команды сортировки
+    LocalDetector("pivot_table", "_detect_pivot_action", ("PIVOT_KEYWORDS",), 0.7, shadowed_by=("sort",)),
+    LocalDetector("highlight", "_detect_highlight_action", ("HIGHLIGHT_KEYWORDS",), 0.65,
+                  shadowed_by=("color_scale", "conditional_format")),
+    LocalDetector("filter_data", "_detect_filter_action", ("FILTER_KEYWORDS",), 0.6, shadowed_by=("highlight",)),
+    # "шапка"/"заголовок" встречаются и в командах закрепления
+    LocalDetector("format", "_detect_format_action", ("FORMAT_BOLD_KEYWORDS", "FORMAT_HEADER_KEYWORDS"), 0.85,
+                  args="query", shadowed_by=("freeze", "sort", "color_scale", "conditional_format", "highlight")),
+]
+
+# Запросы, которые всегда решает LLM
+SKIP_TAGS = ("FORCE_PYTHON_KEYWORDS", "CONVERSATIONAL_KEYWORDS", "DEEP_ANALYSIS_KEYWORDS")
+
+# Запрос про объект без локального детектора ("заголовок диаграммы")
+FOREIGN_OBJECT_TAGS = ("CHART_OVERRIDE_KEYWORDS",)
+
+AMBIGUITY_PENALTY = 0.25     # за каждое другое найденное действие
+COMPOUND_PENALTY = 0.1       # "... и ...", "затем", "then", части через запятую
+LONG_QUERY_PENALTY = 0.1     # больше LONG_QUERY_WORDS слов
+QUESTION_PENALTY = 0.2       # вопрос, а не команда
+FOREIGN_OBJECT_PENALTY = 0.25
+SORT_TARGET_PENALTY = 0.5    # колонка сортировки не названа после "по"/"by"
+LONG_QUERY_WORDS = 10
+
+_COMPOUND = re.compile(r"\s(?:и|а также|затем|потом|then|and)\s")
+# Запятая/точка с запятой между частями запроса (не десятичная запятая "1,5")
+_CLAUSES = re.compile(r"[,;](?!\d)")
+_INTERROGATIVE = re.compile(
+    r"\b(?:как(?:ой|ая|ое|ие|их|им|ого|ому)|сколько|кто|почему|зачем|сравн\w*"
+    r"|which|what|who|why|how many|how much|compare\w*)\b"
+)
+# "по сумме", "по колонке Сумма", "by amount", "by column Amount"
+_SORT_TARGET = re.compile(r"\b(?:по|by)\s+(?:(?:колонк\w*|столбц\w*|полю|column)\s+)?[\"'«]?(\w+)")
+
+
+class FastPathStats:
+    """
+    v11.18.0: Счётчики локального fast path (для /health).
+
+    - checked: запросы, прошедшие через диспетчер
+    - hits: действие возвращено без LLM
+    - low_confidence: детектор сработал, но уверенность ниже порога
+    - skipped: запрос заведомо для LLM (разговор, анализ, прогноз, VLOOKUP)
+    - saved_ms: средняя латентность SmartGPT минус время детектора, по hits
+    """
+
+    LLM_EMA_ALPHA = 0.2
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.hits = 0
+        self.low_confidence = 0
+        self.skipped = 0
+        self.llm_ms_avg = 0.0
+        self.llm_samples = 0
+        self.by_action: Dict[str, Dict[str, float]] = {}
+
+    def _action(self, action: str) -> Dict[str, float]:
+        return self.by_action.setdefault(action, {"hits": 0, "low_confidence": 0, "local_ms": 0.0, "saved_ms": 0.0})
+
+    def observe_llm(self, elapsed_ms: float) -> None:
+        """Латентность SmartGPT - база для оценки сэкономленного времени"""
+        with self._lock:
+            if self.llm_samples == 0:
+                self.llm_ms_avg = elapsed_ms
+            else:
+                self.llm_ms_avg += self.LLM_EMA_ALPHA * (elapsed_ms - self.llm_ms_avg)
+            self.llm_samples += 1
+
+    def record(self, outcome: str, action: Optional[str] = None, local_ms: float = 0.0) -> None:
+        """outcome: hits | low_confidence | miss | skipped"""
+        with self._lock:
+            if outcome == "skipped":
+                self.skipped += 1
+                return
+            self.checked += 1
+            if outcome == "miss":
+                return
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            entry = self._action(action)
+            entry[outcome] += 1
+            if outcome == "hits":
+                entry["local_ms"] += local_ms
+                if self.llm_samples:
+                    entry["saved_ms"] += max(0.0, self.llm_ms_avg - local_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": bool(settings.LOCAL_FAST_PATH_ENABLED),
+                "min_confidence": settings.LOCAL_FAST_PATH_MIN_CONFIDENCE,
+                "checked": self.checked,
+                "hits": self.hits,
+                "low_confidence": self.low_confidence,
+                "skipped": self.skipped,
+                "hit_rate": round(self.hits / self.checked, 4) if self.checked else 0.0,
+                "llm_ms_avg": round(self.llm_ms_avg, 1),
+                "saved_ms_total": round(sum(a["saved_ms"] for a in self.by_action.values()), 1),
+                "by_action": {
+                    action: {
+                        "hits": int(a["hits"]),
+                        "low_confidence": int(a["low_confidence"]),
+                        "local_ms_avg": round(a["local_ms"] / a["hits"], 2) if a["hits"] else 0.0,
+                        "saved_ms": round(a["saved_ms"], 1),
+                    }
+                    for action, a in sorted(self.by_action.items())
+                },
+            }
+
+
+class LocalActionDispatcher:
+    """
+    Запускает локальные детекторы процессора и решает, можно ли ответить без LLM.
+
+    processor - SimpleGPTProcessor (нужны query_keywords() и методы _detect_*_action).
+    """
+
+    def __init__(self, processor: Any, detectors: Optional[List[LocalDetector]] = None):
+        self.processor = processor
+        self.detectors = detectors or LOCAL_DETECTORS
+        self.stats = FastPathStats()
+
+    def _call(self, detector: LocalDetector, query: str, column_names: List[str], df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        method = getattr(self.processor, detector.method)
+        try:
+            if detector.args == "query":
+                return method(query)
+            if detector.args == "columns":
+                return method(query, column_names)
+            return method(query, column_names, df)
+        except Exception as e:
+            logger.warning(f"[FastPath] {detector.method} failed: {e}")
+            return None
+
+    @staticmethod
+    def _sort_target_named(query_lower: str, column: Optional[str]) -> bool:
+        """Колонка сортировки стоит сразу после "по"/"by" (с учётом падежа: "по сумме" -> "Сумма")"""
+        if not column:
+            return False
+        column_words = [w for w in re.findall(r"\w+", column.lower()) if len(w) > 1]
+        for target in _SORT_TARGET.findall(query_lower):
+            for word in column_words:
+                stem = word[:-1] if len(word) > 3 else word
+                if target.startswith(stem):
+                    return True
+        return False
+
+    def score(self, detector: LocalDetector, query: str, found: int, result: Optional[Dict[str, Any]] = None) -> float:
+        """Уверенность в действии detector (результат result) при found найденных действиях"""
+        query_lower = query.lower().strip()
+        confidence = detector.confidence
+        confidence -= AMBIGUITY_PENALTY * max(0, found - 1)
+        if _COMPOUND.search(f" {query_lower} ") or _CLAUSES.search(query_lower):
+            confidence -= COMPOUND_PENALTY
+        if len(query_lower.split()) > LONG_QUERY_WORDS:
+            confidence -= LONG_QUERY_PENALTY
+        if query_lower.endswith("?") or _INTERROGATIVE.search(query_lower):
+            confidence -= QUESTION_PENALTY
+        keywords = self.processor.query_keywords(query_lower)
+        if any(tag in keywords for tag in FOREIGN_OBJECT_TAGS):
+            confidence -= FOREIGN_OBJECT_PENALTY
+        if detector.action == "sort" and not self._sort_target_named(query_lower, (result or {}).get("sort_column")):
+            confidence -= SORT_TARGET_PENALTY
+        return round(confidence, 4)
+
+    def detect(self, query: str, column_names: List[str], df: pd.DataFrame) -> List[Tuple[LocalDetector, Dict[str, Any]]]:
+        """Все сработавшие детекторы в порядке приоритета"""
+        keywords = self.processor.query_keywords(query.lower())
+        found: List[Tuple[LocalDetector, Dict[str, Any]]] = []
+        for detector in self.detectors:
+            if not any(tag in keywords for tag in detector.tags):
+                continue
+            if any(d.action in detector.shadowed_by for d, _ in found):
+                continue
+            result = self._call(detector, query, column_names, df)
+            if result:
+                found.append((detector, result))
+        return found
+
+    def dispatch(
+        self,
+        query: str,
+        column_names: List[str],
+        df: pd.DataFrame,
+        history: Optional[List[Dict[str, Any]]] = None,
+        reference_df: Optional[pd.DataFrame] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Готовое действие без LLM или None (запрос идёт в SmartGPT).
+        """
+        if not settings.LOCAL_FAST_PATH_ENABLED:
+            return None
+
+        keywords = self.processor.query_keywords(query.lower())
+        if (
+            df is None or len(df) == 0 or not column_names
+            or reference_df is not None
+            or any(tag in keywords for tag in SKIP_TAGS)
+            or self.processor._is_conversational_query(query, history)
+        ):
+            self.stats.record("skipped")
+            return None
+
+        start = time.perf_counter()
+        found = self.detect(query, column_names, df)
+        local_ms = (time.perf_counter() - start) * 1000
+        if not found:
+            self.stats.record("miss")
+            return None
+
+        detector, result = found[0]
+        confidence = self.score(detector, query, len(found), result)
+        threshold = settings.LOCAL_FAST_PATH_MIN_CONFIDENCE
+        if confidence < threshold:
+            logger.info(
+                f"[FastPath] {detector.action} confidence {confidence:.2f} < {threshold:.2f} "
+                f"(found: {[d.action for d, _ in found]}), using LLM"
+            )
+            self.stats.record("low_confidence", detector.action)
+            return None
+
+        self.stats.record("hits", detector.action, local_ms)
+        logger.info(f"[FastPath] {detector.action} answered locally in {local_ms:.1f}ms (confidence {confidence:.2f})")
+        result = dict(result)
+        result["fast_path"] = {"detector": detector.method, "confidence": confidence, "local_ms": round(local_ms, 2)}
+        return result
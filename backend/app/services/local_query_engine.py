@@ -0,0 +1,418 @@
+"""
+Local Query Engine v1.0.0 - ответы на простые агрегации без LLM
+
+"Посчитай сумму выручки", "среднее по колонке Цена", "сумма выручки по
+менеджерам" шли в SmartGPT (а часто и в генерацию Python-кода + валидацию),
+хотя IntentParser и ActionComposer уже распознают sum/average/count/max/min
+над колонкой с оценкой certainty, а FunctionRegistry умеет считать их в pandas.
+
+Здесь они соединены в детерминированный путь:
+- IntentParser.parse -> INSERT_FORMULA с операцией sum/average/count/max/min
+- ActionComposer(min_certainty=LOCAL_QUERY_ENGINE_MIN_CERTAINTY).compose -
+  шлюз по certainty намерения и параметров (ActionCompositionError = в LLM)
+- каждое слово запроса должно быть разобрано: операция, колонка, "по <колонка>"
+  (группировка) или служебное слово. Фильтры ("где", "больше", "за январь"),
+  числа и прочие неизвестные слова отправляют запрос в LLM
+- расчёт - FunctionRegistry (calculate_sum, calculate_average, ...,
+  aggregate_by_group) над колонкой, приведённой parse_numeric_series;
+  количество по текстовой колонке - число уникальных значений (nunique)
+
+Ответ имеет ту же форму, что и Python-путь SimpleGPTProcessor.process
+(result, result_type, summary, code, structured_data для таблиц).
+LocalEngineStats (для /health): сколько запросов посчитано локально и сколько
+вызовов LLM и миллисекунд это сэкономило.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.config import settings
+from app.utils.sheet_profile import get_sheet_profile
+from app.utils.type_coercion import parse_numeric_series
+from .action_composer import ActionComposer, ActionCompositionError
+from .function_registry import FunctionRegistry
+from .intent_parser import IntentParser, IntentType
+
+logger = logging.getLogger(__name__)
+
+
+# Основы слов операций (как в IntentParser._detect_operation)
+OPERATION_STEMS: Dict[str, Tuple[str, ...]] = {
+    "sum": ("сумм", "итог", "всего"),
+    "average": ("средн", "avg"),
+    "count": ("количеств", "счёт", "count"),
+    "max": ("максим", "наибольш", "max"),
+    "min": ("миним", "наименьш", "min"),
+}
+
+COUNT_DISTINCT = "count_distinct"
+
+# операция -> (функция FunctionRegistry, agg_func для aggregate_by_group, метка, pandas)
+OPERATIONS: Dict[str, Tuple[str, str, str, str]] = {
+    "sum": ("calculate_sum", "sum", "Сумма", "sum"),
+    "average": ("calculate_average", "mean", "Среднее", "mean"),
+    "count": ("calculate_count", "count", "Количество", "count"),
+    "max": ("calculate_max", "max", "Максимум", "max"),
+    "min": ("calculate_min", "min", "Минимум", "min"),
+    # count по текстовой колонке: "количество менеджеров" - уникальные менеджеры, а не строки
+    COUNT_DISTINCT: ("", "nunique", "Уникальных значений", "nunique"),
+}
+
+# Слова, которые не меняют смысл агрегации
+FILLER_WORDS = frozenset({
+    "посчитай", "посчитать", "подсчитай", "вычисли", "вычислить", "рассчитай",
+    "покажи", "выведи", "скажи", "мне", "в", "во", "из", "колонке", "колонки",
+    "колонка", "колонку", "столбце", "столбца", "столбец", "столбцу", "значение",
+    "значения", "значений", "общая", "общую", "общее", "общий", "все", "всех", "-",
+})
+
+GROUP_MARKER = "по"
+
+# Минимальная доля числовых значений в колонке для sum/average/max/min
+MIN_NUMERIC_SHARE = 0.5
+
+_PUNCTUATION = ".,!?:;\"'«»()"
+_AMBIGUOUS = object()
+
+
+class LocalEngineStats:
+    """
+    v11.19.0: Счётчики локального движка агрегаций (для /health).
+
+    - checked: запросы, прошедшие через движок
+    - answered: посчитано в pandas без LLM
+    - rejected: отправлено в LLM, с причинами (by_reason)
+    - llm_calls_avoided: пропущенные вызовы SmartGPT
+    - saved_ms: средняя латентность SmartGPT минус время движка, по answered
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.answered = 0
+        self.rejected = 0
+        self.llm_calls_avoided = 0
+        self.local_ms = 0.0
+        self.saved_ms = 0.0
+        self.by_operation: Dict[str, int] = {}
+        self.by_reason: Dict[str, int] = {}
+
+    def record_answer(self, operation: str, local_ms: float, llm_ms_avg: float = 0.0) -> None:
+        with self._lock:
+            self.checked += 1
+            self.answered += 1
+            self.llm_calls_avoided += 1
+            self.local_ms += local_ms
+            if llm_ms_avg:
+                self.saved_ms += max(0.0, llm_ms_avg - local_ms)
+            self.by_operation[operation] = self.by_operation.get(operation, 0) + 1
+
+    def record_reject(self, reason: str) -> None:
+        with self._lock:
+            self.checked += 1
+            self.rejected += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": bool(settings.LOCAL_QUERY_ENGINE_ENABLED),
+                "min_certainty": settings.LOCAL_QUERY_ENGINE_MIN_CERTAINTY,
+                "checked": self.checked,
+                "answered": self.answered,
+                "rejected": self.rejected,
+                "answer_rate": round(self.answered / self.checked, 4) if self.checked else 0.0,
+                "llm_calls_avoided": self.llm_calls_avoided,
+                "local_ms_avg": round(self.local_ms / self.answered, 2) if self.answered else 0.0,
+                "saved_ms_total": round(self.saved_ms, 1),
+                "by_operation": dict(sorted(self.by_operation.items())),
+                "by_reason": dict(sorted(self.by_reason.items())),
+            }
+
+
+class LocalQueryEngine:
+    """
+    Считает простые агрегации локально, если IntentParser уверен в запросе.
+
+    processor - SimpleGPTProcessor (форматирование ответа, query_keywords(),
+    _is_conversational_query() и средняя латентность SmartGPT для статистики).
+    """
+
+    def __init__(self, processor: Any):
+        self.processor = processor
+        self.parser = IntentParser()
+        self.registry = FunctionRegistry()
+        self.stats = LocalEngineStats()
+
+    # --- Разбор запроса ---
+
+    @staticmethod
+    def _operation_of(token: str) -> Optional[str]:
+        for operation, stems in OPERATION_STEMS.items():
+            if token.startswith(stems):
+                return operation
+        return None
+
+    @staticmethod
+    def _column_of(token: str, column_names: List[str]) -> Any:
+        """Колонка, к которой относится слово (падежные формы), _AMBIGUOUS или None"""
+        token_stem = token[:-1] if len(token) > 4 else token
+        found = []
+        for col_name in column_names:
+            col_lower = col_name.lower()
+            if " " in col_lower:
+                continue  # многословные колонки - только точным упоминанием
+            col_stem = col_lower[:-1] if len(col_lower) > 4 else col_lower
+            if token == col_lower or (
+                len(token_stem) >= 4 and len(col_stem) >= 4
+                and (col_stem.startswith(token_stem) or token_stem.startswith(col_stem))
+            ):
+                found.append(col_name)
+        if len(found) > 1:
+            return _AMBIGUOUS
+        return found[0] if found else None
+
+    def resolve(self, query: str, column_names: List[str]) -> Tuple[Optional[Tuple[str, str, Optional[str]]], str]:
+        """
+        Разбирает запрос на (операция, колонка, колонка группировки).
+
+        Returns:
+            ((operation, target, group_by), "ok") или (None, причина отказа)
+        """
+        text = f" {query.lower().strip()} "
+        placeholders: Dict[str, str] = {}
+        # Точные упоминания колонок (включая многословные) - длинные первыми
+        for i, col_name in enumerate(sorted(column_names, key=len, reverse=True)):
+            col_lower = col_name.lower()
+            if len(col_lower) >= 3 and f" {col_lower} " in text:
+                placeholder = f"\x00{i}"
+                text = text.replace(f" {col_lower} ", f" {placeholder} ")
+                placeholders[placeholder] = col_name
+
+        operations: set = set()
+        targets: List[str] = []
+        dual: List[Tuple[str, str]] = []  # "сумма" при колонке "Сумма"
+        group_by: Optional[str] = None
+        after_marker = False
+
+        for raw in text.split():
+            token = raw.strip(_PUNCTUATION)
+            if not token:
+                continue
+            if token == GROUP_MARKER:
+                after_marker = True
+                continue
+            column = placeholders.get(token)
+            if column is None:
+                column = self._column_of(token, column_names)
+                operation = self._operation_of(token)
+            else:
+                operation = self._operation_of(column.lower())
+            if column is _AMBIGUOUS:
+                return None, "ambiguous_column"
+
+            if after_marker and column:
+                if group_by is not None:
+                    return None, "multiple_groups"
+                group_by = column
+                after_marker = False
+                continue
+            after_marker = False
+
+            if operation and column:
+                dual.append((operation, column))
+            elif operation:
+                operations.add(operation)
+            elif column:
+                targets.append(column)
+            elif token not in FILLER_WORDS:
+                return None, "unparsed_words"
+
+        if not operations:
+            operations = {operation for operation, _ in dual}
+        if not targets:
+            targets = [column for _, column in dual]
+        if not targets and group_by:
+            # "среднее по колонке Цена" / "среднее по цене" - это колонка, не группировка
+            targets, group_by = [group_by], None
+
+        if len(operations) != 1:
+            return None, "operation"
+        if len(set(targets)) != 1:
+            return None, "target_column"
+        target = targets[0]
+        if group_by == target:
+            return None, "target_column"
+        return (operations.pop(), target, group_by), "ok"
+
+    # --- Расчёт ---
+
+    @staticmethod
+    def _numeric_values(df: pd.DataFrame, target: str) -> pd.Series:
+        """Числовые значения колонки; ValueError, если колонка не числовая"""
+        column = df[target]
+        # v11.21.0: колонка уже разобрана при загрузке листа (SheetProfile)
+        profile = get_sheet_profile(df)
+        position = profile.position(target)
+        values = profile.numeric(position) if position is not None else parse_numeric_series(column)
+        non_empty = int(column.replace("", pd.NA).notna().sum())
+        if non_empty == 0 or values.notna().sum() < MIN_NUMERIC_SHARE * non_empty:
+            raise ValueError(f"Колонка '{target}' не числовая")
+        return values
+
+    def _compute(self, operation: str, target: str, group_by: Optional[str], df: pd.DataFrame) -> Any:
+        func_name, agg_func, _, _ = OPERATIONS[operation]
+        if operation in ("count", COUNT_DISTINCT):
+            values = df[target].replace("", pd.NA)
+        else:
+            values = self._numeric_values(df, target)
+
+        if group_by is None and operation == COUNT_DISTINCT:
+            return int(values.nunique())
+        if group_by is None:
+            frame = pd.DataFrame({target: values})
+            outcome = self.registry.execute(func_name, frame, column=target)
+        else:
+            frame = pd.DataFrame({group_by: df[group_by], target: values})
+            outcome = self.registry.execute(
+                "aggregate_by_group", frame, group_by=[group_by], agg_column=target, agg_func=agg_func
+            )
+        if not outcome.get("success"):
+            raise ValueError(outcome.get("error", "FunctionRegistry error"))
+
+        result = outcome["result"]
+        if group_by is None:
+            if pd.isna(result):
+                raise ValueError(f"Нет значений в колонке '{target}'")
+            return int(result) if operation == "count" else float(result)
+        return result
+
+    @staticmethod
+    def _code(operation: str, target: str, group_by: Optional[str]) -> str:
+        method = OPERATIONS[operation][3]
+        if group_by is None:
+            return f"result = df[{target!r}].{method}()"
+        return f"result = df.groupby([{group_by!r}])[{target!r}].{method}().reset_index()"
+
+    def _response(
+        self,
+        query: str,
+        operation: str,
+        target: str,
+        group_by: Optional[str],
+        result: Any,
+        action: Any,
+    ) -> Dict[str, Any]:
+        """Ответ в форме Python-пути SimpleGPTProcessor.process"""
+        processor = self.processor
+        result_type = processor._get_result_type(result)
+        formatted_result = processor._format_result(result)
+        value_summary = processor._generate_summary(result, result_type, query)
+
+        if group_by is None and operation == COUNT_DISTINCT:
+            summary = f"Уникальных значений в колонке '{target}': {value_summary}"
+        elif group_by is None:
+            summary = f"{action.explanation}: {value_summary}"
+        else:
+            summary = f"{OPERATIONS[operation][2]} '{target}' по '{group_by}': {value_summary}"
+
+        response = {
+            "success": True,
+            "result": formatted_result,
+            "result_type": result_type,
+            "summary": summary,
+            "code": self._code(operation, target, group_by),
+            "validation": "OK",
+            "confidence": action.confidence,
+        }
+        if group_by is None:
+            if operation not in ("count", COUNT_DISTINCT):  # COUNT в Sheets считает только числа
+                response["formula"] = action.config.get("formula")
+        else:
+            # Как в Python-пути: таблица - превью в сайдбаре, большая - отдельный лист
+            from .simple_gpt_processor import format_data_for_sheets
+            response["structured_data"] = {
+                "headers": list(result.columns),
+                "rows": format_data_for_sheets(formatted_result),
+                "display_mode": "preview" if len(formatted_result) <= 200 else "create_sheet",
+            }
+        return response
+
+    def answer(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        column_names: List[str],
+        history: Optional[List[Dict[str, Any]]] = None,
+        reference_df: Optional[pd.DataFrame] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Готовый ответ без LLM или None (запрос идёт в SmartGPT).
+        """
+        if not settings.LOCAL_QUERY_ENGINE_ENABLED:
+            return None
+        if df is None or len(df) == 0 or not column_names or reference_df is not None:
+            return None
+
+        start = time.perf_counter()
+        keywords = self.processor.query_keywords(query.lower())
+        if "FORCE_PYTHON_KEYWORDS" in keywords or self.processor._is_conversational_query(query, history):
+            self.stats.record_reject("conversational")
+            return None
+
+        context = {"column_names": list(column_names), "row_count": len(df) + 1}
+        intent = self.parser.parse(query, context)
+        operation = intent.parameters.get("operation")
+        if intent.type != IntentType.INSERT_FORMULA or operation is None or operation.value not in OPERATIONS:
+            self.stats.record_reject("intent")
+            return None
+
+        resolved, reason = self.resolve(query, list(column_names))
+        if resolved is None:
+            self.stats.record_reject(reason)
+            return None
+        op_name, target, group_by = resolved
+        # Разбор по словам должен подтверждать IntentParser. Колонку "Сумма" парсер
+        # находит и по слову операции ("сумму выручки") - это не противоречие.
+        target_param = intent.parameters["target_column"]
+        parsed_column = (target_param.value or "").lower()
+        column_confirmed = bool(parsed_column) and (
+            parsed_column in (target.lower(), (group_by or "").lower())
+            or self._operation_of(parsed_column) == op_name
+        )
+        if op_name != operation.value or not column_confirmed:
+            self.stats.record_reject("intent_mismatch")
+            return None
+
+        # Шлюз по certainty: ActionComposer проверяет намерение и параметры
+        target_param.value = target
+        try:
+            action = ActionComposer(min_certainty=settings.LOCAL_QUERY_ENGINE_MIN_CERTAINTY).compose(intent)
+        except ActionCompositionError as e:
+            logger.info(f"[LocalEngine] {e}, using LLM")
+            self.stats.record_reject("certainty")
+            return None
+
+        if op_name == "count":
+            try:
+                self._numeric_values(df, target)
+            except ValueError:
+                op_name = COUNT_DISTINCT
+        try:
+            result = self._compute(op_name, target, group_by, df)
+        except (KeyError, ValueError, TypeError) as e:
+            logger.info(f"[LocalEngine] {e}, using LLM")
+            self.stats.record_reject("compute")
+            return None
+
+        response = self._response(query, op_name, target, group_by, result, action)
+        local_ms = (time.perf_counter() - start) * 1000
+        self.stats.record_answer(op_name, local_ms, self.processor.local_dispatcher.stats.llm_ms_avg)
+        response["local_engine"] = {"operation": op_name, "column": target, "group_by": group_by,
+                                    "local_ms": round(local_ms, 2)}
+        logger.info(f"[LocalEngine] {op_name}({target}) by {group_by} answered locally in {local_ms:.1f}ms")
+        return response
@@ -18,6 +18,8 @@ import traceback
 import re
 import logging
 
+from app.services.llm_gateway import get_llm_gateway
+
 logger = logging.getLogger(__name__)
 
 
@@ -121,7 +123,8 @@ result = df[df['Менеджер'] == 'Иванов']
 """
 
     def __init__(self, client: AsyncOpenAI = None):
-        self.client = client
+        # v11.11.0: по умолчанию - общий клиент LLM gateway
+        self.client = client or get_llm_gateway().client
 
     async def generate_and_execute(
         self,
@@ -8,7 +8,8 @@ from pathlib import Path
 import os
 import logging
 from typing import List
-from openai import AsyncOpenAI
+
+from app.services.llm_gateway import get_llm_gateway
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,8 @@ if env_path.exists():
                 os.environ["OPENAI_API_KEY"] = api_key
                 break
 
-client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# v11.11.0: общий клиент LLM gateway (пул соединений, лимиты на модель)
+client = get_llm_gateway().client
 
 
 async def classify_query_complexity(query: str, columns: List[str]) -> str:
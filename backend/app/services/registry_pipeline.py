@@ -0,0 +1,271 @@
+"""
+Registry Pipeline v1.0.0 - ленивый план для цепочки функций FunctionRegistry
+
+FunctionRegistry.execute выполняет одну функцию за вызов, и каждая
+(filter_rows, sort_data, aggregate_by_group, filter_top_n) возвращает
+полный промежуточный DataFrame. Цепочка из N шагов копирует строки N раз.
+
+RegistryPipeline строит логический план и выполняет его лениво:
+- фильтры -> булевы маски (FunctionRegistry.filter_mask), подряд идущие
+  фильтры сливаются в одну маску
+- фильтр после сортировки переносится до неё; фильтр по ключам
+  группировки - до aggregate_by_group
+- condition у filter_top_n/filter_bottom_n становится обычным фильтром
+- подряд идущие сортировки сливаются в одну (последняя - главный ключ);
+  сортировка перед агрегацией, не зависящей от порядка, удаляется
+- до материализации состояние - позиции строк + список колонок; в
+  группировку и в итоговую функцию calculate_* передаются только нужные колонки
+- строки выбираются один раз (take) в конце или перед функцией без
+  ленивой реализации (она выполняется как обычно на готовом DataFrame)
+
+Результат совпадает с последовательным FunctionRegistry.execute по шагам
+(для слитых сортировок - с точностью до порядка равных значений; если фильтр
+по ключу ушёл до группировки, строки её результата нумеруются 0..n-1 заново).
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SORT_FREE_AGGREGATES = {"sum", "mean", "median", "min", "max", "count", "nunique", "std", "var", "size", "prod"}
+COLUMN_REDUCERS = {
+    "calculate_sum", "calculate_average", "calculate_median", "calculate_max", "calculate_min",
+    "calculate_count", "calculate_std", "calculate_mode", "calculate_percentile", "calculate_variance",
+}
+
+
+class RegistryPipeline:
+    """
+    План цепочки функций FunctionRegistry.
+
+    Usage:
+        pipeline = RegistryPipeline(registry, [
+            {"function": "filter_rows", "params": {"column": "Статус", "operator": "==", "value": "Оплачен"}},
+            {"function": "sort_data", "params": {"columns": ["Сумма"], "ascending": False}},
+        ])
+        result = pipeline.execute(df)
+        pipeline.explain()   # ["filter[filter_rows]", "sort[Сумма desc]"]
+    """
+
+    def __init__(self, registry, steps: List[Dict[str, Any]]):
+        self.registry = registry
+        self.steps = [self._normalize_step(step) for step in steps]
+        self.plan = self.optimize(self._logical_plan(self.steps))
+        self.materializations = 0
+
+    # --- План ---
+
+    def _normalize_step(self, step: Dict[str, Any]) -> Dict[str, Any]:
+        """{"function", "params"} или формат function call ({"name", "arguments"})"""
+        name = step.get("function") or step.get("name")
+        params = step.get("params", step.get("arguments")) or {}
+        if name not in self.registry.functions:
+            raise ValueError(f"Функция {name} не найдена")
+        return {"function": name, "params": dict(params)}
+
+    def _logical_plan(self, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nodes = []
+        for step in steps:
+            name, params = step["function"], step["params"]
+            if name in self.registry.FILTER_FUNCTIONS:
+                nodes.append({"op": "filter", "filters": [(name, params)]})
+            elif name == "sort_data":
+                columns = list(params["columns"])
+                ascending = params.get("ascending", True)
+                flags = list(ascending) if isinstance(ascending, (list, tuple)) else [ascending] * len(columns)
+                nodes.append({"op": "sort", "by": columns, "ascending": flags})
+            elif name in ("filter_top_n", "filter_bottom_n"):
+                if params.get("condition"):
+                    nodes.append({"op": "filter", "filters": [("filter_rows", params["condition"])]})
+                nodes.append({"op": "top", "function": name, "column": params["column"], "n": int(params["n"])})
+            elif name == "aggregate_by_group":
+                nodes.append({"op": "aggregate", "group_by": list(params["group_by"]),
+                              "agg_column": params["agg_column"], "agg_func": params["agg_func"]})
+            elif name in ("drop_columns", "reorder_columns"):
+                nodes.append({"op": "project", "function": name, "columns": list(params["columns"])})
+            else:
+                nodes.append({"op": "eager", "function": name, "params": params})
+        return nodes
+
+    @staticmethod
+    def _filter_columns(filters) -> Optional[set]:
+        """Колонки, которые читают фильтры (None - неизвестно)"""
+        columns = set()
+        for name, params in filters:
+            if name == "filter_multiple":
+                columns.update(cond.get("column") for cond in params.get("conditions", []))
+            elif name == "filter_by_date_range":
+                columns.add(params.get("date_column"))
+            elif "column" in params:
+                columns.add(params["column"])
+            else:
+                return None
+        return columns
+
+    def optimize(self, nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Переписывает план до неподвижной точки"""
+        nodes = [dict(node) for node in nodes]
+        changed = True
+        while changed:
+            changed = False
+            for i in range(len(nodes) - 1):
+                first, second = nodes[i], nodes[i + 1]
+                # Фильтр раньше сортировки: строки те же, порядок сохраняется
+                if second["op"] == "filter" and first["op"] == "sort":
+                    nodes[i], nodes[i + 1] = second, first
+                    changed = True
+                    break
+                # Фильтр по ключам группировки - до группировки
+                if second["op"] == "filter" and first["op"] == "aggregate":
+                    columns = self._filter_columns(second["filters"])
+                    if columns is not None and columns <= set(first["group_by"]):
+                        nodes[i], nodes[i + 1] = second, first
+                        changed = True
+                        break
+                # Подряд идущие фильтры - одна маска
+                if first["op"] == "filter" and second["op"] == "filter":
+                    nodes[i:i + 2] = [{"op": "filter", "filters": first["filters"] + second["filters"]}]
+                    changed = True
+                    break
+                # Две сортировки - одна: последняя задаёт главный ключ
+                if first["op"] == "sort" and second["op"] == "sort":
+                    by, ascending = list(second["by"]), list(second["ascending"])
+                    for column, flag in zip(first["by"], first["ascending"]):
+                        if column not in by:
+                            by.append(column)
+                            ascending.append(flag)
+                    nodes[i:i + 2] = [{"op": "sort", "by": by, "ascending": ascending}]
+                    changed = True
+                    break
+                # Порядок строк не влияет на агрегацию
+                if first["op"] == "sort" and second["op"] == "aggregate" and second["agg_func"] in SORT_FREE_AGGREGATES:
+                    del nodes[i]
+                    changed = True
+                    break
+        return nodes
+
+    def explain(self) -> List[str]:
+        lines = []
+        for node in self.plan:
+            op = node["op"]
+            if op == "filter":
+                lines.append(f"filter[{', '.join(name for name, _ in node['filters'])}]")
+            elif op == "sort":
+                keys = ", ".join(f"{c} {'asc' if a else 'desc'}" for c, a in zip(node["by"], node["ascending"]))
+                lines.append(f"sort[{keys}]")
+            elif op == "top":
+                lines.append(f"{node['function']}[{node['column']}, {node['n']}]")
+            elif op == "aggregate":
+                lines.append(f"aggregate[{', '.join(node['group_by'])}: {node['agg_func']}({node['agg_column']})]")
+            elif op == "project":
+                lines.append(f"{node['function']}[{', '.join(node['columns'])}]")
+            else:
+                lines.append(f"eager[{node['function']}]")
+        return lines
+
+    # --- Выполнение ---
+
+    def execute(self, df: pd.DataFrame) -> Any:
+        frame = df
+        rows: Optional[np.ndarray] = None       # позиции строк frame (None - все, в исходном порядке)
+        columns = list(df.columns)
+        numeric: List[str] = []                 # колонки, приведённые к числам (filter_top_n)
+
+        for position, node in enumerate(self.plan):
+            op = node["op"]
+            if op == "filter" and numeric:
+                # После топа колонка уже числовая - фильтр должен видеть приведённые значения
+                frame = self._materialize(frame, rows, columns, numeric)
+                rows, columns, numeric = None, list(frame.columns), []
+            if op == "filter":
+                # Колонки ищутся среди видимых (после проекций), маска считается по всему frame
+                visible = pd.DataFrame(columns=columns)
+                mask = np.ones(len(frame), dtype=bool)
+                for name, params in node["filters"]:
+                    params = self._resolve_columns(name, params, visible)
+                    mask &= np.asarray(self.registry.filter_mask(name, frame, **params), dtype=bool)
+                rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+            elif op == "sort":
+                for column in node["by"]:
+                    if column not in columns:
+                        raise ValueError(f"Колонка '{column}' не найдена")
+                keys = self._take(frame, rows, node["by"], numeric)
+                keys.index = self._positions(frame, rows)
+                rows = keys.sort_values(by=node["by"], ascending=node["ascending"]).index.to_numpy()
+            elif op == "top":
+                column = self.registry._find_column(pd.DataFrame(columns=columns), node["column"])
+                values = pd.to_numeric(self._take(frame, rows, [column], numeric)[column], errors="coerce")
+                values.index = self._positions(frame, rows)
+                picked = values.nlargest(node["n"]) if node["function"] == "filter_top_n" else values.nsmallest(node["n"])
+                rows = picked.index.to_numpy()
+                numeric.append(column)
+            elif op == "aggregate":
+                for column in node["group_by"] + [node["agg_column"]]:
+                    if column not in columns:
+                        raise ValueError(f"Колонка '{column}' не найдена")
+                needed = list(dict.fromkeys(node["group_by"] + [node["agg_column"]]))
+                subset = self._materialize(frame, rows, needed, numeric)
+                frame = self.registry.aggregate_by_group(
+                    subset, group_by=node["group_by"], agg_column=node["agg_column"], agg_func=node["agg_func"]
+                )
+                rows, columns, numeric = None, list(frame.columns), []
+            elif op == "project":
+                if node["function"] == "drop_columns":
+                    columns = [c for c in columns if c not in node["columns"]]
+                else:
+                    missing = [c for c in node["columns"] if c not in columns]
+                    if missing:
+                        raise KeyError(f"{missing} not in index")
+                    columns = node["columns"] + [c for c in columns if c not in node["columns"]]
+            else:
+                name, params = node["function"], node["params"]
+                needed = columns
+                if name in COLUMN_REDUCERS and "column" in params and not params.get("condition"):
+                    needed = [self.registry._find_column(pd.DataFrame(columns=columns), params["column"])]
+                subset = self._materialize(frame, rows, needed, numeric)
+                output = self.registry.functions[name](subset, **params)
+                if not isinstance(output, pd.DataFrame):
+                    if position != len(self.plan) - 1:
+                        raise ValueError(f"{name} возвращает не таблицу и должна быть последним шагом")
+                    return output
+                frame, rows, columns, numeric = output, None, list(output.columns), []
+
+        return self._materialize(frame, rows, columns, numeric)
+
+    def _resolve_columns(self, name: str, params: Dict[str, Any], visible: pd.DataFrame) -> Dict[str, Any]:
+        """Нечёткие названия колонок -> точные среди видимых колонок (как у функции на промежуточном df)"""
+        params = dict(params)
+        if name == "filter_multiple":
+            params["conditions"] = [
+                {**cond, "column": self.registry._find_column(visible, cond["column"])}
+                for cond in params.get("conditions", [])
+            ]
+        elif "column" in params and name != "search_rows":
+            params["column"] = self.registry._find_column(visible, params["column"])
+        return params
+
+    @staticmethod
+    def _positions(frame: pd.DataFrame, rows: Optional[np.ndarray]) -> np.ndarray:
+        return np.arange(len(frame)) if rows is None else rows
+
+    @staticmethod
+    def _take(frame: pd.DataFrame, rows: Optional[np.ndarray], columns: List[str], numeric: List[str]) -> pd.DataFrame:
+        """Только нужные колонки выбранных строк (ключи сортировки, колонка топа)"""
+        subset = frame[columns]
+        subset = subset if rows is None else subset.take(rows)
+        for column in numeric:
+            if column in subset.columns:
+                subset[column] = pd.to_numeric(subset[column], errors="coerce")
+        return subset
+
+    def _materialize(self, frame: pd.DataFrame, rows: Optional[np.ndarray], columns: List[str], numeric: List[str]) -> pd.DataFrame:
+        self.materializations += 1
+        if rows is None and columns == list(frame.columns) and not numeric:
+            return frame
+        result = frame[columns] if columns != list(frame.columns) else frame
+        result = result.take(rows) if rows is not None else result.copy()
+        for column in numeric:
+            if column in result.columns:
+                result[column] = pd.to_numeric(result[column], errors="coerce")
+        return result
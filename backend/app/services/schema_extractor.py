@@ -12,9 +12,116 @@ Schema Extractor v1.0.0 - Schema-Aware Processing для SheetGPT
 
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+from collections import OrderedDict
+import copy
+import hashlib
+import logging
 import re
+import threading
+
+from app.utils.type_coercion import parse_numeric_series
+from app.utils.sheet_profile import get_sheet_profile
+from app.utils.sheet_sketch import SKETCH_MIN_ROWS, ColumnSketch, sketch_column
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCache:
+    """
+    v11.7.0: Content-addressed LRU кэш схем.
+
+    Повторные запросы в одном разговоре присылают тот же лист, поэтому
+    схема и prompt считаются один раз. Ключ - хэш содержимого (название,
+    dtype и значения колонки), а не id(df).
+
+    Два уровня:
+    - frame: (ключи всех колонок, row_count) -> (schema, prompt)
+    - column: ключ колонки -> схема колонки (переиспользуется, если
+      изменилась только часть колонок)
+    """
+
+    def __init__(self, max_frames: int = 128, max_columns: int = 4096):
+        self.max_frames = max_frames
+        self.max_columns = max_columns
+        self._frames: "OrderedDict[Tuple, Tuple[Dict[str, Any], str]]" = OrderedDict()
+        self._columns: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.column_hits = 0
+        self.column_misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def column_key(name: Any, series: pd.Series) -> str:
+        """Быстрый хэш колонки: название + dtype + значения (pd.util.hash_pandas_object)."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr(name).encode("utf-8"))
+        digest.update(str(series.dtype).encode("utf-8"))
+        if series.dtype == object:
+            # hash_pandas_object приводит смешанные значения к str (1 и "1" совпадают)
+            digest.update(pd.api.types.infer_dtype(series, skipna=False).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def get_frame(self, key: Tuple) -> Optional[Tuple[Dict[str, Any], str]]:
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put_frame(self, key: Tuple, schema: Dict[str, Any], prompt: str) -> None:
+        with self._lock:
+            self._frames[key] = (schema, prompt)
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+                self.evictions += 1
+
+    def get_column(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._columns.get(key)
+            if entry is None:
+                self.column_misses += 1
+                return None
+            self._columns.move_to_end(key)
+            self.column_hits += 1
+            return entry
+
+    def put_column(self, key: str, col_schema: Dict[str, Any]) -> None:
+        with self._lock:
+            self._columns[key] = col_schema
+            self._columns.move_to_end(key)
+            while len(self._columns) > self.max_columns:
+                self._columns.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._columns.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "column_hits": self.column_hits,
+                "column_misses": self.column_misses,
+                "evictions": self.evictions,
+                "frames": len(self._frames),
+                "columns": len(self._columns),
+                "max_frames": self.max_frames,
+                "max_columns": self.max_columns,
+            }
 
 
 class SchemaExtractor:
@@ -42,6 +149,59 @@ class SchemaExtractor:
         'серия', 'series',
     ]
 
+    # v11.8.0: Параметры определения типа
+    NUMERIC_RATIO = 0.8        # доля распознанных чисел для типа numeric
+    NUMERIC_PROBE_ROWS = 64    # первые строки для раннего отказа (текстовые колонки)
+    DATE_SAMPLE_SIZE = 10      # значения для проверки формата даты
+    BOOLEAN_VALUES = frozenset({'true', 'false', 'да', 'нет', 'yes', 'no', '1', '0', 'истина', 'ложь'})
+    DATE_PATTERNS = [
+        re.compile(r'\d{2}[./]\d{2}[./]\d{4}'),  # DD.MM.YYYY or DD/MM/YYYY
+        re.compile(r'\d{4}[.-]\d{2}[.-]\d{2}'),  # YYYY-MM-DD
+        re.compile(r'\d{2}[.-]\d{2}[.-]\d{2}'),  # DD-MM-YY
+    ]
+
+    def __init__(self, cache: Optional[SchemaCache] = None):
+        self.cache = cache if cache is not None else SchemaCache()
+
+    def get_schema_and_prompt(self, df: pd.DataFrame) -> Tuple[Dict[str, Any], str]:
+        """
+        v11.7.0: extract_schema + schema_to_prompt с кэшем.
+
+        Одинаковый лист (те же колонки и значения) -> схема из кэша без пересчёта.
+        Изменилась часть колонок -> пересчитываются только они.
+        Возвращается копия схемы (вызывающий код может её менять).
+        """
+        column_keys = [
+            SchemaCache.column_key(col, df.iloc[:, position])
+            for position, col in enumerate(df.columns)
+        ]
+        frame_key = (len(df), tuple(column_keys))
+
+        cached = self.cache.get_frame(frame_key)
+        if cached is not None:
+            schema, prompt = cached
+            return copy.deepcopy(schema), prompt
+
+        schema = {
+            "row_count": len(df),
+            "column_count": len(df.columns),
+            "columns": []
+        }
+        for col, key in zip(df.columns, column_keys):
+            col_schema = self.cache.get_column(key)
+            if col_schema is None:
+                col_schema = self._extract_column_schema(df, col)
+                self.cache.put_column(key, col_schema)
+            schema["columns"].append(copy.deepcopy(col_schema))
+
+        prompt = self.schema_to_prompt(schema)
+        self.cache.put_frame(frame_key, copy.deepcopy(schema), prompt)
+        return schema, prompt
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Счётчики hit/miss кэша схем (для /health)"""
+        return self.cache.stats()
+
     def extract_schema(self, df: pd.DataFrame) -> Dict[str, Any]:
         """
         Извлекает полную схему DataFrame.
@@ -85,12 +245,19 @@ class SchemaExtractor:
     def _extract_column_schema(self, df: pd.DataFrame, column: str) -> Dict[str, Any]:
         """Извлекает схему одной колонки."""
         series = df[column]
+        # v11.21.0: Разбор в числа, пропуски и даты - из SheetProfile запроса (если он есть)
+        profile = get_sheet_profile(df, create=False)
+        position = profile.position(column) if profile is not None else None
+        if position is not None:
+            null_mask = pd.Series(profile.null_mask(position), index=series.index)
+        else:
+            null_mask = series.isna()
 
         # Базовая информация
         col_schema = {
             "name": column,
-            "nullable": series.isna().any(),
-            "null_count": int(series.isna().sum())
+            "nullable": null_mask.any(),
+            "null_count": int(null_mask.sum())
         }
 
         # v9.2.1: Check if column is phone/ID FIRST (before type detection)
@@ -101,21 +268,29 @@ class SchemaExtractor:
             return col_schema
 
         # Определяем тип данных
-        col_type = self._detect_column_type(series)
+        # v11.8.0: числа, распознанные при определении типа, переиспользуются в статистике
+        profile_numeric = None
+        if position is not None and not pd.api.types.is_numeric_dtype(series):
+            profile_numeric = profile.numeric(position)[~null_mask]
+        col_type, numeric_values = self._classify_column(series, profile_numeric)
         col_schema["type"] = col_type
 
         # Дополнительная информация в зависимости от типа
         if col_type == "numeric":
-            col_schema.update(self._extract_numeric_stats(series))
+            col_schema.update(self._extract_numeric_stats(series, numeric_values))
         elif col_type == "category":
             col_schema.update(self._extract_category_stats(series))
         elif col_type == "date":
-            col_schema.update(self._extract_date_stats(series))
+            col_schema.update(self._extract_date_stats(series, profile.dates(position) if position is not None else None))
         elif col_type == "boolean":
             col_schema.update(self._extract_boolean_stats(series))
         elif col_type == "text":
             col_schema.update(self._extract_text_stats(series))
 
+        # v11.16.0: Скетч (квантили / частые значения) для больших листов
+        if len(series) > SKETCH_MIN_ROWS and col_type in ("numeric", "category", "text"):
+            col_schema["sketch"] = sketch_column(series, numeric_values, name=column).to_dict()
+
         return col_schema
 
     def _is_phone_or_id_column(self, column_name: str) -> bool:
@@ -135,69 +310,115 @@ class SchemaExtractor:
         - boolean: True/False, Да/Нет
         - text: произвольный текст
         """
+        return self._classify_column(series)[0]
+
+    def _classify_column(self, series: pd.Series, numeric: Optional[pd.Series] = None) -> Tuple[str, Optional[pd.Series]]:
+        """
+        v11.8.0: Определение типа без Python-цикла по всем значениям.
+        v11.21.0: numeric - уже распознанные числа непустых значений (из SheetProfile).
+
+        Returns:
+            (тип колонки, распознанные числа без NaN-строк - только для текстовых numeric колонок)
+        """
         # Пропускаем NaN для анализа
         non_null = series.dropna()
 
         if len(non_null) == 0:
-            return "empty"
+            return "empty", None
 
         # Проверка на numeric
         if pd.api.types.is_numeric_dtype(series):
-            return "numeric"
+            return "numeric", None
 
-        # Пробуем конвертировать в числа
+        # Пробуем конвертировать в числа (v11.5.0: включая "1 234,5", "15%", "100 ₽")
         try:
-            converted = pd.to_numeric(non_null, errors='coerce')
-            if converted.notna().sum() > len(non_null) * 0.8:
-                return "numeric"
-        except:
+            converted = numeric if numeric is not None else self._probe_numeric(non_null)
+            if converted is not None and converted.notna().sum() > len(non_null) * self.NUMERIC_RATIO:
+                return "numeric", converted
+        except Exception:
             pass
 
+        unique_values = non_null.unique()
+
         # Проверка на boolean
-        unique_lower = set(str(v).lower().strip() for v in non_null.unique())
-        boolean_values = {'true', 'false', 'да', 'нет', 'yes', 'no', '1', '0', 'истина', 'ложь'}
-        if unique_lower.issubset(boolean_values) and len(unique_lower) <= 3:
-            return "boolean"
+        if self._is_boolean_values(unique_values):
+            return "boolean", None
 
         # Проверка на дату
         if self._is_date_column(non_null):
-            return "date"
+            return "date", None
 
         # Проверка на категорию (мало уникальных значений)
-        unique_ratio = len(non_null.unique()) / len(non_null)
-        if unique_ratio < 0.3 or len(non_null.unique()) <= 20:
-            return "category"
+        unique_count = len(unique_values)
+        unique_ratio = unique_count / len(non_null)
+        if unique_ratio < 0.3 or unique_count <= 20:
+            return "category", None
+
+        return "text", None
+
+    def _probe_numeric(self, non_null: pd.Series) -> Optional[pd.Series]:
+        """
+        Разбирает колонку как числа с ранним отказом для текстовых колонок.
 
-        return "text"
+        Колонка numeric, если распознано > NUMERIC_RATIO значений. Если уже в первых
+        строках нераспознанных столько, что порог недостижим даже при успехе всех
+        остальных, - результат известен точно и остаток колонки не разбирается.
+        """
+        total = len(non_null)
+        threshold = total * self.NUMERIC_RATIO
+
+        if total > self.NUMERIC_PROBE_ROWS:
+            head = parse_numeric_series(non_null.iloc[:self.NUMERIC_PROBE_ROWS], mode="ru")
+            failed = int(head.isna().sum())
+            if total - failed <= threshold:
+                return None
+            if failed * 2 > self.NUMERIC_PROBE_ROWS:
+                # Похоже на текст: проверяем минимальный префикс, на котором возможен точный отказ
+                prefix_rows = min(total, total - int(threshold) + 1)
+                if prefix_rows < total:
+                    prefix = parse_numeric_series(non_null.iloc[:prefix_rows], mode="ru")
+                    if total - int(prefix.isna().sum()) <= threshold:
+                        return None
+
+        return parse_numeric_series(non_null, mode="ru")
+
+    def _is_boolean_values(self, unique_values) -> bool:
+        """Все уникальные значения - да/нет (не более 3 вариантов). Выход на первом не-boolean."""
+        seen = set()
+        for value in unique_values:
+            key = str(value).lower().strip()
+            if key not in self.BOOLEAN_VALUES:
+                return False
+            seen.add(key)
+            if len(seen) > 3:
+                return False
+        return True
 
     def _is_date_column(self, series: pd.Series) -> bool:
         """Проверяет, является ли колонка датой."""
         if pd.api.types.is_datetime64_any_dtype(series):
             return True
 
-        # Пробуем распарсить как дату
-        sample = series.head(10)
-        date_patterns = [
-            r'\d{2}[./]\d{2}[./]\d{4}',  # DD.MM.YYYY or DD/MM/YYYY
-            r'\d{4}[.-]\d{2}[.-]\d{2}',  # YYYY-MM-DD
-            r'\d{2}[.-]\d{2}[.-]\d{2}',  # DD-MM-YY
-        ]
+        # Пробуем распарсить как дату (по первым DATE_SAMPLE_SIZE значениям)
+        sample = series.head(self.DATE_SAMPLE_SIZE)
 
         matches = 0
         for val in sample:
             val_str = str(val)
-            for pattern in date_patterns:
-                if re.match(pattern, val_str):
+            for pattern in self.DATE_PATTERNS:
+                if pattern.match(val_str):
                     matches += 1
                     break
 
         return matches >= len(sample) * 0.7
 
-    def _extract_numeric_stats(self, series: pd.Series) -> Dict[str, Any]:
+    def _extract_numeric_stats(self, series: pd.Series, numeric_values: Optional[pd.Series] = None) -> Dict[str, Any]:
         """Статистика для числовой колонки."""
         # Конвертируем в числа если нужно
-        if not pd.api.types.is_numeric_dtype(series):
-            series = pd.to_numeric(series, errors='coerce')
+        if numeric_values is not None:
+            series = numeric_values
+        elif not pd.api.types.is_numeric_dtype(series):
+            series = parse_numeric_series(series, mode="ru")
 
         non_null = series.dropna()
 
@@ -209,10 +430,19 @@ class SchemaExtractor:
             "max": float(non_null.max()),
             "mean": round(float(non_null.mean()), 2),
             "median": round(float(non_null.median()), 2),
-            "is_integer": bool(non_null.apply(lambda x: x == int(x) if pd.notna(x) else True).all()),
+            "is_integer": self._is_integer_values(non_null),
             "sample_values": [float(v) for v in non_null.head(self.MAX_SAMPLE_VALUES).tolist()]
         }
 
+    @staticmethod
+    def _is_integer_values(non_null: pd.Series) -> bool:
+        """Все значения целые (x % 1 == 0). Булевы и целочисленные dtype - целые без проверки."""
+        if pd.api.types.is_bool_dtype(non_null) or pd.api.types.is_integer_dtype(non_null):
+            return True
+        values = non_null.to_numpy(dtype=np.float64)
+        # inf % 1 -> nan: бесконечность не считается целым
+        return bool((np.mod(values, 1.0) == 0).all())
+
     def _extract_category_stats(self, series: pd.Series) -> Dict[str, Any]:
         """Статистика для категориальной колонки."""
         value_counts = series.value_counts()
@@ -235,10 +465,11 @@ class SchemaExtractor:
             "has_more_values": False
         }
 
-    def _extract_date_stats(self, series: pd.Series) -> Dict[str, Any]:
+    def _extract_date_stats(self, series: pd.Series, dates: Optional[pd.Series] = None) -> Dict[str, Any]:
         """Статистика для колонки с датами."""
         try:
-            dates = pd.to_datetime(series, errors='coerce')
+            if dates is None:
+                dates = pd.to_datetime(series, errors='coerce')
             non_null = dates.dropna()
 
             if len(non_null) == 0:
@@ -316,11 +547,19 @@ class SchemaExtractor:
         if col_type == "text_id":
             return f'"{name}" (⚠️ ТЕКСТ-ID, НЕ ЧИСЛОВАЯ КОЛОНКА! Не использовать в вычислениях!)'
 
+        # v11.16.0: Для больших листов - распределение вместо примеров
+        sketch_text = self._sketch_to_prompt(col.get("sketch"))
+
         if col_type == "numeric":
             if col.get("is_integer"):
-                return f'"{name}" (число, {col["min"]}-{col["max"]})'
+                desc = f'"{name}" (число, {col["min"]}-{col["max"]}'
             else:
-                return f'"{name}" (число, {col["min"]:.0f}-{col["max"]:.0f}, среднее {col["mean"]:.0f})'
+                desc = f'"{name}" (число, {col["min"]:.0f}-{col["max"]:.0f}, среднее {col["mean"]:.0f}'
+            return f'{desc}; {sketch_text})' if sketch_text else f'{desc})'
+
+        elif col_type in ("category", "text") and sketch_text:
+            kind = "категория" if col_type == "category" else "текст"
+            return f'"{name}" ({kind}, {sketch_text})'
 
         elif col_type == "category":
             values = col.get("unique_values", [])
@@ -342,6 +581,14 @@ class SchemaExtractor:
             return f'"{name}" (текст)'
 
 
+    @staticmethod
+    def _sketch_to_prompt(sketch: Optional[Dict[str, Any]]) -> str:
+        if not sketch:
+            return ""
+        top = [tuple(item) for item in sketch.get("top") or []]
+        return ColumnSketch(**dict(sketch, top=top)).describe()
+
+
 # Singleton instance
 _schema_extractor = None
 
@@ -29,18 +29,201 @@ Simple GPT Processor v1.0.0 - Упрощённая архитектура без
 
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
 from openai import AsyncOpenAI
 import os
 import time
 import logging
 import re
 import ast
+import asyncio
+import contextvars
+import threading
+import tracemalloc
+import warnings
 
+from app.config import settings
 from .schema_extractor import SchemaExtractor, get_schema_extractor
+from .llm_cache import get_llm_cache, last_cache_key
+from .code_plan_cache import get_code_plan_cache
+from .code_sandbox import get_code_sandbox
+from .llm_gateway import get_llm_gateway
+from .local_action_dispatcher import LocalActionDispatcher
+from .local_query_engine import LocalQueryEngine
+from .sql_engine import SQLQueryEngine
+from .join_engine import JoinError, KeyJoinEngine
+from .forecast_engine import ForecastEngine
+from app.utils.prompt_budget import PromptBudget, estimate_tokens
+from app.utils.sheet_sketch import SKETCH_MIN_ROWS, get_sheet_sketch
+from app.utils.keyword_index import KeywordIndex, KeywordMatch
+from app.utils.sheet_profile import get_sheet_profile
 
 logger = logging.getLogger(__name__)
 
+# v11.13.0: Колбэк прогресса текущего запроса (SSE /api/v1/formula/stream).
+# Вызывается только из потока event loop: (event, data) -> None
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+_progress: contextvars.ContextVar[Optional[ProgressCallback]] = contextvars.ContextVar("simple_gpt_progress", default=None)
+
+
+def emit_progress(event: str, **data: Any) -> None:
+    """Отправляет событие прогресса, если запрос обрабатывается в потоковом режиме"""
+    callback = _progress.get()
+    if callback is None:
+        return
+    try:
+        callback(event, data)
+    except Exception as e:
+        logger.warning(f"[SimpleGPT] Progress callback failed on '{event}': {e}")
+
+
+def _frame_bytes(df: Optional[pd.DataFrame]) -> int:
+    """Сколько байт стоит df.copy() (object-колонки копируются как массивы указателей)"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+class _MemoryTrace:
+    """v11.22.0: Пик памяти (tracemalloc) за время выполнения кода"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.peak_bytes: Optional[int] = None
+        self._started = False
+        self._base = 0
+
+    def __enter__(self) -> "_MemoryTrace":
+        if self.enabled:
+            if tracemalloc.is_tracing():
+                self._base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                self._started = True
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if self.enabled:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_bytes = max(0, peak - self._base)
+            if self._started:
+                tracemalloc.stop()
+        return False
+
+
+def _exec_generated(code: str, df: pd.DataFrame, reference_df: pd.DataFrame = None) -> dict:
+    """Выполняет код в namespace с df (и reference_df), которые код может менять."""
+
+    # Helper functions for safe NaN handling
+    def safe_int(val, default=0):
+        """Safely convert to int, handling NaN/None"""
+        if pd.isna(val) or val is None:
+            return default
+        try:
+            return int(float(val))
+        except (ValueError, TypeError):
+            return default
+
+    def safe_float(val, default=0.0):
+        """Safely convert to float, handling NaN/None"""
+        if pd.isna(val) or val is None:
+            return default
+        try:
+            return float(val)
+        except (ValueError, TypeError):
+            return default
+
+    # Create safe namespace
+    namespace = {
+        'df': df,
+        'pd': pd,
+        'np': np,
+        'result': None,
+        'explanation': None,
+        'datetime': __import__('datetime'),
+        'timedelta': __import__('datetime').timedelta,
+        're': __import__('re'),
+        'math': __import__('math'),
+        'safe_int': safe_int,
+        'safe_float': safe_float,
+    }
+
+    # v9.2.0: Add reference_df for cross-sheet VLOOKUP
+    if reference_df is not None:
+        namespace['reference_df'] = reference_df
+
+    exec(code, namespace)
+
+    result = namespace.get('result')
+    explanation = namespace.get('explanation', '')
+
+    # Allow result = None for text-only responses
+    if result is None and not explanation:
+        raise ValueError("Код не вернул результат (result = None)")
+
+    # For text-only responses, use explanation as result
+    if result is None and explanation:
+        result = explanation
+
+    return {'result': result, 'explanation': explanation}
+
+
+def run_generated_code(
+    code: str,
+    df: pd.DataFrame,
+    reference_df: pd.DataFrame = None,
+    copy_on_write: bool = False,
+    trace_memory: bool = False,
+) -> dict:
+    """
+    Выполняет сгенерированный Pandas код. Возвращает dict с result, explanation и memory.
+
+    v11.10.0: Функция уровня модуля - выполняется в sandbox-процессе (app.services.code_sandbox).
+    v11.22.0: copy_on_write=True - вместо df.copy() на каждую попытку код получает
+    shallow-копии в режиме pandas copy-on-write: исходный лист защищён, колонка
+    копируется только когда код её меняет. Запись прямо в numpy-буфер
+    (df['x'].values[0] = ...) в этом режиме падает на read-only - тогда код
+    выполняется повторно на полных копиях.
+    v11.22.1: Цепочечное присваивание (df['a'][mask] = 0, df['b'].fillna(0,
+    inplace=True)) под copy-on-write молча ничего не меняет - предупреждение
+    ChainedAssignmentError превращается в ошибку и тоже ведёт к полным копиям.
+    memory: режим, байты скопированных
+    входных фреймов, пик памяти попытки (trace_memory). При ошибке те же данные
+    лежат в атрибуте исключения execution_memory.
+    """
+    input_bytes = _frame_bytes(df) + _frame_bytes(reference_df)
+    memory = {"mode": "copy", "input_bytes": input_bytes, "copied_bytes": input_bytes, "peak_bytes": None}
+    trace = _MemoryTrace(trace_memory)
+    try:
+        with trace:
+            if not copy_on_write:
+                output = _exec_generated(code, df.copy(), reference_df.copy() if reference_df is not None else None)
+            else:
+                memory.update(mode="cow", copied_bytes=0)
+                try:
+                    with pd.option_context("mode.copy_on_write", True), warnings.catch_warnings():
+                        warnings.simplefilter("error", pd.errors.ChainedAssignmentError)
+                        warnings.filterwarnings("error", message=".*chained assignment.*inplace method", category=FutureWarning)
+                        output = _exec_generated(
+                            code,
+                            df.copy(deep=False),
+                            reference_df.copy(deep=False) if reference_df is not None else None,
+                        )
+                except (ValueError, Warning) as e:
+                    if isinstance(e, ValueError) and "read-only" not in str(e):
+                        raise
+                    memory.update(mode="cow_fallback", copied_bytes=input_bytes)
+                    output = _exec_generated(code, df.copy(), reference_df.copy() if reference_df is not None else None)
+    except Exception as e:
+        memory["peak_bytes"] = trace.peak_bytes
+        e.execution_memory = memory
+        raise
+
+    memory["peak_bytes"] = trace.peak_bytes
+    output["memory"] = memory
+    return output
+
 
 def format_number_for_sheets(value):
     """Format number for Google Sheets (comma as decimal separator for Russian locale)"""
@@ -110,6 +293,114 @@ def clean_explanation_text(text: str) -> str:
 
     return text.strip()
 
+
+class SpeculationStats:
+    """
+    v11.12.0: Счётчики спекулятивного режима (для /health).
+
+    - started: спекуляция запущена вместе со SmartGPT
+    - hits: SmartGPT вернул None, использован заранее сгенерированный код
+    - cancelled: SmartGPT вернул действие, спекуляция отменена
+    - failed: спекуляция не дала кода, путь Python выполнен последовательно
+    - saved_ms: суммарная экономия min(SmartGPT, спекуляция) по hits
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.saved_ms = 0.0
+
+    def record(self, outcome: str, saved_ms: float = 0.0) -> None:
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.saved_ms += saved_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.hits + self.cancelled + self.failed
+            return {
+                "enabled": bool(settings.SPECULATIVE_EXECUTION_ENABLED),
+                "started": self.started,
+                "hits": self.hits,
+                "cancelled": self.cancelled,
+                "failed": self.failed,
+                "hit_rate": round(self.hits / finished, 4) if finished else 0.0,
+                "saved_ms_total": round(self.saved_ms, 1),
+                "saved_ms_avg": round(self.saved_ms / self.hits, 1) if self.hits else 0.0,
+            }
+
+
+class ExecutionMemoryStats:
+    """
+    v11.22.0: Память выполнения сгенерированного кода (для /health).
+
+    - attempts: выполнения кода (все попытки всех запросов)
+    - cow / cow_fallbacks: попытки в режиме copy-on-write / с повтором на копиях
+    - copied_bytes: байты входных фреймов, скопированных целиком
+    - copies_avoided_bytes: байты, которые раньше копировались на каждую попытку
+    - peak_bytes_max / peak_bytes_avg: пик памяти запроса (максимум по попыткам)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.cow = 0
+        self.cow_fallbacks = 0
+        self.copied_bytes = 0
+        self.copies_avoided_bytes = 0
+        self.total_bytes = 0
+        self.peak_bytes_max = 0
+        self._peak_bytes_sum = 0
+
+    @staticmethod
+    def summarize(attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Сводка по попыткам одного запроса: пик и сумма пиков (total), скопированные байты"""
+        peaks = [a["peak_bytes"] for a in attempts if a.get("peak_bytes") is not None]
+        return {
+            "attempts": len(attempts),
+            "modes": sorted({a["mode"] for a in attempts}),
+            "peak_bytes": max(peaks) if peaks else None,
+            "total_bytes": sum(peaks) if peaks else None,
+            "copied_bytes": sum(a["copied_bytes"] for a in attempts),
+            "copies_avoided_bytes": sum(a["input_bytes"] for a in attempts if a["mode"] == "cow"),
+        }
+
+    def record(self, attempts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        summary = self.summarize(attempts)
+        with self._lock:
+            self.requests += 1
+            self.attempts += len(attempts)
+            self.cow += sum(1 for a in attempts if a["mode"] == "cow")
+            self.cow_fallbacks += sum(1 for a in attempts if a["mode"] == "cow_fallback")
+            self.copied_bytes += summary["copied_bytes"]
+            self.copies_avoided_bytes += summary["copies_avoided_bytes"]
+            if summary["peak_bytes"] is not None:
+                self.total_bytes += summary["total_bytes"]
+                self.peak_bytes_max = max(self.peak_bytes_max, summary["peak_bytes"])
+                self._peak_bytes_sum += summary["peak_bytes"]
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "copy_on_write": bool(settings.CODE_EXEC_COPY_ON_WRITE),
+                "trace_memory": bool(settings.CODE_EXEC_TRACE_MEMORY),
+                "requests": self.requests,
+                "attempts": self.attempts,
+                "cow": self.cow,
+                "cow_fallbacks": self.cow_fallbacks,
+                "copied_bytes": self.copied_bytes,
+                "copies_avoided_bytes": self.copies_avoided_bytes,
+                "total_bytes": self.total_bytes,
+                "peak_bytes_max": self.peak_bytes_max,
+                "peak_bytes_avg": round(self._peak_bytes_sum / self.requests) if self.requests else 0,
+            }
+
+
 class SimpleGPTProcessor:
     """
     Упрощённый процессор на базе GPT-4o.
@@ -173,6 +464,22 @@ class SimpleGPTProcessor:
     MAX_FULL_ROWS = 500  # Максимум строк для full mode
     MAX_SAMPLE_ROWS = 10  # Строк для sample mode
     SMALL_TABLE_THRESHOLD = 50  # Таблицы меньше этого - всегда full
+    # v11.15.0: Верхние границы секций; фактический объём задаёт бюджет токенов
+    JSON_ROWS_LIMIT = 100  # JSON-строк для highlight
+    HISTORY_ITEMS = 5
+    HISTORY_ANSWER_CHARS = 1500
+
+    @staticmethod
+    def query_keywords(query_lower: str) -> KeywordMatch:
+        """
+        v11.17.0: Все списки ключевых слов за один проход по запросу.
+
+        Списки (*_KEYWORDS, CLEAN_OPERATIONS, FILTER_OPERATORS, FILL_VALUE_HINTS и
+        ключи CHART_TYPES/AGG_FUNCTIONS/*_COLORS) скомпилированы в QUERY_KEYWORDS
+        при импорте; результат кэшируется по тексту запроса.
+        Ожидает уже приведённый к нижнему регистру текст.
+        """
+        return QUERY_KEYWORDS.match(query_lower)
 
     @staticmethod
     def determine_data_mode(query: str, row_count: int) -> str:
@@ -189,15 +496,12 @@ class SimpleGPTProcessor:
         if row_count <= SimpleGPTProcessor.SMALL_TABLE_THRESHOLD:
             return "full"
 
-        # Проверяем ключевые слова для full режима
-        for keyword in SimpleGPTProcessor.FULL_DATA_KEYWORDS:
-            if keyword in query_lower:
-                return "full"
-
-        # Проверяем ключевые слова для sample режима
-        for keyword in SimpleGPTProcessor.SAMPLE_KEYWORDS:
-            if keyword in query_lower:
-                return "sample"
+        # Проверяем ключевые слова для full, затем для sample режима
+        keywords = SimpleGPTProcessor.query_keywords(query_lower)
+        if "FULL_DATA_KEYWORDS" in keywords:
+            return "full"
+        if "SAMPLE_KEYWORDS" in keywords:
+            return "sample"
 
         # По умолчанию для средних таблиц - full, для больших - sample
         if row_count <= 200:
@@ -206,7 +510,7 @@ class SimpleGPTProcessor:
             return "sample"
 
     @staticmethod
-    def format_ascii_table(df: pd.DataFrame, column_names: List[str], mode: str, max_rows: int = None) -> str:
+    def format_ascii_table(df: pd.DataFrame, column_names: List[str], mode: str, max_rows: int = None, budget: Optional[PromptBudget] = None) -> str:
         """
         Форматирует данные в ASCII-таблицу как в Google Sheets.
 
@@ -215,6 +519,7 @@ class SimpleGPTProcessor:
             column_names: Названия колонок
             mode: 'full' или 'sample'
             max_rows: Максимум строк (если None, используются дефолты)
+            budget: v11.15.0 - бюджет токенов; строки добавляются, пока помещаются в секцию "table"
 
         Returns:
             ASCII-таблица с координатами (A1, B1, etc.)
@@ -226,8 +531,10 @@ class SimpleGPTProcessor:
         total_rows = len(df)
         if total_rows > max_rows:
             if mode == 'sample':
-                # Sample: первые N строк + последняя
-                df_display = pd.concat([df.head(max_rows - 1), df.tail(1)])
+                # v11.16.0: Sample: репрезентативные строки (крайние, min/max чисел,
+                # частые категории, равномерно по листу) вместо первых N + последней
+                positions = get_sheet_sketch(df, max_rows).sample_positions
+                df_display = df.iloc[positions]
                 truncated = True
             else:
                 # Full: первые max_rows строк
@@ -262,6 +569,8 @@ class SimpleGPTProcessor:
         lines.append("-" * len(header))
 
         # Данные
+        data_lines = []
+        prev_idx = None
         for idx, (df_idx, row) in enumerate(df_display.iterrows()):
             row_num = df_idx + 2  # +2 потому что строка 1 = заголовки, индексы с 0
             row_str = f"{row_num:3} |"
@@ -269,18 +578,29 @@ class SimpleGPTProcessor:
                 val_str = str(val) if pd.notna(val) else ""
                 val_str = val_str[:10]  # Обрезаем длинные значения
                 row_str += f" {val_str:^10} |"
-            lines.append(row_str)
-
-            # Добавляем ... если данные обрезаны и это предпоследняя строка sample
-            if truncated and mode == 'sample' and idx == max_rows - 2:
-                lines.append("... |" + "|".join(f" {'...':^10} " for _ in range(min(len(column_names), 10))))
+            # Добавляем ... на месте пропущенных строк sample
+            if truncated and mode == 'sample' and prev_idx is not None and df_idx - prev_idx > 1:
+                data_lines.append("... |" + "|".join(f" {'...':^10} " for _ in range(min(len(column_names), 10))))
+            prev_idx = df_idx
+            data_lines.append(row_str)
+
+        shown = len(df_display)
+        if budget is not None:
+            # v11.15.0: Столько строк, сколько помещается в бюджет (хвост "[Показано ...]" зарезервирован)
+            body, fitted = budget.fit_lines("table", data_lines, header="\n".join(lines), reserve=20)
+            if fitted < len(data_lines):
+                shown = sum(1 for line in data_lines[:fitted] if not line.startswith("..."))
+                truncated = True
+            lines = [body]
+        else:
+            lines.extend(data_lines)
 
         # Информация о таблице
         if truncated:
             if mode == 'sample':
-                lines.append(f"\n[Показано {len(df_display)} из {total_rows} строк. Режим: SAMPLE]")
+                lines.append(f"\n[Показано {shown} из {total_rows} строк (репрезентативная выборка). Режим: SAMPLE]")
             else:
-                lines.append(f"\n[Показано {len(df_display)} из {total_rows} строк. Режим: FULL]")
+                lines.append(f"\n[Показано {shown} из {total_rows} строк. Режим: FULL]")
         else:
             lines.append(f"\n[Всего: {total_rows} строк. Режим: {'FULL' if mode == 'full' else 'SAMPLE'}]")
 
@@ -1020,14 +1340,26 @@ else:
     # Freeze keywords
     FREEZE_KEYWORDS = ['заморозь', 'заморозить', 'закрепи', 'закрепить', 'freeze', 'pin']
     UNFREEZE_KEYWORDS = ['разморозь', 'разморозить', 'открепи', 'открепить', 'unfreeze', 'unpin']
+    FREEZE_ROWS_KEYWORDS = ['строк', 'строку', 'row', 'первую', 'шапку', 'заголов']
+    FREEZE_COLUMNS_KEYWORDS = ['столб', 'колонк', 'column', 'первый столб', 'первую колонк']
 
     # Format keywords
     FORMAT_BOLD_KEYWORDS = ['жирн', 'bold', 'выдели жирным']
     FORMAT_HEADER_KEYWORDS = ['заголов', 'header', 'шапк', 'первую строку']
     FORMAT_COLOR_KEYWORDS = ['цвет', 'color', 'покрась', 'закрась']
+    FORMAT_COLORS = {
+        'красн': '#FF0000', 'red': '#FF0000',
+        'синий': '#0000FF', 'blue': '#0000FF',
+        'зелен': '#00FF00', 'green': '#00FF00',
+        'желт': '#FFFF00', 'yellow': '#FFFF00',
+        'оранж': '#FFA500', 'orange': '#FFA500',
+        'серый': '#808080', 'сер': '#808080', 'gray': '#808080', 'grey': '#808080',
+    }
 
     # Chart keywords
     CHART_KEYWORDS = ['диаграмм', 'график', 'chart', 'graph', 'построй', 'визуализ', 'plot']
+    # SmartGPT override: такие запросы всегда идут через chart_pending
+    CHART_OVERRIDE_KEYWORDS = ['диаграмм', 'график', 'chart', 'гистограмм', 'круговая', 'круговую', 'круговой', 'кругов', 'pie']
     CHART_TYPES = {
         # Line charts
         'линейн': 'LINE', 'line': 'LINE', 'линия': 'LINE', 'тренд': 'LINE',
@@ -1056,6 +1388,10 @@ else:
                                     'если цена', 'если сумма', 'если значение',
                                     'красным ячейки', 'зелёным ячейки', 'зеленым ячейки',
                                     'пустые значения', 'пустые ячейки', 'желтым пуст', 'жёлтым пуст']
+    CONDITION_BLANK_KEYWORDS = ['пуст', 'empty', 'blank', 'нет данных']
+    CONDITION_NOT_BLANK_KEYWORDS = ['не пуст', 'not empty', 'заполнен', 'есть данные']
+    CONDITION_NEGATIVE_KEYWORDS = ['отрицательн', 'убыт', 'negative', 'минус']
+    CONDITION_POSITIVE_KEYWORDS = ['положительн', 'прибыл', 'positive', 'плюс']
 
     # Color scale / gradient keywords (MUST be checked BEFORE conditional formatting)
     COLOR_SCALE_KEYWORDS = ['цветовая шкала', 'color scale', 'градиент', 'gradient',
@@ -1068,6 +1404,12 @@ else:
                             'низкой ценой красным', 'наоборот цвет', 'инвертируй цвет',
                             'зеленым цветом, а', 'зелёным цветом, а',
                             'красным цветом, а', 'поменяй цвета']
+    # Выбор пресета шкалы
+    COLOR_SCALE_INVERT_KEYWORDS = ['к зелёному', 'к зеленому', 'to green', 'прибыл', 'доход',
+                                   'высок', 'наоборот', 'инвертир', 'большой зелен', 'больше зелен']
+    COLOR_SCALE_BLUE_KEYWORDS = ['синий', 'blue', 'голуб']
+    COLOR_SCALE_GREEN_KEYWORDS = ['зелён', 'зелен', 'green']
+    COLOR_SCALE_RED_KEYWORDS = ['красн']
 
     # Convert to numbers keywords
     CONVERT_TO_NUMBERS_KEYWORDS = ['преобразуй в числ', 'преобразовать в числ', 'конвертируй в числ',
@@ -1150,6 +1492,19 @@ else:
         'trim': ['пробел', 'trim', 'strip', 'whitespace'],
         'fill': ['заполн', 'fill', 'замен', 'replace'],
     }
+    CLEAN_REMOVE_KEYWORDS = ['удали', 'убери', 'remove', 'delete']
+    CLEAN_FILL_KEYWORDS = ['заполн', 'fill', 'замен']
+    CLEAN_ALL_KEYWORDS = ['очисти', 'clean']
+
+    # Fill value hints (checked in order)
+    FILL_VALUE_HINTS = {
+        'zero': ['нул', 'zero', '0'],
+        'string': ['строк', 'string', 'текст'],
+        'mean': ['средн', 'mean', 'average', 'avg'],
+        'median': ['медиан', 'median'],
+        'ffill': ['предыдущ', 'forward', 'ffill', 'последн'],
+    }
+    FILL_VALUES = {'zero': 0, 'string': "", 'mean': "mean", 'median': "median", 'ffill': "ffill"}
 
     # Data validation keywords
     VALIDATION_KEYWORDS = ['валидац', 'validation', 'выпадающ', 'dropdown', 'список',
@@ -1160,6 +1515,12 @@ else:
     HIGHLIGHT_KEYWORDS = ['выдели', 'выделить', 'подсвети', 'подсветить', 'подсветь',
                           'highlight', 'mark', 'покрась', 'покрасить', 'раскрась',
                           'отметь', 'отметить', 'пометь', 'пометить']
+    # Highlight in SmartGPT prompt (JSON rows) and Python analysis result
+    SMART_HIGHLIGHT_KEYWORDS = ['выдели', 'выделить', 'подсвети', 'highlight']
+    HIGHLIGHT_QUERY_KEYWORDS = ['выдели', 'выделить', 'подсвети', 'подсветить', 'highlight', 'mark']
+    # Status values for text filters (checked in order)
+    STATUS_VALUE_KEYWORDS = ['оплачен', 'отменен', 'отменён', 'доставлен', 'возврат', 'активн',
+                             'неактивн', 'завершен', 'завершён', 'выполнен', 'ожидан', 'vip']
 
     # Highlight colors mapping (hex) - more variations
     HIGHLIGHT_COLORS = {
@@ -1199,6 +1560,8 @@ else:
     FILTER_KEYWORDS = ['фильтр', 'filter', 'отфильтр', 'покажи только', 'show only',
                        'где ', 'where ', 'выбери где', 'select where', 'строки где',
                        'rows where', 'отбери', 'выбери строки']
+    # Search/filter queries: SmartGPT highlight is replaced with Python analysis
+    SEARCH_KEYWORDS = ['найди', 'найти', 'поиск', 'где', 'какие', 'какой', 'какая', 'который', 'которые']
 
     # Filter operators
     FILTER_OPERATORS = {
@@ -1223,6 +1586,10 @@ else:
         'не понял', "don't understand", 'поясни', 'clarify'
     ]
 
+    # Forecast queries (forced Python path + write_data conversion)
+    FORECAST_KEYWORDS = ['прогноз', 'спрогнозир', 'forecast', 'предсказ']
+    FORCE_PYTHON_KEYWORDS = FORECAST_KEYWORDS + ['предскажи']
+
     # Deep analysis prompt - for thorough anomaly detection
     ANALYSIS_SYSTEM_PROMPT = """Ты аналитик данных. Найди ВСЕ аномалии из запроса.
 
@@ -1292,7 +1659,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         'голуб': {'red': 0.85, 'green': 0.95, 'blue': 1},    # Light cyan
     }
 
-    def __init__(self):
+    def __init__(self, client: Optional[AsyncOpenAI] = None):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             # Try loading from .env
@@ -1306,8 +1673,101 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
                             os.environ["OPENAI_API_KEY"] = api_key
                             break
 
-        self.client = AsyncOpenAI(api_key=api_key)
+        # v11.11.0: общий клиент LLM gateway (пул соединений, лимиты на модель)
+        self.client = client or get_llm_gateway().client
         self.schema_extractor = get_schema_extractor()
+        self.llm_cache = get_llm_cache()
+        # v11.20.0: Валидированный код по отпечатку схемы (переживает изменение значений)
+        self.code_plans = get_code_plan_cache()
+        self.speculation_stats = SpeculationStats()
+        # v11.22.0: Пик/сумма памяти выполнения кода по запросам
+        self.execution_memory = ExecutionMemoryStats()
+        # v11.18.0: Локальные детекторы до SmartGPT (zero-LLM fast path)
+        self.local_dispatcher = LocalActionDispatcher(self)
+        # v11.19.0: Простые агрегации (сумма/среднее/... по колонке) - pandas без LLM
+        self.local_engine = LocalQueryEngine(self)
+        # v11.23.0: Опциональный движок "sql" - DuckDB вместо exec() pandas-кода
+        self.sql_engine = SQLQueryEngine(self)
+        # v11.28.0: VLOOKUP / merge_by_key - hash join по всем строкам без LLM
+        self.join_engine = KeyJoinEngine()
+        # v11.29.0: Прогнозы - пакетно по всем строкам, LLM выбирает только параметры
+        self.forecast_engine = ForecastEngine(self)
+
+    async def _chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        cache: Optional[bool] = None,
+        stream_stage: Optional[str] = None
+    ) -> str:
+        """
+        v11.9.0: Единая точка вызова chat.completions с кэшем ответов.
+
+        Args:
+            cache: True/False - явно включить/выключить кэш;
+                   None - кэшировать только детерминированные вызовы (LLM_CACHE_MAX_TEMPERATURE)
+            stream_stage: v11.13.0 - этап для событий "token"; при потоковом запросе
+                   ответ читается с stream=True и отдаётся клиенту по мере генерации
+
+        Returns:
+            Текст ответа (message.content)
+        """
+        streaming = stream_stage is not None and _progress.get() is not None
+        use_cache = self.llm_cache.should_cache(temperature, cache)
+        if use_cache:
+            cached = self.llm_cache.get(model, messages, temperature, max_tokens)
+            if cached is not None:
+                if streaming:
+                    emit_progress("token", stage=stream_stage, delta=cached)
+                return cached
+
+        if streaming:
+            content = await self._chat_stream(model, messages, temperature, max_tokens, stream_stage)
+        else:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content
+
+        if use_cache and content:
+            self.llm_cache.set(model, messages, temperature, max_tokens, content)
+        return content
+
+    async def _chat_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stage: str
+    ) -> str:
+        """v11.13.0: chat.completions с stream=True, каждый фрагмент - событие "token"."""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    emit_progress("token", stage=stage, delta=delta)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+        return "".join(parts)
 
     def _detect_sort_action(self, query: str, column_names: List[str]) -> Optional[Dict[str, Any]]:
         """
@@ -1317,15 +1777,15 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         query_lower = query.lower()
 
         # Проверяем наличие ключевых слов сортировки
-        is_sort_query = any(kw in query_lower for kw in self.SORT_KEYWORDS)
+        is_sort_query = "SORT_KEYWORDS" in self.query_keywords(query_lower)
         if not is_sort_query:
             return None
 
         logger.info(f"[SimpleGPT] Sort action detected: {query}")
 
         # Определяем порядок сортировки
-        is_descending = any(kw in query_lower for kw in self.SORT_DESC_KEYWORDS)
-        is_ascending = any(kw in query_lower for kw in self.SORT_ASC_KEYWORDS)
+        is_descending = "SORT_DESC_KEYWORDS" in self.query_keywords(query_lower)
+        is_ascending = "SORT_ASC_KEYWORDS" in self.query_keywords(query_lower)
 
         # По умолчанию - по возрастанию, если явно не указано убывание
         sort_order = "DESCENDING" if is_descending and not is_ascending else "ASCENDING"
@@ -1358,6 +1818,20 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
                 if sort_column:
                     break
 
+        # v11.18.0: Падежные формы ("по сумме" -> "Сумма", "по дате" -> "Дата заказа")
+        if not sort_column:
+            query_words = [w for w in re.findall(r'\w+', query_lower) if not w.startswith(('сортир', 'отсортир', 'упорядоч', 'sort'))]
+            for idx, col_name in enumerate(column_names):
+                for word in col_name.lower().split():
+                    stem = word[:-1]
+                    if len(word) > 3 and any(q.startswith(stem) for q in query_words):
+                        sort_column = col_name
+                        sort_column_index = idx
+                        logger.info(f"[SimpleGPT] Found sort column by stem: '{col_name}' at index {idx}")
+                        break
+                if sort_column:
+                    break
+
         if not sort_column:
             logger.warning(f"[SimpleGPT] Sort column not found in query. Available columns: {column_names}")
             return None
@@ -1366,6 +1840,8 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
             "action_type": "sort",
             "column_name": sort_column,
             "column_index": sort_column_index,
+            "sort_column": sort_column,  # v11.18.0: поля, которые читает frontend
+            "sort_column_index": sort_column_index,
             "sort_order": sort_order,
             "message": f"Сортировка по колонке '{sort_column}' ({('по убыванию' if sort_order == 'DESCENDING' else 'по возрастанию')})"
         }
@@ -1377,7 +1853,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         query_lower = query.lower()
 
         # Check for unfreeze first
-        is_unfreeze = any(kw in query_lower for kw in self.UNFREEZE_KEYWORDS)
+        is_unfreeze = "UNFREEZE_KEYWORDS" in self.query_keywords(query_lower)
         if is_unfreeze:
             logger.info(f"[SimpleGPT] Unfreeze action detected: {query}")
             return {
@@ -1388,7 +1864,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
             }
 
         # Check for freeze
-        is_freeze = any(kw in query_lower for kw in self.FREEZE_KEYWORDS)
+        is_freeze = "FREEZE_KEYWORDS" in self.query_keywords(query_lower)
         if not is_freeze:
             return None
 
@@ -1399,7 +1875,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         freeze_columns = 0
 
         # Check for row freeze
-        if any(word in query_lower for word in ['строк', 'строку', 'row', 'первую', 'шапку', 'заголов']):
+        if "FREEZE_ROWS_KEYWORDS" in self.query_keywords(query_lower):
             # Try to find number
             import re
             numbers = re.findall(r'(\d+)\s*(?:строк|строку|row)', query_lower)
@@ -1409,7 +1885,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
                 freeze_rows = 1  # Default to 1 row (header)
 
         # Check for column freeze
-        if any(word in query_lower for word in ['столб', 'колонк', 'column', 'первый столб', 'первую колонк']):
+        if "FREEZE_COLUMNS_KEYWORDS" in self.query_keywords(query_lower):
             import re
             numbers = re.findall(r'(\d+)\s*(?:столб|колонк|column)', query_lower)
             if numbers:
@@ -1441,8 +1917,8 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         query_lower = query.lower()
 
         # Check for bold formatting
-        is_bold = any(kw in query_lower for kw in self.FORMAT_BOLD_KEYWORDS)
-        is_header = any(kw in query_lower for kw in self.FORMAT_HEADER_KEYWORDS)
+        is_bold = "FORMAT_BOLD_KEYWORDS" in self.query_keywords(query_lower)
+        is_header = "FORMAT_HEADER_KEYWORDS" in self.query_keywords(query_lower)
 
         if not (is_bold or is_header):
             return None
@@ -1454,20 +1930,11 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
 
         # Check for color
         color = None
-        if any(kw in query_lower for kw in self.FORMAT_COLOR_KEYWORDS):
+        if "FORMAT_COLOR_KEYWORDS" in self.query_keywords(query_lower):
             # Try to detect color
-            color_map = {
-                'красн': '#FF0000', 'red': '#FF0000',
-                'синий': '#0000FF', 'blue': '#0000FF',
-                'зелен': '#00FF00', 'green': '#00FF00',
-                'желт': '#FFFF00', 'yellow': '#FFFF00',
-                'оранж': '#FFA500', 'orange': '#FFA500',
-                'серый': '#808080', 'сер': '#808080', 'gray': '#808080', 'grey': '#808080',
-            }
-            for color_word, color_code in color_map.items():
-                if color_word in query_lower:
-                    color = color_code
-                    break
+            color_word = self.query_keywords(query_lower).first(self.FORMAT_COLORS)
+            if color_word:
+                color = self.FORMAT_COLORS[color_word]
 
         return {
             "action_type": "format",
@@ -1483,21 +1950,15 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         Использует GPT для умного выбора колонок диаграммы на основе запроса пользователя.
         """
         # Analyze column types
+        profile = get_sheet_profile(df)
         column_info = []
         for idx, col in enumerate(column_names):
             if idx >= len(df.columns):
                 continue
             col_data = df.iloc[:, idx]
 
-            # Determine type
-            col_type = "text"
-            try:
-                numeric_data = pd.to_numeric(col_data, errors='coerce')
-                non_null_ratio = numeric_data.notna().sum() / len(numeric_data) if len(numeric_data) > 0 else 0
-                if non_null_ratio > 0.5:
-                    col_type = "number"
-            except:
-                pass
+            # Determine type (v11.21.0: доля чисел из SheetProfile)
+            col_type = "number" if profile.is_numeric(idx) else "text"
 
             # Check for date
             col_lower = col.lower()
@@ -1514,7 +1975,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         unique_counts = {}
         for idx, col in enumerate(column_names):
             if idx < len(df.columns):
-                unique_count = df.iloc[:, idx].nunique()
+                unique_count = profile.unique_count(idx)
                 total_count = len(df)
                 unique_counts[col] = f"{unique_count} уникальных из {total_count}"
 
@@ -1565,14 +2026,14 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
 - title должен отражать запрос"""
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self._chat(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0,
                 max_tokens=200
             )
 
-            result_text = response.choices[0].message.content.strip()
+            result_text = content.strip()
             # Extract JSON from response
             import json
             if "```" in result_text:
@@ -1587,6 +2048,95 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
             logger.error(f"[SimpleGPT] GPT chart selection failed: {e}")
             return None
 
+    @staticmethod
+    def _reference_schema_lines(reference_df: pd.DataFrame) -> str:
+        """
+        v11.28.0: Схема справочного листа для VLOOKUP: тип и число уникальных
+        значений колонки (по ним LLM выбирает key_column/value_column).
+        """
+        lines = []
+        for col in reference_df.columns:
+            series = reference_df[col]
+            if series.ndim != 1:
+                continue
+            kind = "число" if pd.api.types.is_numeric_dtype(series) else "текст"
+            lines.append(f"- {col}: {kind}, уникальных {series.nunique(dropna=True)}")
+        return "\n".join(lines)
+
+    def _apply_reference_join(
+        self,
+        smart_result: Dict[str, Any],
+        df: pd.DataFrame,
+        reference_df: pd.DataFrame,
+        reference_sheet_name: Optional[str],
+        query: str
+    ) -> Dict[str, Any]:
+        """
+        v11.28.0: action_type=vlookup -> write_data + merge_by_key, посчитанные
+        локально по всем строкам (KeyJoinEngine). Колонки - из ответа LLM, при их
+        отсутствии - детектор. Если join не удался, ответ остаётся прежним
+        (фронтенд сделает поиск сам).
+        """
+        try:
+            joined = self.join_engine.lookup(
+                df, reference_df,
+                key_column=smart_result.get("key_column"),
+                value_columns=smart_result.get("value_columns") or smart_result.get("value_column"),
+                query=query
+            )
+        except JoinError as e:
+            logger.warning(f"[SmartGPT] VLOOKUP join skipped: {e}")
+            return smart_result
+        action = joined.to_action(reference_sheet_name)
+        action["write_data"] = format_data_for_sheets(action["write_data"])
+        return {**smart_result, **action}
+
+    def _align_write_data(self, response: Dict[str, Any], df: pd.DataFrame) -> None:
+        """
+        v11.28.0: Строки write_data с merge_by_key (прогноз) - по ключам листа:
+        нормализованное сравнение ключей вместо trim+lower на фронтенде.
+        Без совпадений строки не трогаем.
+        """
+        try:
+            joined = self.join_engine.merge_rows(
+                df, response["merge_by_key"], response.get("write_headers") or [], response.get("write_data") or []
+            )
+        except JoinError as e:
+            logger.warning(f"[SimpleGPT] merge_by_key alignment skipped: {e}")
+            return
+        if joined.matched:
+            action = joined.to_action()
+            for field in ("merge_by_key", "write_headers", "join_stats"):
+                response[field] = action[field]
+            response["write_data"] = format_data_for_sheets(joined.rows)
+
+    def _format_history_section(self, history: Optional[List[Dict[str, Any]]], budget: PromptBudget) -> str:
+        """
+        v11.15.0: Секция истории диалога в пределах бюджета "history".
+        Приоритет у последних сообщений: старые отбрасываются первыми.
+        """
+        if not history:
+            budget.skip("history")
+            return ""
+
+        entries = []
+        for item in history[-self.HISTORY_ITEMS:]:
+            q = item.get('query', '')
+            r = item.get('response', item.get('summary', item.get('answer', '')))
+            if isinstance(r, dict):
+                r = r.get('summary', r.get('explanation', str(r)[:self.HISTORY_ANSWER_CHARS]))
+            # Longer limit for history to capture full analysis results (tables, lists)
+            entries.append((q, str(r)[:self.HISTORY_ANSWER_CHARS]))
+
+        def render(newest_first) -> str:
+            text = "\n=== ИСТОРИЯ ДИАЛОГА ===\n"
+            for i, (q, r) in enumerate(reversed(newest_first), 1):
+                text += f"{i}. Вопрос: {q}\n   Ответ: {r}\n"
+            return text + "=== КОНЕЦ ИСТОРИИ ===\n\n"
+
+        kept, _ = budget.fit_items("history", entries[::-1], render)
+        return render(kept) if kept else ""
+
     async def _gpt_smart_action(self, query: str, column_names: List[str], df: pd.DataFrame, history: List[Dict[str, Any]] = None, custom_context: Optional[str] = None, reference_df: pd.DataFrame = None, reference_sheet_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         УМНЫЙ GPT-обработчик. GPT сама понимает запрос, анализирует данные и формирует готовый ответ.
@@ -1620,86 +2170,47 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
         # "а на Ozon?" with history "Сколько товаров на WB?" -> "Сколько товаров на Ozon?"
         query = self._rewrite_followup_query(query, history)
 
-        # Prepare history context
-        history_text = ""
-        if history and len(history) > 0:
-            history_text = "\n=== ИСТОРИЯ ДИАЛОГА ===\n"
-            for i, item in enumerate(history[-5:], 1):
-                q = item.get('query', '')
-                r = item.get('response', item.get('summary', item.get('answer', '')))
-                if isinstance(r, dict):
-                    r = r.get('summary', r.get('explanation', str(r)[:1500]))
-                # Longer limit for history to capture full analysis results (tables, lists)
-                history_text += f"{i}. Вопрос: {q}\n   Ответ: {str(r)[:1500]}\n"
-            history_text += "=== КОНЕЦ ИСТОРИИ ===\n\n"
+        # v11.15.0: Секции данных собираются в бюджет токенов (PROMPT_DATA_TOKEN_BUDGET).
+        # Порядок заполнения: role -> history -> reference -> schema -> table -> json_rows,
+        # неиспользованный бюджет секции переходит в следующие.
+        budget = PromptBudget.from_settings()
 
         # Add personalization context
         context_text = ""
-        if custom_context:
+        role_text = budget.fit_text("role", custom_context)
+        if role_text:
             context_text = f"""
 === РОЛЬ ПОЛЬЗОВАТЕЛЯ ===
-{custom_context}
+{role_text}
 ВАЖНО: Учитывай роль пользователя при формулировании ответов и выборе действий!
 === КОНЕЦ РОЛИ ===
 
 """
 
-        # ===========================================================================
-        # v11.0.0: ГИБРИДНАЯ ЛОГИКА - определяем режим данных
-        # ===========================================================================
-        data_mode = self.determine_data_mode(query, len(df))
-        logger.info(f"[SmartGPT] 📊 Data mode: {data_mode} for query: {query[:50]}... ({len(df)} rows)")
-
-        # Формируем ASCII-таблицу с координатами (как в Google Sheets)
-        ascii_table = self.format_ascii_table(df, column_names, data_mode)
-
-        # Дополнительно готовим JSON для highlight (нужны точные номера строк)
-        data_rows = []
-        rows_for_json = df.head(self.MAX_FULL_ROWS) if data_mode == 'full' else df.head(self.MAX_SAMPLE_ROWS)
-        for idx, row in rows_for_json.iterrows():
-            row_data = {f"col_{i}_{column_names[i]}": str(v) for i, v in enumerate(row) if i < len(column_names)}
-            row_data["_row_number"] = idx + 2  # +2 for 1-indexing and header
-            data_rows.append(row_data)
-
-        # Column info с типами
-        col_info = []
-        for idx, col in enumerate(column_names):
-            if idx < len(df.columns):
-                col_data = df.iloc[:, idx]
-                try:
-                    numeric = pd.to_numeric(col_data, errors='coerce')
-                    if numeric.notna().sum() / len(numeric) > 0.5:
-                        col_info.append(f"{idx}. '{col}' (числовая, min={numeric.min():.1f}, max={numeric.max():.1f}, sum={numeric.sum():.1f})")
-                    else:
-                        samples = col_data.dropna().head(3).tolist()
-                        unique_count = col_data.nunique()
-                        col_info.append(f"{idx}. '{col}' (текст, {unique_count} уник.): {samples}")
-                except:
-                    col_info.append(f"{idx}. '{col}'")
-
-        # Для full режима показываем JSON только при highlight запросах
-        is_highlight_request = any(kw in query.lower() for kw in ['выдели', 'выделить', 'подсвети', 'highlight'])
-        data_json_section = ""
-        if data_mode == 'full' and is_highlight_request:
-            # Для highlight нужен JSON с номерами строк
-            data_json_section = f"\n\nJSON (для highlight, с _row_number):\n{json.dumps(data_rows[:100], ensure_ascii=False)}"
+        # Prepare history context
+        history_text = self._format_history_section(history, budget)
 
         # v10.0.9: Add reference sheet info if provided (for VLOOKUP/cross-sheet operations)
         reference_sheet_section = ""
         if reference_df is not None and reference_sheet_name:
             ref_cols = list(reference_df.columns)
-            # v10.1.3: Show more rows for VLOOKUP - up to 50 rows to cover most use cases
-            ref_rows_sample = reference_df.head(50).to_string()
-            logger.info(f"[SmartGPT] 🔗 VLOOKUP MODE - reference_df: {reference_sheet_name}, {len(reference_df)} rows, cols: {ref_cols}")
+            # v11.28.0: Справочник в промпте - схема и несколько строк; поиск по всем
+            # строкам делает KeyJoinEngine, так что размер листа не влияет на латентность
+            ref_schema = self._reference_schema_lines(reference_df)
+            ref_lines = reference_df.head(int(settings.JOIN_REFERENCE_SAMPLE_ROWS)).to_string().split("\n")
+            ref_rows_sample, ref_shown = budget.fit_lines("reference", ref_lines[1:], header=ref_lines[0], reserve=250)
+            logger.info(f"[SmartGPT] 🔗 VLOOKUP MODE - reference_df: {reference_sheet_name}, {len(reference_df)} rows ({ref_shown} in prompt), cols: {ref_cols}")
             reference_sheet_section = f"""
 
 ⚠️⚠️⚠️ ВАЖНО: CROSS-SHEET VLOOKUP ⚠️⚠️⚠️
 Пользователь просит подтянуть данные из листа "{reference_sheet_name}".
-Данные этого листа ЗАГРУЖЕНЫ и доступны ниже!
+Данные этого листа ЗАГРУЖЕНЫ целиком - сервер сопоставит ВСЕ строки по ключу!
 
 ДОПОЛНИТЕЛЬНЫЙ ЛИСТ "{reference_sheet_name}" ({len(reference_df)} строк):
 Колонки: {ref_cols}
-Пример данных:
+Схема:
+{ref_schema}
+Пример данных (первые {ref_shown} строк):
 {ref_rows_sample}
 
 🔴 НЕ ГОВОРИ "нет данных" - данные ЕСТЬ выше!
@@ -1713,10 +2224,66 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
 
 🔴 ОБЯЗАТЕЛЬНО указывай value_column - название колонки из справочного листа!
 """
+        else:
+            budget.skip("reference")
+
+        # ===========================================================================
+        # v11.0.0: ГИБРИДНАЯ ЛОГИКА - определяем режим данных
+        # ===========================================================================
+        data_mode = self.determine_data_mode(query, len(df))
+        logger.info(f"[SmartGPT] 📊 Data mode: {data_mode} for query: {query[:50]}... ({len(df)} rows)")
+
+        # Column info с типами
+        # v11.16.0: для больших листов - квантили чисел и частые значения текста (скетчи)
+        sketches = get_sheet_sketch(df, self.MAX_SAMPLE_ROWS).columns if len(df) > SKETCH_MIN_ROWS else {}
+        # v11.21.0: числа и уникальные значения - из SheetProfile (колонки уже разобраны при загрузке)
+        profile = get_sheet_profile(df)
+        col_info = []
+        for idx, col in enumerate(column_names):
+            if idx < len(df.columns):
+                col_data = df.iloc[:, idx]
+                sketch = sketches.get(str(df.columns[idx]))
+                try:
+                    if profile.is_numeric(idx):
+                        numeric = profile.numeric(idx)
+                        line = f"{idx}. '{col}' (числовая, min={numeric.min():.1f}, max={numeric.max():.1f}, sum={numeric.sum():.1f})"
+                        if sketch is not None and sketch.kind == "numeric":
+                            line += f" [{sketch.describe()}]"
+                        col_info.append(line)
+                    elif sketch is not None and sketch.kind == "categorical":
+                        col_info.append(f"{idx}. '{col}' (текст, {sketch.describe()})")
+                    else:
+                        samples = col_data.dropna().head(3).tolist()
+                        unique_count = profile.unique_count(idx)
+                        col_info.append(f"{idx}. '{col}' (текст, {unique_count} уник.): {samples}")
+                except:
+                    col_info.append(f"{idx}. '{col}'")
+        schema_text, _ = budget.fit_lines("schema", col_info)
+
+        # Формируем ASCII-таблицу с координатами (как в Google Sheets)
+        ascii_table = self.format_ascii_table(df, column_names, data_mode, budget=budget)
+
+        # Для full режима показываем JSON только при highlight запросах
+        is_highlight_request = "SMART_HIGHLIGHT_KEYWORDS" in self.query_keywords(query.lower())
+        data_json_section = ""
+        if data_mode == 'full' and is_highlight_request:
+            # Для highlight нужен JSON с номерами строк
+            data_rows = []
+            for idx, row in df.head(self.JSON_ROWS_LIMIT).iterrows():
+                row_data = {f"col_{i}_{column_names[i]}": str(v) for i, v in enumerate(row) if i < len(column_names)}
+                row_data["_row_number"] = idx + 2  # +2 for 1-indexing and header
+                data_rows.append(row_data)
+            json_rows, _ = budget.fit_items(
+                "json_rows", data_rows, lambda rows: json.dumps(rows, ensure_ascii=False)
+            )
+            if json_rows:
+                data_json_section = f"\n\nJSON (для highlight, с _row_number):\n{json.dumps(json_rows, ensure_ascii=False)}"
+        else:
+            budget.skip("json_rows")
 
         # v10.2.4: Detect forecast query and add CRITICAL instruction
         forecast_critical = ""
-        if any(kw in query.lower() for kw in ['прогноз', 'спрогнозир', 'forecast', 'предсказ']):
+        if "FORECAST_KEYWORDS" in self.query_keywords(query.lower()):
             forecast_critical = """
 🚨🚨🚨 КРИТИЧЕСКАЯ ИНСТРУКЦИЯ ДЛЯ ПРОГНОЗА 🚨🚨🚨
 
@@ -1758,7 +2325,7 @@ explanation += "- Строка 17: Пауэрбанк, кол-во = -2\n"
 РЕЖИМ ДАННЫХ: {data_mode.upper()} {'(все данные доступны - можешь использовать highlight)' if data_mode == 'full' else '[X] SAMPLE - ЗАПРЕЩЕНО: highlight! Для поиска/фильтрации -> ТОЛЬКО analysis!'}
 
 КОЛОНКИ ({len(column_names)}):
-{chr(10).join(col_info)}
+{schema_text}
 
 ТАБЛИЦА (формат Google Sheets с координатами A1, B1...):
 ```
@@ -2094,15 +2661,22 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
 Думай вслух в <thinking>, потом действуй в <response>."""
 
+        # v11.15.0: Токены по секциям - для каждого запроса
+        budget.log(logger, "SmartGPT")
+        logger.info(f"[SmartGPT] Prompt ~{estimate_tokens(prompt)} tokens ({len(prompt)} chars)")
+
         try:
-            response = await self.client.chat.completions.create(
+            # v11.9.0: Cached explicitly - same query + same sheet -> same action
+            content = await self._chat(
                 model="gpt-4o",  # Use full GPT-4o for smart analysis
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.1,  # Slight temperature for more natural thinking
-                max_tokens=1500   # More tokens for thinking + response
+                max_tokens=1500,  # More tokens for thinking + response
+                cache=True,
+                stream_stage="smart"
             )
 
-            full_response = response.choices[0].message.content.strip()
+            full_response = content.strip()
             logger.info(f"[SmartGPT] Full response: {full_response[:800]}")
 
             # Parse <thinking> block (for logging/debugging)
@@ -2131,9 +2705,8 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             # v11.1.2: OVERRIDE - highlight for search/filter queries should ALWAYS use Python
             # GPT makes mistakes when visually parsing large tables for filtering
             if result.get("action_type") == "highlight":
-                search_keywords = ['найди', 'найти', 'поиск', 'где', 'какие', 'какой', 'какая', 'который', 'которые']
                 query_lower = query.lower()
-                is_search_query = any(kw in query_lower for kw in search_keywords)
+                is_search_query = "SEARCH_KEYWORDS" in self.query_keywords(query_lower)
 
                 if data_mode == "sample":
                     logger.warning(f"[SmartGPT] [\!] OVERRIDE: highlight forbidden in SAMPLE mode! Switching to Python analysis")
@@ -2145,18 +2718,14 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             # v11.3: OVERRIDE - ALWAYS use chart_pending for chart queries
             # This ensures _finalize_chart_action is called for proper row filtering and data transposition
             # SmartGPT's direct chart response doesn't support row_filter/aggregated_data
-            chart_keywords = ['диаграмм', 'график', 'chart', 'гистограмм', 'круговая', 'круговую', 'круговой', 'кругов', 'pie']
             query_lower = query.lower()
-            is_chart_query = any(kw in query_lower for kw in chart_keywords)
+            is_chart_query = "CHART_OVERRIDE_KEYWORDS" in self.query_keywords(query_lower)
 
             if is_chart_query:
                 logger.warning(f"[SmartGPT] [\!] OVERRIDE: chart query detected (action_type={result.get('action_type')}), forcing chart_pending for proper filtering")
                 # Determine chart type from query
-                chart_type = 'COLUMN'  # Default
-                for type_keyword, type_value in self.CHART_TYPES.items():
-                    if type_keyword in query_lower:
-                        chart_type = type_value
-                        break
+                type_keyword = self.query_keywords(query_lower).first(self.CHART_TYPES)
+                chart_type = self.CHART_TYPES[type_keyword] if type_keyword else 'COLUMN'  # Default
                 return {
                     "action_type": "chart_pending",
                     "chart_type": chart_type,
@@ -2203,7 +2772,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for chart keywords
-        is_chart_query = any(kw in query_lower for kw in self.CHART_KEYWORDS)
+        is_chart_query = "CHART_KEYWORDS" in self.query_keywords(query_lower)
         if not is_chart_query:
             return None
 
@@ -2211,11 +2780,10 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
         # Determine chart type
         chart_type = 'COLUMN'  # Default
-        for type_keyword, type_value in self.CHART_TYPES.items():
-            if type_keyword in query_lower:
-                chart_type = type_value
-                logger.info(f"[SimpleGPT] Chart type detected: {type_value}")
-                break
+        type_keyword = self.query_keywords(query_lower).first(self.CHART_TYPES)
+        if type_keyword:
+            chart_type = self.CHART_TYPES[type_keyword]
+            logger.info(f"[SimpleGPT] Chart type detected: {chart_type}")
 
         # Mark that we need GPT selection (will be done in async process method)
         return {
@@ -2256,7 +2824,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                     if y_idx < len(df.columns):
                         col_name = column_names[y_idx]
                         try:
-                            col_sum = pd.to_numeric(df.iloc[:, y_idx], errors='coerce').sum()
+                            col_sum = get_sheet_profile(df).numeric(y_idx).sum()
                             rows.append([col_name, round(float(col_sum), 2)])
                         except Exception as e:
                             logger.error(f"[SimpleGPT] Error summing column {col_name}: {e}")
@@ -2347,7 +2915,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                     if y_idx < len(df.columns):
                         y_col = df.columns[y_idx]
                         # Convert to numeric
-                        agg_df[y_col] = pd.to_numeric(agg_df.iloc[:, y_idx], errors='coerce')
+                        agg_df[y_col] = get_sheet_profile(df).numeric(y_idx)
                         if aggregation == "mean":
                             agg_dict[y_col] = 'mean'
                         elif aggregation == "count":
@@ -2433,7 +3001,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for conditional format keywords
-        is_conditional = any(kw in query_lower for kw in self.CONDITIONAL_FORMAT_KEYWORDS)
+        is_conditional = "CONDITIONAL_FORMAT_KEYWORDS" in self.query_keywords(query_lower)
         if not is_conditional:
             return None
 
@@ -2442,11 +3010,10 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         # Detect color
         format_color = {'red': 1, 'green': 1, 'blue': 0.7}  # Default yellow
         color_name = "жёлтый"
-        for color_kw, color_value in self.CONDITION_COLORS.items():
-            if color_kw in query_lower:
-                format_color = color_value
-                color_name = color_kw
-                break
+        color_kw = self.query_keywords(query_lower).first(self.CONDITION_COLORS)
+        if color_kw:
+            format_color = self.CONDITION_COLORS[color_kw]
+            color_name = color_kw
 
         # Find column mentioned in query - exact word match first
         target_column = None
@@ -2520,8 +3087,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             for idx, col_name in enumerate(column_names):
                 if idx < len(df.columns):
                     try:
-                        numeric_data = pd.to_numeric(df.iloc[:, idx], errors='coerce')
-                        if numeric_data.notna().sum() / len(numeric_data) > 0.5:
+                        if get_sheet_profile(df).is_numeric(idx):
                             target_column = col_name
                             target_column_index = idx
                             break
@@ -2554,22 +3120,22 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             condition_value = float(equal_match.group(1).replace(',', '.'))
 
         # "пусто" / "пустые"
-        if any(w in query_lower for w in ['пуст', 'empty', 'blank', 'нет данных']):
+        if "CONDITION_BLANK_KEYWORDS" in self.query_keywords(query_lower):
             condition_type = "BLANK"
             condition_value = None
 
         # "не пусто" / "заполнено"
-        if any(w in query_lower for w in ['не пуст', 'not empty', 'заполнен', 'есть данные']):
+        if "CONDITION_NOT_BLANK_KEYWORDS" in self.query_keywords(query_lower):
             condition_type = "NOT_BLANK"
             condition_value = None
 
         # "отрицательн" / "убыток"
-        if any(w in query_lower for w in ['отрицательн', 'убыт', 'negative', 'минус']):
+        if "CONDITION_NEGATIVE_KEYWORDS" in self.query_keywords(query_lower):
             condition_type = "NUMBER_LESS"
             condition_value = 0
 
         # "положительн" / "прибыль"
-        if any(w in query_lower for w in ['положительн', 'прибыл', 'positive', 'плюс']):
+        if "CONDITION_POSITIVE_KEYWORDS" in self.query_keywords(query_lower):
             condition_type = "NUMBER_GREATER"
             condition_value = 0
 
@@ -2614,7 +3180,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for pivot keywords
-        is_pivot = any(kw in query_lower for kw in self.PIVOT_KEYWORDS)
+        is_pivot = "PIVOT_KEYWORDS" in self.query_keywords(query_lower)
         if not is_pivot:
             return None
 
@@ -2623,6 +3189,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         # Analyze columns
         numeric_cols = []
         categorical_cols = []
+        profile = get_sheet_profile(df)
 
         for idx, col_name in enumerate(column_names):
             if idx >= len(df.columns):
@@ -2631,16 +3198,14 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
             # Check if numeric
             try:
-                numeric_data = pd.to_numeric(col_data, errors='coerce')
-                non_null_ratio = numeric_data.notna().sum() / len(numeric_data) if len(numeric_data) > 0 else 0
-                if non_null_ratio > 0.5:
+                if profile.is_numeric(idx):
                     numeric_cols.append({'name': col_name, 'index': idx})
                     continue
             except:
                 pass
 
             # Otherwise categorical
-            unique_count = col_data.nunique()
+            unique_count = profile.unique_count(idx)
             if unique_count <= len(col_data) * 0.7:  # Up to 70% unique = categorical
                 categorical_cols.append({'name': col_name, 'index': idx})
 
@@ -2693,7 +3258,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         # If not found, try synonyms (e.g., "продажи" -> "Сумма")
         if not value_column:
             for query_term, synonyms in self.VALUE_COLUMN_SYNONYMS.items():
-                if query_term in query_lower:
+                if query_term in self.query_keywords(query_lower).keywords:
                     # Found a business term in query, look for matching column
                     for num in numeric_cols:
                         num_lower = num['name'].lower()
@@ -2720,11 +3285,8 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 value_column = numeric_cols[0]
 
         # Detect aggregation function
-        agg_func = 'sum'  # Default
-        for kw, func in self.AGG_FUNCTIONS.items():
-            if kw in query_lower:
-                agg_func = func
-                break
+        agg_kw = self.query_keywords(query_lower).first(self.AGG_FUNCTIONS)
+        agg_func = self.AGG_FUNCTIONS[agg_kw] if agg_kw else 'sum'  # Default
 
         if not group_column or not value_column:
             logger.warning(f"[SimpleGPT] Cannot create pivot: group_column={group_column}, value_column={value_column}")
@@ -2788,7 +3350,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
         
         # Check for CSV split keywords
-        is_csv_split = any(kw in query_lower for kw in self.CSV_SPLIT_KEYWORDS)
+        is_csv_split = "CSV_SPLIT_KEYWORDS" in self.query_keywords(query_lower)
         if not is_csv_split:
             return None
         
@@ -2892,7 +3454,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for clean keywords
-        is_clean = any(kw in query_lower for kw in self.CLEAN_KEYWORDS)
+        is_clean = "CLEAN_KEYWORDS" in self.query_keywords(query_lower)
         if not is_clean:
             return None
 
@@ -2902,27 +3464,27 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         operations = []
 
         # Check for duplicate removal
-        if any(kw in query_lower for kw in self.CLEAN_OPERATIONS['duplicate']):
+        if "CLEAN_OPERATIONS.duplicate" in self.query_keywords(query_lower):
             operations.append('remove_duplicates')
 
         # Check for empty row removal
-        if any(kw in query_lower for kw in self.CLEAN_OPERATIONS['empty_rows']):
+        if "CLEAN_OPERATIONS.empty_rows" in self.query_keywords(query_lower):
             # Distinguish between "удали пустые" vs "заполни пустые"
-            if any(w in query_lower for w in ['удали', 'убери', 'remove', 'delete']):
+            if "CLEAN_REMOVE_KEYWORDS" in self.query_keywords(query_lower):
                 operations.append('remove_empty_rows')
-            elif any(w in query_lower for w in ['заполн', 'fill', 'замен']):
+            elif "CLEAN_FILL_KEYWORDS" in self.query_keywords(query_lower):
                 operations.append('fill_empty')
 
         # Check for trimming whitespace
-        if any(kw in query_lower for kw in self.CLEAN_OPERATIONS['trim']):
+        if "CLEAN_OPERATIONS.trim" in self.query_keywords(query_lower):
             operations.append('trim_whitespace')
 
         # Check for fill operation (if not already detected)
-        if 'fill_empty' not in operations and any(kw in query_lower for kw in self.CLEAN_OPERATIONS['fill']):
+        if 'fill_empty' not in operations and "CLEAN_OPERATIONS.fill" in self.query_keywords(query_lower):
             operations.append('fill_empty')
 
         # Default to all common operations if just "очисти данные"
-        if not operations and any(w in query_lower for w in ['очисти', 'clean']):
+        if not operations and "CLEAN_ALL_KEYWORDS" in self.query_keywords(query_lower):
             operations = ['remove_duplicates', 'remove_empty_rows', 'trim_whitespace']
 
         if not operations:
@@ -2934,21 +3496,12 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             # Check for specific fill values
             import re
 
-            # "нулями" / "0" / "zeros"
-            if any(w in query_lower for w in ['нул', 'zero', '0']):
-                fill_value = 0
-            # "пустой строкой" / ""
-            elif any(w in query_lower for w in ['строк', 'string', 'текст']):
-                fill_value = ""
-            # "средним" / "mean" / "average"
-            elif any(w in query_lower for w in ['средн', 'mean', 'average', 'avg']):
-                fill_value = "mean"
-            # "медианой" / "median"
-            elif any(w in query_lower for w in ['медиан', 'median']):
-                fill_value = "median"
-            # "предыдущим" / "forward fill"
-            elif any(w in query_lower for w in ['предыдущ', 'forward', 'ffill', 'последн']):
-                fill_value = "ffill"
+            # "нулями" / "пустой строкой" / "средним" / "медианой" / "предыдущим"
+            keywords = self.query_keywords(query_lower)
+            for hint, value in self.FILL_VALUES.items():
+                if f"FILL_VALUE_HINTS.{hint}" in keywords:
+                    fill_value = value
+                    break
             # Specific number
             number_match = re.search(r'(\d+(?:[.,]\d+)?)', query_lower)
             if number_match and fill_value is None:
@@ -3087,7 +3640,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for validation keywords
-        is_validation = any(kw in query_lower for kw in self.VALIDATION_KEYWORDS)
+        is_validation = "VALIDATION_KEYWORDS" in self.query_keywords(query_lower)
         if not is_validation:
             return None
 
@@ -3154,7 +3707,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             for idx, col_name in enumerate(column_names):
                 if idx < len(df.columns):
                     try:
-                        unique_count = df.iloc[:, idx].nunique()
+                        unique_count = get_sheet_profile(df).unique_count(idx)
                         total_count = len(df)
                         # Categorical if less than 50% unique values and <= 20 unique
                         if unique_count <= 20 and unique_count < total_count * 0.5:
@@ -3210,7 +3763,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for highlight keywords FIRST
-        is_highlight = any(kw in query_lower for kw in self.HIGHLIGHT_KEYWORDS)
+        is_highlight = "HIGHLIGHT_KEYWORDS" in self.query_keywords(query_lower)
         if not is_highlight:
             return None
 
@@ -3218,19 +3771,18 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
         # Detect color from query - first check explicit colors
         highlight_color = None
-        for color_key, color_hex in self.HIGHLIGHT_COLORS.items():
-            if color_key in query_lower:
-                highlight_color = color_hex
-                logger.info(f"[SimpleGPT] Highlight color (explicit): {color_key} -> {color_hex}")
-                break
+        keywords = self.query_keywords(query_lower)
+        color_key = keywords.first(self.HIGHLIGHT_COLORS)
+        if color_key:
+            highlight_color = self.HIGHLIGHT_COLORS[color_key]
+            logger.info(f"[SimpleGPT] Highlight color (explicit): {color_key} -> {highlight_color}")
 
         # If no explicit color, try to detect by context (status words)
         if not highlight_color:
-            for context_key, color_hex in self.CONTEXT_COLORS.items():
-                if context_key in query_lower:
-                    highlight_color = color_hex
-                    logger.info(f"[SimpleGPT] Highlight color (context): {context_key} -> {color_hex}")
-                    break
+            context_key = keywords.first(self.CONTEXT_COLORS)
+            if context_key:
+                highlight_color = self.CONTEXT_COLORS[context_key]
+                logger.info(f"[SimpleGPT] Highlight color (context): {context_key} -> {highlight_color}")
 
         # Default to yellow if nothing matched
         if not highlight_color:
@@ -3260,13 +3812,12 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 break
 
         # Detect operator
-        for op, patterns in self.FILTER_OPERATORS.items():
-            for pattern in patterns:
-                if pattern in query_lower:
-                    operator = op
+        keywords = self.query_keywords(query_lower)
+        for op in self.FILTER_OPERATORS:
+            if f"FILTER_OPERATORS.{op}" in keywords:
+                operator = op
+                if operator != '==':
                     break
-            if operator != '==':
-                break
 
         # Extract value
         import re
@@ -3277,13 +3828,10 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 filter_value = float(number_match.group(1).replace(',', '.'))
             else:
                 # Try to find text value (e.g., status names)
-                status_words = ['оплачен', 'отменен', 'отменён', 'доставлен', 'возврат', 'активн',
-                                'неактивн', 'завершен', 'завершён', 'выполнен', 'ожидан', 'vip']
-                for status in status_words:
-                    if status in query_lower:
-                        filter_value = status
-                        operator = 'contains'
-                        break
+                status = self.query_keywords(query_lower).first(self.STATUS_VALUE_KEYWORDS)
+                if status:
+                    filter_value = status
+                    operator = 'contains'
 
         # Execute filter to find rows
         try:
@@ -3384,7 +3932,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for filter keywords
-        is_filter = any(kw in query_lower for kw in self.FILTER_KEYWORDS)
+        is_filter = "FILTER_KEYWORDS" in self.query_keywords(query_lower)
         if not is_filter:
             return None
 
@@ -3419,13 +3967,12 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         filter_value = None
 
         # Check operators in order of specificity (longer patterns first)
-        for op, patterns in self.FILTER_OPERATORS.items():
-            for pattern in patterns:
-                if pattern in query_lower:
-                    operator = op
+        keywords = self.query_keywords(query_lower)
+        for op in self.FILTER_OPERATORS:
+            if f"FILTER_OPERATORS.{op}" in keywords:
+                operator = op
+                if operator != '==':
                     break
-            if operator != '==':
-                break
 
         # Extract value based on operator
         if operator in ['empty', 'not_empty']:
@@ -3562,7 +4109,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for convert to numbers keywords
-        is_convert = any(kw in query_lower for kw in self.CONVERT_TO_NUMBERS_KEYWORDS)
+        is_convert = "CONVERT_TO_NUMBERS_KEYWORDS" in self.query_keywords(query_lower)
         if not is_convert:
             return None
 
@@ -3627,7 +4174,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         query_lower = query.lower()
 
         # Check for color scale keywords
-        is_color_scale = any(kw in query_lower for kw in self.COLOR_SCALE_KEYWORDS)
+        is_color_scale = "COLOR_SCALE_KEYWORDS" in self.query_keywords(query_lower)
         if not is_color_scale:
             return None
 
@@ -3706,8 +4253,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
             for idx, col_name in enumerate(column_names):
                 if idx < len(df.columns):
                     try:
-                        numeric_data = pd.to_numeric(df.iloc[:, idx], errors='coerce')
-                        if numeric_data.notna().sum() / len(numeric_data) > 0.5:
+                        if get_sheet_profile(df).is_numeric(idx):
                             target_column = col_name
                             target_column_index = idx
                             logger.info(f"[SimpleGPT] Auto-selected numeric column for color scale: {col_name}")
@@ -3723,19 +4269,19 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         preset_name = 'green_yellow_red'  # Default: low=green, high=red (good for costs, expenses)
 
         # "высокой ценой зеленым" / "наоборот" / "прибыль" = high values should be green
-        if any(kw in query_lower for kw in ['к зелёному', 'к зеленому', 'to green', 'прибыл', 'доход',
-                                             'высок', 'наоборот', 'инвертир', 'большой зелен', 'больше зелен']):
+        keywords = self.query_keywords(query_lower)
+        if "COLOR_SCALE_INVERT_KEYWORDS" in keywords:
             preset_name = 'red_yellow_green'  # low=red, high=green (good for profits, revenue)
-        elif any(kw in query_lower for kw in ['синий', 'blue', 'голуб']):
+        elif "COLOR_SCALE_BLUE_KEYWORDS" in keywords:
             preset_name = 'white_to_blue'
-        elif any(kw in query_lower for kw in ['зелён', 'зелен', 'green']) and 'красн' not in query_lower:
+        elif "COLOR_SCALE_GREEN_KEYWORDS" in keywords and "COLOR_SCALE_RED_KEYWORDS" not in keywords:
             preset_name = 'white_to_green'
 
         preset = self.COLOR_SCALE_PRESETS[preset_name]
 
         # Get column stats for the gradient
         try:
-            col_data = pd.to_numeric(df.iloc[:, target_column_index], errors='coerce')
+            col_data = get_sheet_profile(df).numeric(target_column_index)
             min_val = float(col_data.min())
             max_val = float(col_data.max())
             mid_val = float(col_data.median())
@@ -3769,11 +4315,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
     def _is_analysis_query(self, query: str) -> bool:
         """Detect if query requires deep analysis mode."""
-        query_lower = query.lower()
-        for keyword in self.DEEP_ANALYSIS_KEYWORDS:
-            if keyword in query_lower:
-                return True
-        return False
+        return "DEEP_ANALYSIS_KEYWORDS" in self.query_keywords(query.lower())
 
     def _rewrite_followup_query(self, query: str, history: List[Dict[str, Any]] = None) -> str:
         """
@@ -3860,11 +4402,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 return True
 
         # Check conversational keywords
-        for keyword in self.CONVERSATIONAL_KEYWORDS:
-            if keyword in query_lower:
-                return True
-
-        return False
+        return "CONVERSATIONAL_KEYWORDS" in self.query_keywords(query_lower)
 
     async def _handle_conversational(
         self,
@@ -3892,7 +4430,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         prompt += f"\n\nКОНТЕКСТ ДАННЫХ:\n{schema_prompt[:1000]}"
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self._chat(
                 model=self.MODEL,
                 messages=[
                     {"role": "system", "content": "Ты умный аналитик данных. Отвечай развёрнуто и понятно на вопросы пользователя."},
@@ -3902,7 +4440,7 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 max_tokens=800
             )
 
-            answer = response.choices[0].message.content.strip()
+            answer = content.strip()
 
             return {
                 "success": True,
@@ -3923,12 +4461,24 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
         custom_context: Optional[str] = None,
         history: List[Dict[str, Any]] = None,
         reference_df: pd.DataFrame = None,
-        reference_sheet_name: Optional[str] = None
+        reference_sheet_name: Optional[str] = None,
+        speculative: Optional[bool] = None,
+        progress: Optional[ProgressCallback] = None,
+        engine: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Главный метод обработки запроса.
+
+        v11.12.0: speculative=True запускает схему и генерацию Python-кода
+        параллельно со SmartGPT (None - по SPECULATIVE_EXECUTION_ENABLED).
+        v11.13.0: progress - колбэк событий (schema, action, token, code,
+        execution, validation) для потокового ответа.
+        v11.23.0: engine - "pandas" или "sql" (DuckDB) для Python-пути
+        (None - по SQL_ENGINE_DEFAULT; без duckdb - pandas).
         """
         start_time = time.time()
+        speculation = None
+        progress_token = _progress.set(progress)
 
         # DEBUG: Log incoming history
         logger.info(f"[SimpleGPT] Query: {query[:50]}...")
@@ -3938,6 +4488,50 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                 logger.info(f"[SimpleGPT] History[{i}]: query={h.get('query', 'N/A')[:30]}, response={str(h.get('response', h.get('summary', 'N/A')))[:50]}")
 
         try:
+            # v11.18.0: Простые команды (сортировка, закрепление, формат...) -
+            # локальный детектор без LLM, если уверенность достаточна
+            local_result = self.local_dispatcher.dispatch(query, column_names, df, history=history, reference_df=reference_df)
+            if local_result:
+                emit_progress("action", action_type=local_result.get("action_type"), forced_python=False, fast_path=True)
+                elapsed = time.time() - start_time
+                message = local_result.get("message", "")
+                local_result.update({
+                    "success": True,
+                    "result_type": "action",
+                    "processing_time": f"{elapsed:.2f}s",
+                    "processor": "LocalFastPath v1.0",
+                    "confidence": local_result["fast_path"]["confidence"],
+                    "summary": local_result.get("summary", message),
+                    "explanation": local_result.get("summary", message),
+                    "response_type": "analysis"
+                })
+                return local_result
+
+            # v11.19.0: "Сумма по колонке", "среднее цены по менеджерам" -
+            # считаем в pandas, если IntentParser уверен в операции и колонке
+            local_answer = self.local_engine.answer(query, df, column_names, history=history, reference_df=reference_df)
+            if local_answer:
+                emit_progress("action", action_type="analysis", forced_python=False, local_engine=True)
+                elapsed = time.time() - start_time
+                local_answer.update({
+                    "processing_time": f"{elapsed:.2f}s",
+                    "processor": "LocalQueryEngine v1.0"
+                })
+                return local_answer
+
+            # v11.29.0: Прогноз по колонкам периодов - модели над матрицей позиций
+            # (NumPy) вместо сгенерированного скрипта; без периодов - Python-путь
+            if "FORECAST_KEYWORDS" in self.query_keywords(query.lower()):
+                forecast_answer = await self.forecast_engine.answer(query, df, reference_df=reference_df)
+                if forecast_answer:
+                    emit_progress("action", action_type="write_data", forced_python=False, forecast_engine=True)
+                    elapsed = time.time() - start_time
+                    forecast_answer.update({
+                        "processing_time": f"{elapsed:.2f}s",
+                        "processor": "ForecastEngine v1.0"
+                    })
+                    return forecast_answer
+
             # =====================================================
             # SMART GPT - GPT сама понимает и выполняет ЛЮБОЙ запрос
             # Никакого хардкода - GPT формирует готовый ответ
@@ -3945,16 +4539,44 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
             # v10.3.0: ПРИНУДИТЕЛЬНО Python для прогнозов (SmartGPT не даёт детальных расчётов)
             query_lower = query.lower()
-            force_python_keywords = ['прогноз', 'спрогнозир', 'forecast', 'предсказ', 'предскажи']
-            force_python = any(kw in query_lower for kw in force_python_keywords)
-
-            if force_python:
+            force_python = "FORCE_PYTHON_KEYWORDS" in self.query_keywords(query_lower)
+
+            # v11.20.0: Этот запрос к листу с той же схемой уже решался Python-кодом -
+            # код перезапускается на новых данных без SmartGPT и генерации
+            path_start = time.perf_counter()
+            # v11.23.0: план и спекуляция - это pandas-код, для движка sql не используются
+            engine = self.sql_engine.resolve(engine)
+            if engine == "sql":
+                speculative = False
+            plan_key = self._code_plan_key(query, df, custom_context, history, reference_df) if engine == "pandas" else None
+            code_plan = self.code_plans.get(plan_key) if plan_key else None
+
+            if code_plan is not None:
+                logger.info(f"[SimpleGPT] Code plan cache hit - reusing validated code")
+                smart_result = None
+            elif force_python:
                 logger.info(f"[SimpleGPT] 🔄 FORECAST DETECTED - forcing Python path for detailed calculations")
                 smart_result = None  # Skip SmartGPT, go directly to Python
             else:
+                # v11.12.0: Спекулятивно готовим Python-путь, пока SmartGPT решает
+                speculation = self._start_speculation(query, df, custom_context, history, reference_df, reference_sheet_name, speculative)
+                smart_start = time.perf_counter()
                 smart_result = await self._gpt_smart_action(query, column_names, df, history=history, custom_context=custom_context, reference_df=reference_df, reference_sheet_name=reference_sheet_name)
+                smart_ms = (time.perf_counter() - smart_start) * 1000
+                self.local_dispatcher.stats.observe_llm(smart_ms)
+
+            emit_progress(
+                "action",
+                action_type=smart_result.get("action_type") if smart_result else "analysis",
+                forced_python=force_python,
+                code_plan=code_plan is not None
+            )
 
             if smart_result:
+                if speculation is not None:
+                    self._cancel_speculation(speculation)
+                    self.speculation_stats.record("cancelled")
+                    speculation = None
                 elapsed = time.time() - start_time
                 logger.info(f"[SmartGPT] Action: {smart_result.get('action_type')}")
 
@@ -4056,9 +4678,13 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                             "message": "Создаю диаграмму"
                         }
 
+                # v11.28.0: VLOOKUP считается локально по всем строкам справочника
+                if smart_result.get("action_type") == "vlookup" and reference_df is not None:
+                    smart_result = self._apply_reference_join(smart_result, df, reference_df, reference_sheet_name, query)
+
                 # v10.2.5: Forecast query fix - convert structured_data to write_data
                 # AI often returns structured_data for forecasts, but we need write_data + merge_by_key
-                is_forecast_query = any(kw in query.lower() for kw in ['прогноз', 'спрогнозир', 'forecast', 'предсказ'])
+                is_forecast_query = "FORECAST_KEYWORDS" in self.query_keywords(query.lower())
                 has_structured_data = smart_result.get("structured_data") is not None
                 missing_write_data = smart_result.get("action_type") != "write_data" or smart_result.get("merge_by_key") is None
 
@@ -4098,6 +4724,11 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
                     del smart_result["structured_data"]  # Remove to prevent confusion
                     logger.info(f"[SmartGPT] ✅ FORECAST FIX: Converted to write_data with merge_by_key='{key_col}', {len(write_data)} rows")
 
+                # v11.28.0: Ключи write_data - по значениям листа (нормализованный join)
+                if smart_result.get("action_type") == "write_data" and smart_result.get("merge_by_key") \
+                        and "join_stats" not in smart_result:
+                    self._align_write_data(smart_result, df)
+
                 # GPT возвращает готовый ответ - просто добавляем метаданные
                 smart_result.update({
                     "success": True,
@@ -4115,75 +4746,65 @@ chat: {{"action_type": "chat", "message": "Уточните, пожалуйст
 
             # 1. Schema extraction
             logger.info(f"[SimpleGPT] Processing: {query[:50]}...")
-            schema = self.schema_extractor.extract_schema(df)
-            schema_prompt = self.schema_extractor.schema_to_prompt(schema)
-            logger.info(f"[SimpleGPT] Schema: {schema['column_count']} cols, {schema['row_count']} rows")
-            
-            # v9.2.0: Add reference sheet schema if provided
-            if reference_df is not None:
-                ref_schema = self.schema_extractor.extract_schema(reference_df)
-                ref_prompt = self.schema_extractor.schema_to_prompt(ref_schema)
-                ref_name = reference_sheet_name or "reference_df"
-                schema_prompt += f"""
-
-⚠️⚠️⚠️ КРИТИЧЕСКИ ВАЖНО - CROSS-SHEET VLOOKUP ⚠️⚠️⚠️
-Пользователь просит ПОДТЯНУТЬ данные из листа "{ref_name}".
-Данные из этого листа УЖЕ ЗАГРУЖЕНЫ в переменную reference_df!
-
-🔴 НЕ СПРАШИВАЙ пользователя где данные - они УЖЕ В reference_df!
-🔴 НЕ ГОВОРИ "нет данных" - данные ЕСТЬ в reference_df!
-🟢 ПРОСТО СДЕЛАЙ merge/join между df и reference_df!
-
-ДОПОЛНИТЕЛЬНЫЙ СПРАВОЧНИК (reference_df) - лист "{ref_name}":
-{ref_prompt}
-
-ОБЯЗАТЕЛЬНЫЕ ДЕЙСТВИЯ для VLOOKUP (подтягивание данных между листами):
-
-СПОСОБ 1 - merge (рекомендуется для массовых операций):
-merged = df.merge(reference_df[['ключ', 'значение']], left_on='колонка_df', right_on='ключ', how='left')
-
-СПОСОБ 2 - map через словарь (быстрее для больших данных):
-lookup_dict = reference_df.set_index('ключ')['значение'].to_dict()
-df['новая_колонка'] = df['колонка_df'].map(lookup_dict)
-
-СПОСОБ 3 - поиск одного значения:
-value = reference_df.loc[reference_df['ключ'] == искомое, 'значение'].values
-result = value[0] if len(value) > 0 else 'Не найдено'
-
-ОБРАБОТКА НЕНАЙДЕННЫХ ЗНАЧЕНИЙ:
-- После merge проверяй: not_found = merged['результат'].isna().sum()
-- Сообщай пользователю сколько значений не найдено
-- Показывай примеры ненайденных: df[df['результат'].isna()]['ключ'].head(5).tolist()
-
-ТИПИЧНЫЕ ОШИБКИ (избегай!):
-- НЕ используй .values[0] без проверки длины массива
-- НЕ забывай how='left' чтобы сохранить все строки df
-- ПРОВЕРЯЙ типы данных ключей (str vs int): df['id'].astype(str)
-"""
-                logger.info(f"[SimpleGPT] Reference sheet added: {ref_name}, {ref_schema['row_count']} rows")
-                # v10.0.9: Mark that reference_df was received (for debugging deployment)
-                logger.info(f"[SimpleGPT] ⚠️ VLOOKUP MODE ACTIVATED - reference_df has {ref_schema['row_count']} rows")
+            prefetched = None
+            if speculation is not None:
+                prefetched = await self._collect_speculation(speculation, smart_ms)
+                speculation = None
+            if prefetched is not None:
+                schema_prompt = prefetched["schema_prompt"]
+            else:
+                schema, schema_prompt = self._build_schema_prompt(df, reference_df, reference_sheet_name)
+                emit_progress("schema", columns=schema["column_count"], rows=schema["row_count"])
 
             # 2. Generate and execute code (with retries)
-            result = await self._generate_and_execute(
+            # v11.20.0: код из плана - первая попытка; если он упал, генерируем заново
+            if code_plan is not None:
+                prefetched_code, prefetched_cache_key = code_plan["code"], None
+            elif prefetched:
+                prefetched_code, prefetched_cache_key = prefetched["code"], prefetched["cache_key"]
+            else:
+                prefetched_code = prefetched_cache_key = None
+            result = await self._execute_with_engine(
+                engine,
                 query=query,
                 df=df,
                 schema_prompt=schema_prompt,
                 custom_context=custom_context,
                 history=history,
-                reference_df=reference_df
+                reference_df=reference_df,
+                prefetched_code=prefetched_code,
+                prefetched_cache_key=prefetched_cache_key
             )
 
+            plan_reused = code_plan is not None and result["success"] and result.get("code") == code_plan["code"]
+            if code_plan is not None and not plan_reused:
+                logger.warning(f"[SimpleGPT] Cached code plan failed on new data, regenerated")
+                self.code_plans.record_fallback(plan_key)
+
+            execution_memory = list(result.get("memory", []))
             if not result["success"]:
+                self.execution_memory.record(execution_memory)
                 return self._create_error_response(result.get("error", "Unknown error"), time.time() - start_time)
 
             # 3. Post-validation
-            validation = await self._validate_result(query, result["result"])
+            if plan_reused:
+                # План уже прошёл валидацию на листе с этой схемой
+                validation = "OK"
+                self.code_plans.record_reuse(code_plan, (time.perf_counter() - path_start) * 1000)
+            else:
+                validation = await self._validate_result(query, result["result"])
+            emit_progress("validation", verdict=validation, code_plan=plan_reused)
+
+            if validation == "OK" and plan_key and not plan_reused:
+                self.code_plans.store(plan_key, result["code"], (time.perf_counter() - path_start) * 1000)
 
             if validation == "BAD":
                 logger.warning(f"[SimpleGPT] Post-validation failed, retrying with clarification...")
+                # v11.9.1: Отклонённый код не должен повторяться из кэша на тот же запрос
+                self.llm_cache.invalidate(result.get("cache_key"))
                 # Retry with explicit clarification
-                result = await self._generate_and_execute(
+                result = await self._execute_with_engine(
+                    engine,
                     query=query,
                     df=df,
                     schema_prompt=schema_prompt,
@@ -4192,9 +4813,11 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                     clarification="Предыдущий результат не соответствовал запросу. Убедись что возвращаешь правильный тип данных: список для 'какие', число для 'сколько', DataFrame для 'покажи'.",
                     reference_df=reference_df
                 )
+                execution_memory.extend(result.get("memory", []))
 
                 # Check retry result
                 if not result.get("success"):
+                    self.execution_memory.record(execution_memory)
                     return self._create_error_response(result.get("error", "Validation failed after retry"), time.time() - start_time)
 
             # 4. Format response
@@ -4218,12 +4841,15 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                 "code": result.get("code"),
                 "processing_time": f"{elapsed:.2f}s",
                 "processor": "SimpleGPT v1.0",
-                "validation": validation
+                "validation": validation,
+                "engine": result.get("engine", "pandas"),
+                # v11.22.0: пик и сумма памяти по всем попыткам выполнения кода
+                "execution_memory": self.execution_memory.record(execution_memory)
             }
 
             # Check if this is a highlight query
             query_lower = query.lower()
-            is_highlight_query = any(kw in query_lower for kw in ['выдели', 'выделить', 'подсвети', 'подсветить', 'highlight', 'mark'])
+            is_highlight_query = "HIGHLIGHT_QUERY_KEYWORDS" in self.query_keywords(query_lower)
 
             if is_highlight_query:
                 logger.info(f"[SimpleGPT] Highlight query detected: {query[:50]}")
@@ -4283,7 +4909,7 @@ result = value[0] if len(value) > 0 else 'Не найдено'
 
             # v10.2.5: Forecast fix for Python analysis path
             # Same logic as SmartGPT path - convert structured_data to write_data for forecasts
-            is_forecast_query = any(kw in query.lower() for kw in ['прогноз', 'спрогнозир', 'forecast', 'предсказ'])
+            is_forecast_query = "FORECAST_KEYWORDS" in self.query_keywords(query.lower())
             has_structured_data = response.get("structured_data") is not None
 
             if is_forecast_query and has_structured_data:
@@ -4326,6 +4952,7 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                 response["write_headers"] = write_headers
                 del response["structured_data"]  # Remove to prevent new sheet creation
                 logger.info(f"[SimpleGPT] ✅ FORECAST FIX: Converted to write_data with merge_by_key='{key_col}', {len(write_data)} rows")
+                self._align_write_data(response, df)
 
             return response
 
@@ -4334,6 +4961,185 @@ result = value[0] if len(value) > 0 else 'Не найдено'
             error_msg = f"{type(e).__name__}: {str(e)}" if str(e) else type(e).__name__
             logger.error(f"[SimpleGPT] Error: {error_msg}", exc_info=True)
             return self._create_error_response(error_msg, elapsed)
+        finally:
+            if speculation is not None:
+                self._cancel_speculation(speculation)
+                self.speculation_stats.record("cancelled")
+            _progress.reset(progress_token)
+
+    def _build_schema_prompt(
+        self,
+        df: pd.DataFrame,
+        reference_df: pd.DataFrame = None,
+        reference_sheet_name: Optional[str] = None
+    ) -> tuple:
+        """Схема листа (и справочника для VLOOKUP) + текст для промпта генерации кода."""
+        # v11.7.0: Content-addressed schema cache (follow-up queries reuse the schema)
+        schema, schema_prompt = self.schema_extractor.get_schema_and_prompt(df)
+        logger.info(f"[SimpleGPT] Schema: {schema['column_count']} cols, {schema['row_count']} rows")
+        
+        # v9.2.0: Add reference sheet schema if provided
+        if reference_df is not None:
+            ref_schema, ref_prompt = self.schema_extractor.get_schema_and_prompt(reference_df)
+            ref_name = reference_sheet_name or "reference_df"
+            schema_prompt += f"""
+
+⚠️⚠️⚠️ КРИТИЧЕСКИ ВАЖНО - CROSS-SHEET VLOOKUP ⚠️⚠️⚠️
+Пользователь просит ПОДТЯНУТЬ данные из листа "{ref_name}".
+Данные из этого листа УЖЕ ЗАГРУЖЕНЫ в переменную reference_df!
+
+🔴 НЕ СПРАШИВАЙ пользователя где данные - они УЖЕ В reference_df!
+🔴 НЕ ГОВОРИ "нет данных" - данные ЕСТЬ в reference_df!
+🟢 ПРОСТО СДЕЛАЙ merge/join между df и reference_df!
+
+ДОПОЛНИТЕЛЬНЫЙ СПРАВОЧНИК (reference_df) - лист "{ref_name}":
+{ref_prompt}
+
+ОБЯЗАТЕЛЬНЫЕ ДЕЙСТВИЯ для VLOOKUP (подтягивание данных между листами):
+
+СПОСОБ 1 - merge (рекомендуется для массовых операций):
+merged = df.merge(reference_df[['ключ', 'значение']], left_on='колонка_df', right_on='ключ', how='left')
+
+СПОСОБ 2 - map через словарь (быстрее для больших данных):
+lookup_dict = reference_df.set_index('ключ')['значение'].to_dict()
+df['новая_колонка'] = df['колонка_df'].map(lookup_dict)
+
+СПОСОБ 3 - поиск одного значения:
+value = reference_df.loc[reference_df['ключ'] == искомое, 'значение'].values
+result = value[0] if len(value) > 0 else 'Не найдено'
+
+ОБРАБОТКА НЕНАЙДЕННЫХ ЗНАЧЕНИЙ:
+- После merge проверяй: not_found = merged['результат'].isna().sum()
+- Сообщай пользователю сколько значений не найдено
+- Показывай примеры ненайденных: df[df['результат'].isna()]['ключ'].head(5).tolist()
+
+ТИПИЧНЫЕ ОШИБКИ (избегай!):
+- НЕ используй .values[0] без проверки длины массива
+- НЕ забывай how='left' чтобы сохранить все строки df
+- ПРОВЕРЯЙ типы данных ключей (str vs int): df['id'].astype(str)
+"""
+            logger.info(f"[SimpleGPT] Reference sheet added: {ref_name}, {ref_schema['row_count']} rows")
+            # v10.0.9: Mark that reference_df was received (for debugging deployment)
+            logger.info(f"[SimpleGPT] ⚠️ VLOOKUP MODE ACTIVATED - reference_df has {ref_schema['row_count']} rows")
+
+        return schema, schema_prompt
+
+    def _code_plan_key(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        custom_context: Optional[str],
+        history: Optional[List[Dict[str, Any]]],
+        reference_df: Optional[pd.DataFrame]
+    ) -> Optional[str]:
+        """
+        v11.20.0: Ключ плана кода: запрос + названия и типы колонок.
+        v11.20.1: Типы - kind из SheetProfile (числа уже разобраны при загрузке листа):
+        ключ считается до SmartGPT на каждом pandas-запросе, полная экстракция
+        схемы здесь не нужна.
+        """
+        if not self.code_plans.enabled:
+            return None
+        ref_schema = self._profile_schema(reference_df) if reference_df is not None else None
+        return self.code_plans.make_key(query, self._profile_schema(df), ref_schema, custom_context, history)
+
+    @staticmethod
+    def _profile_schema(df: pd.DataFrame) -> Dict[str, Any]:
+        """Названия колонок и их kind (empty | numeric | date | text) в форме схемы для CodePlanCache"""
+        profile = get_sheet_profile(df)
+        return {"columns": [{"name": str(name), "type": profile.kind(i)} for i, name in enumerate(df.columns)]}
+
+    def _start_speculation(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        custom_context: Optional[str],
+        history: Optional[List[Dict[str, Any]]],
+        reference_df: Optional[pd.DataFrame],
+        reference_sheet_name: Optional[str],
+        speculative: Optional[bool] = None
+    ) -> Optional[asyncio.Task]:
+        """
+        v11.12.0: Запускает схему + генерацию кода задачей рядом со SmartGPT.
+        Если SmartGPT вернёт действие - задача отменяется, иначе код уже готов
+        и задержка Python-пути перекрывается с задержкой SmartGPT.
+        """
+        enabled = settings.SPECULATIVE_EXECUTION_ENABLED if speculative is None else speculative
+        if not enabled:
+            return None
+        self.speculation_stats.record("started")
+        return asyncio.create_task(self._speculative_code_path(query, df, custom_context, history, reference_df, reference_sheet_name))
+
+    async def _speculative_code_path(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        custom_context: Optional[str],
+        history: Optional[List[Dict[str, Any]]],
+        reference_df: Optional[pd.DataFrame],
+        reference_sheet_name: Optional[str]
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # Схема считается в потоке: event loop в это время обслуживает запрос SmartGPT
+        schema, schema_prompt = await asyncio.to_thread(self._build_schema_prompt, df, reference_df, reference_sheet_name)
+        emit_progress("schema", columns=schema["column_count"], rows=schema["row_count"], speculative=True)
+        code = await self._generate_code(
+            query=query,
+            schema_prompt=schema_prompt,
+            custom_context=custom_context,
+            history=history
+        )
+        return {
+            "schema_prompt": schema_prompt,
+            "code": code,
+            # contextvar задачи не виден вызывающему коду - ключ передаём явно
+            "cache_key": last_cache_key(),
+            "elapsed_ms": (time.perf_counter() - started) * 1000
+        }
+
+    async def _collect_speculation(self, task: asyncio.Task, smart_ms: float) -> Optional[Dict[str, Any]]:
+        """Дожидается спекулятивной задачи; None - выполнить Python-путь последовательно."""
+        try:
+            prefetched = await task
+        except Exception as e:
+            logger.warning(f"[SimpleGPT] Speculation failed: {type(e).__name__}: {e}")
+            self.speculation_stats.record("failed")
+            return None
+
+        if not prefetched["code"]:
+            self.speculation_stats.record("failed")
+            prefetched["cache_key"] = None
+            return prefetched
+
+        saved_ms = min(smart_ms, prefetched["elapsed_ms"])
+        self.speculation_stats.record("hits", saved_ms)
+        logger.info(f"[SimpleGPT] Speculation hit: code ready, saved ~{saved_ms:.0f} ms")
+        return prefetched
+
+    @staticmethod
+    def _cancel_speculation(task: asyncio.Task) -> None:
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # помечаем исключение как полученное
+            return
+        task.cancel()
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _execute_with_engine(self, engine: str, **kwargs) -> Dict[str, Any]:
+        """
+        v11.23.0: Python-путь выбранным движком. Движок "sql" генерирует и выполняет
+        один SELECT в DuckDB; если это не удалось - тот же запрос идёт в pandas-путь.
+        """
+        if engine == "sql":
+            sql_kwargs = {k: v for k, v in kwargs.items() if k not in ("prefetched_code", "prefetched_cache_key")}
+            result = await self.sql_engine.generate_and_execute(**sql_kwargs)
+            self.sql_engine.stats.record(result["success"], None if result["success"] else "execution")
+            if result["success"]:
+                return result
+            logger.warning(f"[SimpleGPT] SQL engine failed ({result.get('error')}), falling back to pandas")
+        result = await self._generate_and_execute(**kwargs)
+        result["engine"] = "pandas"
+        return result
 
     async def _generate_and_execute(
         self,
@@ -4344,23 +5150,37 @@ result = value[0] if len(value) > 0 else 'Не найдено'
         history: List[Dict[str, Any]] = None,
         clarification: Optional[str] = None,
         previous_error: Optional[str] = None,
-        reference_df: pd.DataFrame = None
+        reference_df: pd.DataFrame = None,
+        prefetched_code: Optional[str] = None,
+        prefetched_cache_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Генерирует и выполняет код с retry."""
+        """
+        Генерирует и выполняет код с retry.
+        v11.12.0: prefetched_code - код первой попытки, сгенерированный спекулятивно.
+        v11.22.0: result["memory"] - память каждой выполненной попытки (run_generated_code).
+        v11.9.1: result["cache_key"] - ключ LLM-кэша выполненного кода.
+        """
+        memory: List[Dict[str, Any]] = []
 
         for attempt in range(self.MAX_RETRIES + 1):
-            # Generate code
-            code = await self._generate_code(
-                query=query,
-                schema_prompt=schema_prompt,
-                custom_context=custom_context,
-                history=history,
-                clarification=clarification,
-                previous_error=previous_error
-            )
+            if prefetched_code:
+                code, code_cache_key = prefetched_code, prefetched_cache_key
+                prefetched_code = None
+            else:
+                # Generate code
+                code = await self._generate_code(
+                    query=query,
+                    schema_prompt=schema_prompt,
+                    custom_context=custom_context,
+                    history=history,
+                    clarification=clarification,
+                    previous_error=previous_error
+                )
 
-            if not code:
-                return {"success": False, "error": "Не удалось сгенерировать код"}
+                if not code:
+                    return {"success": False, "error": "Не удалось сгенерировать код"}
+                code_cache_key = last_cache_key()
+            emit_progress("code", attempt=attempt + 1, code=code)
 
             # v9.3.3: Fix syntax BEFORE validation
             code = self._fix_code_syntax(code)
@@ -4373,18 +5193,27 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                     previous_error = f"SYNTAX ERROR: {safety_error}. DO NOT use triple quotes! Use: explanation = 'text' + 'more text'"
                 else:
                     previous_error = f"Небезопасный код: {safety_error}"
+                self.llm_cache.invalidate(code_cache_key)
                 continue
 
             # Execute code
             try:
-                exec_result = self._execute_code(code, df, reference_df)
-                return {"success": True, "result": exec_result['result'], "explanation": exec_result.get('explanation', ''), "code": code}
+                exec_result = await self._execute_code_isolated(code, df, reference_df)
+                if exec_result.get('memory'):
+                    memory.append(exec_result['memory'])
+                emit_progress("execution", attempt=attempt + 1, success=True, result_type=self._get_result_type(exec_result['result']))
+                # cache_key - чтобы снять код из LLM-кэша, если его отклонит пост-валидация
+                return {"success": True, "result": exec_result['result'], "explanation": exec_result.get('explanation', ''), "code": code, "memory": memory, "cache_key": code_cache_key}
             except Exception as e:
+                if getattr(e, "execution_memory", None):
+                    memory.append(e.execution_memory)
                 previous_error = f"{type(e).__name__}: {str(e)}"
                 logger.warning(f"[SimpleGPT] Attempt {attempt + 1} failed: {previous_error}")
+                emit_progress("execution", attempt=attempt + 1, success=False, error=previous_error)
+                self.llm_cache.invalidate(code_cache_key)
                 continue
 
-        return {"success": False, "error": previous_error}
+        return {"success": False, "error": previous_error, "memory": memory}
 
     async def _generate_code(
         self,
@@ -4442,18 +5271,19 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                 system_prompt = self.ANALYSIS_SYSTEM_PROMPT + "\n\n" + self.SYSTEM_PROMPT
                 logger.info("[SimpleGPT] Using deep analysis mode")
 
-            response = await self.client.chat.completions.create(
+            # v11.9.0: Cached explicitly; entry is invalidated if the code fails to run
+            content = await self._chat(
                 model=self.MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.1,
-                max_tokens=1000
+                max_tokens=1000,
+                cache=True,
+                stream_stage="code"
             )
 
-            content = response.choices[0].message.content
-
             # Extract code from markdown
             code_match = re.search(r'```python\s*(.*?)\s*```', content, re.DOTALL)
             if code_match:
@@ -4476,7 +5306,7 @@ result = value[0] if len(value) > 0 else 'Не найдено'
         result_str = self._format_for_validation(result)
 
         try:
-            response = await self.client.chat.completions.create(
+            content = await self._chat(
                 model="gpt-4o-mini",  # Cheaper model for validation
                 messages=[
                     {"role": "user", "content": self.VALIDATION_PROMPT.format(
@@ -4488,8 +5318,12 @@ result = value[0] if len(value) > 0 else 'Не найдено'
                 max_tokens=10
             )
 
-            answer = response.choices[0].message.content.strip().upper()
-            return "OK" if "OK" in answer else "BAD"
+            answer = content.strip().upper()
+            if "OK" in answer:
+                return "OK"
+            # v11.9.1: Вердикт BAD не кэшируется - иначе повтор запроса получит его без проверки
+            self.llm_cache.invalidate(last_cache_key())
+            return "BAD"
 
         except Exception as e:
             logger.warning(f"[SimpleGPT] Validation error: {e}")
@@ -4586,61 +5420,27 @@ result = value[0] if len(value) > 0 else 'Не найдено'
 
         return True, None
 
-    def _execute_code(self, code: str, df: pd.DataFrame, reference_df: pd.DataFrame = None) -> dict:
-        """Выполняет код в sandbox. Возвращает dict с result и explanation."""
-
-        # Helper functions for safe NaN handling
-        def safe_int(val, default=0):
-            """Safely convert to int, handling NaN/None"""
-            if pd.isna(val) or val is None:
-                return default
-            try:
-                return int(float(val))
-            except (ValueError, TypeError):
-                return default
-
-        def safe_float(val, default=0.0):
-            """Safely convert to float, handling NaN/None"""
-            if pd.isna(val) or val is None:
-                return default
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return default
-
-        # Create safe namespace
-        namespace = {
-            'df': df.copy(),
-            'pd': pd,
-            'np': np,
-            'result': None,
-            'explanation': None,
-            'datetime': __import__('datetime'),
-            'timedelta': __import__('datetime').timedelta,
-            're': __import__('re'),
-            'math': __import__('math'),
-            'safe_int': safe_int,
-            'safe_float': safe_float,
+    @staticmethod
+    def _execution_options() -> Dict[str, bool]:
+        """v11.22.0: copy-on-write вместо df.copy() и замер памяти (settings)"""
+        return {
+            "copy_on_write": bool(settings.CODE_EXEC_COPY_ON_WRITE),
+            "trace_memory": bool(settings.CODE_EXEC_TRACE_MEMORY),
         }
-        
-        # v9.2.0: Add reference_df for cross-sheet VLOOKUP
-        if reference_df is not None:
-            namespace['reference_df'] = reference_df.copy()
-
-        exec(code, namespace)
-
-        result = namespace.get('result')
-        explanation = namespace.get('explanation', '')
 
-        # Allow result = None for text-only responses
-        if result is None and not explanation:
-            raise ValueError("Код не вернул результат (result = None)")
-
-        # For text-only responses, use explanation as result
-        if result is None and explanation:
-            result = explanation
+    def _execute_code(self, code: str, df: pd.DataFrame, reference_df: pd.DataFrame = None) -> dict:
+        """Выполняет код в текущем процессе. Возвращает dict с result, explanation и memory."""
+        return run_generated_code(code, df, reference_df, **self._execution_options())
 
-        return {'result': result, 'explanation': explanation}
+    async def _execute_code_isolated(self, code: str, df: pd.DataFrame, reference_df: pd.DataFrame = None) -> dict:
+        """
+        v11.10.0: Выполняет код в sandbox-процессе (лимиты CPU/памяти, kill по таймауту).
+        Event loop не блокируется. Если sandbox выключен - выполняет в процессе, как раньше.
+        """
+        sandbox = get_code_sandbox()
+        if sandbox is None:
+            return self._execute_code(code, df, reference_df)
+        return await sandbox.run(run_generated_code, code, df, reference_df, **self._execution_options())
 
     def _format_result(self, result: Any) -> Any:
         """Форматирует результат для JSON."""
@@ -4758,6 +5558,24 @@ result = value[0] if len(value) > 0 else 'Не найдено'
         }
 
 
+def _build_query_keyword_index() -> KeywordIndex:
+    """v11.17.0: Автомат по всем спискам ключевых слов SimpleGPTProcessor"""
+    index = KeywordIndex()
+    for name, value in vars(SimpleGPTProcessor).items():
+        if name.endswith("_KEYWORDS") and isinstance(value, list):
+            index.add(name, value)
+    for name in ("CLEAN_OPERATIONS", "FILTER_OPERATORS", "FILL_VALUE_HINTS"):
+        for group, keywords in getattr(SimpleGPTProcessor, name).items():
+            index.add(f"{name}.{group}", keywords)
+    for name in ("CHART_TYPES", "AGG_FUNCTIONS", "VALUE_COLUMN_SYNONYMS", "FORMAT_COLORS",
+                 "CONDITION_COLORS", "HIGHLIGHT_COLORS", "CONTEXT_COLORS"):
+        index.add(name, getattr(SimpleGPTProcessor, name).keys())
+    return index.compile()
+
+
+QUERY_KEYWORDS = _build_query_keyword_index()
+
+
 # Singleton
 _processor = None
 
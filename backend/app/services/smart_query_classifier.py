@@ -18,6 +18,8 @@ from typing import Dict, Any, List, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
 
+from app.utils.column_index import get_column_index
+
 
 class QueryComplexity(Enum):
     SIMPLE = "simple"      # Pattern matching - 0 tokens
@@ -37,6 +39,18 @@ class ClassificationResult:
     extracted_params: Optional[Dict[str, Any]] = None
 
 
+def _compile_indicators(patterns: List[str]) -> Tuple[re.Pattern, List[Tuple[str, re.Pattern]]]:
+    """
+    v11.17.0: Группа индикаторов -> (одна альтернатива всех паттернов, скомпилированные паттерны).
+
+    Альтернатива отвечает "есть ли совпадение в группе" за один re.search;
+    отдельные паттерны нужны только при совпадении - чтобы reason указывал
+    первый по порядку паттерн, как раньше.
+    """
+    combined = re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+    return combined, [(pattern, re.compile(pattern, re.IGNORECASE)) for pattern in patterns]
+
+
 class SmartQueryClassifier:
     """
     Умный классификатор запросов для выбора оптимальной стратегии.
@@ -111,6 +125,26 @@ class SmartQueryClassifier:
         r"(характеристик\w*|параметр\w*|спецификаци)",            # Характеристики
     ]
 
+    # v11.17.0: Все паттерны компилируются один раз при импорте
+    _SIMPLE_COMPILED = [
+        (name, re.compile(regex, re.IGNORECASE), func_name, extractor)
+        for name, regex, func_name, extractor in SIMPLE_PATTERNS
+    ]
+    _GENERATE_COMPILED = _compile_indicators(GENERATE_INDICATORS)
+    _COMPLEX_COMPILED = _compile_indicators(COMPLEX_INDICATORS)
+    _MEDIUM_COMPILED = _compile_indicators(MEDIUM_INDICATORS)
+
+    @staticmethod
+    def _first_indicator(group: Tuple[re.Pattern, List[Tuple[str, re.Pattern]]], query_lower: str) -> Optional[str]:
+        """Первый совпавший паттерн группы или None"""
+        combined, patterns = group
+        if not combined.search(query_lower):
+            return None
+        for pattern, regex in patterns:
+            if regex.search(query_lower):
+                return pattern
+        return None
+
     def classify(self, query: str, column_names: List[str] = None) -> ClassificationResult:
         """
         Классифицирует запрос и возвращает рекомендуемую стратегию.
@@ -125,17 +159,17 @@ class SmartQueryClassifier:
         query_lower = query.lower().strip()
 
         # 0. Проверяем GENERATE patterns (генерация данных из знаний LLM)
-        for pattern in self.GENERATE_INDICATORS:
-            if re.search(pattern, query_lower, re.IGNORECASE):
-                return ClassificationResult(
-                    complexity=QueryComplexity.GENERATE,
-                    confidence=0.90,
-                    reason=f"Generate pattern detected: {pattern[:30]}..."
-                )
+        pattern = self._first_indicator(self._GENERATE_COMPILED, query_lower)
+        if pattern:
+            return ClassificationResult(
+                complexity=QueryComplexity.GENERATE,
+                confidence=0.90,
+                reason=f"Generate pattern detected: {pattern[:30]}..."
+            )
 
         # 1. Проверяем SIMPLE patterns (0 tokens!)
-        for pattern_name, regex, func_name, param_extractor in self.SIMPLE_PATTERNS:
-            match = re.search(regex, query_lower, re.IGNORECASE)
+        for pattern_name, regex, func_name, param_extractor in self._SIMPLE_COMPILED:
+            match = regex.search(query_lower)
             if match:
                 try:
                     params = param_extractor(match)
@@ -162,22 +196,22 @@ class SmartQueryClassifier:
                     continue
 
         # 2. Проверяем COMPLEX indicators
-        for pattern in self.COMPLEX_INDICATORS:
-            if re.search(pattern, query_lower, re.IGNORECASE):
-                return ClassificationResult(
-                    complexity=QueryComplexity.COMPLEX,
-                    confidence=0.90,
-                    reason=f"Complex pattern detected: {pattern[:30]}..."
-                )
+        pattern = self._first_indicator(self._COMPLEX_COMPILED, query_lower)
+        if pattern:
+            return ClassificationResult(
+                complexity=QueryComplexity.COMPLEX,
+                confidence=0.90,
+                reason=f"Complex pattern detected: {pattern[:30]}..."
+            )
 
         # 3. Проверяем MEDIUM indicators
-        for pattern in self.MEDIUM_INDICATORS:
-            if re.search(pattern, query_lower, re.IGNORECASE):
-                return ClassificationResult(
-                    complexity=QueryComplexity.MEDIUM,
-                    confidence=0.85,
-                    reason=f"Medium pattern detected: {pattern[:30]}..."
-                )
+        pattern = self._first_indicator(self._MEDIUM_COMPILED, query_lower)
+        if pattern:
+            return ClassificationResult(
+                complexity=QueryComplexity.MEDIUM,
+                confidence=0.85,
+                reason=f"Medium pattern detected: {pattern[:30]}..."
+            )
 
         # 4. Эвристика по длине и сложности
         word_count = len(query.split())
@@ -211,25 +245,9 @@ class SmartQueryClassifier:
             )
 
     def _fuzzy_match_column(self, search: str, column_names: List[str]) -> Optional[str]:
-        """Нечёткий поиск колонки по названию."""
-        search_lower = search.lower().strip()
-
-        # 1. Точное совпадение
-        for col in column_names:
-            if col.lower() == search_lower:
-                return col
-
-        # 2. Содержит искомое
-        for col in column_names:
-            if search_lower in col.lower():
-                return col
-
-        # 3. Искомое содержит название колонки
-        for col in column_names:
-            if col.lower() in search_lower:
-                return col
-
-        return None
+        """Нечёткий поиск колонки по названию: точное -> содержит искомое -> содержится в искомом."""
+        # v11.26.0: общий индекс колонок листа вместо трёх линейных проходов
+        return get_column_index(column_names).match(search)
 
     def get_execution_strategy(self, result: ClassificationResult) -> Dict[str, Any]:
         """
@@ -0,0 +1,327 @@
+"""
+SQL Engine v1.0.0 - DuckDB вместо exec() сгенерированного pandas-кода
+
+Python-путь SimpleGPT генерирует pandas-код и выполняет его через exec().
+На больших листах такой код часто медленный (iterrows, циклы по строкам),
+а exec() - самая рискованная часть пайплайна.
+
+Движок "sql" (опционально, выбирается на запрос или SQL_ENGINE_DEFAULT):
+- лист регистрируется в in-process DuckDB как таблица df, справочник - reference_df
+- LLM пишет ОДИН SELECT вместо Python-кода
+- запрос выполняется векторизованно и многопоточно в курсоре общей базы;
+  доступ к файлам, сети, расширениям и смена настроек запрещены
+  (enable_external_access, lock_configuration)
+- результат приводится к тем же типам, что и у pandas-пути: число/текст,
+  список (одна колонка) или DataFrame - дальше ответ собирает process()
+
+Если duckdb не установлен или SQL не удалось выполнить за MAX_RETRIES + 1
+попыток, запрос уходит в pandas-путь (fallback).
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:  # pragma: no cover - duckdb не входит в минимальную установку
+    duckdb = None
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("pandas", "sql")
+
+SQL_SYSTEM_PROMPT = """Ты эксперт-аналитик данных. Пиши SQL для DuckDB.
+
+ТАБЛИЦЫ:
+- df - лист пользователя (колонки и типы - в СХЕМЕ ДАННЫХ)
+- reference_df - лист-справочник для VLOOKUP (только если он есть в схеме)
+
+ПРАВИЛА:
+1. Ровно ОДИН запрос SELECT (можно WITH ... SELECT). Без INSERT/UPDATE/CREATE/COPY.
+2. Названия колонок ВСЕГДА в двойных кавычках: "Сумма", "Менеджер".
+3. Числа, хранящиеся текстом (тип text в схеме), приводи так:
+   TRY_CAST(REPLACE(REPLACE("Сумма", ' ', ''), ',', '.') AS DOUBLE)
+4. Даты-текст: TRY_CAST(NULLIF("Дата", '') AS DATE)
+5. Форма результата:
+   - одно число или текст ("сколько", "какой") - одна строка, одна колонка
+   - список ("какие", "перечисли") - одна колонка
+   - таблица ("покажи", "по менеджерам") - несколько колонок с понятными названиями
+6. Для топов используй ORDER BY ... LIMIT N. Не выводи больше 500 строк.
+
+Верни только SQL в блоке ```sql ... ```"""
+
+_SQL_BLOCK = re.compile(r"```(?:sql)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+
+class SQLEngineStats:
+    """
+    Счётчики движка "sql" (для /health).
+
+    - requests: запросы, выполненные движком sql
+    - answered: SQL выполнился, ответ собран
+    - fallbacks: SQL не удался - запрос ушёл в pandas-путь (по причинам)
+    - sql_ms_avg: среднее время выполнения SQL в DuckDB
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.answered = 0
+        self.attempts = 0
+        self.fallbacks: Dict[str, int] = {}
+        self.sql_ms = 0.0
+        self.rows_scanned = 0
+
+    def record_attempt(self, sql_ms: float, rows: int) -> None:
+        with self._lock:
+            self.attempts += 1
+            self.sql_ms += sql_ms
+            self.rows_scanned += rows
+
+    def record(self, answered: bool, reason: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            if answered:
+                self.answered += 1
+            else:
+                self.fallbacks[reason or "error"] = self.fallbacks.get(reason or "error", 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "available": DUCKDB_AVAILABLE,
+                "default_engine": str(settings.SQL_ENGINE_DEFAULT),
+                "requests": self.requests,
+                "answered": self.answered,
+                "fallbacks": sum(self.fallbacks.values()),
+                "fallbacks_by_reason": dict(self.fallbacks),
+                "attempts": self.attempts,
+                "sql_ms_avg": round(self.sql_ms / self.attempts, 1) if self.attempts else 0.0,
+                "rows_scanned": self.rows_scanned,
+            }
+
+
+class SQLQueryEngine:
+    """
+    Генерация и выполнение SQL по листу (DuckDB).
+
+    Usage:
+        engine = SQLQueryEngine(processor)
+        if engine.resolve(request_engine) == "sql":
+            result = await engine.generate_and_execute(query, df, schema_prompt)
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.stats = SQLEngineStats()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return DUCKDB_AVAILABLE
+
+    def resolve(self, engine: Optional[str]) -> str:
+        """Движок запроса: явный выбор или SQL_ENGINE_DEFAULT; sql без duckdb -> pandas"""
+        engine = (engine or str(settings.SQL_ENGINE_DEFAULT)).lower()
+        if engine not in ENGINES:
+            logger.warning(f"[SQL-ENGINE] Unknown engine '{engine}', using pandas")
+            return "pandas"
+        if engine == "sql" and not self.available:
+            logger.warning("[SQL-ENGINE] duckdb is not installed, using pandas")
+            self.stats.record(False, "unavailable")
+            return "pandas"
+        return engine
+
+    # --- SQL ---
+
+    @staticmethod
+    def extract_sql(content: Optional[str]) -> Optional[str]:
+        if not content:
+            return None
+        match = _SQL_BLOCK.search(content)
+        sql = (match.group(1) if match else content).strip().rstrip(";").strip()
+        return sql or None
+
+    def validate_sql(self, sql: str) -> Tuple[bool, Optional[str]]:
+        """Только один SELECT; синтаксис проверяет парсер DuckDB"""
+        try:
+            with duckdb.connect(":memory:") as con:
+                statements = con.extract_statements(sql)
+        except Exception as e:
+            return False, f"Syntax error: {e}"
+        if len(statements) != 1:
+            return False, f"Ожидался один запрос, получено {len(statements)}"
+        if statements[0].type != duckdb.StatementType.SELECT:
+            return False, f"Разрешён только SELECT, получено {statements[0].type.name}"
+        return True, None
+
+    def _database(self):
+        """
+        Общая in-memory база движка: создание соединения DuckDB стоит ~20 мс,
+        курсор - доли миллисекунды. Ограничения задаются один раз и заблокированы.
+        """
+        with self._db_lock:
+            if self._db is None:
+                config = {"enable_external_access": False}
+                if int(settings.SQL_ENGINE_THREADS) > 0:
+                    config["threads"] = int(settings.SQL_ENGINE_THREADS)
+                self._db = duckdb.connect(":memory:", config=config)
+                self._db.execute("SET lock_configuration = true")
+            return self._db
+
+    def _connect(self, df: pd.DataFrame, reference_df: Optional[pd.DataFrame] = None):
+        """Курсор запроса: df и reference_df видны только в нём (временные view)"""
+        database = self._database()
+        with self._db_lock:
+            con = database.cursor()
+        # Регистрация - без копирования: DuckDB читает колонки DataFrame напрямую
+        con.register("df", df)
+        if reference_df is not None:
+            con.register("reference_df", reference_df)
+        return con
+
+    @staticmethod
+    def _to_result(frame: pd.DataFrame) -> Any:
+        """Форма результата как у pandas-пути: скаляр, список или таблица"""
+        if frame.shape == (1, 1):
+            value = frame.iat[0, 0]
+            if isinstance(value, np.generic):
+                value = value.item()
+            return None if pd.isna(value) else value
+        if frame.shape[1] == 1:
+            return frame.iloc[:, 0].tolist()
+        return frame
+
+    def _fetch(self, con, sql: str, rows: int) -> pd.DataFrame:
+        start = time.perf_counter()
+        frame = con.execute(sql).df()
+        self.stats.record_attempt((time.perf_counter() - start) * 1000, rows)
+        return frame
+
+    def _output(self, frame: pd.DataFrame) -> Dict[str, Any]:
+        result = self._to_result(frame)
+        if result is None:
+            raise ValueError("SQL вернул пустой результат (NULL)")
+        return {"result": result, "explanation": ""}
+
+    def execute(self, sql: str, df: pd.DataFrame, reference_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """Выполняет SELECT по df/reference_df. Возвращает dict с result и explanation"""
+        con = self._connect(df, reference_df)
+        try:
+            frame = self._fetch(con, sql, len(df))
+        finally:
+            con.close()
+        return self._output(frame)
+
+    async def _execute_async(self, sql: str, df: pd.DataFrame, reference_df: Optional[pd.DataFrame]) -> Dict[str, Any]:
+        """Выполнение в потоке: event loop свободен, по таймауту запрос прерывается"""
+        con = self._connect(df, reference_df)
+        try:
+            frame = await asyncio.wait_for(
+                asyncio.to_thread(self._fetch, con, sql, len(df)),
+                timeout=float(settings.SQL_ENGINE_TIMEOUT),
+            )
+        except asyncio.TimeoutError:
+            con.interrupt()
+            raise TimeoutError(f"SQL выполнялся дольше {settings.SQL_ENGINE_TIMEOUT:.0f} секунд и был остановлен")
+        finally:
+            con.close()
+        return self._output(frame)
+
+    async def generate_sql(
+        self,
+        query: str,
+        schema_prompt: str,
+        custom_context: Optional[str] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+        clarification: Optional[str] = None,
+        previous_error: Optional[str] = None,
+    ) -> Optional[str]:
+        """SQL по схеме листа (тот же LLM, что и для pandas-кода; ответ кэшируется)"""
+        user_prompt = f"СХЕМА ДАННЫХ:\n{schema_prompt}\n"
+        if history:
+            questions = [str(item.get("query")) for item in history[-5:] if item.get("query")]
+            if questions:
+                user_prompt += "\nПРЕДЫДУЩИЕ ВОПРОСЫ:\n" + "\n".join(f"- {q}" for q in questions) + "\n"
+        user_prompt += f"\nЗАПРОС: {query}\n"
+        if custom_context:
+            user_prompt += f"\nРОЛЬ ПОЛЬЗОВАТЕЛЯ: {custom_context}\n"
+        if clarification:
+            user_prompt += f"\nВАЖНО: {clarification}\n"
+        if previous_error:
+            user_prompt += f"\nПРЕДЫДУЩАЯ ОШИБКА (избегай её): {previous_error}\n"
+
+        try:
+            content = await self.processor._chat(
+                model=self.processor.MODEL,
+                messages=[
+                    {"role": "system", "content": SQL_SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.1,
+                max_tokens=800,
+                cache=True,
+                stream_stage="code",
+            )
+        except Exception as e:
+            logger.error(f"[SQL-ENGINE] SQL generation error: {e}")
+            return None
+        return self.extract_sql(content)
+
+    async def generate_and_execute(
+        self,
+        query: str,
+        df: pd.DataFrame,
+        schema_prompt: str,
+        custom_context: Optional[str] = None,
+        history: Optional[List[Dict[str, Any]]] = None,
+        clarification: Optional[str] = None,
+        reference_df: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """
+        Генерирует и выполняет SQL с retry (как _generate_and_execute для pandas).
+        Ответ: {"success", "result", "explanation", "code": sql, "engine": "sql", "cache_key"}.
+        """
+        from .simple_gpt_processor import emit_progress
+        from .llm_cache import last_cache_key
+
+        previous_error = None
+        for attempt in range(self.processor.MAX_RETRIES + 1):
+            sql = await self.generate_sql(query, schema_prompt, custom_context, history, clarification, previous_error)
+            if not sql:
+                return {"success": False, "error": "Не удалось сгенерировать SQL", "engine": "sql"}
+            cache_key = last_cache_key()
+            emit_progress("code", attempt=attempt + 1, code=sql, engine="sql")
+
+            is_valid, error = self.validate_sql(sql)
+            if not is_valid:
+                previous_error = error
+                self.processor.llm_cache.invalidate(cache_key)
+                continue
+
+            try:
+                output = await self._execute_async(sql, df, reference_df)
+            except Exception as e:
+                previous_error = f"{type(e).__name__}: {e}"
+                logger.warning(f"[SQL-ENGINE] Attempt {attempt + 1} failed: {previous_error}")
+                emit_progress("execution", attempt=attempt + 1, success=False, error=previous_error, engine="sql")
+                self.processor.llm_cache.invalidate(cache_key)
+                continue
+
+            emit_progress("execution", attempt=attempt + 1, success=True, engine="sql",
+                          result_type=self.processor._get_result_type(output["result"]))
+            return {"success": True, "code": sql, "engine": "sql", "cache_key": cache_key, **output}
+
+        return {"success": False, "error": previous_error, "engine": "sql"}
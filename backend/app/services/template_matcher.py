@@ -6,6 +6,7 @@
 from typing import Optional, List, Dict, Tuple
 import re
 from .formula_templates import get_all_templates, FormulaTemplate
+from app.utils.column_index import get_column_index
 
 
 class TemplateMatcher:
@@ -182,10 +183,10 @@ class TemplateMatcher:
         if column_match:
             return column_match.group(1)
         
-        # Ищем упоминание названия столбца
-        for i, col_name in enumerate(columns):
-            if col_name.lower() in query_lower:
-                return chr(65 + i)  # A=65, B=66, etc
+        # Ищем упоминание названия столбца (v11.26.0: индекс колонок листа)
+        position = get_column_index(columns).mentioned(query_lower)
+        if position is not None:
+            return chr(65 + position)  # A=65, B=66, etc
         
         return None
     
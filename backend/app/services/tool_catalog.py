@@ -0,0 +1,176 @@
+"""
+Tool Catalog v1.0.0 - предвычисленный каталог OpenAI tool definitions
+
+FunctionRegistry.get_function_definitions раньше собирал литерал из ~100
+определений на каждый вызов, а TwoStageProcessor/AIFunctionCaller фильтровали
+его заново для каждого запроса и отправляли в LLM всё, что прошло фильтр.
+
+ToolCatalog строится один раз при импорте function_registry:
+- для каждой функции - определение, JSON (ensure_ascii=False) и оценка токенов
+- записи хранятся в кортежах, каталог не меняется после сборки
+- подмножества по намерению (action_type, aggregation, group_by, ...)
+  мемоизируются - повторное намерение не фильтрует список заново
+- pack() набирает самые релевантные функции под бюджет токенов вместо
+  отправки 100+ определений
+"""
+
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.prompt_budget import estimate_tokens
+
+# action_type из понимания запроса (TwoStageProcessor) -> функции
+INTENT_FUNCTIONS: Dict[str, Tuple[str, ...]] = {
+    "filter": (
+        "filter_rows", "filter_between", "filter_in_list", "filter_not_in_list",
+        "filter_null", "filter_not_null", "filter_regex", "filter_outliers",
+    ),
+    "top_n": ("filter_top_n", "filter_bottom_n"),  # ТОЛЬКО эти для топ N!
+    "aggregate": ("aggregate_by_group", "pivot_table"),
+    "sort": ("sort_data", "calculate_rank"),
+    "transform": (
+        "case_when", "if_then_else", "fill_missing", "coalesce",
+        "create_bins", "calculate_percentage",
+    ),
+    "highlight": ("highlight_rows",),  # ТОЛЬКО highlight_rows для выделения!
+    "search": ("search_rows", "filter_rows", "filter_regex"),
+    "calculate": (
+        "calculate_sum", "calculate_average", "calculate_count",
+        "calculate_min", "calculate_max", "calculate_std",
+        "calculate_percentage", "calculate_ratio",
+    ),
+}
+BASE_FUNCTIONS = ("filter_rows", "calculate_sum", "aggregate_by_group", "sort_data", "highlight_rows")
+
+
+@dataclass(frozen=True)
+class ToolEntry:
+    """Одна функция каталога: определение не изменять - оно общее для всех запросов"""
+    name: str
+    definition: Dict[str, Any]
+    json: str
+    tokens: int
+
+
+class ToolCatalog:
+    """
+    Неизменяемый каталог function definitions.
+
+    Usage:
+        catalog = get_tool_catalog()
+        entries = catalog.for_intent("filter", aggregation="sum", group_by=True)
+        functions = catalog.pack([e.name for e in entries], budget=6000)
+    """
+
+    def __init__(self, definitions: Iterable[Dict[str, Any]]):
+        entries = []
+        for definition in definitions:
+            serialized = json.dumps(definition, ensure_ascii=False, separators=(",", ":"))
+            entries.append(ToolEntry(definition["name"], definition, serialized, estimate_tokens(serialized)))
+        self.entries: Tuple[ToolEntry, ...] = tuple(entries)
+        self.definitions: Tuple[Dict[str, Any], ...] = tuple(entry.definition for entry in self.entries)
+        self._by_name = {entry.name: entry for entry in self.entries}
+        self.total_tokens = sum(entry.tokens for entry in self.entries)
+
+        self._intent_cache: Dict[tuple, Tuple[ToolEntry, ...]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def get(self, name: str) -> Optional[ToolEntry]:
+        return self._by_name.get(name)
+
+    def select(self, names: Iterable[str]) -> Tuple[ToolEntry, ...]:
+        """Записи по именам в порядке каталога (неизвестные имена пропускаются)"""
+        wanted = set(names)
+        return tuple(entry for entry in self.entries if entry.name in wanted)
+
+    def for_intent(
+        self,
+        action_type: str = "unknown",
+        aggregation: str = "none",
+        group_by: bool = False,
+        sort_by: bool = False,
+        limit: bool = False,
+        output_type: str = "table",
+    ) -> Tuple[ToolEntry, ...]:
+        """Функции для понятого намерения; результат мемоизируется по ключу намерения"""
+        key = (action_type, aggregation, bool(group_by), bool(sort_by), bool(limit), output_type)
+        with self._lock:
+            cached = self._intent_cache.get(key)
+            if cached is not None:
+                self._hits += 1
+                return cached
+
+        names = set(INTENT_FUNCTIONS.get(action_type, ()))
+        if aggregation != "none":
+            names.update(["aggregate_by_group", "pivot_table"])
+            if aggregation in ("sum", "count", "avg", "min", "max"):
+                names.add(f"calculate_{aggregation}")
+        if group_by:
+            names.update(["aggregate_by_group", "pivot_table", "top_n_per_group"])
+        if sort_by:
+            names.update(["sort_data", "calculate_rank"])
+        if limit:
+            names.update(["filter_top_n", "filter_bottom_n"])
+        if output_type == "highlight":
+            names.add("highlight_rows")
+
+        selected = self.select(names) or self.select(BASE_FUNCTIONS)
+        with self._lock:
+            self._misses += 1
+            self._intent_cache[key] = selected
+        return selected
+
+    def pack(self, preferred: Optional[Iterable[str]] = None, budget: int = 0, fill: bool = False) -> List[Dict[str, Any]]:
+        """
+        Определения под бюджет токенов (0 - без ограничения).
+
+        Сначала preferred в переданном порядке, при fill=True - остальные функции
+        каталога. Функция, которая не помещается, пропускается (следующая,
+        более короткая, ещё может поместиться).
+        """
+        order: List[ToolEntry] = []
+        seen = set()
+        for name in preferred or ():
+            entry = self._by_name.get(name)
+            if entry is not None and name not in seen:
+                order.append(entry)
+                seen.add(name)
+        if fill or preferred is None:
+            order.extend(entry for entry in self.entries if entry.name not in seen)
+
+        packed, used = [], 0
+        for entry in order:
+            if budget and used + entry.tokens > budget:
+                continue
+            packed.append(entry.definition)
+            used += entry.tokens
+        return packed
+
+    def tokens_for(self, definitions: Iterable[Dict[str, Any]]) -> int:
+        return sum(self._by_name[d["name"]].tokens for d in definitions if d["name"] in self._by_name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tools": len(self.entries),
+                "total_tokens": self.total_tokens,
+                "intent_subsets": len(self._intent_cache),
+                "intent_hits": self._hits,
+                "intent_misses": self._misses,
+            }
+
+
+def get_tool_catalog() -> ToolCatalog:
+    """Каталог FunctionRegistry (собирается при импорте function_registry)"""
+    from app.services.function_registry import TOOL_CATALOG
+    return TOOL_CATALOG
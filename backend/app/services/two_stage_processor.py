@@ -26,6 +26,9 @@ from openai import AsyncOpenAI
 import pandas as pd
 import os
 
+from app.config import settings
+from app.services.tool_catalog import BASE_FUNCTIONS, get_tool_catalog
+
 
 class TwoStageProcessor:
     """
@@ -39,6 +42,7 @@ class TwoStageProcessor:
         self.client = client
         self.understanding_model = "gpt-4o-mini"  # Быстрый и дешевый для понимания
         self.function_model = "gpt-4o"  # Точный для выбора функции
+        self.catalog = get_tool_catalog()  # v11.25.0: предвычисленные definitions
 
     async def stage1_understand(
         self,
@@ -178,81 +182,31 @@ class TwoStageProcessor:
     def select_functions_for_intent(
         self,
         understanding: Dict[str, Any],
-        all_functions: List[Dict]
+        all_functions: Optional[List[Dict]] = None
     ) -> List[Dict]:
         """
         Выбирает релевантные функции на основе понятого намерения
+
+        v11.25.0: подмножество берётся из каталога (мемоизировано по намерению);
+        all_functions ограничивает выбор, если передан не полный каталог
         """
         action_type = understanding.get("action_type", "unknown")
-        aggregation = understanding.get("aggregation", "none")
-        output_type = understanding.get("output_type", "table")
-
-        # Маппинг action_type → функции
-        function_map = {
-            "filter": [
-                "filter_rows", "filter_between", "filter_in_list", "filter_not_in_list",
-                "filter_null", "filter_not_null", "filter_regex", "filter_outliers"
-            ],
-            "top_n": [
-                "filter_top_n", "filter_bottom_n"  # ТОЛЬКО эти для топ N!
-            ],
-            "aggregate": [
-                "aggregate_by_group", "pivot_table"  # Группировка
-            ],
-            "sort": [
-                "sort_data", "calculate_rank"
-            ],
-            "transform": [
-                "case_when", "if_then_else", "fill_missing", "coalesce",
-                "create_bins", "calculate_percentage"
-            ],
-            "highlight": [
-                "highlight_rows"  # ТОЛЬКО highlight_rows для выделения!
-            ],
-            "search": [
-                "search_rows", "filter_rows", "filter_regex"
-            ],
-            "calculate": [
-                "calculate_sum", "calculate_average", "calculate_count",
-                "calculate_min", "calculate_max", "calculate_std",
-                "calculate_percentage", "calculate_ratio"
+        entries = self.catalog.for_intent(
+            action_type=action_type,
+            aggregation=understanding.get("aggregation", "none"),
+            group_by=bool(understanding.get("group_by")),
+            sort_by=bool(understanding.get("sort_by")),
+            limit=bool(understanding.get("limit")),
+            output_type=understanding.get("output_type", "table"),
+        )
+        names = [entry.name for entry in entries]
+        if all_functions is not None:
+            available = {f["name"] for f in all_functions}
+            names = [name for name in names if name in available] or [
+                name for name in BASE_FUNCTIONS if name in available
             ]
-        }
-
-        # Получаем базовые функции для action_type
-        relevant_names = set(function_map.get(action_type, []))
-
-        # Добавляем функции для агрегации если нужна
-        if aggregation != "none":
-            relevant_names.update([
-                "aggregate_by_group", "pivot_table",
-                f"calculate_{aggregation}" if aggregation in ["sum", "count", "avg", "min", "max"] else None
-            ])
-            relevant_names.discard(None)
-
-        # Добавляем group_by функции если есть группировка
-        if understanding.get("group_by"):
-            relevant_names.update(["aggregate_by_group", "pivot_table", "top_n_per_group"])
-
-        # Добавляем sort функции если есть сортировка
-        if understanding.get("sort_by"):
-            relevant_names.update(["sort_data", "calculate_rank"])
-
-        # Добавляем limit функции если есть лимит
-        if understanding.get("limit"):
-            relevant_names.update(["filter_top_n", "filter_bottom_n"])
-
-        # Для highlight всегда добавляем highlight_rows
-        if output_type == "highlight":
-            relevant_names.add("highlight_rows")
-
-        # Фильтруем функции
-        filtered = [f for f in all_functions if f["name"] in relevant_names]
 
-        # Если ничего не нашли - возвращаем базовый набор
-        if not filtered:
-            base_functions = ["filter_rows", "calculate_sum", "aggregate_by_group", "sort_data", "highlight_rows"]
-            filtered = [f for f in all_functions if f["name"] in base_functions]
+        filtered = self.catalog.pack(names, budget=settings.TOOL_CATALOG_TOKEN_BUDGET)
 
         print(f"[STAGE 2 PREP v8.0.0] Selected {len(filtered)} functions for action_type={action_type}")
 
@@ -333,7 +287,7 @@ class TwoStageProcessor:
         query: str,
         df: pd.DataFrame,
         column_names: List[str],
-        all_functions: List[Dict]
+        all_functions: Optional[List[Dict]] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Полный двухэтапный процесс
@@ -374,8 +328,8 @@ if __name__ == "__main__":
     import asyncio
 
     async def test():
-        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        processor = TwoStageProcessor(client)
+        from app.services.llm_gateway import get_llm_gateway
+        processor = TwoStageProcessor(get_llm_gateway().client)
 
         # Тестовые данные
         df = pd.DataFrame({
@@ -5,6 +5,13 @@ Utility modules for SheetGPT backend
 from .fuzzy_match import find_best_column_match, get_similar_columns, normalize_column_name
 from .query_classifier import QueryClassifier
 from .metrics import metrics_collector, track_execution, MetricsCollector
+from .type_coercion import parse_numeric_series, auto_convert_numeric_columns
+from .sheet_ingest import rows_to_frame, IngestStats
+from .prompt_budget import PromptBudget, estimate_tokens
+from .sheet_sketch import get_sheet_sketch, representative_rows, sketch_column
+from .keyword_index import KeywordIndex, KeywordMatch
+from .sheet_profile import SheetProfile, get_sheet_profile
+from .column_index import ColumnIndex, get_column_index
 
 __all__ = [
     "find_best_column_match",
@@ -14,4 +21,19 @@ __all__ = [
     "metrics_collector",
     "track_execution",
     "MetricsCollector",
+    "parse_numeric_series",
+    "auto_convert_numeric_columns",
+    "rows_to_frame",
+    "IngestStats",
+    "PromptBudget",
+    "estimate_tokens",
+    "get_sheet_sketch",
+    "representative_rows",
+    "sketch_column",
+    "KeywordIndex",
+    "KeywordMatch",
+    "SheetProfile",
+    "get_sheet_profile",
+    "ColumnIndex",
+    "get_column_index",
 ]
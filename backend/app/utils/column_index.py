@@ -0,0 +1,278 @@
+"""
+ColumnIndex v1.0.0 - индекс названий колонок листа для нечёткого поиска
+
+Поиск колонки по названию был реализован четыре раза и каждый раз линейно:
+FunctionRegistry._find_column (подстроки через .lower() на каждый вызов),
+fuzzy_match.find_best_column_match (SequenceMatcher против всех колонок),
+SmartQueryClassifier._fuzzy_match_column и TemplateMatcher._find_mentioned_column.
+За один запрос они вызываются многократно для одних и тех же колонок.
+
+ColumnIndex строится один раз на набор колонок (get_column_index) и хранит:
+- нормализованные названия (lower + strip) и точное соответствие
+- инвертированный индекс символьных триграмм: "кто содержит подстроку" -
+  пересечение списков, "кто содержится в тексте" - колонки, все триграммы
+  которых есть в тексте; кандидаты проверяются обычным `in`
+- индекс биграмм: кандидаты для SequenceMatcher (без общих биграмм и при
+  большой разнице длин ratio не дотягивает до порога)
+- индекс первых 4 символов слов (русские падежи) и таблицу синонимов
+  get_column_synonyms
+- результаты каждого поиска мемоизируются
+
+Каждый метод повторяет порядок и правила прежней реализации:
+- resolve()  - find_best_column_match (exact -> fuzzy -> substring -> stem -> synonym)
+- find()     - FunctionRegistry._find_column (contains: самое короткое, обратное: самое длинное)
+- match()    - SmartQueryClassifier._fuzzy_match_column (первое по порядку)
+- mentioned()- TemplateMatcher._find_mentioned_column (первая колонка, упомянутая в тексте)
+"""
+
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .fuzzy_match import get_column_synonyms
+from .metrics import metrics_collector
+
+NGRAM = 3
+STEM = 4  # столько первых символов слова сравнивается (сумма / сумму)
+_SYNONYMS = get_column_synonyms()
+
+
+def _ngrams(text: str, n: int) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class ColumnIndex:
+    """Инвертированные индексы по названиям колонок одного листа"""
+
+    def __init__(self, columns: Iterable[Any]):
+        self.columns: Tuple[Any, ...] = tuple(columns)
+        self._positions: Dict[Any, int] = {}
+        for pos, col in enumerate(self.columns):
+            self._positions.setdefault(col, pos)
+        self.keys: List[Optional[str]] = [
+            str(col).lower().strip() if isinstance(col, str) else None for col in self.columns
+        ]
+        self._exact: Dict[str, int] = {}
+        self._lower: Dict[str, int] = {}  # lower() без strip - как в FunctionRegistry._find_column
+        self._trigrams: Dict[str, List[int]] = {}
+        self._bigrams: Dict[str, List[int]] = {}
+        self._stems: Dict[str, List[int]] = {}
+        self._trigram_count: List[int] = []
+        self._short: List[int] = []       # короче триграммы: проверяются напрямую
+
+        for pos, key in enumerate(self.keys):
+            self._trigram_count.append(0)
+            if key is None:
+                continue
+            self._exact.setdefault(key, pos)
+            self._lower.setdefault(self.columns[pos].lower(), pos)
+            grams = _ngrams(key, NGRAM)
+            self._trigram_count[pos] = len(grams)
+            if not grams:
+                self._short.append(pos)
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(pos)
+            for gram in _ngrams(key, 2):
+                self._bigrams.setdefault(gram, []).append(pos)
+            for word in set(key.split()):
+                if len(word) >= STEM:
+                    postings = self._stems.setdefault(word[:STEM], [])
+                    if not postings or postings[-1] != pos:
+                        postings.append(pos)
+
+        self._memo: Dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.memo_hits = 0
+        self.methods: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    # --- Примитивы индекса ---
+
+    def _containing(self, text: str) -> List[int]:
+        """Позиции колонок, название которых содержит text (по возрастанию)"""
+        grams = _ngrams(text, NGRAM)
+        if not grams:
+            return [pos for pos, key in enumerate(self.keys) if key is not None and text in key]
+        postings = sorted((self._trigrams.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return []
+        return sorted(pos for pos in candidates if text in self.keys[pos])
+
+    def _contained_in(self, text: str) -> List[int]:
+        """Позиции колонок, название которых входит в text (по возрастанию)"""
+        hits: Dict[int, int] = {}
+        for gram in _ngrams(text, NGRAM):
+            for pos in self._trigrams.get(gram, ()):
+                hits[pos] = hits.get(pos, 0) + 1
+        candidates = [pos for pos, count in hits.items() if count == self._trigram_count[pos]]
+        candidates.extend(self._short)
+        return sorted(pos for pos in set(candidates) if self.keys[pos] in text)
+
+    def _with_stem(self, stem: str) -> List[int]:
+        return self._stems.get(stem, [])
+
+    def _fuzzy(self, text: str, threshold: float) -> Tuple[Optional[int], float]:
+        """Лучший SequenceMatcher.ratio среди кандидатов (первая колонка при равенстве)"""
+        grams = _ngrams(text, 2)
+        if grams:
+            candidates = set()
+            for gram in grams:
+                candidates.update(self._bigrams.get(gram, ()))
+        else:
+            candidates = {pos for pos, key in enumerate(self.keys) if key is not None}
+
+        best, best_score = None, 0.0
+        for pos in sorted(candidates):
+            key = self.keys[pos]
+            # ratio <= 2*min(len)/(сумма длин) - длинные/короткие колонки не проверяем
+            if 2 * min(len(key), len(text)) < threshold * (len(key) + len(text)):
+                continue
+            score = SequenceMatcher(None, text, key).ratio()
+            if score > best_score:
+                best, best_score = pos, score
+        return best, best_score
+
+    def _memoized(self, key: tuple, compute):
+        with self._lock:
+            self.lookups += 1
+            if key in self._memo:
+                self.memo_hits += 1
+                return self._memo[key], True
+        value = compute()
+        with self._lock:
+            self._memo[key] = value
+        return value, False
+
+    def _column(self, pos: Optional[int]) -> Optional[Any]:
+        return None if pos is None else self.columns[pos]
+
+    # --- Поиск ---
+
+    def resolve(self, requested: str, threshold: float = 0.6) -> Tuple[Optional[str], str]:
+        """(колонка, метод) по правилам find_best_column_match; метод "none" - не найдено"""
+        if not requested or not self.columns:
+            return None, "none"
+        text = requested.lower().strip()
+
+        def compute() -> Tuple[Optional[int], str]:
+            pos, method = self._resolve(text, threshold)
+            with self._lock:
+                self.methods[method] = self.methods.get(method, 0) + 1
+            # Качество сопоставления - один раз на название для этого листа
+            metrics_collector.log_fuzzy_match(requested, self._column(pos), list(self.columns), method=method)
+            return pos, method
+
+        (pos, method), _ = self._memoized(("resolve", text, threshold), compute)
+        return self._column(pos), method
+
+    def _resolve(self, text: str, threshold: float) -> Tuple[Optional[int], str]:
+        # 1. Точное совпадение
+        if text in self._exact:
+            return self._exact[text], "exact"
+
+        # 2. SequenceMatcher
+        pos, score = self._fuzzy(text, threshold)
+        if pos is not None and score >= threshold:
+            return pos, "fuzzy"
+
+        # 3. Подстрока в любую сторону - первая колонка по порядку
+        found = self._containing(text) + self._contained_in(text)
+        if found:
+            return min(found), "substring"
+
+        # 3.5. Первые 4 символа слова (падежи)
+        found = [p for word in text.split() if len(word) >= STEM for p in self._with_stem(word[:STEM])]
+        if found:
+            return min(found), "stem"
+
+        # 4. Синонимы: подстрока или начало слова колонки
+        found = []
+        for synonym in _SYNONYMS.get(text, [text]):
+            found.extend(self._containing(synonym))
+            if len(synonym) >= STEM:
+                found.extend(self._with_stem(synonym[:STEM]))
+        if found:
+            return min(found), "synonym"
+
+        return None, "none"
+
+    def find(self, column_name: str) -> Optional[Any]:
+        """Колонка по правилам FunctionRegistry._find_column (None - не найдено)"""
+        if column_name in self._positions:
+            return column_name
+        if not isinstance(column_name, str):
+            return None
+
+        def compute() -> Optional[int]:
+            text = column_name.lower()
+            if text in self._lower:
+                return self._lower[text]
+            contains = [pos for pos in self._containing(text.strip()) if text in self.columns[pos].lower()]
+            if contains:
+                return min(contains, key=lambda p: len(self.columns[p]))
+            reverse = [pos for pos in self._contained_in(text) if self.columns[pos].lower() in text]
+            if reverse:
+                return max(reverse, key=lambda p: len(self.columns[p]))
+            return None
+
+        pos, _ = self._memoized(("find", column_name), compute)
+        return self._column(pos)
+
+    def match(self, search: str) -> Optional[Any]:
+        """Колонка по правилам SmartQueryClassifier._fuzzy_match_column"""
+        text = search.lower().strip()
+
+        def compute() -> Optional[int]:
+            if text in self._exact:
+                return self._exact[text]
+            for found in (self._containing(text), self._contained_in(text)):
+                if found:
+                    return found[0]
+            return None
+
+        pos, _ = self._memoized(("match", text), compute)
+        return self._column(pos)
+
+    def mentioned(self, text: str) -> Optional[int]:
+        """Позиция первой колонки, название которой встречается в тексте"""
+        text = text.lower()
+        found, _ = self._memoized(("mentioned", text), lambda: self._contained_in(text))
+        return found[0] if found else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "columns": len(self.columns),
+                "lookups": self.lookups,
+                "memo_hits": self.memo_hits,
+                "methods": dict(self.methods),
+            }
+
+
+# Индекс на набор колонок: лист одного запроса разбирается несколькими модулями
+_indexes: "OrderedDict[tuple, ColumnIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_INDEXES_SIZE = 64
+
+
+def get_column_index(columns: Iterable[Any]) -> ColumnIndex:
+    """ColumnIndex для этих колонок (строится один раз, LRU на _INDEXES_SIZE листов)"""
+    key = tuple(columns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = ColumnIndex(key)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > _INDEXES_SIZE:
+            _indexes.popitem(last=False)
+    return index
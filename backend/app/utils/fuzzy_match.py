@@ -15,7 +15,7 @@ def find_best_column_match(
     """
     Находит лучшее совпадение для requested_column среди available_columns
 
-    Стратегия (по приоритету):
+    Стратегия (по приоритету, см. ColumnIndex.resolve):
     1. Точное совпадение (case-insensitive)
     2. Fuzzy match (SequenceMatcher) с порогом 0.6
     3. Substring match (содержит или содержится)
@@ -33,64 +33,10 @@ def find_best_column_match(
     if not requested_column or not available_columns:
         return None
 
-    requested_lower = requested_column.lower().strip()
-    available_lower = {col: col.lower().strip() for col in available_columns}
-
-    # 1️⃣ Точное совпадение (case-insensitive)
-    for col, col_lower in available_lower.items():
-        if requested_lower == col_lower:
-            return col
-
-    # 2️⃣ Fuzzy match (SequenceMatcher)
-    best_match = None
-    best_score = 0.0
-
-    for col, col_lower in available_lower.items():
-        score = SequenceMatcher(None, requested_lower, col_lower).ratio()
-        if score > best_score:
-            best_score = score
-            best_match = col
-
-    if best_score >= threshold:
-        return best_match
-
-    # 3️⃣ Substring match (содержит или содержится)
-    for col, col_lower in available_lower.items():
-        if requested_lower in col_lower or col_lower in requested_lower:
-            return col
-
-    # 3.5️⃣ Partial word match (для русских падежей: "сумма" vs "сумму")
-    # Проверяем первые 4 символа каждого слова
-    requested_words = requested_lower.split()
-    for col, col_lower in available_lower.items():
-        col_words = col_lower.split()
-        for req_word in requested_words:
-            if len(req_word) >= 4:  # Минимум 4 символа для надежности
-                req_stem = req_word[:4]
-                for col_word in col_words:
-                    if col_word.startswith(req_stem):
-                        return col
-
-    # 4️⃣ Synonym match (русские синонимы для общих столбцов)
-    synonyms = get_column_synonyms()
-    requested_synonyms = synonyms.get(requested_lower, [requested_lower])
-
-    for col, col_lower in available_lower.items():
-        # Проверяем каждый синоним на вхождение в название колонки
-        for req_syn in requested_synonyms:
-            # Проверка вхождения синонима как подстроки
-            if req_syn in col_lower:
-                return col
-            # Проверка вхождения синонима как отдельного слова
-            col_words = col_lower.split()
-            for col_word in col_words:
-                # Проверка на первые 4 символа (для падежей)
-                if len(col_word) >= 4 and len(req_syn) >= 4:
-                    if col_word.startswith(req_syn[:4]):
-                        return col
-
-    # 5️⃣ Не найдено
-    return None
+    # v11.26.0: Индекс колонок листа (n-граммы, основы слов, синонимы) с мемоизацией
+    from app.utils.column_index import get_column_index
+    match, _method = get_column_index(available_columns).resolve(requested_column, threshold)
+    return match
 
 
 def get_column_synonyms() -> Dict[str, List[str]]:
@@ -0,0 +1,188 @@
+"""
+Compiled multi-keyword matcher v1.0.0
+
+SimpleGPTProcessor проверял запрос десятками отдельных циклов
+any(kw in query_lower for kw in ...): FULL_DATA/SAMPLE/CONVERSATIONAL, списки
+прогноза/выделения/диаграмм и списки внутри каждого _detect_*_action. Один
+запрос сканировался 40+ раз, по одному проходу на каждое ключевое слово.
+
+Здесь все списки компилируются один раз (при импорте) в автомат Aho-Corasick:
+- один проход по тексту находит все вхождения всех ключевых слов, включая
+  перекрывающиеся ("выдели" внутри "выделить") - то же, что даёт `kw in text`
+  для каждого слова по отдельности
+- результат - KeywordMatch: множество тегов (имён списков) и найденных слов
+- match() кэширует результат по тексту, поэтому все детекторы одного запроса
+  читают одно и то же сопоставление
+
+Использование:
+    index = KeywordIndex({"SORT_KEYWORDS": [...], "CHART_TYPES": CHART_TYPES.keys()})
+    m = index.match(query.lower())
+    if "SORT_KEYWORDS" in m: ...
+    chart_type = CHART_TYPES.get(m.first(CHART_TYPES), "COLUMN")
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+
+class KeywordMatch:
+    """Результат одного прохода: найденные теги и ключевые слова"""
+
+    __slots__ = ("tags", "keywords", "_vocabulary")
+
+    def __init__(self, tags: FrozenSet[str], keywords: FrozenSet[str], vocabulary: FrozenSet[str]):
+        self.tags = tags
+        self.keywords = keywords
+        self._vocabulary = vocabulary
+
+    def __contains__(self, tag: str) -> bool:
+        return tag in self.tags
+
+    def __repr__(self) -> str:
+        return f"KeywordMatch(tags={sorted(self.tags)})"
+
+    def _check(self, keyword: str) -> None:
+        if keyword not in self._vocabulary:
+            raise KeyError(f"Keyword {keyword!r} is not compiled into the index")
+
+    def any(self, keywords: Iterable[str]) -> bool:
+        """Аналог any(kw in text for kw in keywords) для слов из индекса"""
+        for keyword in keywords:
+            if keyword in self.keywords:
+                return True
+            self._check(keyword)
+        return False
+
+    def first(self, keywords: Iterable[str]) -> Optional[str]:
+        """Первое (в порядке keywords) найденное слово - для упорядоченных словарей вида CHART_TYPES"""
+        for keyword in keywords:
+            if keyword in self.keywords:
+                return keyword
+            self._check(keyword)
+        return None
+
+
+class KeywordIndex:
+    """
+    Автомат Aho-Corasick над ключевыми словами, сгруппированными по тегам.
+
+    Одно слово может входить в несколько тегов ("заголов" - и FREEZE_ROWS, и
+    FORMAT_HEADER). Выходы состояний хранятся битовыми масками слов, уже
+    объединёнными по суффиксным ссылкам, поэтому проход - O(len(text)).
+    """
+
+    def __init__(self, groups: Optional[Mapping[str, Iterable[str]]] = None, cache_size: int = 512):
+        self._tags_by_keyword: "OrderedDict[str, set]" = OrderedDict()
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[str, KeywordMatch]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._compiled = False
+        for tag, keywords in (groups or {}).items():
+            self.add(tag, keywords)
+
+    # --- Построение ---
+
+    def add(self, tag: str, keywords: Iterable[str]) -> "KeywordIndex":
+        for keyword in keywords:
+            if not keyword:
+                continue
+            self._tags_by_keyword.setdefault(keyword, set()).add(tag)
+        self._compiled = False
+        return self
+
+    @property
+    def tags(self) -> FrozenSet[str]:
+        return frozenset(tag for tags in self._tags_by_keyword.values() for tag in tags)
+
+    def keywords(self, tag: str) -> List[str]:
+        return [keyword for keyword, tags in self._tags_by_keyword.items() if tag in tags]
+
+    def compile(self) -> "KeywordIndex":
+        """Строит trie, суффиксные ссылки и объединённые выходы"""
+        words = list(self._tags_by_keyword)
+        goto: List[Dict[str, int]] = [{}]
+        out: List[int] = [0]
+        for word_id, word in enumerate(words):
+            state = 0
+            for char in word:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    out.append(0)
+                state = nxt
+            out[state] |= 1 << word_id
+
+        # BFS: суффиксные ссылки и полный переход для каждого символа trie
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                link = fail[state]
+                while link and char not in goto[link]:
+                    link = fail[link]
+                target = goto[link].get(char, 0)
+                fail[nxt] = target if target != nxt else 0
+                out[nxt] |= out[fail[nxt]]
+
+        self._words = words
+        self._word_tags = [frozenset(self._tags_by_keyword[word]) for word in words]
+        self._vocabulary = frozenset(words)
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._compiled = True
+        with self._lock:
+            self._cache.clear()
+        return self
+
+    # --- Поиск ---
+
+    def scan(self, text: str) -> KeywordMatch:
+        """Один проход по тексту без кэша"""
+        if not self._compiled:
+            self.compile()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found |= out[state]
+
+        keywords = []
+        tags = set()
+        word_id = 0
+        while found:
+            if found & 1:
+                keywords.append(self._words[word_id])
+                tags |= self._word_tags[word_id]
+            found >>= 1
+            word_id += 1
+        return KeywordMatch(frozenset(tags), frozenset(keywords), self._vocabulary)
+
+    def match(self, text: str) -> KeywordMatch:
+        """scan() с LRU-кэшем по тексту (детекторы одного запроса не сканируют его повторно)"""
+        if not self._compiled:
+            self.compile()
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+        result = self.scan(text)
+        with self._lock:
+            self._cache[text] = result
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def cache_info(self) -> Tuple[int, int]:
+        return len(self._cache), self._cache_size
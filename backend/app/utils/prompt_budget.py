@@ -0,0 +1,218 @@
+"""
+Token-budgeted prompt assembly v1.0.0
+
+SmartGPT собирал секции данных без учёта токенов: ASCII-таблица до 500 строк,
+до 100 JSON-строк, 50 строк справочника через to_string() и до пяти ответов
+истории по 1500 символов. Большие листы давали огромные промпты, маленькие -
+недоиспользовали контекст.
+
+Здесь:
+- estimate_tokens(): локальная оценка числа токенов (без tiktoken и сети),
+  откалибрована под BPE gpt-4o: латиница ~5 символов на токен, кириллица ~4,
+  цифры ~3, пунктуация - по токену, длинные пробельные выравнивания - дёшево
+- PromptBudget: бюджет на каждую секцию (role, history, reference, schema,
+  table, json_rows); секции заполняются по порядку, неиспользованный бюджет
+  переходит в следующие секции (таблица получает то, что не потратили история и схема)
+- report()/log(): число токенов по секциям для каждого запроса
+
+Использование:
+    budget = PromptBudget.from_settings()
+    role = budget.fit_text("role", custom_context)
+    table, shown = budget.fit_lines("table", row_lines, header=header)
+    budget.log(logger, "SmartGPT")
+"""
+
+import logging
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|[А-Яа-яЁё]+|\d+|\n+|[ \t]+|[^\sA-Za-zА-Яа-яЁё\d]")
+
+# Порядок заполнения и доля общего бюджета каждой секции
+SECTION_SHARES: Dict[str, float] = {
+    "role": 0.04,
+    "history": 0.14,
+    "reference": 0.18,
+    "schema": 0.10,
+    "table": 0.40,
+    "json_rows": 0.14,
+}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Оценка числа токенов текста (погрешность ~10-20% относительно tiktoken o200k)"""
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        first = piece[0]
+        if first == "\n":
+            tokens += 1
+        elif first == " " or first == "\t":
+            # Одиночный пробел склеивается со следующим словом
+            if len(piece) > 1:
+                tokens += 1 + len(piece) // 8
+        elif first.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif first.isascii() and first.isalpha():
+            tokens += math.ceil(len(piece) / 5)
+        elif first.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Обрезает текст до max_tokens (по оценке), стараясь не резать посреди слова"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Бинарный поиск длины префикса
+    limit = max_tokens - estimate_tokens(suffix)
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= limit:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    if space > lo * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + suffix if cut else ""
+
+
+class PromptBudget:
+    """
+    Бюджет токенов на секции промпта.
+
+    Секции заполняются в порядке SECTION_SHARES; то, что секция не потратила,
+    добавляется к бюджету следующих (carry-over). Секции без данных
+    (нет справочника, нет истории) целиком отдают свой бюджет дальше.
+    """
+
+    def __init__(self, total_tokens: int = 16000, shares: Optional[Dict[str, float]] = None):
+        self.total_tokens = max(0, int(total_tokens))
+        self.shares = dict(shares or SECTION_SHARES)
+        self.used: Dict[str, int] = {}
+        self.truncated: Dict[str, bool] = {}
+        self._spare = 0
+
+    @classmethod
+    def from_settings(cls) -> "PromptBudget":
+        from app.config import settings
+        return cls(total_tokens=int(settings.PROMPT_DATA_TOKEN_BUDGET))
+
+    # --- Бюджет ---
+
+    def base(self, section: str) -> int:
+        return int(self.total_tokens * self.shares.get(section, 0.0))
+
+    def available(self, section: str) -> int:
+        """Бюджет секции + бюджет, не использованный предыдущими секциями"""
+        return self.base(section) + self._spare
+
+    def _commit(self, section: str, tokens: int, truncated: bool = False) -> None:
+        self._spare = max(0, self.available(section) - tokens)
+        self.used[section] = self.used.get(section, 0) + tokens
+        self.truncated[section] = truncated
+
+    def skip(self, section: str) -> None:
+        """Секция пуста - её бюджет переходит следующим секциям"""
+        self._commit(section, 0)
+
+    def add(self, section: str, text: str) -> str:
+        """Учитывает текст секции без обрезки (обязательная часть промпта)"""
+        self._commit(section, estimate_tokens(text))
+        return text
+
+    # --- Заполнение секций ---
+
+    def fit_text(self, section: str, text: Optional[str]) -> str:
+        """Текст целиком или обрезанный до бюджета секции"""
+        if not text:
+            self.skip(section)
+            return ""
+        limit = self.available(section)
+        fitted = truncate_to_tokens(text, limit)
+        self._commit(section, estimate_tokens(fitted), truncated=fitted != text)
+        return fitted
+
+    def fit_lines(
+        self,
+        section: str,
+        lines: Iterable[str],
+        header: str = "",
+        reserve: int = 0,
+    ) -> Tuple[str, int]:
+        """
+        Берёт строки по порядку, пока они помещаются в бюджет.
+
+        Args:
+            header: обязательный заголовок (учитывается в бюджете, всегда включается)
+            reserve: токены, оставляемые под хвост секции (например, строку "[Показано N из M]")
+
+        Returns:
+            (текст секции, число включённых строк)
+        """
+        limit = self.available(section) - reserve
+        used = estimate_tokens(header)
+        parts = [header] if header else []
+        count = 0
+        truncated = False
+        for line in lines:
+            cost = estimate_tokens(line) + 1
+            if used + cost > limit:
+                truncated = True
+                break
+            parts.append(line)
+            used += cost
+            count += 1
+        self._commit(section, used + reserve, truncated=truncated)
+        return "\n".join(parts), count
+
+    def fit_items(self, section: str, items: Sequence[Any], render) -> Tuple[List[Any], int]:
+        """
+        Максимальный префикс items, у которого render(prefix) помещается в бюджет.
+
+        render вызывается на префиксах (бинарный поиск), поэтому подходит для
+        json.dumps списка и других форматов, где нельзя считать элементы по одному.
+        """
+        if not items:
+            self.skip(section)
+            return [], 0
+        limit = self.available(section)
+        lo, hi = 0, len(items)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if estimate_tokens(render(items[:mid])) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        used = estimate_tokens(render(items[:lo])) if lo else 0
+        self._commit(section, used, truncated=lo < len(items))
+        return list(items[:lo]), used
+
+    # --- Метрики ---
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget": self.total_tokens,
+            "sections": dict(self.used),
+            "truncated": sorted(name for name, cut in self.truncated.items() if cut),
+            "total": sum(self.used.values()),
+        }
+
+    def log(self, log: logging.Logger = logger, label: str = "PROMPT") -> Dict[str, Any]:
+        report = self.report()
+        sections = " ".join(f"{name}={tokens}" for name, tokens in report["sections"].items())
+        truncated = f" truncated={','.join(report['truncated'])}" if report["truncated"] else ""
+        log.info(f"[{label}] tokens: {sections} total={report['total']}/{report['budget']}{truncated}")
+        return report
@@ -0,0 +1,155 @@
+"""
+Single-pass загрузка данных листа в DataFrame
+
+Google Sheets присылает данные как список строк (List[List[Any]]), строки
+бывают разной длины (пустые хвосты не отправляются). Раньше каждая строка
+копировалась в Python-цикле (row + [None] * ..., row[:num_cols]), и на пике
+в памяти жили сразу три копии: исходный JSON-список, выровненный список и DataFrame.
+
+Здесь один object-массив NumPy (rows x cols) выделяется сразу под итоговый
+размер и заполняется блоками строк одинаковой длины. Недостающие ячейки
+остаются None (значение по умолчанию для object-массива) - без копий строк.
+
+Используется в:
+- main.py (sheet_data и reference_sheet_data)
+- AICodeExecutor.process_with_code
+"""
+
+import logging
+import sys
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestStats:
+    """Статистика загрузки одного листа"""
+    rows: int = 0
+    cols: int = 0
+    padded_rows: int = 0       # строки короче заголовка (дополнены None)
+    truncated_rows: int = 0    # строки длиннее заголовка (лишние ячейки отброшены)
+    ingest_ms: float = 0.0     # время построения DataFrame
+    frame_bytes: int = 0       # оценка размера DataFrame в памяти
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _fill_block(target: np.ndarray, row_idx: np.ndarray, block: List[Any], width: int) -> None:
+    """
+    Записывает строки одинаковой длины в target[row_idx, :width].
+    Если ячейки не скаляры (NumPy пытается развернуть вложенные списки) -
+    записываем построчно.
+    """
+    try:
+        if len(row_idx) == target.shape[0] and width == target.shape[1]:
+            target[:] = block
+        else:
+            target[row_idx, :width] = block
+    except (ValueError, TypeError):
+        for pos, row in zip(row_idx, block):
+            for j in range(width):
+                target[pos, j] = row[j]
+
+
+def rows_to_frame(
+    rows: Optional[Sequence[Sequence[Any]]],
+    columns: Sequence[str],
+    infer_types: bool = True
+) -> Tuple[pd.DataFrame, IngestStats]:
+    """
+    Строит DataFrame из строк разной длины за один проход.
+
+    - Строки короче заголовка дополняются None
+    - Строки длиннее заголовка обрезаются
+    - Типы колонок выводятся как у pd.DataFrame(list_of_lists) (int64/float64/bool/object)
+
+    Args:
+        rows: данные листа (строки), могут быть None/пустыми
+        columns: заголовки колонок
+        infer_types: выводить типы колонок (False - все колонки object)
+
+    Returns:
+        (DataFrame, IngestStats)
+    """
+    start = time.perf_counter()
+    rows = rows or []
+    n_rows = len(rows)
+    n_cols = len(columns)
+    stats = IngestStats(rows=n_rows, cols=n_cols)
+
+    data = np.empty((n_rows, n_cols), dtype=object)
+
+    if n_rows and n_cols:
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=n_rows)
+        stats.padded_rows = int((lengths < n_cols).sum())
+        stats.truncated_rows = int((lengths > n_cols).sum())
+
+        if stats.padded_rows == 0 and stats.truncated_rows == 0:
+            # Частый случай: все строки ровные - один блок
+            _fill_block(data, np.arange(n_rows), list(rows), n_cols)
+        else:
+            for length in np.unique(lengths):
+                length = int(length)
+                width = min(length, n_cols)
+                if width == 0:
+                    continue
+                row_idx = np.flatnonzero(lengths == length)
+                block = [rows[i] for i in row_idx]
+                if length > n_cols:
+                    # Лишние ячейки отбрасываются срезом блока, а не копией каждой строки
+                    full = np.empty((len(block), length), dtype=object)
+                    try:
+                        full[:] = block
+                        data[row_idx, :n_cols] = full[:, :n_cols]
+                        continue
+                    except (ValueError, TypeError):
+                        pass
+                _fill_block(data, row_idx, block, width)
+
+    # DataFrame поверх готового массива (без копии), затем вывод типов по колонкам
+    df = pd.DataFrame(data, columns=list(columns), copy=False)
+    if infer_types:
+        df = df.infer_objects(copy=False)
+
+    stats.ingest_ms = round((time.perf_counter() - start) * 1000, 2)
+    stats.frame_bytes = estimate_frame_bytes(df)
+    return df, stats
+
+
+def estimate_frame_bytes(df: pd.DataFrame, sample_size: int = 256) -> int:
+    """
+    Оценка размера DataFrame в байтах.
+
+    memory_usage(deep=True) вызывает sys.getsizeof для каждой ячейки object-колонок
+    (на 20k x 30 это дольше самой загрузки), поэтому для object-колонок размер
+    считается по равномерной выборке ячеек.
+    """
+    total = 0
+    n_rows = len(df)
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        total += int(column.memory_usage(index=False))
+        if column.dtype == object and n_rows:
+            step = max(1, n_rows // sample_size)
+            sample = column.to_numpy()[::step]
+            per_cell = sum(sys.getsizeof(value) for value in sample) / len(sample)
+            total += int(per_cell * n_rows)
+    return int(total)
+
+
+def log_ingest_stats(stats: IngestStats, label: str = "sheet") -> None:
+    """Логирует статистику загрузки в формате [INGEST]"""
+    extra = ""
+    if stats.padded_rows or stats.truncated_rows:
+        extra = f", padded={stats.padded_rows}, truncated={stats.truncated_rows}"
+    logger.info(
+        f"[INGEST] {label}: {stats.rows}x{stats.cols} in {stats.ingest_ms:.1f} ms, "
+        f"{stats.frame_bytes / 1024:.1f} KB{extra}"
+    )
@@ -0,0 +1,325 @@
+"""
+SheetProfile - общий профиль колонок листа на один запрос
+
+В одном запросе /api/v1/formula каждая колонка сканировалась много раз:
+auto_convert_numeric_columns разбирал её в числа, _gpt_smart_action снова
+вызывал pd.to_numeric и nunique для col_info, SchemaExtractor профилировал её
+ещё раз, детекторы диаграмм/сводных/условного форматирования и
+FunctionRegistry._parse_numeric_column - ещё по разу.
+
+SheetProfile создаётся при загрузке листа (main._build_request_frames) и
+хранит результаты этих проходов по позиции колонки:
+- numeric(pos, mode): float64 Series (parse_numeric_series, "ru" или "auto")
+- null_mask / non_null, unique_count, numeric_share, kind
+- dates(pos): pd.to_datetime(errors="coerce")
+- v11.27.0: индексы строк для FunctionRegistry - хеш значение -> позиции
+  (==, IN, VLOOKUP), отсортированные позиции (топ N; диапазоны - если индекс
+  уже построен), коды строк
+  astype(str) (поиск подстроки по уникальным значениям, а не по всем строкам)
+
+Всё считается лениво и один раз. Запись привязана к подписи колонки
+(название, dtype, длина): если колонку заменили (auto_convert -> float64,
+телефоны -> str), она пересчитывается при следующем обращении.
+
+Профиль привязан к объекту DataFrame (как get_sheet_sketch): все потребители
+одного запроса получают его через get_sheet_profile(df).
+
+Используется в:
+- main._build_request_frames, auto_convert_numeric_columns
+- SchemaExtractor, SimpleGPTProcessor (col_info, диаграммы, сводные, детекторы)
+- FunctionRegistry._parse_numeric_column, LocalQueryEngine
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .type_coercion import parse_numeric_series
+
+NUMERIC_SHARE = 0.5   # доля распознанных чисел, с которой колонка считается числовой
+
+
+class SheetProfile:
+    """Ленивые результаты сканирования колонок одного DataFrame"""
+
+    def __init__(self, df: pd.DataFrame):
+        self._frame = weakref.ref(df)
+        self._lock = threading.Lock()
+        self._columns: Dict[int, Dict[str, Any]] = {}
+        self.computed: Dict[str, int] = {}   # сколько раз каждое поле реально считалось
+        self.lookups: Dict[str, int] = {}    # обращения к индексам строк (hash, range, top, contains)
+
+    @property
+    def frame(self) -> Optional[pd.DataFrame]:
+        return self._frame()
+
+    # --- Кэш по колонкам ---
+
+    def _entry(self, position: int) -> Tuple[pd.Series, Dict[str, Any]]:
+        df = self._frame()
+        if df is None:
+            raise ReferenceError("DataFrame of this SheetProfile no longer exists")
+        series = df.iloc[:, position]
+        signature = (str(df.columns[position]), str(series.dtype), len(series))
+        with self._lock:
+            entry = self._columns.get(position)
+            if entry is None or entry["signature"] != signature:
+                entry = {"signature": signature}
+                self._columns[position] = entry
+        return series, entry
+
+    def _cached(self, position: int, field: str, compute: Callable[[pd.Series], Any]) -> Any:
+        series, entry = self._entry(position)
+        if field not in entry:
+            value = compute(series)
+            with self._lock:
+                entry[field] = value
+                self.computed[field] = self.computed.get(field, 0) + 1
+        return entry[field]
+
+    def invalidate(self, position: Optional[int] = None) -> None:
+        """Сбросить профиль колонки (или всего листа) после изменения значений"""
+        with self._lock:
+            if position is None:
+                self._columns.clear()
+            else:
+                self._columns.pop(position, None)
+
+    def adopt_numeric(self, position: int, values: pd.Series) -> None:
+        """
+        Колонка заменена своими же распознанными числами (auto_convert):
+        разбор "ru" переносится в новую запись, чтобы не считать его заново.
+        """
+        self.invalidate(position)
+        _, entry = self._entry(position)
+        with self._lock:
+            entry["numeric:ru"] = values
+
+    # --- Поля профиля ---
+
+    def numeric(self, position: int, mode: str = "ru") -> pd.Series:
+        """Колонка как float64 (нераспознанные значения -> NaN), индекс как у листа"""
+        return self._cached(position, f"numeric:{mode}", lambda s: parse_numeric_series(s, mode=mode))
+
+    def numeric_share(self, position: int) -> float:
+        """Доля строк, распознанных как числа (от всех строк листа)"""
+        def share(series: pd.Series) -> float:
+            return float(self.numeric(position).notna().sum()) / len(series) if len(series) else 0.0
+        return self._cached(position, "numeric_share", share)
+
+    def is_numeric(self, position: int, threshold: float = NUMERIC_SHARE) -> bool:
+        return self.numeric_share(position) > threshold
+
+    def null_mask(self, position: int) -> np.ndarray:
+        return self._cached(position, "null_mask", lambda s: s.isna().to_numpy())
+
+    def non_null(self, position: int) -> int:
+        return self._cached(position, "non_null", lambda s: int(len(s) - self.null_mask(position).sum()))
+
+    def unique_count(self, position: int) -> int:
+        """nunique() без NaN"""
+        return self._cached(position, "unique_count", lambda s: int(s.nunique()))
+
+    def dates(self, position: int) -> pd.Series:
+        """Колонка как datetime64 (нераспознанные значения -> NaT)"""
+        def parse(series: pd.Series) -> pd.Series:
+            if pd.api.types.is_datetime64_any_dtype(series):
+                return series
+            try:
+                return pd.to_datetime(series, errors="coerce")
+            except (TypeError, ValueError):
+                return pd.Series(pd.NaT, index=series.index)
+        return self._cached(position, "dates", parse)
+
+    def kind(self, position: int) -> str:
+        """empty | numeric | date | text"""
+        def detect(series: pd.Series) -> str:
+            if self.non_null(position) == 0:
+                return "empty"
+            if self.is_numeric(position):
+                return "numeric"
+            if pd.api.types.is_datetime64_any_dtype(series):
+                return "date"
+            return "text"
+        return self._cached(position, "kind", detect)
+
+    def position(self, column: Any) -> Optional[int]:
+        """Позиция колонки по названию (None, если нет или название не уникально)"""
+        df = self._frame()
+        if df is None:
+            return None
+        try:
+            loc = df.columns.get_loc(column)
+        except KeyError:
+            return None
+        return loc if isinstance(loc, int) else None
+
+    # --- Индексы строк (v11.27.0) ---
+    #
+    # Методы возвращают позиции/маску строк или None, если индекс не может
+    # ответить так же, как полный проход (несовместимый тип значения, NaN в
+    # списке, даты) - тогда вызывающий код сканирует колонку как раньше.
+
+    def _count_lookup(self, kind: str) -> None:
+        with self._lock:
+            self.lookups[kind] = self.lookups.get(kind, 0) + 1
+
+    def value_positions(self, position: int) -> Tuple[pd.Index, np.ndarray, np.ndarray]:
+        """Хеш-индекс: (уникальные значения, позиции строк по значениям, границы)"""
+        def build(series: pd.Series):
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            order = np.argsort(codes, kind="stable")   # внутри значения - по возрастанию позиции
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            return pd.Index(uniques, dtype=object), order, bounds
+        return self._cached(position, "index:hash", build)
+
+    def sorted_positions(self, position: int, descending: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Отсортированный массив numeric(position, "auto") без NaN: (позиции, значения).
+        Равные значения - по возрастанию позиции (как nlargest/nsmallest keep="first").
+        """
+        def build(_series: pd.Series):
+            values = self.numeric(position, mode="auto").to_numpy()
+            valid = np.flatnonzero(~np.isnan(values))
+            keys = -values[valid] if descending else values[valid]
+            order = valid[np.argsort(keys, kind="stable")]
+            return order, values[order]
+        return self._cached(position, "index:desc" if descending else "index:asc", build)
+
+    def string_codes(self, position: int) -> Tuple[np.ndarray, pd.Series, pd.Series]:
+        """astype(str) колонки как коды + уникальные строки (и они же в нижнем регистре)"""
+        def build(series: pd.Series):
+            codes, uniques = pd.factorize(series.astype(str))
+            uniques = pd.Series(uniques, dtype=object)
+            return codes, uniques, uniques.str.lower()
+        return self._cached(position, "index:strings", build)
+
+    def _has(self, position: int, field: str) -> bool:
+        _, entry = self._entry(position)
+        return field in entry
+
+    def _series(self, position: int) -> pd.Series:
+        series, _ = self._entry(position)
+        return series
+
+    def _hashable_values(self, position: int, values: List[Any]) -> bool:
+        """Значения, для которых поиск по хешу совпадает с == / isin по колонке"""
+        series = self._series(position)
+        if pd.api.types.is_bool_dtype(series):
+            return False
+        if pd.api.types.is_numeric_dtype(series):
+            return all(
+                isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)) and not pd.isna(v)
+                for v in values
+            )
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            return all(isinstance(v, str) for v in values)
+        return False
+
+    def equal_positions(self, position: int, values: List[Any]) -> Optional[np.ndarray]:
+        """Позиции строк, где колонка == одному из values (по возрастанию)"""
+        if not self._hashable_values(position, values):
+            return None
+        uniques, order, bounds = self.value_positions(position)
+        self._count_lookup("hash")
+        codes = uniques.get_indexer(pd.Index(list(values), dtype=object))
+        parts = [order[bounds[c]:bounds[c + 1]] for c in np.unique(codes[codes >= 0])]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def numeric_dtype(self, position: int) -> bool:
+        """Колонка уже числовая (int/float, не bool) - сравнения по ней совпадают с индексом"""
+        series = self._series(position)
+        return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+    @staticmethod
+    def _is_number(value: Any) -> bool:
+        return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+    def range_positions(self, position: int, low: Any = None, high: Any = None,
+                        low_inclusive: bool = True, high_inclusive: bool = True) -> Optional[np.ndarray]:
+        """Позиции строк с low <(=) numeric(position, "auto") <(=) high (границы опциональны)"""
+        bounds = [b for b in (low, high) if b is not None]
+        if not bounds or not all(self._is_number(b) for b in bounds):
+            return None
+        # Сортировка ради одной маски дороже векторного сравнения (разбор колонки
+        # уже в профиле) - диапазон берётся из индекса, только если он построен
+        if not self._has(position, "index:asc"):
+            return None
+        order, values = self.sorted_positions(position)
+        self._count_lookup("range")
+        start, end = 0, len(order)
+        if low is not None:
+            start = np.searchsorted(values, low, side="left" if low_inclusive else "right")
+        if high is not None:
+            end = np.searchsorted(values, high, side="right" if high_inclusive else "left")
+        return order[start:end] if start < end else np.empty(0, dtype=np.intp)
+
+    def top_positions(self, position: int, n: int, largest: bool = True,
+                      mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """nlargest/nsmallest(n) числовой колонки (с маской условия) - позиции в порядке результата"""
+        if not self.numeric_dtype(position):
+            return None
+        order, _ = self.sorted_positions(position, descending=largest)
+        self._count_lookup("top")
+        if mask is not None:
+            order = order[mask[order]]
+        return order[:max(int(n), 0)]
+
+    def contains_mask(self, position: int, term: str, case_sensitive: bool = False) -> np.ndarray:
+        """astype(str).str.contains(term, case=...) - проверка по уникальным строкам"""
+        codes, uniques, lowered = self.string_codes(position)
+        self._count_lookup("contains")
+        if not case_sensitive and not any(ch in _REGEX_SPECIAL for ch in term):
+            hits = lowered.str.contains(term.lower(), regex=False)
+        else:
+            hits = uniques.str.contains(term, case=case_sensitive, regex=True, na=False)
+        return hits.to_numpy(dtype=bool)[codes]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"columns": len(self._columns), "computed": dict(self.computed), "lookups": dict(self.lookups)}
+
+
+_REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+
+
+def positions_mask(length: int, positions: np.ndarray) -> np.ndarray:
+    mask = np.zeros(length, dtype=bool)
+    mask[positions] = True
+    return mask
+
+
+# Профиль на объект DataFrame (как кэш get_sheet_sketch)
+_profiles: "OrderedDict[int, Tuple[weakref.ref, SheetProfile]]" = OrderedDict()
+_profiles_lock = threading.Lock()
+_PROFILES_SIZE = 64
+
+
+def get_sheet_profile(df: pd.DataFrame, create: bool = True) -> Optional[SheetProfile]:
+    """
+    SheetProfile для этого объекта DataFrame.
+
+    create=False - только уже созданный профиль (для промежуточных фреймов,
+    например отфильтрованных, профиль не заводится).
+    """
+    key = id(df)
+    with _profiles_lock:
+        entry = _profiles.get(key)
+        if entry is not None and entry[0]() is df:
+            _profiles.move_to_end(key)
+            return entry[1]
+    if not create:
+        return None
+
+    profile = SheetProfile(df)
+    with _profiles_lock:
+        _profiles[key] = (weakref.ref(df), profile)
+        while len(_profiles) > _PROFILES_SIZE:
+            _profiles.popitem(last=False)
+    return profile
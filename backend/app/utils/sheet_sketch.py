@@ -0,0 +1,231 @@
+"""
+Скетчи колонок и репрезентативная выборка строк для больших листов
+
+В режиме SAMPLE (лист > 200 строк) LLM видела df.head(9) + последнюю строку.
+Первые строки обычно одного месяца/менеджера/категории, без экстремумов -
+код писался по нерепрезентативной выборке и часто требовал повторной попытки.
+
+Здесь за один векторизованный проход по каждой колонке:
+- ColumnSketch: число уникальных значений, квантили (p05..p95) для чисел,
+  top-k частых значений с долями для текста и категорий
+- representative_rows(): стратифицированная выборка строк - первая и последняя,
+  строки с min/max каждой числовой колонки, по строке на частые значения
+  категорий, остаток равномерно по листу
+
+Скетч листа кэшируется на объект DataFrame (get_sheet_sketch), поэтому
+SmartGPT-промпт и ASCII-таблица в одном запросе считают его один раз.
+
+Используется в:
+- SimpleGPTProcessor.format_ascii_table (SAMPLE) и колонки SmartGPT-промпта
+- SchemaExtractor (schema_to_prompt для листов > SKETCH_MIN_ROWS)
+"""
+
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+SKETCH_MIN_ROWS = 200       # с этого размера листа скетчи добавляются в промпты
+TOP_K = 5                   # частых значений на колонку
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+MAX_STRATA_VALUES = 20      # категории с большим числом значений не стратифицируются
+
+
+@dataclass
+class ColumnSketch:
+    """Сжатое описание одной колонки"""
+    name: str
+    kind: str                                   # numeric | categorical | empty
+    non_null: int = 0
+    distinct: int = 0
+    quantiles: Optional[Dict[str, float]] = None
+    top: List[Tuple[str, int]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["top"] = [list(item) for item in self.top]
+        return data
+
+    def describe(self, top_k: int = TOP_K) -> str:
+        """Короткое описание для промпта"""
+        if self.kind == "numeric" and self.quantiles:
+            q = self.quantiles
+            return (
+                f"p05={_fmt(q['p05'])}, p25={_fmt(q['p25'])}, медиана={_fmt(q['p50'])}, "
+                f"p75={_fmt(q['p75'])}, p95={_fmt(q['p95'])}"
+            )
+        if self.kind == "categorical" and self.top and self.non_null:
+            # Редкие значения (почти уникальный текст) - не "частые", а примеры
+            frequent = [
+                (value, count) for value, count in self.top[:top_k]
+                if count > 1 and count * 100 >= self.non_null
+            ]
+            if not frequent:
+                examples = ", ".join(f'"{value[:30]}"' for value, _ in self.top[:2])
+                return f"{self.distinct} уник., примеры: {examples}"
+            top = ", ".join(f'"{value[:30]}" {count * 100 / self.non_null:.0f}%' for value, count in frequent)
+            return f"{self.distinct} уник., частые: {top}"
+        return ""
+
+
+@dataclass
+class SheetSketch:
+    """Скетчи всех колонок + позиции репрезентативных строк"""
+    rows: int
+    columns: Dict[str, ColumnSketch]
+    sample_positions: List[int]
+
+
+def _fmt(value: float) -> str:
+    if value is None or not np.isfinite(value):
+        return "?"
+    if float(value).is_integer():
+        return f"{int(value)}"
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def sketch_column(series: pd.Series, numeric_values: Optional[pd.Series] = None, name: Any = None) -> ColumnSketch:
+    """
+    Скетч колонки.
+
+    Args:
+        numeric_values: уже распознанные числа (SchemaExtractor), иначе числовая
+            колонка определяется по dtype
+    """
+    name = str(series.name if name is None else name)
+    if numeric_values is not None or (
+        pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    ):
+        values = (numeric_values if numeric_values is not None else series).to_numpy(dtype=np.float64, na_value=np.nan)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return ColumnSketch(name=name, kind="empty")
+        quantiles = np.quantile(values, QUANTILES)
+        return ColumnSketch(
+            name=name,
+            kind="numeric",
+            non_null=int(len(values)),
+            distinct=int(len(np.unique(values))),
+            quantiles={f"p{int(q * 100):02d}": float(v) for q, v in zip(QUANTILES, quantiles)},
+        )
+
+    try:
+        counts = series.value_counts(dropna=True)
+    except TypeError:
+        # Нехешируемые ячейки (списки) - сравниваем по тексту
+        counts = series.dropna().astype(str).value_counts()
+    non_null = int(counts.sum())
+    if non_null == 0:
+        return ColumnSketch(name=name, kind="empty")
+    return ColumnSketch(
+        name=name,
+        kind="categorical",
+        non_null=non_null,
+        distinct=int(len(counts)),
+        top=[(str(value)[:50], int(count)) for value, count in counts.head(TOP_K).items()],
+    )
+
+
+def representative_rows(df: pd.DataFrame, n: int, sketches: Optional[Dict[str, ColumnSketch]] = None) -> List[int]:
+    """
+    Позиции (iloc) n строк, представляющих весь лист.
+
+    Приоритет: первая и последняя строка; min/max числовых колонок и первые
+    вхождения частых значений категорий (по очереди между колонками, не больше
+    3/4 выборки); остаток - равномерно по листу. Результат отсортирован.
+    """
+    total = len(df)
+    if total <= n:
+        return list(range(total))
+    if n <= 0:
+        return []
+
+    chosen: "OrderedDict[int, None]" = OrderedDict()
+    chosen[0] = None
+    if n > 1:
+        chosen[total - 1] = None
+
+    if sketches is None:
+        sketches = {str(col): sketch_column(df.iloc[:, i], name=col) for i, col in enumerate(df.columns)}
+
+    groups: List[List[int]] = []
+    for position, col in enumerate(df.columns):
+        sketch = sketches.get(str(col))
+        if sketch is None:
+            continue
+        series = df.iloc[:, position]
+        if sketch.kind == "numeric":
+            values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            finite = np.isfinite(values)
+            if finite.any():
+                masked = np.where(finite, values, np.nan)
+                groups.append([int(np.nanargmin(masked)), int(np.nanargmax(masked))])
+        elif sketch.kind == "categorical" and 1 < sketch.distinct <= MAX_STRATA_VALUES:
+            # Первое вхождение каждого значения (в порядке частоты)
+            firsts = series.reset_index(drop=True).dropna().astype(str).drop_duplicates()
+            first_pos: Dict[str, int] = {}
+            for pos, value in firsts.items():
+                first_pos.setdefault(value[:50], int(pos))  # top хранит значения, обрезанные до 50 символов
+            groups.append([first_pos[value] for value, _ in sketch.top if value in first_pos])
+
+    strata_limit = max(len(chosen), (n * 3) // 4)
+    depth = max((len(g) for g in groups), default=0)
+    for level in range(depth):
+        for group in groups:
+            if len(chosen) >= strata_limit:
+                break
+            if level < len(group):
+                chosen.setdefault(group[level], None)
+        if len(chosen) >= strata_limit:
+            break
+
+    # Остаток - равномерно по листу
+    if len(chosen) < n:
+        for pos in np.linspace(0, total - 1, n + 2).astype(int)[1:-1]:
+            if len(chosen) >= n:
+                break
+            chosen.setdefault(int(pos), None)
+    if len(chosen) < n:
+        for pos in range(total):
+            if len(chosen) >= n:
+                break
+            chosen.setdefault(pos, None)
+
+    return sorted(chosen)[:n]
+
+
+def build_sheet_sketch(df: pd.DataFrame, sample_rows: int = 10) -> SheetSketch:
+    """Скетчи колонок + репрезентативная выборка строк"""
+    sketches = {str(col): sketch_column(df.iloc[:, i], name=col) for i, col in enumerate(df.columns)}
+    return SheetSketch(
+        rows=len(df),
+        columns=sketches,
+        sample_positions=representative_rows(df, sample_rows, sketches),
+    )
+
+
+# Кэш скетча на объект DataFrame (в пределах запроса лист не меняется)
+_cache: "OrderedDict[Tuple, Tuple[weakref.ref, SheetSketch]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 16
+
+
+def get_sheet_sketch(df: pd.DataFrame, sample_rows: int = 10) -> SheetSketch:
+    """build_sheet_sketch с кэшем по объекту DataFrame, его форме и колонкам"""
+    key = (id(df), df.shape, tuple(map(str, df.columns)), sample_rows)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0]() is df:
+            _cache.move_to_end(key)
+            return entry[1]
+
+    sketch = build_sheet_sketch(df, sample_rows)
+    with _cache_lock:
+        _cache[key] = (weakref.ref(df), sketch)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return sketch
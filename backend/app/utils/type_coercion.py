@@ -0,0 +1,233 @@
+"""
+Vectorized type coercion для SheetGPT
+
+Google Sheets отдаёт значения строками в русской локали:
+"11 838 336,22", "15%", "1 200 ₽", "р.857 765".
+
+Раньше каждая ячейка разбиралась отдельным Python-вызовом
+(convert_russian_number через df[col].apply), а затем ещё раз через
+pd.to_numeric. Здесь то же самое делается целой колонкой за один проход:
+уникальные значения склеиваются в одну строку, чистятся str.replace/re.sub
+и конвертируются одним np.array(dtype=float64), без Python-функции на ячейку.
+
+Используется в:
+- main.py (авто-конвертация колонок sheet_data и reference_sheet_data)
+- FunctionRegistry._parse_numeric_column
+- SchemaExtractor (определение numeric колонок и статистика)
+"""
+
+import logging
+import re
+from typing import Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# v9.2.1: Колонки, которые НЕ конвертируются в числа (телефоны, ID, коды и т.п.)
+SKIP_CONVERT_PATTERNS = [
+    'телефон', 'phone', 'тел', 'mobile', 'моб',
+    'id', 'код', 'code', 'артикул', 'sku', 'article',
+    'инн', 'огрн', 'кпп', 'снилс', 'паспорт', 'passport',
+    'индекс', 'zip', 'postal',
+    'номер', 'number', 'num', '№',
+    'счет', 'счёт', 'account', 'card', 'карт',
+    'серия', 'series',
+]
+
+# Разделитель ячеек при склейке колонки в одну строку
+_CELL_SEP = '\x00'
+
+# Пробелы-разделители тысяч: обычный, неразрывный, узкий неразрывный + переносы/табы
+_SPACE_CHARS = (' ', '\u00a0', '\u202f', '\t', '\r', '\n')
+
+# Символы и коды валют + знак процента (значение "15%" -> 15)
+_CURRENCY_PERCENT_RE = re.compile(r'(?i:₽|\$|€|£|¥|руб\.?|р\.|rub|usd|eur)|%')
+
+# Строка, которая НЕ является числом (целиком) -> заменяется на "nan"
+_INVALID_NUMBER_RE = re.compile(
+    r'^(?![-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$|[-+]?(?i:nan|inf|infinity)$).*$',
+    re.MULTILINE
+)
+
+# FunctionRegistry: одна запятая и <= 2 значащих символов после неё = десятичная запятая
+_DECIMAL_COMMA_RE = re.compile(r'^([^,\n]*),((?:[ .]*[^ .,\n]){0,2}[ .]*)$', re.MULTILINE)
+
+# Всё, кроме цифр, точки и минуса (формат FunctionRegistry: "$1,234.56" -> 1234.56)
+_NON_NUMERIC_RE = re.compile(r'[^\d.\-\n]+')
+
+_EMPTY_LINE_RE = re.compile(r'^$', re.MULTILINE)
+
+
+def should_skip_convert(column_name: str, patterns: Optional[List[str]] = None) -> bool:
+    """Check if column should NOT be converted to numeric (phone/ID/code columns)."""
+    col_lower = str(column_name).lower()
+    for pattern in (patterns if patterns is not None else SKIP_CONVERT_PATTERNS):
+        if pattern in col_lower:
+            return True
+    return False
+
+
+def _lines_to_float(text: str, count: int) -> Optional[np.ndarray]:
+    """
+    Конвертирует строки (по одной на значение) в float64 за один вызов NumPy.
+    Нечисловые строки -> NaN. None, если количество строк не совпало (нужен fallback).
+    """
+    parts = text.split('\n')
+    if len(parts) != count:
+        return None
+    try:
+        return np.array(parts, dtype=np.float64)
+    except ValueError:
+        parts = _INVALID_NUMBER_RE.sub('nan', text).split('\n')
+        return np.array(parts, dtype=np.float64)
+
+
+def _parse_ru_values(values: List[Any]) -> Optional[np.ndarray]:
+    """
+    Русский формат: вся колонка склеивается в одну строку, очистка делается
+    str.replace/re.sub по этой строке (C-уровень), затем один np.array(dtype=float).
+    """
+    text = _CELL_SEP.join(map(str, values))
+    for ch in _SPACE_CHARS:
+        if ch in text:
+            text = text.replace(ch, '')
+    if _CURRENCY_PERCENT_RE.search(text):
+        text = _CURRENCY_PERCENT_RE.sub('', text)
+    text = text.replace(',', '.').replace(_CELL_SEP, '\n')
+    return _lines_to_float(text, len(values))
+
+
+def _parse_auto_values(values: List[Any]) -> Optional[np.ndarray]:
+    """Формат FunctionRegistry (десятичная запятая по эвристике, мусор вырезается)."""
+    text = _CELL_SEP.join(map(str, values))
+    if '\n' in text:
+        text = text.replace('\n', ' ')
+    text = text.replace(_CELL_SEP, '\n')
+    if ',' in text:
+        text = _DECIMAL_COMMA_RE.sub(r'\1.\2', text)
+    text = _NON_NUMERIC_RE.sub('', text)
+    text = _EMPTY_LINE_RE.sub('0', text)
+    return _lines_to_float(text, len(values))
+
+
+def _parse_value_fallback(val: Any, mode: str) -> float:
+    """Медленный путь для одной ячейки (только если склейка колонки не удалась)."""
+    parsed = _parse_ru_values([val]) if mode == "ru" else _parse_auto_values([val])
+    return float(parsed[0]) if parsed is not None else np.nan
+
+
+def _numeric_object_mask(series: pd.Series) -> Optional[np.ndarray]:
+    """
+    Маска ячеек, которые уже являются числами (int/float) внутри object-колонки.
+    Возвращает None, если в колонке только строки (частый случай - проверка не нужна).
+    """
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred in ("string", "empty"):
+        return None
+    values = series.to_numpy(dtype=object)
+    return np.fromiter(
+        (isinstance(v, (int, float, np.integer, np.floating)) for v in values),
+        dtype=bool,
+        count=len(values),
+    )
+
+
+def parse_numeric_series(series: pd.Series, mode: str = "ru") -> pd.Series:
+    """
+    Разбирает колонку в float64 целиком (без Python-вызова на ячейку).
+
+    Режимы:
+    - "ru": формат Google Sheets RU (поведение convert_russian_number из main.py).
+      Пробелы = разделитель тысяч, запятая = десятичный разделитель.
+      "11 838 336,22" -> 11838336.22, "15%" -> 15.0, "1 200 ₽" -> 1200.0
+    - "auto": формат FunctionRegistry._parse_numeric_column.
+      Одна запятая и не более 2 цифр после неё = десятичная, иначе разделитель тысяч.
+      Удаляется всё кроме цифр, точки и минуса. "$1,234.56" -> 1234.56, "12,6" -> 12.6.
+      Строка без цифр -> 0.0.
+
+    Повторяющиеся значения (категории, небольшие целые) разбираются один раз
+    через pd.factorize. Нераспознанные значения -> NaN. Индекс сохраняется.
+    """
+    if mode not in ("ru", "auto"):
+        raise ValueError(f"Unknown coercion mode: {mode}")
+
+    if pd.api.types.is_bool_dtype(series):
+        # Чекбоксы (True/False) - не числа (как и float("True") в старом коде)
+        if mode == "auto":
+            return series.astype("float64")
+        return pd.Series(np.nan, index=series.index, dtype="float64")
+
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("float64")
+
+    if len(series) == 0:
+        return pd.Series([], index=series.index, dtype="float64")
+
+    parse_values = _parse_ru_values if mode == "ru" else _parse_auto_values
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    unique_values = list(uniques)
+    parsed = parse_values(unique_values) if unique_values else np.empty(0, dtype=np.float64)
+    if parsed is None:
+        parsed = np.array([_parse_value_fallback(v, mode) for v in unique_values], dtype=np.float64)
+
+    if mode == "auto" and unique_values:
+        # Числа внутри object-колонки оставляем как есть (1e-05 не должно стать "105")
+        numeric_mask = _numeric_object_mask(pd.Series(unique_values, dtype=object))
+        if numeric_mask is not None and numeric_mask.any():
+            parsed[numeric_mask] = np.array(unique_values, dtype=object)[numeric_mask].astype(np.float64)
+
+    # NaN/None получают код -1 -> берём NaN из "хвоста"
+    lookup = np.append(parsed, np.nan)
+    return pd.Series(lookup[codes], index=series.index, dtype="float64")
+
+
+def auto_convert_numeric_columns(
+    df: pd.DataFrame,
+    threshold: float = 0.5,
+    skip_patterns: Optional[List[str]] = None,
+    log_prefix: str = "",
+    profile=None
+) -> pd.DataFrame:
+    """
+    Авто-конвертация колонок DataFrame (in place) после загрузки из Google Sheets.
+
+    - Колонки телефонов/ID/кодов -> принудительно строки
+    - Колонка становится float64, если распознано > threshold значений
+
+    Args:
+        df: DataFrame (изменяется на месте и возвращается)
+        threshold: доля распознанных чисел для конвертации
+        skip_patterns: паттерны названий колонок, которые остаются текстом
+        log_prefix: префикс в логах (например "ref:" для reference_df)
+        profile: SheetProfile листа (v11.21.0) - разбор колонки сохраняется в
+            профиль и не повторяется следующими потребителями
+    """
+    row_count = len(df)
+    for position, col in enumerate(df.columns):
+        if should_skip_convert(col, skip_patterns):
+            # v9.2.2: FORCE phone/ID columns to STRING to prevent any calculations
+            df.isetitem(position, df.iloc[:, position].astype(str))
+            if profile is not None:
+                profile.invalidate(position)
+            logger.info(f"[AUTO-CONVERT] 🔒 {log_prefix}'{col}' → FORCED to string (phone/ID/code)")
+            continue
+
+        column = df.iloc[:, position]
+        if pd.api.types.is_float_dtype(column):
+            continue
+
+        if profile is not None:
+            converted = profile.numeric(position)
+        else:
+            converted = parse_numeric_series(column, mode="ru")
+        if converted.notna().sum() > row_count * threshold:
+            df.isetitem(position, converted)
+            if profile is not None:
+                profile.adopt_numeric(position, converted)
+            logger.info(f"[AUTO-CONVERT] ✅ {log_prefix}'{col}' → numeric")
+
+    return df
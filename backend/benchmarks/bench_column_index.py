@@ -0,0 +1,61 @@
+"""
+Benchmark: поиск колонок - линейные проходы vs ColumnIndex
+
+Один "запрос" = несколько обращений к колонкам (registry._find_column,
+find_best_column_match, classifier) с повторяющимися названиями, как в
+реальной обработке. Сравнивается прежний линейный поиск (SequenceMatcher по
+всем колонкам) с индексом, построенным один раз на лист.
+
+Запуск (из папки backend):
+    python benchmarks/bench_column_index.py [columns] [requests]
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.test_column_index import COLUMNS, WORDS, legacy_best_match, legacy_registry
+from app.utils.column_index import ColumnIndex
+
+logging.getLogger("app.utils.metrics").setLevel(logging.ERROR)
+
+
+def make_columns(count: int):
+    columns = list(COLUMNS)
+    i = 0
+    while len(columns) < count:
+        columns.append(f"{COLUMNS[i % len(COLUMNS)]} {i // len(COLUMNS) + 1}")
+        i += 1
+    return columns
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    columns = make_columns(count)
+    lookups = [w for w in WORDS if w] * 3
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        for word in lookups:
+            legacy_best_match(word, columns)
+            legacy_registry(columns, word)
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        index = ColumnIndex(columns)  # новый лист на каждый запрос - индекс строится заново
+        for word in lookups:
+            index.resolve(word)
+            index.find(word)
+    index_ms = (time.perf_counter() - start) * 1000
+
+    print(f"Sheet: {count} columns, {requests} requests x {len(lookups) * 2} lookups")
+    print(f"  linear {legacy_ms:8.1f} ms   index {index_ms:8.1f} ms   speedup {legacy_ms / index_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark: выполнение сгенерированного кода с df.copy() на попытку vs copy-on-write
+
+Запрос с ретраями и повтором после пост-валидации выполняет код до 6 раз
+(MAX_RETRIES + 1, дважды). До v11.22.0 каждая попытка начиналась с df.copy().
+
+Запуск (из папки backend):
+    python benchmarks/bench_copy_on_write.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench-dummy-key")
+
+from benchmarks.bench_type_coercion import make_sheet
+from app.services.simple_gpt_processor import run_generated_code
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+ATTEMPTS = 6
+CODES = {
+    "read-only": "result = df.groupby('Колонка 2')['Колонка 0'].sum().idxmax()",
+    "mutating": "df['Колонка 0'] = df['Колонка 0'] * 1.2\nresult = df['Колонка 0'].sum()",
+}
+
+
+def run(code, df, copy_on_write):
+    start = time.perf_counter()
+    peaks = []
+    for _ in range(ATTEMPTS):
+        output = run_generated_code(code, df, copy_on_write=copy_on_write, trace_memory=True)
+        peaks.append(output["memory"]["peak_bytes"])
+    return (time.perf_counter() - start) * 1000, max(peaks), sum(peaks)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = auto_convert_numeric_columns(make_sheet(rows, cols))
+    mb = 1024 * 1024
+
+    print(f"Sheet: {rows} rows x {cols} columns, {df.memory_usage(index=True).sum() / mb:.1f} MB, {ATTEMPTS} attempts")
+    for name, code in CODES.items():
+        for label, cow in (("df.copy()    ", False), ("copy-on-write", True)):
+            ms, peak, total = run(code, df, cow)
+            print(f"  {name:9} {label}: {ms:8.1f} ms  peak {peak / mb:7.1f} MB  total {total / mb:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
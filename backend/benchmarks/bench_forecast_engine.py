@@ -0,0 +1,83 @@
+"""
+Benchmark: прогноз по SKU - построчный скрипт (iterrows) vs ForecastEngine
+
+Python-путь для "прогноз" генерировал скрипт по образцу из промпта: iterrows
+по строкам, для каждой - тренд или взвешенное среднее в цикле по месяцам.
+ForecastEngine считает модели сразу для всех строк операциями над матрицей
+SKU x месяцы; "auto" обучает все три модели дважды (backtest + прогноз).
+Время LLM (генерация скрипта vs выбор параметров) не входит.
+
+Запуск (из папки backend):
+    python benchmarks/bench_forecast_engine.py [skus] [months] [repeats]
+"""
+
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.forecast_engine import MONTHS, ForecastEngine
+
+logging.getLogger("app.services.forecast_engine").setLevel(logging.WARNING)
+
+
+def make_sheet(skus: int, months: int) -> pd.DataFrame:
+    rng = np.random.default_rng(4)
+    base = rng.integers(10, 500, skus)[:, None]
+    trend = rng.normal(0, 0.05, skus)[:, None] * np.arange(months)
+    season = 1 + 0.2 * np.sin(np.arange(months) * 2 * np.pi / 12)
+    values = np.round(base * (1 + trend) * season * rng.uniform(0.8, 1.2, (skus, months)))
+    columns = {"Артикул": [f"SKU-{i}" for i in range(skus)]}
+    for m in range(months):
+        columns[f"{MONTHS[m % 12]} {2023 + m // 12}"] = np.maximum(values[:, m], 0)
+    return pd.DataFrame(columns)
+
+
+def script_forecast(df: pd.DataFrame, value_cols):
+    """Построчный прогноз из образца в промпте Python-пути"""
+    forecasts = []
+    for _, row in df.iterrows():
+        values = [v for v in (row[col] for col in value_cols) if v > 0]
+        if len(values) >= 2 and values[0] > 0 and abs(values[-1] - values[0]) / values[0] > 0.1:
+            rates = [(values[i] - values[i - 1]) / values[i - 1] for i in range(1, len(values)) if values[i - 1] > 0]
+            forecasts.append(max(0, round(values[-1] * (1 + sum(rates) / len(rates)))))
+        elif len(values) >= 2:
+            weights = range(1, len(values) + 1)
+            forecasts.append(max(0, round(sum(v * w for v, w in zip(values, weights)) / sum(weights))))
+        else:
+            forecasts.append(values[0] if values else 0)
+    return forecasts
+
+
+def main():
+    skus = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    months = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    sheet = make_sheet(skus, months)
+    engine = ForecastEngine(processor=None)
+    periods = engine.period_columns(sheet)
+    print(f"Sheet: {skus} SKU x {len(periods)} months")
+
+    script_ms = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        script_forecast(sheet, periods)
+        script_ms = min(script_ms, (time.perf_counter() - start) * 1000)
+    print(f"  iterrows script        : {script_ms:8.1f} ms")
+
+    for method in ("linear", "seasonal_naive", "exp_smoothing", "auto"):
+        batch_ms = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            engine.forecast(sheet, "Артикул", periods, 3, method)
+            batch_ms = min(batch_ms, (time.perf_counter() - start) * 1000)
+        print(f"  batch {method:16} : {batch_ms:8.1f} ms  speedup {script_ms / batch_ms:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: cross-sheet VLOOKUP - построчный поиск по словарю vs KeyJoinEngine
+
+Прежде справочник уходил в промпт как to_string() до 200 строк, а поиск
+делался построчно (Map по ключу с trim + lower на фронтенде). Сравниваются:
+- размер секции справочника в промпте (токены): 200 строк vs схема + sample
+- построчный поиск через dict vs hash join по нормализованным ключам
+  (в join входит нормализация: числа-текстом, регистр, пробелы). Join
+  нормализует только уникальные ключи и пишет строку на уникальный ключ листа,
+  поэтому выигрыш растёт с повторами ключей; на полностью уникальных ключах -
+  паритет по времени, выигрыш только в промпте и качестве сопоставления
+
+Запуск (из папки backend):
+    python benchmarks/bench_join_engine.py [rows] [repeats]
+"""
+
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.services.join_engine import KeyJoinEngine
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+from app.utils.prompt_budget import estimate_tokens
+
+logging.getLogger("app.services.join_engine").setLevel(logging.WARNING)
+logging.getLogger("app.utils.metrics").setLevel(logging.WARNING)
+
+
+def make_sheets(rows: int, catalog: int):
+    """Лист заказов (rows строк, ключи повторяются) и справочник на catalog артикулов"""
+    rng = np.random.default_rng(3)
+    keys = rng.permutation(catalog) + 100_000
+    sheet = pd.DataFrame({"Артикул": rng.choice(keys, rows), "Склад": rng.choice(["Москва", "Казань", "Омск"], rows)})
+    reference = pd.DataFrame({
+        "Артикул": [f" {k} " if i % 3 else str(k) for i, k in enumerate(rng.permutation(keys))],
+        "Наименование": [f"Товар {i}" for i in range(catalog)],
+        "Октябрь": rng.integers(0, 1000, catalog),
+    })
+    return sheet, reference
+
+
+def dict_lookup(sheet: pd.DataFrame, reference: pd.DataFrame):
+    mapping = {}
+    for key, value in zip(reference["Артикул"], reference["Октябрь"]):
+        mapping.setdefault(str(key).strip().lower(), value)
+    return [[key, mapping.get(str(key).strip().lower(), "")] for key in sheet["Артикул"]]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    engine = KeyJoinEngine()
+
+    for catalog in (rows, rows // 20):
+        sheet, reference = make_sheets(rows, catalog)
+        print(f"Sheet: {rows} rows, reference: {catalog} keys")
+
+        old_section = reference.head(200).to_string()
+        new_section = SimpleGPTProcessor._reference_schema_lines(reference) + "\n" + \
+            reference.head(int(settings.JOIN_REFERENCE_SAMPLE_ROWS)).to_string()
+        print(f"  prompt: {estimate_tokens(old_section):6d} tokens (200 rows) -> "
+              f"{estimate_tokens(new_section):4d} tokens (schema + sample)")
+
+        loop_ms = join_ms = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            dict_lookup(sheet, reference)
+            loop_ms = min(loop_ms, (time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            result = engine.lookup(sheet, reference, "Артикул", "Октябрь")
+            join_ms = min(join_ms, (time.perf_counter() - start) * 1000)
+        print(f"  lookup: dict {loop_ms:8.1f} ms  join {join_ms:8.1f} ms  speedup {loop_ms / join_ms:5.1f}x"
+              f"  ({result.matched} keys matched, {len(result.rows)} rows written)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: цепочка FunctionRegistry.execute vs ленивый план (execute_plan)
+
+Цепочка материализует полный DataFrame на каждом шаге; план сливает фильтры,
+переносит их до сортировки/группировки и выбирает строки один раз.
+
+Запуск (из папки backend):
+    python benchmarks/bench_registry_pipeline.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.function_registry import FunctionRegistry
+
+
+def make_orders(rows: int, cols: int, seed: int = 42) -> pd.DataFrame:
+    """Лист заказов + cols "широких" колонок (их копирует каждый шаг цепочки)"""
+    rng = np.random.default_rng(seed)
+    data = {
+        "Менеджер": rng.choice([f"Менеджер {i}" for i in range(50)], rows),
+        "Статус": rng.choice(["Оплачен", "Отменен", "Новый"], rows),
+        "Город": rng.choice(["Москва", "Казань", "Омск", "Пермь"], rows),
+        "Сумма": rng.uniform(100, 100_000, rows).round(2),
+        "Количество": rng.integers(1, 100, rows),
+    }
+    for i in range(cols):
+        data[f"Поле {i}"] = rng.uniform(0, 1, rows)
+    return pd.DataFrame(data)
+
+
+def step(function, **params):
+    return {"function": function, "params": params}
+
+
+PLANS = {
+    "sort -> 2 filters -> top": [
+        step("sort_data", columns=["Количество"], ascending=False),
+        step("filter_rows", column="Статус", operator="==", value="Оплачен"),
+        step("filter_in_list", column="Город", values=["Москва", "Казань"]),
+        step("filter_top_n", column="Сумма", n=100),
+    ],
+    "filter -> sort -> groupby": [
+        step("filter_rows", column="Сумма", operator=">", value=5000),
+        step("sort_data", columns=["Сумма"]),
+        step("aggregate_by_group", group_by=["Менеджер"], agg_column="Сумма", agg_func="sum"),
+        step("filter_not_in_list", column="Менеджер", values=["Менеджер 1"]),
+    ],
+    "filter -> sort -> drop": [
+        step("filter_between", column="Количество", min_value=10, max_value=60),
+        step("sort_data", columns=["Сумма"], ascending=False),
+        step("filter_rows", column="Статус", operator="!=", value="Отменен"),
+        step("drop_columns", columns=["Город"]),
+    ],
+}
+
+
+def chained(registry, df, steps):
+    for item in steps:
+        df = registry.execute(item["function"], df, **item["params"])["result"]
+    return df
+
+
+def best_ms(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    df = make_orders(rows, cols)
+    registry = FunctionRegistry()
+
+    print(f"Sheet: {rows} rows x {len(df.columns)} columns")
+    for name, steps in PLANS.items():
+        chained_ms = best_ms(lambda: chained(registry, df, steps))
+        fused_ms = best_ms(lambda: registry.execute_plan(df, steps))
+        plan = registry.execute_plan(df, steps)["plan"]
+        print(f"  {name:26}: chained {chained_ms:8.1f} ms  fused {fused_ms:8.1f} ms  "
+              f"speedup {chained_ms / fused_ms:5.1f}x  plan {plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark: фильтры/VLOOKUP FunctionRegistry - полный проход vs индексы SheetProfile
+
+Один запрос многократно обращается к одним и тем же колонкам (цепочки
+фильтров, VLOOKUP по справочнику). Без профиля каждый вызов сканирует
+колонку; с профилем индекс строится при первом обращении и дальше
+переиспользуется. В "indexed" входит время построения индексов.
+
+Запуск (из папки backend):
+    python benchmarks/bench_row_indexes.py [rows] [repeats]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_registry_pipeline import make_orders
+from app.services.function_registry import FunctionRegistry
+from app.utils.sheet_profile import get_sheet_profile
+
+WORKLOADS = {
+    "vlookup x200": lambda r, df: [r.vlookup(df, f"Менеджер {i % 60}", "Менеджер", "Сумма") for i in range(200)],
+    "filter == / in": lambda r, df: [
+        (r.filter_rows(df, "Статус", "==", "Оплачен"), r.filter_in_list(df, "Город", ["Москва", "Омск"]))
+        for _ in range(10)
+    ],
+    "range / between": lambda r, df: [
+        (r.filter_rows(df, "Сумма", ">", 90_000), r.filter_between(df, "Количество", 95, 99))
+        for _ in range(10)
+    ],
+    "top n": lambda r, df: [r.filter_top_n(df, "Сумма", 10) for _ in range(10)],
+    "search": lambda r, df: [r.search_rows(df, "Менеджер", "джер 4") for _ in range(10)],
+}
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    registry = FunctionRegistry()
+    base = make_orders(rows, 5)
+    print(f"Sheet: {rows} rows x {len(base.columns)} columns")
+
+    for name, workload in WORKLOADS.items():
+        scan_ms = indexed_ms = float("inf")
+        for _ in range(repeats):
+            plain = base.copy()
+            start = time.perf_counter()
+            workload(registry, plain)
+            scan_ms = min(scan_ms, (time.perf_counter() - start) * 1000)
+
+            sheet = base.copy()
+            get_sheet_profile(sheet)    # новый профиль - индексы строятся заново
+            start = time.perf_counter()
+            workload(registry, sheet)
+            indexed_ms = min(indexed_ms, (time.perf_counter() - start) * 1000)
+        print(f"  {name:16}: scan {scan_ms:8.1f} ms  indexed {indexed_ms:8.1f} ms  speedup {scan_ms / indexed_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark: SchemaExtractor с кэшем схем vs пересчёт на каждый запрос
+
+Сценарий разговора: первый запрос (miss), затем follow-up запросы с тем же
+листом (hit) и запрос после изменения одной колонки (частичный hit).
+
+Запуск (из папки backend):
+    python benchmarks/bench_schema_cache.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_type_coercion import make_sheet
+from app.services.schema_extractor import SchemaExtractor
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = auto_convert_numeric_columns(make_sheet(rows, cols))
+    extractor = SchemaExtractor()
+
+    def uncached(frame):
+        schema = extractor.extract_schema(frame)
+        return schema, extractor.schema_to_prompt(schema)
+
+    _, base_ms = timed(uncached, df)
+    (schema, prompt), miss_ms = timed(extractor.get_schema_and_prompt, df.copy())
+    _, hit_ms = timed(extractor.get_schema_and_prompt, df.copy())
+
+    changed = df.copy()
+    changed.iloc[0, 0] = -1.0
+    _, partial_ms = timed(extractor.get_schema_and_prompt, changed)
+
+    assert prompt == uncached(df)[1]
+    print(f"Sheet: {rows} rows x {cols} columns")
+    print(f"  extract_schema + prompt : {base_ms:8.1f} ms")
+    print(f"  cache miss              : {miss_ms:8.1f} ms")
+    print(f"  cache hit (same sheet)  : {hit_ms:8.1f} ms")
+    print(f"  one column changed      : {partial_ms:8.1f} ms")
+    print(f"  stats                   : {extractor.cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmark: SchemaExtractor.extract_schema на широком листе
+
+Лист: числа (уже float после авто-конвертации), числа строками,
+категории и текст с высокой кардинальностью (комментарии, ID заказов).
+
+Запуск (из папки backend):
+    python benchmarks/bench_schema_extractor.py [rows] [text_cols]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_type_coercion import make_sheet
+from app.services.schema_extractor import SchemaExtractor
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+
+def make_wide_sheet(rows: int, text_cols: int):
+    df = auto_convert_numeric_columns(make_sheet(rows, 30))
+    rng = np.random.default_rng(1)
+    for i in range(text_cols):
+        df[f"Комментарий {i}"] = [f"Комментарий к заказу {v}" for v in rng.integers(0, 10**6, rows)]
+    return df
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    text_cols = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    df = make_wide_sheet(rows, text_cols)
+    extractor = SchemaExtractor()
+
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        extractor.extract_schema(df)
+        best = min(best, time.perf_counter() - start)
+
+    print(f"Sheet: {rows} rows x {df.shape[1]} columns ({text_cols} high-cardinality text)")
+    print(f"  extract_schema  : {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: single-pass загрузка листа vs старое выравнивание строк
+
+Старый путь (main.py до v11.6.0):
+    padded_data = [row + [None] * ... / row[:num_cols] for row in sheet_data]
+    pd.DataFrame(padded_data, columns=column_names)
+Новый путь:
+    app.utils.sheet_ingest.rows_to_frame(sheet_data, column_names)
+
+Меряется время и пиковая память (tracemalloc) поверх уже загруженного JSON.
+
+Запуск (из папки backend):
+    python benchmarks/bench_sheet_ingest.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.sheet_ingest import rows_to_frame
+
+
+def legacy_ingest(rows, columns):
+    """Копия старого цикла из main.py."""
+    padded_data = []
+    num_cols = len(columns)
+    for row in rows:
+        if len(row) < num_cols:
+            row = list(row) + [None] * (num_cols - len(row))
+        padded_data.append(row[:num_cols])
+    return pd.DataFrame(padded_data, columns=columns)
+
+
+def make_rows(rows: int, cols: int, seed: int = 42):
+    """Строки как из Google Sheets: каждая 5-я строка без пустого хвоста."""
+    rng = np.random.default_rng(seed)
+    data = []
+    for i, value in enumerate(rng.uniform(0, 1_000_000, rows)):
+        row = [f"{value:,.2f}".replace(",", " ").replace(".", ","), f"Менеджер {i % 50}", int(value)]
+        row += [f"Текст {j}" for j in range(cols - len(row))]
+        if i % 5 == 0:
+            row = row[:cols - 3]
+        data.append(row)
+    return data
+
+
+def measure(func, rows, columns, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows, columns)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func(rows, columns)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, peak
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    n_cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    rows = make_rows(n_rows, n_cols)
+    columns = [f"Колонка {i}" for i in range(n_cols)]
+
+    pd.testing.assert_frame_equal(legacy_ingest(rows, columns), rows_to_frame(rows, columns)[0])
+
+    legacy_time, legacy_peak = measure(legacy_ingest, rows, columns)
+    new_time, new_peak = measure(lambda r, c: rows_to_frame(r, c)[0], rows, columns)
+    _, stats = rows_to_frame(rows, columns)
+
+    print(f"Sheet: {n_rows} rows x {n_cols} columns ({stats.padded_rows} short rows)")
+    print(f"  legacy padding  : {legacy_time * 1000:8.1f} ms, peak {legacy_peak / 2**20:7.1f} MB")
+    print(f"  single-pass     : {new_time * 1000:8.1f} ms, peak {new_peak / 2**20:7.1f} MB")
+    print(f"  stats           : ingest {stats.ingest_ms:.1f} ms, frame ~{stats.frame_bytes / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: цепочка сканирований одного запроса с общим SheetProfile и без него
+
+Потребители в порядке запроса /api/v1/formula:
+    auto_convert_numeric_columns -> col_info (numeric + nunique) ->
+    SchemaExtractor -> FunctionRegistry._parse_numeric_column
+Без общего профиля каждый потребитель сканирует колонки заново (моделируется
+отдельной копией листа на каждого потребителя - как было до v11.21.0).
+
+Запуск (из папки backend):
+    python benchmarks/bench_sheet_profile.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench-dummy-key")
+
+from benchmarks.bench_type_coercion import make_sheet
+from app.services.function_registry import FunctionRegistry
+from app.services.schema_extractor import SchemaExtractor
+from app.utils.sheet_profile import get_sheet_profile
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+
+def consumers(frames, registry):
+    """Все проходы запроса; frames[i] - лист, который видит i-й потребитель"""
+    df = auto_convert_numeric_columns(frames[0], profile=get_sheet_profile(frames[0]))
+
+    profile = get_sheet_profile(frames[1])
+    col_info = [(profile.is_numeric(i), profile.unique_count(i)) for i in range(len(frames[1].columns))]
+
+    schema = SchemaExtractor().extract_schema(frames[2])
+
+    numeric_cols = [c for c in frames[3].columns if str(frames[3][c].dtype) != "object"]
+    for col in numeric_cols:
+        registry._parse_numeric_column(frames[3][col], frames[3])
+    return df, col_info, schema
+
+
+def run(df, shared: bool, registry, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        base = auto_convert_numeric_columns(df.copy())
+        if shared:
+            frame = df.copy()
+            frames = [frame] * 4
+        else:
+            # Каждый потребитель - отдельный объект: профиль не переиспользуется
+            frames = [df.copy()] + [base.copy() for _ in range(3)]
+        start = time.perf_counter()
+        consumers(frames, registry)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = make_sheet(rows, cols)
+    registry = FunctionRegistry()
+
+    separate_time = run(df, shared=False, registry=registry)
+    shared_time = run(df, shared=True, registry=registry)
+
+    frame = df.copy()
+    consumers([frame] * 4, registry)
+    computed = get_sheet_profile(frame).stats()["computed"]
+
+    print(f"Sheet: {rows} rows x {cols} columns")
+    print(f"  scan per consumer : {separate_time * 1000:8.1f} ms")
+    print(f"  shared profile    : {shared_time * 1000:8.1f} ms")
+    print(f"  speedup           : {separate_time / shared_time:8.1f}x")
+    print(f"  computed fields   : {computed}")
+
+
+if __name__ == "__main__":
+    main()
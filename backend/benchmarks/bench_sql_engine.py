@@ -0,0 +1,73 @@
+"""
+Benchmark: движок "sql" (DuckDB) vs pandas-код через run_generated_code
+
+Для каждого размера листа (10k-1M строк) одни и те же запросы выполняются
+pandas-кодом, который обычно пишет LLM (векторный и с циклом по строкам),
+и одним SELECT в DuckDB. Время LLM не входит - только выполнение.
+
+Запуск (из папки backend):
+    python benchmarks/bench_sql_engine.py [rows,rows,...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench-dummy-key")
+
+from unittest.mock import MagicMock
+
+from benchmarks.bench_type_coercion import make_sheet
+from app.services.simple_gpt_processor import SimpleGPTProcessor, run_generated_code
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+CASES = {
+    "group sum": (
+        "result = df.groupby('Колонка 2')['Колонка 0'].sum().sort_values(ascending=False).reset_index()",
+        'SELECT "Колонка 2", SUM("Колонка 0") AS s FROM df GROUP BY 1 ORDER BY 2 DESC',
+    ),
+    "filter count": (
+        "result = int(((df['Колонка 1'] > 500) & (df['Колонка 3'] < 50)).sum())",
+        'SELECT COUNT(*) FROM df WHERE "Колонка 1" > 500 AND "Колонка 3" < 50',
+    ),
+    "row loop": (
+        "total = 0\n"
+        "for _, row in df.iterrows():\n"
+        "    if row['Колонка 1'] > 500:\n"
+        "        total += row['Колонка 0']\n"
+        "result = total",
+        'SELECT SUM("Колонка 0") FROM df WHERE "Колонка 1" > 500',
+    ),
+}
+ROW_LOOP_LIMIT = 100_000  # iterrows на 1M строк - минуты; выше лимита не запускаем
+
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1].split(",")] if len(sys.argv) > 1 else [10_000, 100_000, 1_000_000]
+    engine = SimpleGPTProcessor(client=MagicMock()).sql_engine
+    if not engine.available:
+        print("duckdb is not installed")
+        return
+
+    for rows in sizes:
+        df = auto_convert_numeric_columns(make_sheet(rows, 10))
+        print(f"Sheet: {rows} rows x 10 columns")
+        for name, (code, sql) in CASES.items():
+            sql_ms = min(timed(engine.execute, sql, df) for _ in range(3))
+            if name == "row loop" and rows > ROW_LOOP_LIMIT:
+                print(f"  {name:12}: pandas       skipped  sql {sql_ms:8.1f} ms")
+                continue
+            pandas_ms = min(timed(run_generated_code, code, df, copy_on_write=True) for _ in range(3))
+            print(f"  {name:12}: pandas {pandas_ms:8.1f} ms  sql {sql_ms:8.1f} ms  speedup {pandas_ms / sql_ms:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
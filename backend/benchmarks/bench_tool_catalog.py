@@ -0,0 +1,62 @@
+"""
+Benchmark: подготовка function definitions на запрос - старый путь vs ToolCatalog
+
+Старый путь: собрать литерал definitions, отфильтровать по намерению и
+сериализовать в JSON для запроса к LLM. Каталог: мемоизированное подмножество
+и pack() с готовыми оценками токенов. Печатает время и токены, отправляемые в LLM.
+
+Запуск (из папки backend):
+    python benchmarks/bench_tool_catalog.py [requests]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.function_registry import FunctionRegistry
+from app.services.tool_catalog import INTENT_FUNCTIONS, get_tool_catalog
+from app.utils.prompt_budget import estimate_tokens
+
+BUDGET = 6000
+
+
+def legacy(action_type):
+    definitions = FunctionRegistry._function_definitions()
+    names = set(INTENT_FUNCTIONS.get(action_type, ()))
+    filtered = [d for d in definitions if d["name"] in names] or definitions
+    return json.dumps(filtered, ensure_ascii=False)
+
+
+def catalog_path(catalog, action_type):
+    names = [entry.name for entry in catalog.for_intent(action_type)]
+    return catalog.pack(names, budget=BUDGET)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    intents = list(INTENT_FUNCTIONS) + ["unknown"]
+    catalog = get_tool_catalog()
+
+    start = time.perf_counter()
+    for i in range(requests):
+        legacy(intents[i % len(intents)])
+    legacy_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for i in range(requests):
+        catalog_path(catalog, intents[i % len(intents)])
+    catalog_ms = (time.perf_counter() - start) * 1000
+
+    print(f"Catalog: {len(catalog)} tools, {catalog.total_tokens} tokens; {requests} requests")
+    print(f"  legacy  {legacy_ms:8.1f} ms   catalog {catalog_ms:8.1f} ms   speedup {legacy_ms / catalog_ms:5.1f}x")
+    all_tokens = estimate_tokens(json.dumps(list(catalog.definitions), ensure_ascii=False))
+    packed = catalog.pack(None, budget=BUDGET)
+    print(f"  all-functions fallback: {len(catalog)} tools ~{all_tokens} tokens -> "
+          f"{len(packed)} tools ~{catalog.tokens_for(packed)} tokens (budget {BUDGET})")
+
+
+if __name__ == "__main__":
+    main()
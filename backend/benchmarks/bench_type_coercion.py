@@ -0,0 +1,108 @@
+"""
+Benchmark: векторизованная конвертация колонок vs старый per-cell путь
+
+Старый путь (main.py до v11.5.0):
+    df[col].apply(convert_russian_number) -> при неудаче pd.to_numeric(df[col])
+Новый путь:
+    app.utils.type_coercion.auto_convert_numeric_columns(df)
+
+Запуск (из папки backend):
+    python benchmarks/bench_type_coercion.py [rows] [cols]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.type_coercion import auto_convert_numeric_columns, should_skip_convert
+
+
+def convert_russian_number(val):
+    """Копия per-cell конвертера из main.py (до v11.5.0)."""
+    if pd.isna(val):
+        return None
+    s = str(val).strip()
+    if not s:
+        return None
+    s = s.replace(' ', '').replace('\u00a0', '')
+    s = s.replace(',', '.')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def legacy_auto_convert(df: pd.DataFrame) -> pd.DataFrame:
+    """Старый цикл авто-конвертации из main.py."""
+    for col in df.columns:
+        if should_skip_convert(col):
+            df[col] = df[col].astype(str)
+            continue
+        converted = df[col].apply(convert_russian_number)
+        if converted.notna().sum() > len(df) * 0.5:
+            df[col] = converted
+        else:
+            converted = pd.to_numeric(df[col], errors='coerce')
+            if converted.notna().sum() > len(df) * 0.5:
+                df[col] = converted
+    return df
+
+
+def make_sheet(rows: int, cols: int, seed: int = 42) -> pd.DataFrame:
+    """Синтетический лист как из Google Sheets: всё строками, русский формат чисел."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(cols):
+        kind = i % 5
+        if kind == 0:
+            values = rng.uniform(0, 10_000_000, rows)
+            column = [f"{v:,.2f}".replace(",", " ").replace(".", ",") for v in values]
+        elif kind == 1:
+            column = [str(v) for v in rng.integers(0, 1000, rows)]
+        elif kind == 2:
+            column = [f"Менеджер {v}" for v in rng.integers(0, 50, rows)]
+        elif kind == 3:
+            column = [f"{v:.1f}" for v in rng.uniform(0, 100, rows)]
+            for j in rng.integers(0, rows, rows // 20):
+                column[j] = ""
+        else:
+            column = [f"2024-{m:02d}-{d:02d}" for m, d in zip(rng.integers(1, 13, rows), rng.integers(1, 28, rows))]
+        data[f"Колонка {i}"] = column
+    return pd.DataFrame(data)
+
+
+def bench(func, df: pd.DataFrame, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        frame = df.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    df = make_sheet(rows, cols)
+
+    legacy = legacy_auto_convert(df.copy())
+    vectorized = auto_convert_numeric_columns(df.copy())
+    pd.testing.assert_frame_equal(legacy, vectorized)
+
+    legacy_time = bench(legacy_auto_convert, df)
+    vectorized_time = bench(auto_convert_numeric_columns, df)
+
+    print(f"Sheet: {rows} rows x {cols} columns")
+    print(f"  legacy per-cell : {legacy_time * 1000:8.1f} ms")
+    print(f"  vectorized      : {vectorized_time * 1000:8.1f} ms")
+    print(f"  speedup         : {legacy_time / vectorized_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
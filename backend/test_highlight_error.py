@@ -2,6 +2,7 @@
 Тест воспроизведения ошибки с запросом "выдели города с населением больше 1,7 млн"
 """
 
+import asyncio
 import sys
 sys.path.insert(0, '.')
 
@@ -47,12 +48,12 @@ try:
     ai_service = AIService()
 
     # Обрабатываем запрос
-    result = ai_service.process_formula_request(
+    result = asyncio.run(ai_service.process_formula_request(
         query=query,
         column_names=column_names,
         sheet_data=test_data,
         history=[]
-    )
+    ))
 
     print(f"\n{'='*80}")
     print(f"[RESULT]:")
@@ -2,6 +2,7 @@
 Test Russian query with encoding fix
 """
 
+import asyncio
 import sys
 import os
 
@@ -34,12 +35,12 @@ print(f"{'='*80}\n")
 
 try:
     executor = get_ai_executor()
-    result = executor.process_with_code(
+    result = asyncio.run(executor.process_with_code(
         query=query,
         column_names=column_names,
         sheet_data=test_data,
         history=[]
-    )
+    ))
 
     print(f"\n{'='*80}")
     print(f"[RESULT]:")
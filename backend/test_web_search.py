@@ -2,6 +2,7 @@
 Тестирование веб-поиска через DuckDuckGo
 """
 
+import asyncio
 import sys
 sys.path.insert(0, '.')
 
@@ -38,7 +39,7 @@ def test_table_generation_with_search():
     print(f"\n[QUERY] Запрос: {query}")
     print(f"[SEARCH] Выполняется веб-поиск и генерация таблицы...\n")
 
-    result = ai_executor._generate_table_from_knowledge(query)
+    result = asyncio.run(ai_executor._generate_table_from_knowledge(query))
 
     print(f"\n[OK] Результат:")
     print(f"   Summary: {result.get('summary', 'N/A')}")
@@ -70,7 +71,7 @@ def test_table_without_search():
     print(f"\n[QUERY] Запрос: {query}")
     print(f"[AI] Генерация таблицы из знаний AI...\n")
 
-    result = ai_executor._generate_table_from_knowledge(query)
+    result = asyncio.run(ai_executor._generate_table_from_knowledge(query))
 
     print(f"\n[OK] Результат:")
     print(f"   Summary: {result.get('summary', 'N/A')}")
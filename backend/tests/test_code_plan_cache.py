@@ -0,0 +1,128 @@
+"""
+Тесты кэша планов кода (CodePlanCache): код по схеме листа переиспользуется
+на изменившихся данных без SmartGPT и генерации
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.code_plan_cache import CodePlanCache
+from app.services.llm_cache import InMemoryLRUBackend, SQLiteBackend
+from app.services.schema_extractor import SchemaExtractor
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+QUERY = "какой менеджер продал больше всех"
+CODE = "result = df.groupby('Менеджер')['Сумма'].sum().idxmax()\nexplanation = 'Лучший менеджер: ' + str(result)"
+
+
+def sheet(amounts):
+    return pd.DataFrame({"Менеджер": ["Иванов", "Петров", "Сидоров"], "Сумма": amounts})
+
+
+@pytest.fixture
+def processor():
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc.code_plans = CodePlanCache()
+    proc._gpt_smart_action = AsyncMock(return_value=None)  # SmartGPT -> Python-путь
+    proc._generate_code = AsyncMock(return_value=CODE)
+    proc._validate_result = AsyncMock(return_value="OK")
+    return proc
+
+
+def run(processor, df, query=QUERY):
+    return asyncio.run(processor.process(query, df, list(df.columns)))
+
+
+def schema(df):
+    return SchemaExtractor().extract_schema(df)
+
+
+def test_key_depends_on_query_and_schema_not_values():
+    cache = CodePlanCache()
+    key = cache.make_key(QUERY, schema(sheet([100, 200, 300])))
+
+    # другие значения и число строк - тот же план
+    longer = pd.concat([sheet([1, 2, 3]), sheet([4, 5, 6])], ignore_index=True)
+    assert cache.make_key(QUERY, schema(longer)) == key
+    # регистр, пробелы и "?" в конце не важны
+    assert cache.make_key("  Какой менеджер   продал больше всех? ", schema(sheet([1, 2, 3]))) == key
+    # тип колонки, колонки и роль пользователя - важны
+    assert cache.make_key(QUERY, schema(sheet(["a", "b", "c"]))) != key
+    assert cache.make_key(QUERY, schema(sheet([1, 2, 3]).rename(columns={"Сумма": "Выручка"}))) != key
+    assert cache.make_key(QUERY, schema(sheet([1, 2, 3])), custom_context="CFO") != key
+
+
+def test_hit_reruns_code_on_new_data_without_llm(processor):
+    first = run(processor, sheet([100, 500, 300]))
+    assert first["success"] and first["result"] == "Петров"
+    assert processor.code_plans.stats()["stores"] == 1
+
+    processor._gpt_smart_action.reset_mock()
+    processor._generate_code.reset_mock()
+    processor._validate_result.reset_mock()
+
+    second = run(processor, sheet([900, 500, 300]))
+    assert second["success"] and second["result"] == "Иванов"
+    assert second["validation"] == "OK"
+    processor._gpt_smart_action.assert_not_called()
+    processor._generate_code.assert_not_called()
+    processor._validate_result.assert_not_called()
+
+    stats = processor.code_plans.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_failing_plan_falls_back_to_regeneration(processor):
+    df = sheet([100, 500, 300])
+    key = processor._code_plan_key(QUERY, df, None, None, None)
+    processor.code_plans.store(key, "result = df['Нет такой колонки'].sum()", cost_ms=3000.0)
+
+    response = run(processor, df)
+
+    assert response["success"] and response["result"] == "Петров"
+    processor._generate_code.assert_awaited_once()
+    stats = processor.code_plans.stats()
+    assert stats["fallbacks"] == 1
+    # на место упавшего плана сохранён новый код
+    assert processor.code_plans.get(key)["code"] == CODE
+
+
+def test_bad_validation_is_not_cached(processor):
+    processor._validate_result = AsyncMock(return_value="BAD")
+    run(processor, sheet([100, 500, 300]))
+    assert processor.code_plans.stats()["stores"] == 0
+
+
+def test_lru_eviction_and_disk_store(tmp_path):
+    cache = CodePlanCache(backend=InMemoryLRUBackend(max_entries=2))
+    for key in ("a", "b", "c"):
+        cache.store(key, f"result = '{key}'", cost_ms=1.0)
+    assert cache.get("a") is None
+    assert cache.get("c")["code"] == "result = 'c'"
+    assert cache.stats()["evictions"] == 1
+
+    path = str(tmp_path / "plans.sqlite3")
+    CodePlanCache(backend=SQLiteBackend(path, table="code_plans")).store("k", CODE, cost_ms=2500.0)
+    restored = CodePlanCache(backend=SQLiteBackend(path, table="code_plans")).get("k")
+    assert restored["code"] == CODE
+    assert restored["cost_ms"] == 2500.0
+
+
+def test_plan_key_uses_sheet_profile_not_schema_extraction(processor, monkeypatch):
+    monkeypatch.setattr(processor.schema_extractor, "get_schema_and_prompt",
+                        MagicMock(side_effect=AssertionError("full schema extraction")))
+    key = processor._code_plan_key(QUERY, sheet([100, 200, 300]), None, None, None)
+
+    assert processor._code_plan_key(QUERY, sheet(["1 000", "20,5", "7"]), None, None, None) == key
+    assert processor._code_plan_key(QUERY, sheet(["a", "b", "c"]), None, None, None) != key
+    assert processor._code_plan_key(QUERY, sheet([1, 2, 3]), None, None, sheet([1, 2, 3])) != key
@@ -0,0 +1,131 @@
+"""
+Тесты для sandbox-выполнения сгенерированного кода (app.services.code_sandbox)
+"""
+
+import asyncio
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.code_sandbox import (
+    CodeSandbox,
+    SandboxCrashedError,
+    SandboxExecutionError,
+    SandboxTimeoutError,
+)
+from app.services.simple_gpt_processor import run_generated_code
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    sb = CodeSandbox(workers=1, timeout=5, cpu_seconds=2, memory_mb=1024)
+    sb.start()
+    yield sb
+    sb.close()
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Менеджер': ['Иванов', 'Петров', 'Иванов'],
+        'Сумма': [100.0, 250.5, 300.0],
+    })
+
+
+def test_result_matches_in_process_execution(sandbox, df):
+    code = "result = df.groupby('Менеджер')['Сумма'].sum()\nexplanation = 'ok'"
+    remote = sandbox.run_sync(run_generated_code, code, df)
+    local = run_generated_code(code, df)
+    pd.testing.assert_series_equal(remote['result'], local['result'])
+    assert remote['explanation'] == 'ok'
+
+
+def test_filtered_dataframe_keeps_index(sandbox, df):
+    result = sandbox.run_sync(run_generated_code, "result = df[df['Сумма'] > 200]", df)['result']
+    assert result.index.tolist() == [1, 2]
+
+
+def test_code_exception_is_reraised_with_original_type(sandbox, df):
+    with pytest.raises(KeyError):
+        sandbox.run_sync(run_generated_code, "result = df['Нет такой']", df)
+    # Воркер остаётся рабочим после ошибки
+    assert sandbox.run_sync(run_generated_code, "result = 1", df)['result'] == 1
+
+
+def test_unpicklable_result(sandbox, df):
+    with pytest.raises(SandboxExecutionError):
+        sandbox.run_sync(run_generated_code, "result = (x for x in range(3))", df)
+
+
+def test_wall_clock_timeout_kills_worker(sandbox, df):
+    with pytest.raises(SandboxTimeoutError):
+        sandbox.run_sync(run_generated_code, "import time\ntime.sleep(30)", df, timeout=1)
+    assert sandbox.run_sync(run_generated_code, "result = 2", df)['result'] == 2
+    assert sandbox.stats()['timeouts'] >= 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="RLIMIT_CPU is Unix-only")
+def test_cpu_limit(sandbox, df):
+    with pytest.raises((SandboxCrashedError, SandboxTimeoutError)):
+        sandbox.run_sync(run_generated_code, "while True:\n    pass", df)
+    assert sandbox.run_sync(run_generated_code, "result = 3", df)['result'] == 3
+
+
+def test_async_run_does_not_block_event_loop(sandbox, df):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await sandbox.run(run_generated_code, "import time\ntime.sleep(0.5)\nresult = 4", df)
+        task.cancel()
+        return result['result'], ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == 4
+    assert ticks > 10
+
+
+def test_large_numeric_frame_roundtrip(sandbox):
+    big = pd.DataFrame({'x': np.arange(200_000, dtype=np.float64), 'y': np.arange(200_000)})
+    result = sandbox.run_sync(run_generated_code, "result = df", big)['result']
+    pd.testing.assert_frame_equal(result, big)
+
+
+def test_ai_code_executor_awaits_sandbox(sandbox, df, monkeypatch):
+    from app.services import ai_code_executor
+
+    monkeypatch.setattr(ai_code_executor, "get_code_sandbox", lambda: sandbox)
+    executor = ai_code_executor.AICodeExecutor.__new__(ai_code_executor.AICodeExecutor)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        code = "total = 0\nfor i in range(3000000):\n    total += i\nresult = df['Сумма'].sum()"
+        result = await executor._execute_python_code(code, df)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result["result"] == 650.5
+    assert ticks > 5
+    assert not isinstance(sys.stdout, ai_code_executor.SafeStringIO)
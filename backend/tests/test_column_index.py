@@ -0,0 +1,148 @@
+"""
+Тесты ColumnIndex: индексированный поиск колонок даёт те же ответы, что
+прежние линейные реализации (registry, classifier, template matcher, fuzzy_match)
+"""
+
+import os
+import random
+import sys
+from difflib import SequenceMatcher
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.function_registry import FunctionRegistry
+from app.services.smart_query_classifier import SmartQueryClassifier
+from app.services.template_matcher import TemplateMatcher
+from app.utils.column_index import ColumnIndex, get_column_index
+from app.utils.fuzzy_match import find_best_column_match, get_column_synonyms
+from app.utils.metrics import metrics_collector
+
+COLUMNS = [
+    "Менеджер", "Сумма продаж", "Заказали на сумму", "Дата заказа", "Город", "Статус",
+    "Кол-во", "Цена", "Товар", "Клиент", "ID", "Скидка %", "Выручка (руб)", "Сумма",
+]
+WORDS = [
+    "сумма", "сумму", "сумм", "продажи", "продаж", "выручка", "дата", "менеджер", "менеджера",
+    "город", "статус", "цена", "стоимость", "товар", "продукт", "клиенты", "id", "кол", "скидка",
+    "заказ", "заказали на сумму", "итого", "регион", "сумма продаж по городам", "а", "",
+]
+
+
+# --- Прежние линейные реализации (эталон) ---
+
+def legacy_registry(columns, column_name):
+    if column_name in columns:
+        return column_name
+    for col in columns:
+        if col.lower() == column_name.lower():
+            return col
+    column_lower = column_name.lower()
+    matches = [col for col in columns if column_lower in col.lower()]
+    if matches:
+        return min(matches, key=len)
+    reverse = [col for col in columns if col.lower() in column_lower]
+    return max(reverse, key=len) if reverse else None
+
+
+def legacy_classifier(columns, search):
+    search_lower = search.lower().strip()
+    for check in (lambda c: c == search_lower, lambda c: search_lower in c, lambda c: c in search_lower):
+        for col in columns:
+            if check(col.lower()):
+                return col
+    return None
+
+
+def legacy_best_match(requested, columns, threshold=0.6):
+    requested_lower = requested.lower().strip()
+    available = {col: col.lower().strip() for col in columns}
+    for col, low in available.items():
+        if requested_lower == low:
+            return col
+    best, best_score = None, 0.0
+    for col, low in available.items():
+        score = SequenceMatcher(None, requested_lower, low).ratio()
+        if score > best_score:
+            best, best_score = col, score
+    if best_score >= threshold:
+        return best
+    for col, low in available.items():
+        if requested_lower in low or low in requested_lower:
+            return col
+    for col, low in available.items():
+        for word in requested_lower.split():
+            if len(word) >= 4 and any(w.startswith(word[:4]) for w in low.split()):
+                return col
+    for col, low in available.items():
+        for syn in get_column_synonyms().get(requested_lower, [requested_lower]):
+            if syn in low:
+                return col
+            if len(syn) >= 4 and any(len(w) >= 4 and w.startswith(syn[:4]) for w in low.split()):
+                return col
+    return None
+
+
+def sheets():
+    rng = random.Random(11)
+    yield COLUMNS
+    for _ in range(30):
+        yield rng.sample(COLUMNS, rng.randint(1, len(COLUMNS)))
+
+
+def test_registry_find_matches_legacy():
+    registry = FunctionRegistry()
+    for columns in sheets():
+        df = pd.DataFrame(columns=columns)
+        for word in WORDS + [w.upper() for w in WORDS]:
+            expected = legacy_registry(columns, word)
+            if expected is None:
+                with pytest.raises(ValueError, match="не найдена"):
+                    registry._find_column(df, word)
+            else:
+                assert registry._find_column(df, word) == expected, (columns, word)
+
+
+def test_classifier_and_best_match_match_legacy():
+    classifier = SmartQueryClassifier()
+    for columns in sheets():
+        for word in WORDS:
+            assert classifier._fuzzy_match_column(word, columns) == legacy_classifier(columns, word), (columns, word)
+            if word:
+                assert find_best_column_match(word, columns) == legacy_best_match(word, columns), (columns, word)
+
+
+def test_template_matcher_mentioned_column():
+    matcher = TemplateMatcher()
+    assert matcher._find_mentioned_column("посчитай сумма продаж по городам", COLUMNS) == "B"
+    assert matcher._find_mentioned_column("средняя цена", ["Товар", "Цена"]) == "B"
+    assert matcher._find_mentioned_column("что-то другое", ["Товар", "Цена"]) is None
+
+
+def test_index_is_shared_and_memoized():
+    assert get_column_index(list(COLUMNS)) is get_column_index(tuple(COLUMNS))
+
+    index = ColumnIndex(COLUMNS)
+    before = len(metrics_collector.metrics)
+    assert index.resolve("Сумма") == ("Сумма", "exact")
+    assert index.resolve("выручка") == ("Выручка (руб)", "fuzzy")
+    assert index.resolve("  ВЫРУЧКА ") == ("Выручка (руб)", "fuzzy")
+    assert index.resolve("Регион") == (None, "none")
+    stats = index.stats()
+    assert stats["memo_hits"] == 1
+    assert stats["methods"] == {"exact": 1, "fuzzy": 1, "none": 1}
+
+    # Метрика качества сопоставления - по разу на название
+    logged = [m for m in metrics_collector.metrics[before:] if m.get("type") == "fuzzy_match"]
+    assert [(m["requested"], m["method"], m["success"]) for m in logged] == [
+        ("Сумма", "exact", True), ("выручка", "fuzzy", True), ("Регион", "none", False),
+    ]
+
+
+def test_non_string_columns():
+    index = ColumnIndex([0, "Сумма", 2.5])
+    assert index.find(0) == 0
+    assert index.find("сумм") == "Сумма"
+    assert index.match("1") is None
@@ -0,0 +1,117 @@
+"""
+Тесты выполнения сгенерированного кода в режиме copy-on-write (без df.copy() на попытку)
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.config import settings
+from app.services.code_plan_cache import CodePlanCache
+from app.services.simple_gpt_processor import SimpleGPTProcessor, run_generated_code
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Менеджер': ['Иванов', 'Петров', 'Иванов'],
+        'Сумма': [100.0, 250.5, 300.0],
+    })
+
+
+@pytest.mark.parametrize("code", [
+    "df['Сумма'] = df['Сумма'] * 2\nresult = df['Сумма'].sum()",
+    "df.loc[0, 'Сумма'] = 0\nresult = df['Сумма'].sum()",
+    "df.sort_values('Сумма', inplace=True)\ndf.drop(columns=['Менеджер'], inplace=True)\nresult = len(df.columns)",
+    "df['Бонус'] = df['Сумма'] * 0.1\nresult = df['Бонус'].sum()",
+])
+def test_mutating_code_does_not_touch_source(df, code):
+    snapshot = df.copy()
+    expected = run_generated_code(code, df.copy())['result']
+
+    output = run_generated_code(code, df, copy_on_write=True)
+
+    pd.testing.assert_frame_equal(df, snapshot)
+    assert output['result'] == expected
+    assert output['memory']['mode'] == "cow"
+    assert output['memory']['copied_bytes'] == 0
+
+
+def test_write_into_numpy_buffer_falls_back_to_copy(df):
+    snapshot = df.copy()
+    output = run_generated_code("df['Сумма'].values[0] = 0\nresult = df['Сумма'].sum()", df, copy_on_write=True)
+
+    pd.testing.assert_frame_equal(df, snapshot)
+    assert output['result'] == pytest.approx(550.5)
+    assert output['memory']['mode'] == "cow_fallback"
+    assert output['memory']['copied_bytes'] == output['memory']['input_bytes'] > 0
+
+
+@pytest.mark.parametrize("code,expected", [
+    # под copy-on-write оба идиома молча не меняют df
+    ("df['b'].fillna(0, inplace=True)\nresult = int(df['b'].isna().sum())", 0),
+    ("df['a'][df['a'] > 1] = 0\nresult = float(df['a'].sum())", 1.0),
+])
+def test_chained_assignment_falls_back_to_copy(code, expected):
+    frame = pd.DataFrame({'a': [1, 2, 3], 'b': [1.0, None, 3.0]})
+    snapshot = frame.copy()
+
+    output = run_generated_code(code, frame, copy_on_write=True)
+
+    assert output['result'] == expected == run_generated_code(code, frame)['result']
+    assert output['memory']['mode'] == "cow_fallback"
+    pd.testing.assert_frame_equal(frame, snapshot)
+
+
+def test_copy_on_write_and_memory_trace_are_opt_in():
+    from app.config import Settings
+    defaults = Settings.model_fields
+    assert defaults["CODE_EXEC_COPY_ON_WRITE"].default is False
+    assert defaults["CODE_EXEC_TRACE_MEMORY"].default is False
+
+
+def test_memory_traced_and_attached_to_errors(df):
+    output = run_generated_code("result = list(range(100000))", df, copy_on_write=True, trace_memory=True)
+    assert output['memory']['peak_bytes'] > 100000
+
+    with pytest.raises(KeyError) as error:
+        run_generated_code("result = df['Нет такой']", df, copy_on_write=True, trace_memory=True)
+    assert error.value.execution_memory['mode'] == "cow"
+    assert error.value.execution_memory['peak_bytes'] is not None
+
+
+def test_request_reports_memory_over_all_attempts(df, monkeypatch):
+    monkeypatch.setattr(settings, "CODE_SANDBOX_ENABLED", False)
+    monkeypatch.setattr(settings, "CODE_EXEC_COPY_ON_WRITE", True)
+    monkeypatch.setattr(settings, "CODE_EXEC_TRACE_MEMORY", True)
+    monkeypatch.setattr("app.services.simple_gpt_processor.get_code_sandbox", lambda: None)
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc.code_plans = CodePlanCache(enabled=False)
+    proc._gpt_smart_action = AsyncMock(return_value=None)
+    proc._validate_result = AsyncMock(return_value="OK")
+    proc._generate_code = AsyncMock(side_effect=[
+        "result = df['Нет такой'].sum()",
+        "df['Сумма'] = df['Сумма'] / 2\nresult = df['Сумма'].sum()",
+    ])
+
+    response = asyncio.run(proc.process("сумма пополам", df, list(df.columns)))
+
+    assert response["success"] and response["result"] == pytest.approx(325.25)
+    assert df['Сумма'].sum() == pytest.approx(650.5)
+    memory = response["execution_memory"]
+    assert memory["attempts"] == 2
+    assert memory["modes"] == ["cow"]
+    assert memory["copied_bytes"] == 0
+    assert memory["total_bytes"] >= memory["peak_bytes"] > 0
+
+    stats = proc.execution_memory.to_dict()
+    assert (stats["requests"], stats["attempts"], stats["cow"]) == (1, 2, 2)
+    assert stats["copies_avoided_bytes"] == 2 * int(df.memory_usage(index=True).sum())
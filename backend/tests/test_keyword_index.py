@@ -0,0 +1,118 @@
+"""
+Тесты скомпилированного индекса ключевых слов (app.utils.keyword_index)
+и его использования в SimpleGPTProcessor и классификаторах запросов
+"""
+
+import os
+import random
+import re
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.simple_gpt_processor import QUERY_KEYWORDS, SimpleGPTProcessor
+from app.services.smart_query_classifier import SmartQueryClassifier
+from app.utils.keyword_index import KeywordIndex
+from app.utils.query_classifier import QueryClassifier
+
+QUERIES = [
+    "отсортируй по убыванию суммы",
+    "закрепи первую строку",
+    "разморозь всё",
+    "построй круговую диаграмму продаж по менеджерам",
+    "выдели красным строки где сумма больше 10000",
+    "удали дубликаты и заполни пустые ячейки нулями",
+    "сделай прогноз продаж на январь",
+    "почему ты так посчитал?",
+    "найди аномалии в ценах",
+    "сводная по регионам, среднее",
+    "цветовая шкала от красного к зеленому, высокой ценой зеленым",
+    "покажи только строки где статус оплачен",
+    "Sort by revenue desc and highlight top 5",
+    "what if we exclude returns",
+    "",
+]
+
+
+def test_overlapping_keywords_match_like_substring_check():
+    index = KeywordIndex({"A": ["выдели", "выделить"], "B": ["дел", "лит"], "C": ["he", "she", "hers"]}).compile()
+    match = index.match("выделить ushers")
+    assert match.tags == {"A", "B", "C"}
+    assert match.keywords == {"выдели", "выделить", "дел", "лит", "he", "she", "hers"}
+    assert "A" not in index.match("выделы")
+    assert "B" in index.match("выделы")
+
+
+def test_random_texts_equivalent_to_naive_any():
+    rng = random.Random(13)
+    words = ["".join(rng.choice("абв") for _ in range(rng.randint(1, 4))) for _ in range(40)]
+    groups = {f"T{i}": words[i::7] for i in range(7)}
+    index = KeywordIndex(groups).compile()
+    for _ in range(300):
+        text = "".join(rng.choice("абвг ") for _ in range(rng.randint(0, 30)))
+        expected = {tag for tag, kws in groups.items() if any(kw in text for kw in kws)}
+        assert index.scan(text).tags == expected
+
+
+def test_processor_index_equivalent_to_keyword_lists():
+    """Каждый тег совпадает ровно тогда, когда совпал бы прежний any(kw in query_lower ...)"""
+    for query in QUERIES:
+        query_lower = query.lower()
+        match = SimpleGPTProcessor.query_keywords(query_lower)
+        for tag in QUERY_KEYWORDS.tags:
+            expected = any(kw in query_lower for kw in QUERY_KEYWORDS.keywords(tag))
+            assert (tag in match) == expected, (query, tag)
+
+
+def test_all_keyword_lists_registered():
+    lists = [name for name, value in vars(SimpleGPTProcessor).items()
+             if name.endswith("_KEYWORDS") and isinstance(value, list)]
+    assert len(lists) > 30
+    assert set(lists) <= QUERY_KEYWORDS.tags
+    assert {"CLEAN_OPERATIONS.duplicate", "FILTER_OPERATORS.not_empty", "CHART_TYPES"} <= QUERY_KEYWORDS.tags
+
+
+def test_first_follows_mapping_order():
+    match = SimpleGPTProcessor.query_keywords("круговая диаграмма долей в процентах")
+    # 'кругов' объявлен в CHART_TYPES раньше 'процент'
+    assert match.first(SimpleGPTProcessor.CHART_TYPES) == "кругов"
+    assert match.first(SimpleGPTProcessor.AGG_FUNCTIONS) is None
+    with pytest.raises(KeyError):
+        match.any(["слово не из индекса"])
+
+
+def test_match_is_cached_per_text():
+    assert SimpleGPTProcessor.query_keywords("сортировка по дате") is SimpleGPTProcessor.query_keywords("сортировка по дате")
+
+
+def test_detectors_use_index():
+    processor = SimpleGPTProcessor(client=MagicMock())
+    assert SimpleGPTProcessor.determine_data_mode("выдели все строки где сумма > 5", 1000) == "full"
+    assert SimpleGPTProcessor.determine_data_mode("посчитай общую сумму", 1000) == "sample"
+    assert processor._is_conversational_query("почему так?", []) is True
+    assert processor._is_analysis_query("найди аномалии") is True
+    assert processor._is_analysis_query("сумма продаж") is False
+
+
+def test_query_classifier_matches_per_pattern_loop():
+    classifier = QueryClassifier()
+    for query in QUERIES:
+        query_lower = query.lower()
+        expected = {
+            category for category, patterns in classifier.patterns.items()
+            if any(re.search(pattern, query_lower) for pattern in patterns)
+        } or set(classifier.default_categories)
+        assert set(classifier.classify(query)) == expected, query
+
+
+def test_smart_classifier_reports_first_pattern():
+    classifier = SmartQueryClassifier()
+    result = classifier.classify("посчитай корреляцию и сделай pivot")
+    assert result.reason == "Complex pattern detected: (корреляц|correlation)..."
+    result = classifier.classify("составь сравнительную таблицу моделей")
+    assert result.complexity.value == "generate"
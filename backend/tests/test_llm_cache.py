@@ -0,0 +1,181 @@
+"""
+Тесты для кэша ответов LLM (app.services.llm_cache) и SimpleGPTProcessor._chat
+"""
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.llm_cache import (
+    InMemoryLRUBackend,
+    LLMResponseCache,
+    SQLiteBackend,
+    bypass_llm_cache,
+    set_cache_tenant,
+)
+from app.services.code_plan_cache import CodePlanCache
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+MESSAGES = [{"role": "user", "content": "Сумма продаж по менеджерам"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        backend = InMemoryLRUBackend(max_entries=3)
+    else:
+        backend = SQLiteBackend(str(tmp_path / "llm_cache.sqlite3"), max_entries=3)
+    return LLMResponseCache(backend=backend, ttl_seconds=60)
+
+
+class TestLLMResponseCache:
+    def test_miss_then_hit(self, cache):
+        assert cache.get("gpt-4o", MESSAGES, 0, 100) is None
+        cache.set("gpt-4o", MESSAGES, 0, 100, "ответ")
+        assert cache.get("gpt-4o", MESSAGES, 0, 100) == "ответ"
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["by_model"]["gpt-4o"] == {"hits": 1, "misses": 1}
+
+    def test_key_depends_on_model_temperature_and_max_tokens(self, cache):
+        cache.set("gpt-4o", MESSAGES, 0, 100, "ответ")
+        assert cache.get("gpt-4o-mini", MESSAGES, 0, 100) is None
+        assert cache.get("gpt-4o", MESSAGES, 0.1, 100) is None
+        assert cache.get("gpt-4o", MESSAGES, 0, 200) is None
+
+    def test_prompt_is_normalized(self, cache):
+        cache.set("gpt-4o", [{"role": "user", "content": "строка 1  \r\nстрока 2\n"}], 0, 100, "ответ")
+        assert cache.get("gpt-4o", [{"role": "user", "content": "строка 1\nстрока 2"}], 0, 100) == "ответ"
+
+    def test_ttl_expiry(self, cache):
+        cache.set("gpt-4o", MESSAGES, 0, 100, "ответ", ttl_seconds=-1)
+        assert cache.get("gpt-4o", MESSAGES, 0, 100) is None
+        assert cache.stats()["expired"] == 1
+
+    def test_lru_eviction(self, cache):
+        for i in range(4):
+            cache.set("gpt-4o", [{"role": "user", "content": f"q{i}"}], 0, 100, f"a{i}")
+            time.sleep(0.001)
+        assert cache.get("gpt-4o", [{"role": "user", "content": "q0"}], 0, 100) is None
+        assert cache.get("gpt-4o", [{"role": "user", "content": "q3"}], 0, 100) == "a3"
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate(self, cache):
+        cache.set("gpt-4o", MESSAGES, 0, 100, "ответ")
+        cache.invalidate(cache.make_key("gpt-4o", MESSAGES, 0, 100))
+        assert cache.get("gpt-4o", MESSAGES, 0, 100) is None
+
+
+class TestCachePolicy:
+    def test_only_deterministic_calls_by_default(self):
+        cache = LLMResponseCache()
+        assert cache.should_cache(0)
+        assert not cache.should_cache(0.3)
+        assert cache.should_cache(0.3, cache=True)
+        assert not cache.should_cache(0, cache=False)
+
+    def test_bypass_context(self):
+        cache = LLMResponseCache()
+        with bypass_llm_cache():
+            assert not cache.should_cache(0)
+        assert cache.should_cache(0)
+        assert cache.stats()["bypassed"] == 1
+
+    def test_bypass_tenant(self):
+        cache = LLMResponseCache(bypass_tenants=["42"])
+
+        def run(tenant):
+            set_cache_tenant(tenant)
+            return cache.should_cache(0)
+
+        import contextvars
+        assert contextvars.copy_context().run(run, 42) is False
+        assert contextvars.copy_context().run(run, 7) is True
+
+    def test_disabled(self):
+        assert not LLMResponseCache(enabled=False).should_cache(0, cache=True)
+
+
+class TestProcessorChat:
+    def _processor(self):
+        with patch('app.services.simple_gpt_processor.AsyncOpenAI'):
+            processor = SimpleGPTProcessor()
+        processor.llm_cache = LLMResponseCache()
+        response = MagicMock()
+        response.choices[0].message.content = "result = 1"
+        processor.client.chat.completions.create = AsyncMock(return_value=response)
+        return processor
+
+    def test_deterministic_call_is_cached(self):
+        processor = self._processor()
+
+        async def run():
+            first = await processor._chat("gpt-4o-mini", MESSAGES, 0, 10)
+            second = await processor._chat("gpt-4o-mini", MESSAGES, 0, 10)
+            return first, second
+
+        assert asyncio.run(run()) == ("result = 1", "result = 1")
+        assert processor.client.chat.completions.create.await_count == 1
+
+    def test_non_deterministic_call_is_not_cached(self):
+        processor = self._processor()
+
+        async def run():
+            await processor._chat("gpt-4o", MESSAGES, 0.3, 10)
+            await processor._chat("gpt-4o", MESSAGES, 0.3, 10)
+
+        asyncio.run(run())
+        assert processor.client.chat.completions.create.await_count == 2
+
+    def test_failed_code_is_invalidated(self):
+        processor = self._processor()
+        processor.client.chat.completions.create.return_value.choices[0].message.content = (
+            "```python\nresult = df['нет такой колонки'].sum()\n```"
+        )
+        import pandas as pd
+        df = pd.DataFrame({'Сумма': [1, 2]})
+
+        async def run():
+            return await processor._generate_and_execute(query="сумма", df=df, schema_prompt="схема")
+
+        result = asyncio.run(run())
+        assert result["success"] is False
+        assert processor.llm_cache.stats()["invalidated"] >= 1
+        assert processor.llm_cache.stats()["entries"] == 0
+
+    def test_code_rejected_by_validation_is_invalidated(self):
+        import pandas as pd
+        processor = self._processor()
+        processor.code_plans = CodePlanCache(enabled=False)
+        processor._gpt_smart_action = AsyncMock(return_value=None)  # SmartGPT -> Python-путь
+
+        def reply(**kwargs):
+            response = MagicMock()
+            # max_tokens=10 - пост-валидация, иначе генерация кода
+            response.choices[0].message.content = "BAD" if kwargs["max_tokens"] == 10 else "```python\nresult = 3\n```"
+            return response
+
+        create = processor.client.chat.completions.create
+        create.side_effect = reply
+        df = pd.DataFrame({'Менеджер': ['Иванов', 'Петров'], 'Сумма': [1, 2]})
+
+        def run():
+            return asyncio.run(processor.process("какой менеджер лучший", df, list(df.columns)))
+
+        assert run()["success"]
+        first_calls = create.await_count
+        assert processor.llm_cache.stats()["invalidated"] == 2  # код и вердикт BAD
+
+        # Повтор: отклонённый код и вердикт снова идут в LLM, из кэша - только код с уточнением
+        assert run()["success"]
+        repeated = [call.kwargs["max_tokens"] for call in create.await_args_list[first_calls:]]
+        assert repeated == [1000, 10]
@@ -0,0 +1,173 @@
+"""
+Тесты для общего LLM gateway (app.services.llm_gateway)
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.llm_gateway import LLMGateway, _parse_model_limits
+
+
+class FakeCompletions:
+    """Имитация chat.completions: считает одновременные запросы по моделям"""
+
+    def __init__(self, delay: float = 0.02, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.active = {}
+        self.peak = {}
+
+    async def create(self, **kwargs):
+        model = kwargs["model"]
+        self.active[model] = self.active.get(model, 0) + 1
+        self.peak[model] = max(self.peak.get(model, 0), self.active[model])
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("upstream error")
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=model))])
+        finally:
+            self.active[model] -= 1
+
+
+class FakeClient:
+    def __init__(self, completions: FakeCompletions):
+        self.chat = SimpleNamespace(completions=completions)
+        self.models = "models-endpoint"
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+def make_gateway(completions: FakeCompletions, **kwargs) -> LLMGateway:
+    gateway = LLMGateway(**kwargs)
+    built = []
+
+    def build():
+        client = FakeClient(completions)
+        built.append(client)
+        gateway.clients_created += 1
+        return client
+
+    gateway._build_client = build
+    gateway.built = built
+    return gateway
+
+
+class TestConcurrencyLimits:
+    def test_per_model_limit(self):
+        completions = FakeCompletions()
+        gateway = make_gateway(completions, default_concurrency=5, model_concurrency={"gpt-4o": 2})
+
+        async def burst():
+            calls = [gateway.client.chat.completions.create(model="gpt-4o", messages=[]) for _ in range(8)]
+            calls += [gateway.client.chat.completions.create(model="gpt-4o-mini", messages=[]) for _ in range(8)]
+            return await asyncio.gather(*calls)
+
+        responses = asyncio.run(burst())
+
+        assert len(responses) == 16
+        assert completions.peak["gpt-4o"] == 2
+        assert completions.peak["gpt-4o-mini"] == 5
+        stats = gateway.stats()["models"]
+        assert stats["gpt-4o"]["calls"] == 8
+        assert stats["gpt-4o"]["limit"] == 2
+        assert stats["gpt-4o"]["in_flight"] == 0
+        assert stats["gpt-4o"]["waiting"] == 0
+        assert stats["gpt-4o"]["max_wait_ms"] > 0
+
+    def test_error_releases_slot(self):
+        completions = FakeCompletions(fail=True)
+        gateway = make_gateway(completions, default_concurrency=1)
+
+        async def run():
+            for _ in range(3):
+                with pytest.raises(RuntimeError):
+                    await gateway.client.chat.completions.create(model="gpt-4o", messages=[])
+
+        asyncio.run(asyncio.wait_for(run(), timeout=5))
+        stats = gateway.stats()["models"]["gpt-4o"]
+        assert stats["errors"] == 3
+        assert stats["in_flight"] == 0
+
+
+class TestClientPerLoop:
+    def test_client_reused_within_loop(self):
+        gateway = make_gateway(FakeCompletions(delay=0))
+
+        async def run():
+            for _ in range(5):
+                await gateway.client.chat.completions.create(model="gpt-4o", messages=[])
+            return gateway.raw_client()
+
+        raw = asyncio.run(run())
+        assert gateway.built == [raw]
+
+    def test_new_loop_gets_new_client(self):
+        gateway = make_gateway(FakeCompletions(delay=0))
+
+        async def run():
+            return await gateway.client.chat.completions.create(model="gpt-4o", messages=[])
+
+        asyncio.run(run())
+        asyncio.run(run())
+        assert len(gateway.built) == 2
+
+    def test_aclose_closes_loop_client(self):
+        gateway = make_gateway(FakeCompletions(delay=0))
+
+        async def run():
+            gateway.raw_client()
+            await gateway.aclose()
+
+        asyncio.run(run())
+        assert gateway.built[0].closed
+
+    def test_other_attributes_proxied(self):
+        gateway = make_gateway(FakeCompletions(delay=0))
+
+        async def run():
+            return gateway.client.models
+
+        assert asyncio.run(run()) == "models-endpoint"
+
+
+class TestBuildClient:
+    def test_pooled_http_client(self):
+        gateway = LLMGateway(
+            api_key="sk-test", max_connections=7, max_keepalive_connections=3,
+            keepalive_expiry=30.0, request_timeout=42.0, max_retries=1,
+        )
+
+        async def run():
+            client = gateway.raw_client()
+            try:
+                return client, client._client
+            finally:
+                await gateway.aclose()
+
+        client, http_client = asyncio.run(run())
+        assert isinstance(http_client, httpx.AsyncClient)
+        assert client.max_retries == 1
+        assert http_client.timeout.read == 42.0
+        pool = http_client._transport._pool
+        assert pool._max_connections == 7
+        assert pool._max_keepalive_connections == 3
+        assert pool._keepalive_expiry == 30.0
+
+
+def test_parse_model_limits():
+    assert _parse_model_limits("gpt-4o=8, gpt-4o-mini=16") == {"gpt-4o": 8, "gpt-4o-mini": 16}
+    assert _parse_model_limits("gpt-4o=x,bad,=3") == {}
+    assert _parse_model_limits("") == {}
+    assert _parse_model_limits({"gpt-4o": "4"}) == {"gpt-4o": 4}
@@ -0,0 +1,129 @@
+"""
+Тесты локального fast path (LocalActionDispatcher): простые команды без LLM
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.config import settings
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Менеджер": ["Иванов", "Петров", "Сидоров"],
+        "Сумма": [300, 100, 200],
+        "Статус": ["оплачен", "отменен", "оплачен"],
+    })
+
+
+@pytest.fixture
+def processor():
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc._gpt_smart_action = AsyncMock(return_value={"action_type": "chat", "summary": "LLM"})
+    return proc
+
+
+def run(processor, query, df, **kwargs):
+    return asyncio.run(processor.process(query, df, list(df.columns), **kwargs))
+
+
+def test_sort_answered_without_llm(processor, df):
+    result = run(processor, "отсортируй по сумме по убыванию", df)
+
+    processor._gpt_smart_action.assert_not_called()
+    assert result["success"] is True
+    assert result["processor"] == "LocalFastPath v1.0"
+    assert result["action_type"] == "sort"
+    assert result["sort_column"] == "Сумма"
+    assert result["sort_column_index"] == 1
+    assert result["sort_order"] == "DESCENDING"
+    assert result["fast_path"]["local_ms"] < 50
+
+
+def test_freeze_header_answered_without_llm(processor, df):
+    result = run(processor, "закрепи шапку", df)
+
+    processor._gpt_smart_action.assert_not_called()
+    assert result["action_type"] == "freeze"
+    assert result["freeze_rows"] == 1
+    assert result["summary"] == "Закреплено: первая строка"
+
+
+def test_low_confidence_goes_to_llm(processor, df):
+    # highlight - эвристический детектор, уверенность ниже порога
+    result = run(processor, "выдели строки где статус оплачен", df)
+    processor._gpt_smart_action.assert_awaited_once()
+    assert result["summary"] == "LLM"
+
+    stats = processor.local_dispatcher.stats.to_dict()
+    assert stats["low_confidence"] == 1
+    assert stats["by_action"]["highlight"]["low_confidence"] == 1
+
+
+def test_compound_and_conversational_queries_skip_fast_path(processor, df):
+    dispatcher = processor.local_dispatcher
+    columns = list(df.columns)
+    # два действия в одном запросе
+    assert dispatcher.dispatch("отсортируй по сумме и закрепи шапку", columns, df) is None
+    # вопрос и прогноз решает LLM
+    assert dispatcher.dispatch("почему отсортировано по сумме?", columns, df) is None
+    assert dispatcher.dispatch("сделай прогноз и отсортируй по сумме", columns, df) is None
+    # VLOOKUP со вторым листом
+    assert dispatcher.dispatch("отсортируй по сумме", columns, df, reference_df=df) is None
+    assert dispatcher.stats.skipped == 3
+
+
+def test_hit_rate_and_saved_latency(processor, df):
+    dispatcher = processor.local_dispatcher
+    dispatcher.stats.observe_llm(3000.0)
+    columns = list(df.columns)
+
+    assert dispatcher.dispatch("закрепи первую строку", columns, df) is not None
+    assert dispatcher.dispatch("отсортируй по менеджеру", columns, df) is not None
+    assert dispatcher.dispatch("сколько всего продаж", columns, df) is None
+
+    stats = dispatcher.stats.to_dict()
+    assert stats["checked"] == 3
+    assert stats["hits"] == 2
+    assert stats["hit_rate"] == pytest.approx(2 / 3, abs=1e-4)
+    assert stats["by_action"]["freeze"]["hits"] == 1
+    assert 2900 < stats["by_action"]["sort"]["saved_ms"] <= 3000
+    assert stats["saved_ms_total"] > 5800
+
+
+def test_disabled_by_setting(processor, df, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_FAST_PATH_ENABLED", False)
+    run(processor, "закрепи шапку", df)
+    processor._gpt_smart_action.assert_awaited_once()
+
+
+def test_analysis_queries_with_action_words_go_to_llm(processor):
+    df = pd.DataFrame({
+        "Регион": ["Север", "Юг", "Север"],
+        "Менеджер": ["Иванов", "Петров", "Сидоров"],
+        "Продажи": [300, 100, 200],
+    })
+    dispatcher = processor.local_dispatcher
+    columns = list(df.columns)
+    # части через запятую, вопросительные слова, колонка не после "по", заголовок диаграммы
+    assert dispatcher.dispatch("сравни продажи по регионам, отсортируй по убыванию", columns, df) is None
+    assert dispatcher.dispatch("какой менеджер продал больше всех, отсортируй", columns, df) is None
+    assert dispatcher.dispatch("отсортируй, менеджер по убыванию", columns, df) is None
+    assert dispatcher.dispatch("заголовок диаграммы сделай жирным", columns, df) is None
+    assert dispatcher.stats.low_confidence == 4
+
+    # Команды с колонкой после "по" по-прежнему решаются локально
+    assert dispatcher.dispatch("отсортируй по регионам по убыванию", columns, df)["sort_column"] == "Регион"
+    assert dispatcher.dispatch("sort by column Продажи", columns, df)["sort_column"] == "Продажи"
+    assert dispatcher.dispatch("сделай заголовок жирным", columns, df)["action_type"] == "format"
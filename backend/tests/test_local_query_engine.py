@@ -0,0 +1,137 @@
+"""
+Тесты локального движка агрегаций (LocalQueryEngine): сумма/среднее/... без LLM
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.config import settings
+from app.services.intent_parser import IntentParser
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Менеджер": ["Иванов", "Петров", "Иванов"],
+        "Выручка": ["1 200,5", "300", "500"],  # строки из Sheets в RU-формате
+        "Сумма": [10, 20, 30],
+        "Статус": ["оплачен", "отменен", ""],
+    })
+
+
+@pytest.fixture
+def processor():
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc._gpt_smart_action = AsyncMock(return_value={"action_type": "chat", "summary": "LLM"})
+    return proc
+
+
+def run(processor, query, df, **kwargs):
+    return asyncio.run(processor.process(query, df, list(df.columns), **kwargs))
+
+
+def test_sum_answered_without_llm(processor, df):
+    result = run(processor, "посчитай сумму выручки", df)
+
+    processor._gpt_smart_action.assert_not_called()
+    assert result["success"] is True
+    assert result["processor"] == "LocalQueryEngine v1.0"
+    assert result["result_type"] == "number"
+    assert result["result"] == pytest.approx(2000.5)
+    assert result["summary"] == "Сумма значений в колонке 'Выручка': 2 000.50"
+    assert result["formula"] == "=SUM(B2:B4)"
+    assert result["validation"] == "OK"
+
+
+def test_group_by_returns_table(processor, df):
+    result = run(processor, "сумма выручки по менеджерам", df)
+
+    processor._gpt_smart_action.assert_not_called()
+    assert result["result_type"] == "table"
+    assert result["result"] == [{"Менеджер": "Иванов", "Выручка": 1700.5}, {"Менеджер": "Петров", "Выручка": 300.0}]
+    assert result["structured_data"]["headers"] == ["Менеджер", "Выручка"]
+    assert result["structured_data"]["display_mode"] == "preview"
+    assert result["local_engine"]["group_by"] == "Менеджер"
+
+
+def test_other_operations(processor, df):
+    engine = processor.local_engine
+    columns = list(df.columns)
+    assert engine.answer("среднее по колонке Выручка", df, columns)["result"] == pytest.approx(2000.5 / 3)
+    assert engine.answer("минимум выручки", df, columns)["result"] == pytest.approx(300.0)
+    # пустые ячейки не считаются
+    assert engine.answer("количество статус", df, columns)["result"] == 2
+
+
+@pytest.mark.parametrize("query", [
+    "сумма выручки где статус оплачен",   # фильтр
+    "сумма выручки за январь",            # период
+    "посчитай среднее по сумме",          # IntentParser выбрал sum, в запросе average
+    "сумма статуса",                      # не числовая колонка
+    "почему такая сумма выручки?",        # разговор
+])
+def test_uncertain_queries_go_to_llm(processor, df, query):
+    assert processor.local_engine.answer(query, df, list(df.columns)) is None
+
+
+def test_llm_traffic_counter(processor, df):
+    engine = processor.local_engine
+    processor.local_dispatcher.stats.observe_llm(2500.0)
+    columns = list(df.columns)
+
+    engine.answer("посчитай сумму выручки", df, columns)
+    engine.answer("сумма по менеджерам", df, columns)
+    engine.answer("сумма выручки где статус оплачен", df, columns)
+
+    stats = engine.stats.to_dict()
+    assert stats["checked"] == 3
+    assert stats["answered"] == 2
+    assert stats["llm_calls_avoided"] == 2
+    assert stats["by_operation"] == {"sum": 2}
+    assert stats["by_reason"] == {"unparsed_words": 1}
+    assert 4900 < stats["saved_ms_total"] <= 5000
+
+
+def test_disabled_by_setting(processor, df, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_QUERY_ENGINE_ENABLED", False)
+    run(processor, "посчитай сумму выручки", df)
+    processor._gpt_smart_action.assert_awaited_once()
+
+
+def test_intent_parser_matches_case_forms():
+    parser = IntentParser()
+    context = {"column_names": ["Менеджер", "Выручка"], "row_count": 10}
+    target = parser.parse("посчитай сумму выручки", context).parameters["target_column"]
+    assert (target.value, target.certainty) == ("Выручка", 0.90)
+
+
+def test_count_of_text_column_is_distinct_values(processor):
+    df = pd.DataFrame({
+        "Менеджер": ["Иванов", "Петров", "Сидоров"] * 10,
+        "Регион": ["Север", "Юг"] * 15,
+        "Цена": range(30),
+    })
+    engine = processor.local_engine
+    columns = list(df.columns)
+
+    result = engine.answer("количество менеджеров", df, columns)
+    assert result["result"] == 3
+    assert result["summary"] == "Уникальных значений в колонке 'Менеджер': 3"
+    assert result["code"] == "result = df['Менеджер'].nunique()"
+    assert result["local_engine"]["operation"] == "count_distinct"
+    assert "formula" not in result
+
+    grouped = engine.answer("количество менеджеров по регионам", df, columns)
+    assert grouped["result"] == [{"Регион": "Север", "Менеджер": 3}, {"Регион": "Юг", "Менеджер": 3}]
+    # Числовая колонка - по-прежнему количество значений
+    assert engine.answer("количество по колонке Цена", df, columns)["result"] == 30
@@ -0,0 +1,123 @@
+"""
+Тесты бюджета токенов для секций промпта SmartGPT (app.utils.prompt_budget)
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.config import settings
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+from app.utils.prompt_budget import PromptBudget, estimate_tokens, truncate_to_tokens
+
+
+def wide_frame(rows: int = 500, cols: int = 10) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    data = {f"Колонка {i}": rng.integers(0, 1_000_000, rows) for i in range(cols - 1)}
+    data["Менеджер"] = [f"Менеджер {i % 40}" for i in range(rows)]
+    return pd.DataFrame(data)
+
+
+def test_estimate_tokens_close_to_bpe():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("The quick brown fox jumps over the lazy dog") == 9
+    # Кириллица дороже латиницы, длинные числа - несколько токенов
+    assert 10 <= estimate_tokens("Посчитай сумму продаж по менеджерам за октябрь") <= 16
+    assert estimate_tokens("1234567890") == 4
+    # Выравнивание пробелами в ASCII-таблице почти бесплатно
+    assert estimate_tokens(" " * 40) <= 6
+
+
+def test_truncate_to_tokens():
+    text = "слово " * 500
+    cut = truncate_to_tokens(text, 50)
+    assert estimate_tokens(cut) <= 50
+    assert cut.endswith("...")
+    assert truncate_to_tokens("коротко", 50) == "коротко"
+
+
+def test_unused_budget_carries_over():
+    budget = PromptBudget(total_tokens=1000, shares={"role": 0.2, "table": 0.8})
+    budget.skip("role")
+    assert budget.available("table") == 1000
+
+    budget = PromptBudget(total_tokens=1000, shares={"role": 0.2, "table": 0.8})
+    budget.fit_text("role", "Ты финансовый директор")
+    assert 800 < budget.available("table") < 1000
+
+
+def test_fit_lines_stops_at_budget():
+    budget = PromptBudget(total_tokens=100, shares={"table": 1.0})
+    text, count = budget.fit_lines("table", [f"строка номер {i}" for i in range(100)], header="заголовок")
+    assert 0 < count < 100
+    assert text.startswith("заголовок")
+    report = budget.report()
+    assert report["sections"]["table"] <= 100
+    assert report["truncated"] == ["table"]
+
+
+def test_ascii_table_respects_budget():
+    df = wide_frame()
+    columns = list(df.columns)
+    unbounded = SimpleGPTProcessor.format_ascii_table(df, columns, "full")
+
+    budget = PromptBudget(total_tokens=3000, shares={"table": 1.0})
+    bounded = SimpleGPTProcessor.format_ascii_table(df, columns, "full", budget=budget)
+
+    assert estimate_tokens(bounded) <= 3000 < estimate_tokens(unbounded)
+    assert "из 500 строк. Режим: FULL]" in bounded
+    # Без бюджета вывод не меняется
+    assert unbounded.endswith("[Показано 500 из 500 строк. Режим: FULL]") or unbounded.endswith("[Всего: 500 строк. Режим: FULL]")
+
+
+def test_small_table_unchanged_by_budget():
+    df = pd.DataFrame({"Менеджер": ["Иванов", "Петров"], "Сумма": [100, 200]})
+    columns = list(df.columns)
+    plain = SimpleGPTProcessor.format_ascii_table(df, columns, "full")
+    assert SimpleGPTProcessor.format_ascii_table(df, columns, "full", budget=PromptBudget()) == plain
+
+
+def test_history_keeps_latest_items():
+    processor = SimpleGPTProcessor(client=MagicMock())
+    history = [{"query": f"вопрос {i}", "response": f"ответ {i} " + "x" * 1400} for i in range(5)]
+    budget = PromptBudget(total_tokens=1000, shares={"history": 1.0})
+
+    text = processor._format_history_section(history, budget)
+
+    assert "вопрос 4" in text
+    assert "вопрос 0" not in text
+    assert estimate_tokens(text) <= 1000
+
+
+@pytest.fixture
+def smart_prompt(monkeypatch):
+    """Промпт, который _gpt_smart_action отправляет в LLM"""
+    processor = SimpleGPTProcessor(client=MagicMock())
+    processor._chat = AsyncMock(return_value='<response>{"action_type": "analysis"}</response>')
+
+    def run(query, df, **kwargs):
+        asyncio.run(processor._gpt_smart_action(query, list(df.columns), df, **kwargs))
+        return processor._chat.await_args.kwargs["messages"][0]["content"]
+
+    return run
+
+
+def test_smart_prompt_within_budget(smart_prompt, monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_DATA_TOKEN_BUDGET", 4000)
+    small = smart_prompt("выдели строки где сумма больше 500000", wide_frame())
+
+    monkeypatch.setattr(settings, "PROMPT_DATA_TOKEN_BUDGET", 40000)
+    large = smart_prompt("выдели строки где сумма больше 500000", wide_frame())
+
+    assert estimate_tokens(small) < estimate_tokens(large)
+    assert "строк. Режим: FULL]" in small
+    assert "JSON (для highlight" in large
@@ -0,0 +1,135 @@
+"""
+Тесты ленивого плана FunctionRegistry (RegistryPipeline): тот же результат,
+что и у цепочки execute(), но с одной материализацией строк
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.function_registry import FunctionRegistry
+from app.services.registry_pipeline import RegistryPipeline
+
+
+@pytest.fixture
+def registry():
+    return FunctionRegistry()
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(7)
+    rows = 200
+    return pd.DataFrame({
+        "Менеджер": rng.choice(["Иванов", "Петров", "Сидоров", "Козлов"], rows),
+        "Статус": rng.choice(["Оплачен", "Отменен", "Новый"], rows),
+        "Сумма": [f"{v:.2f}" for v in rng.uniform(100, 10000, rows)],
+        "Количество": rng.integers(1, 50, rows),
+        "Город": rng.choice(["Москва", "Казань", "Омск"], rows),
+    }, index=np.arange(1000, 1000 + rows))
+
+
+def chained(registry, df, steps):
+    for step in steps:
+        output = registry.execute(step["function"], df, **step["params"])
+        assert output["success"], output["error"]
+        df = output["result"]
+    return df
+
+
+def step(function, **params):
+    return {"function": function, "params": params}
+
+
+PLANS = {
+    "filter-sort-top": [
+        step("sort_data", columns=["Количество"], ascending=False),
+        step("filter_rows", column="Статус", operator="==", value="Оплачен"),
+        step("filter_rows", column="Сумма", operator=">", value="2000"),
+        step("filter_top_n", column="Сумма", n=5),
+    ],
+    "top-with-condition": [
+        step("filter_in_list", column="Город", values=["Москва", "Омск"]),
+        step("filter_bottom_n", column="Сумма", n=7, condition={"column": "Статус", "operator": "!=", "value": "Отменен"}),
+    ],
+    "aggregate-then-key-filter": [
+        step("sort_data", columns=["Сумма"]),
+        step("filter_between", column="Количество", min_value=5, max_value=40),
+        step("aggregate_by_group", group_by=["Менеджер"], agg_column="Количество", agg_func="sum"),
+        step("filter_not_in_list", column="Менеджер", values=["Петров"]),
+        step("sort_data", columns=["Количество"], ascending=False),
+    ],
+    "project-and-search": [
+        step("drop_columns", columns=["Город"]),
+        step("search_rows", column="Менеджер", search_term="ов"),
+        step("reorder_columns", columns=["Сумма", "Менеджер"]),
+        step("filter_multiple", conditions=[
+            {"column": "Статус", "operator": "==", "value": "Новый"},
+            {"column": "Количество", "operator": ">=", "value": 10},
+        ]),
+    ],
+    "top-then-sort": [
+        step("filter_top_n", column="Сумма", n=20),
+        step("filter_rows", column="Сумма", operator=">", value=5000),
+        step("sort_data", columns=["Менеджер"]),
+    ],
+}
+
+
+@pytest.mark.parametrize("name", PLANS)
+def test_plan_matches_chained_execution(registry, df, name):
+    steps = PLANS[name]
+    expected = chained(registry, df, steps)
+
+    output = registry.execute_plan(df, steps)
+
+    assert output["success"], output.get("error")
+    result = output["result"]
+    if name == "aggregate-then-key-filter":
+        # фильтр по ключу ушёл до группировки - строки группировки нумеруются заново
+        result, expected = result.reset_index(drop=True), expected.reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected)
+    assert output["materializations"] <= 2
+
+
+def test_terminal_reducer_gets_filtered_column(registry, df):
+    steps = [
+        step("filter_rows", column="Статус", operator="==", value="Оплачен"),
+        step("calculate_sum", column="Количество"),
+    ]
+    output = registry.execute_plan(df, steps)
+    assert output["result"] == chained(registry, df, steps)
+
+
+def test_optimizer_pushes_and_fuses(registry):
+    pipeline = RegistryPipeline(registry, PLANS["filter-sort-top"])
+    assert pipeline.explain() == ["filter[filter_rows, filter_rows]", "sort[Количество desc]", "filter_top_n[Сумма, 5]"]
+
+    pipeline = RegistryPipeline(registry, PLANS["aggregate-then-key-filter"])
+    assert pipeline.explain() == [
+        "filter[filter_between, filter_not_in_list]",
+        "aggregate[Менеджер: sum(Количество)]",
+        "sort[Количество desc]",
+    ]
+
+    pipeline = RegistryPipeline(registry, [
+        step("sort_data", columns=["Сумма"]),
+        step("sort_data", columns=["Менеджер"], ascending=False),
+    ])
+    assert pipeline.explain() == ["sort[Менеджер desc, Сумма asc]"]
+
+
+def test_function_call_format_and_errors(registry, df):
+    output = registry.execute_plan(df, [{"name": "filter_null", "arguments": {"column": "Город"}}])
+    assert output["success"] and output["result"].empty
+
+    output = registry.execute_plan(df, [step("sort_data", columns=["Нет такой"])])
+    assert not output["success"] and "Нет такой" in output["error"]
+
+    with pytest.raises(ValueError):
+        RegistryPipeline(registry, [step("unknown_function")])
@@ -0,0 +1,112 @@
+"""
+Тесты индексов строк SheetProfile в FunctionRegistry: результат по индексу
+совпадает с полным проходом по колонке, индекс строится один раз на колонку
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.function_registry import FunctionRegistry
+from app.utils.sheet_profile import get_sheet_profile
+
+
+@pytest.fixture
+def registry():
+    return FunctionRegistry()
+
+
+@pytest.fixture
+def sheet():
+    rng = np.random.default_rng(5)
+    rows = 300
+    amounts = rng.integers(0, 40, rows) * 250.0
+    amounts[rng.choice(rows, 15, replace=False)] = np.nan
+    df = pd.DataFrame({
+        "Менеджер": rng.choice(["Иванов", "Петров", "иванова", "Сидоров (ст.)", None], rows),
+        "Сумма": amounts,
+        "Количество": rng.integers(1, 20, rows),
+        "Сумма текстом": [f"{v:,.0f} ₽".replace(",", " ") for v in rng.integers(100, 100000, rows)],
+        "Статус": rng.choice(["Оплачен", "Отменен", "Новый"], rows),
+    }, index=np.arange(500, 500 + rows))
+    get_sheet_profile(df)   # лист запроса: профиль заводит main._build_request_frames
+    return df
+
+
+CALLS = [
+    ("filter_rows", dict(column="Статус", operator="==", value="Оплачен")),
+    ("filter_rows", dict(column="Статус", operator="!=", value="Оплачен")),
+    ("filter_rows", dict(column="Менеджер", operator="!=", value="Иванов")),
+    ("filter_rows", dict(column="Сумма", operator="==", value=5000)),
+    ("filter_rows", dict(column="Сумма", operator=">", value=5000)),
+    ("filter_rows", dict(column="Сумма", operator=">=", value="5 000")),
+    ("filter_rows", dict(column="Сумма", operator="<", value=1000.0)),
+    ("filter_rows", dict(column="Сумма текстом", operator="<=", value=50000)),
+    ("filter_rows", dict(column="Менеджер", operator="contains", value="ИВАН")),
+    ("filter_rows", dict(column="Сумма", operator="==", value="5000")),
+    ("filter_in_list", dict(column="Менеджер", values=["Иванов", "иванова", "Нет такого"])),
+    ("filter_in_list", dict(column="Сумма", values=[250, 500.0, 999])),
+    ("filter_not_in_list", dict(column="Статус", values=["Новый"])),
+    ("filter_between", dict(column="Количество", min_value=5, max_value=10)),
+    ("filter_between", dict(column="Сумма", min_value=2000, max_value=1000)),
+    ("search_rows", dict(column="Менеджер", search_term="иван")),
+    ("search_rows", dict(column="Менеджер", search_term="Иван", case_sensitive=True)),
+    ("search_rows", dict(column="Менеджер", search_term=r"\(ст\.\)|^Пет")),
+    ("search_rows", dict(column="Менеджер", search_term="none")),
+    ("filter_multiple", dict(conditions=[
+        {"column": "Статус", "operator": "==", "value": "Оплачен"},
+        {"column": "Сумма", "operator": ">", "value": "2500"},
+    ])),
+    ("filter_multiple", dict(logic="OR", conditions=[
+        {"column": "Менеджер", "operator": "contains", "value": "сид"},
+        {"column": "Количество", "operator": "<=", "value": 2},
+    ])),
+    ("filter_top_n", dict(column="Сумма", n=7)),
+    ("filter_bottom_n", dict(column="Сумма", n=12)),
+    ("filter_top_n", dict(column="Количество", n=5, condition={"column": "Статус", "operator": "==", "value": "Новый"})),
+    ("filter_top_n", dict(column="Сумма текстом", n=3)),
+]
+
+
+@pytest.mark.parametrize("name,params", CALLS, ids=[f"{n}-{i}" for i, (n, _) in enumerate(CALLS)])
+def test_indexed_result_matches_scan(registry, sheet, name, params):
+    expected = registry.functions[name](sheet.copy(), **params)   # копия - без профиля, полный проход
+    result = registry.functions[name](sheet, **params)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_vlookup_and_index_reuse(registry, sheet):
+    plain = sheet.copy()
+    for value in ["Петров", "Нет такого", None]:
+        assert registry.vlookup(sheet, value, "Менеджер", "Количество") == registry.vlookup(plain, value, "Менеджер", "Количество")
+    assert registry.vlookup(sheet, 5000, "Сумма", "Статус") == registry.vlookup(plain, 5000, "Сумма", "Статус")
+
+    profile = get_sheet_profile(sheet)
+    for _ in range(3):
+        registry.filter_rows(sheet, "Статус", "==", "Оплачен")
+        registry.filter_in_list(sheet, "Статус", ["Новый"])
+        registry.filter_rows(sheet, "Сумма", ">", 1000)
+        registry.filter_top_n(sheet, "Сумма", 3)
+    stats = profile.stats()
+    assert stats["computed"]["index:hash"] == 3          # Менеджер, Сумма, Статус - по одному разу
+    assert stats["computed"]["index:desc"] == 1
+    assert stats["lookups"]["hash"] >= 6 and stats["lookups"]["top"] == 3
+    # Диапазон - сравнением по разобранной колонке, пока сортировка не построена
+    assert "index:asc" not in stats["computed"] and "range" not in stats["lookups"]
+
+    registry.filter_bottom_n(sheet, "Сумма", 3)
+    expected = registry.filter_rows(sheet.copy(), "Сумма", "<=", 1000)
+    pd.testing.assert_frame_equal(registry.filter_rows(sheet, "Сумма", "<=", 1000), expected)
+    assert profile.stats()["lookups"]["range"] == 1
+
+
+def test_replaced_column_rebuilds_index(registry, sheet):
+    assert len(registry.filter_rows(sheet, "Статус", "==", "Оплачен")) > 0
+    sheet["Статус"] = sheet["Статус"].map({"Оплачен": 1.0, "Отменен": 2.0, "Новый": 3.0})
+    assert len(registry.filter_rows(sheet, "Статус", "==", "Оплачен")) == 0
+    assert len(registry.filter_rows(sheet, "Статус", "==", 1)) == (sheet["Статус"] == 1).sum()
@@ -0,0 +1,89 @@
+"""
+Тесты для content-addressed кэша схем (SchemaExtractor.get_schema_and_prompt)
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.schema_extractor import SchemaCache, SchemaExtractor
+
+
+def make_df():
+    return pd.DataFrame({
+        'Менеджер': ['Иванов', 'Петров', 'Сидоров', 'Иванов'],
+        'Сумма': [1000.0, 2500.5, 300.0, 1200.0],
+        'Дата': ['01.01.2024', '02.01.2024', '03.01.2024', '04.01.2024'],
+    })
+
+
+def test_cached_result_matches_uncached():
+    extractor = SchemaExtractor()
+    df = make_df()
+    expected = extractor.extract_schema(df)
+    schema, prompt = extractor.get_schema_and_prompt(df)
+    assert schema == expected
+    assert prompt == extractor.schema_to_prompt(expected)
+
+
+def test_identical_sheet_hits_cache():
+    extractor = SchemaExtractor()
+    extractor.get_schema_and_prompt(make_df())
+    extractor.get_schema_and_prompt(make_df())
+    stats = extractor.cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+def test_changed_column_reuses_other_columns():
+    extractor = SchemaExtractor()
+    df = make_df()
+    extractor.get_schema_and_prompt(df)
+
+    changed = df.copy()
+    changed['Сумма'] = [1.0, 2.0, 3.0, 4.0]
+    schema, _ = extractor.get_schema_and_prompt(changed)
+
+    stats = extractor.cache_stats()
+    assert stats["misses"] == 2
+    assert stats["column_hits"] == 2
+    assert stats["column_misses"] == 4
+    assert schema == extractor.extract_schema(changed)
+
+
+def test_renamed_column_is_a_different_key():
+    extractor = SchemaExtractor()
+    df = make_df()
+    extractor.get_schema_and_prompt(df)
+    schema, _ = extractor.get_schema_and_prompt(df.rename(columns={'Сумма': 'Выручка'}))
+    assert [c["name"] for c in schema["columns"]] == ['Менеджер', 'Выручка', 'Дата']
+
+
+def test_mixed_types_do_not_collide():
+    a = pd.Series([1, 'a'], dtype=object)
+    b = pd.Series(['1', 'a'], dtype=object)
+    assert SchemaCache.column_key('x', a) != SchemaCache.column_key('x', b)
+
+
+def test_returned_schema_is_a_copy():
+    extractor = SchemaExtractor()
+    schema, _ = extractor.get_schema_and_prompt(make_df())
+    schema["columns"][0]["name"] = "changed"
+    again, _ = extractor.get_schema_and_prompt(make_df())
+    assert again["columns"][0]["name"] == 'Менеджер'
+
+
+def test_lru_eviction():
+    extractor = SchemaExtractor(cache=SchemaCache(max_frames=2, max_columns=100))
+    frames = [pd.DataFrame({'x': [i, i + 1]}) for i in range(3)]
+    for df in frames:
+        extractor.get_schema_and_prompt(df)
+    extractor.get_schema_and_prompt(frames[0])
+
+    stats = extractor.cache_stats()
+    assert stats["frames"] == 2
+    assert stats["evictions"] >= 1
+    assert stats["hits"] == 0
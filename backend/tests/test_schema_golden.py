@@ -0,0 +1,168 @@
+"""
+Golden-тесты SchemaExtractor: схема и prompt должны совпадать с эталоном
+(tests/golden/schema/*.json), снятым до векторизации (v11.8.0).
+
+Обновить эталоны (только если поведение меняется намеренно):
+    python tests/test_schema_golden.py --update
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.schema_extractor import SchemaExtractor
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "schema")
+
+
+def case_sales():
+    """Типичный лист продаж после авто-конвертации в main.py"""
+    df = pd.DataFrame({
+        'Менеджер': ['Иванов', 'Петров', 'Сидоров', 'Иванов', 'Петров', None],
+        'Сумма продаж': ['150 000,50', '89 000', '1 200 000', '15 300,75', '0', '42'],
+        'Количество': ['10', '5', '8', '12', '3', '7'],
+        'Дата': ['01.01.2024', '15.01.2024', '03.02.2024', '20.02.2024', '01.03.2024', '05.03.2024'],
+        'Телефон': ['79001234567', '79007654321', '79001112233', '79004445566', '79007778899', None],
+        'Оплачено': ['Да', 'Нет', 'Да', 'да', 'Нет', 'Да'],
+        'Пустая': [None, None, None, None, None, None],
+    })
+    return auto_convert_numeric_columns(df)
+
+
+def case_raw_strings():
+    """Строки без авто-конвертации: проценты, валюта, ISO-даты, 1/0, смешанные колонки"""
+    return pd.DataFrame({
+        'Маржа': ['15%', '20,5%', '7%', '12%', '30%', 'н/д', '11%', '9%', '10%', '8%'],
+        'Цена': ['1 200 ₽', '500 руб.', '$300', '99,90', '0,5', '10', '1e3', '15', '7', '100'],
+        'Флаг': ['1', '0', '1', '1', '0', '0', '1', '0', '1', '1'],
+        'Статус': ['true', 'False', 'TRUE', 'false', 'true', 'true', 'false', 'True', 'true', 'false'],
+        'Создан': ['2024-01-05', '2024-02-10', '2024-03-15', None, '2024-05-20',
+                   '2024-06-25', '2024-07-30', '2024-08-04', '2024-09-09', '2024-10-14'],
+        'Смешанная': ['1', '2', 'три', '4', '5', 'шесть', '7', '8', '9', 'десять'],
+        'Комментарий': [f'Комментарий номер {i} к заказу' for i in range(10)],
+    })
+
+
+def case_edge_types():
+    """bool/int/float dtypes, NaN в числах, много категорий, большие и дробные числа"""
+    return pd.DataFrame({
+        'Активен': [True, False, True, True, False, True, False, True, True, True, False, True],
+        'Штуки': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+        'Вес': [1.5, np.nan, 2.25, 3.0, -4.75, 5.5, np.nan, 0.0, 9.125, 10.0, 11.0, 12.5],
+        'Целые float': [1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0],
+        'Большие': [10**12, 2 * 10**12, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+        'Город': ['Москва', 'Казань', 'Пермь', 'Омск', 'Тула', 'Уфа', 'Сочи', 'Тверь',
+                  'Самара', 'Курск', 'Орёл', 'Москва'],
+        'Регион': ['Север', 'Юг', 'Север', 'Юг', 'Север', 'Юг', 'Север', 'Юг',
+                   'Север', 'Юг', 'Север', 'Юг'],
+        'Дата US': ['01/02/2024'] * 6 + ['xx'] * 6,
+        'Дата YY': ['01-02-24', '03-04-24', '05-06-24', '07-08-24', 'abc', '09-10-24',
+                    '11-12-24', '13-01-24', '14-02-24', '15-03-24', '16-04-24', '17-05-24'],
+        'Да/Нет': ['да', 'нет', 'да', 'нет', 'да', 'нет', 'да', 'нет', 'да', 'нет', 'ДА', 'НЕТ'],
+        'Артикул': [1001, 1002, 1003, 1004, 1005, 1006, 1007, 1008, 1009, 1010, 1011, 1012],
+    })
+
+
+def case_single_row():
+    return pd.DataFrame({'Имя': ['Иванов'], 'Сумма': [100.0], 'Флаг': ['Да'], 'Дата': ['01.01.2024']})
+
+
+def case_wide_random():
+    """Широкий лист со случайными данными (высокая кардинальность текста)"""
+    rng = np.random.default_rng(7)
+    rows = 400
+    data = {}
+    for i in range(24):
+        kind = i % 8
+        if kind == 0:
+            data[f'Сумма {i}'] = [f"{v:,.2f}".replace(",", " ").replace(".", ",") for v in rng.uniform(0, 1e6, rows)]
+        elif kind == 1:
+            data[f'Кол-во {i}'] = [str(v) for v in rng.integers(0, 100, rows)]
+        elif kind == 2:
+            data[f'Клиент {i}'] = [f"Клиент {v}" for v in rng.integers(0, 10_000, rows)]
+        elif kind == 3:
+            data[f'Отдел {i}'] = [f"Отдел {v}" for v in rng.integers(0, 8, rows)]
+        elif kind == 4:
+            data[f'Дата {i}'] = [f"{d:02d}.{m:02d}.2024" for d, m in zip(rng.integers(1, 28, rows), rng.integers(1, 13, rows))]
+        elif kind == 5:
+            values = [f"{v:.1f}" for v in rng.uniform(-50, 50, rows)]
+            for j in rng.integers(0, rows, rows // 4):
+                values[j] = 'ошибка'
+            data[f'Дельта {i}'] = values
+        elif kind == 6:
+            data[f'Флаг {i}'] = list(rng.choice(['Да', 'Нет', 'да'], rows))
+        else:
+            data[f'Заметка {i}'] = [f"Заметка {v} " * int(v % 4 + 1) for v in rng.integers(0, 10**6, rows)]
+    return auto_convert_numeric_columns(pd.DataFrame(data))
+
+
+CASES = {
+    "sales": case_sales,
+    "raw_strings": case_raw_strings,
+    "edge_types": case_edge_types,
+    "single_row": case_single_row,
+    "wide_random": case_wide_random,
+}
+
+
+def _to_jsonable(obj):
+    """numpy-скаляры -> Python, чтобы схему можно было сравнить с JSON-эталоном"""
+    if isinstance(obj, dict):
+        return {k: _to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(v) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def build_snapshot(name):
+    extractor = SchemaExtractor()
+    df = CASES[name]()
+    schema = extractor.extract_schema(df)
+    return {"schema": _to_jsonable(schema), "prompt": extractor.schema_to_prompt(schema)}
+
+
+def golden_path(name):
+    return os.path.join(GOLDEN_DIR, f"{name}.json")
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_schema_matches_golden(name):
+    with open(golden_path(name), encoding="utf-8") as f:
+        expected = json.load(f)
+    actual = json.loads(json.dumps(build_snapshot(name), ensure_ascii=False))
+    assert actual["schema"] == expected["schema"]
+    assert actual["prompt"] == expected["prompt"]
+
+
+def test_numeric_probe_does_not_reject_text_prefix():
+    """Текст в начале колонки не даёт ложного раннего отказа, если чисел > 80%"""
+    values = ['нет данных'] * 64 + [str(i) for i in range(336)]
+    series = pd.Series(values, dtype=object)
+    assert SchemaExtractor()._detect_column_type(series) == "numeric"
+    assert SchemaExtractor()._detect_column_type(pd.Series(values[:100] + ['x'] * 300)) == "category"
+
+
+def test_infinity_is_not_integer():
+    stats = SchemaExtractor()._extract_numeric_stats(pd.Series([1.0, float('inf')]))
+    assert stats["is_integer"] is False
+
+
+if __name__ == "__main__":
+    if "--update" not in sys.argv:
+        print("Usage: python tests/test_schema_golden.py --update")
+        sys.exit(1)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for case_name in sorted(CASES):
+        with open(golden_path(case_name), "w", encoding="utf-8") as f:
+            json.dump(build_snapshot(case_name), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"updated {golden_path(case_name)}")
@@ -0,0 +1,73 @@
+"""
+Тесты для single-pass загрузки листа (app.utils.sheet_ingest)
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.sheet_ingest import rows_to_frame, estimate_frame_bytes
+
+
+def legacy_frame(rows, columns):
+    """Старый путь из main.py: выравнивание строк в Python-цикле."""
+    num_cols = len(columns)
+    padded_data = []
+    for row in rows:
+        if len(row) < num_cols:
+            row = list(row) + [None] * (num_cols - len(row))
+        padded_data.append(row[:num_cols])
+    return pd.DataFrame(padded_data, columns=columns)
+
+
+@pytest.mark.parametrize("rows,columns", [
+    ([[1, 'a', 2.5], [2, 'b', None], [3, 'c', 1]], ['x', 'y', 'z']),
+    ([[1, 'a'], [2, 'b', None, 9], [3]], ['x', 'y', 'z']),
+    ([[True, 1], [False, None]], ['a', 'b']),
+    ([['1 000,5', ''], ['x', '']], ['Сумма', 'Комментарий']),
+    ([[[1, 2], 'a'], [[3], 'b']], ['a', 'b']),
+    ([[1, 2], [None, 3]], ['a', 'a']),
+    ([[], []], ['a']),
+])
+def test_matches_legacy_padding(rows, columns):
+    df, stats = rows_to_frame(rows, columns)
+    pd.testing.assert_frame_equal(df, legacy_frame(rows, columns))
+    assert stats.rows == len(rows)
+    assert stats.cols == len(columns)
+
+
+def test_does_not_modify_input_rows():
+    rows = [[1], [2, 3, 4]]
+    rows_to_frame(rows, ['a', 'b'])
+    assert rows == [[1], [2, 3, 4]]
+
+
+def test_stats_counts_ragged_rows():
+    _, stats = rows_to_frame([[1], [1, 2], [1, 2, 3], []], ['a', 'b'])
+    assert stats.padded_rows == 2
+    assert stats.truncated_rows == 1
+    assert stats.ingest_ms >= 0
+    assert stats.frame_bytes > 0
+    assert set(stats.to_dict()) == {
+        'rows', 'cols', 'padded_rows', 'truncated_rows', 'ingest_ms', 'frame_bytes'
+    }
+
+
+def test_empty_input():
+    df, stats = rows_to_frame(None, ['a', 'b'])
+    assert list(df.columns) == ['a', 'b']
+    assert len(df) == 0
+    assert stats.frame_bytes == 0
+
+
+def test_estimate_frame_bytes_close_to_deep_memory_usage():
+    df = pd.DataFrame({
+        'Менеджер': [f'Менеджер {i % 50}' for i in range(5000)],
+        'Сумма': [float(i) for i in range(5000)],
+    })
+    exact = df.memory_usage(index=False, deep=True).sum()
+    assert abs(estimate_frame_bytes(df) - exact) / exact < 0.1
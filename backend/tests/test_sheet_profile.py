@@ -0,0 +1,97 @@
+"""
+Тесты SheetProfile: колонка разбирается один раз на запрос, все потребители
+(auto-convert, схема, SmartGPT, детекторы, FunctionRegistry) читают профиль
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.function_registry import FunctionRegistry
+from app.services.schema_extractor import SchemaExtractor
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+from app.utils.sheet_profile import SheetProfile, get_sheet_profile
+from app.utils.type_coercion import auto_convert_numeric_columns
+
+
+def sheet():
+    """Лист как из Google Sheets: всё строками"""
+    return pd.DataFrame({
+        "Менеджер": ["Иванов", "Петров", "Иванов", None],
+        "Сумма": ["1 200,5", "300", "", "450"],
+        "Телефон": ["79001112233", "79004445566", "", "79007778899"],
+        "Дата": ["2024-01-05", "2024-02-10", "2024-03-15", "2024-04-20"],
+    })
+
+
+def test_profile_is_shared_per_frame_object():
+    df = sheet()
+    profile = get_sheet_profile(df)
+    assert get_sheet_profile(df) is profile
+    assert get_sheet_profile(df.copy(), create=False) is None
+    assert isinstance(get_sheet_profile(df.copy()), SheetProfile)
+
+
+def test_fields_match_direct_scans():
+    df = sheet()
+    profile = get_sheet_profile(df)
+    assert profile.numeric(1).tolist()[:2] == [1200.5, 300.0]
+    assert profile.numeric_share(1) == pytest.approx(0.75)
+    assert profile.is_numeric(1) and not profile.is_numeric(0)
+    assert profile.unique_count(0) == df["Менеджер"].nunique()
+    assert np.array_equal(profile.null_mask(0), df["Менеджер"].isna().to_numpy())
+    assert profile.non_null(0) == 3
+    assert profile.dates(3).dt.month.tolist() == [1, 2, 3, 4]
+    assert [profile.kind(i) for i in (0, 1)] == ["text", "numeric"]
+
+
+def test_each_column_parsed_once_across_pipeline():
+    df = sheet()
+    profile = get_sheet_profile(df)
+    auto_convert_numeric_columns(df, profile=profile)
+    assert df["Сумма"].dtype == np.float64
+
+    # схема и детектор сводной используют готовый разбор; повторные проходы ничего не считают
+    processor = SimpleGPTProcessor(client=MagicMock())
+    for _ in range(2):
+        SchemaExtractor().get_schema_and_prompt(df)
+        processor._detect_pivot_action("сводная по менеджерам", list(df.columns), df)
+        assert profile.computed["numeric:ru"] <= len(df.columns)
+        assert profile.computed.get("unique_count", 0) <= len(df.columns)
+        assert profile.computed["null_mask"] == len(df.columns)
+
+    # FunctionRegistry ("auto"-разбор) - тоже один раз на колонку
+    registry = FunctionRegistry()
+    registry._parse_numeric_column(df["Сумма"], df)
+    registry._parse_numeric_column(df["Сумма"], df)
+    assert profile.computed["numeric:auto"] == 1
+
+
+def test_replaced_column_is_recomputed():
+    df = sheet()
+    profile = get_sheet_profile(df)
+    assert profile.unique_count(0) == 2
+    df.isetitem(0, pd.Series(["A", "B", "C", "D"]))
+    assert profile.unique_count(0) == 2  # тот же dtype и название - явный сброс
+    profile.invalidate(0)
+    assert profile.unique_count(0) == 4
+    df.isetitem(1, pd.Series([1.0, 2.0, 3.0, 4.0]))
+    assert profile.numeric(1).sum() == 10.0  # dtype изменился - пересчёт сам
+
+
+def test_schema_unchanged_with_profile():
+    plain = sheet()
+    auto_convert_numeric_columns(plain)
+    profiled = sheet()
+    auto_convert_numeric_columns(profiled, profile=get_sheet_profile(profiled))
+
+    extractor = SchemaExtractor()
+    assert extractor.extract_schema(profiled) == extractor.extract_schema(plain)
@@ -0,0 +1,96 @@
+"""
+Тесты скетчей колонок и репрезентативной выборки строк (app.utils.sheet_sketch)
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.schema_extractor import SchemaExtractor
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+from app.utils.sheet_sketch import get_sheet_sketch, representative_rows, sketch_column
+
+
+def sales_frame(rows: int = 1000) -> pd.DataFrame:
+    """Лист, отсортированный по месяцу: первые строки - один месяц и один менеджер"""
+    rng = np.random.default_rng(3)
+    months = np.repeat(["Январь", "Февраль", "Март", "Апрель"], rows // 4)
+    managers = np.tile(["Иванов"] * 50 + ["Петров"] * 50 + ["Сидоров"] * 50, rows // 150 + 1)[:rows]
+    amounts = rng.integers(1_000, 100_000, rows).astype(float)
+    amounts[777] = 5_000_000
+    return pd.DataFrame({"Месяц": months, "Менеджер": managers, "Сумма": amounts})
+
+
+def test_numeric_sketch_quantiles():
+    sketch = sketch_column(pd.Series(np.arange(101, dtype=float), name="x"))
+    assert sketch.kind == "numeric"
+    assert sketch.distinct == 101
+    assert sketch.quantiles == {"p05": 5.0, "p25": 25.0, "p50": 50.0, "p75": 75.0, "p95": 95.0}
+    assert "медиана=50" in sketch.describe()
+
+
+def test_categorical_sketch_top_k():
+    series = pd.Series(["a"] * 6 + ["b"] * 3 + ["c", None])
+    sketch = sketch_column(series, name="Категория")
+    assert sketch.kind == "categorical"
+    assert sketch.non_null == 10
+    assert sketch.distinct == 3
+    assert sketch.top[:2] == [("a", 6), ("b", 3)]
+    assert sketch.describe() == '3 уник., частые: "a" 60%, "b" 30%'
+
+
+def test_unique_text_shows_examples_not_frequencies():
+    sketch = sketch_column(pd.Series([f"Клиент {i}" for i in range(300)]))
+    assert sketch.describe().startswith("300 уник., примеры:")
+
+
+def test_representative_rows_cover_strata_and_extremes():
+    df = sales_frame()
+    positions = representative_rows(df, 10)
+
+    assert len(positions) == 10
+    assert positions == sorted(positions)
+    assert positions[0] == 0 and positions[-1] == len(df) - 1
+    sample = df.iloc[positions]
+    assert set(sample["Месяц"]) == {"Январь", "Февраль", "Март", "Апрель"}
+    assert set(sample["Менеджер"]) == {"Иванов", "Петров", "Сидоров"}
+    assert 777 in positions  # выброс по сумме
+    assert df["Сумма"].idxmin() in positions
+
+
+def test_representative_rows_small_frame():
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    assert representative_rows(df, 10) == [0, 1, 2]
+
+
+def test_sheet_sketch_cached_per_frame():
+    df = sales_frame()
+    assert get_sheet_sketch(df) is get_sheet_sketch(df)
+    assert get_sheet_sketch(df.copy()) is not get_sheet_sketch(df)
+
+
+def test_sample_table_uses_representative_rows():
+    df = sales_frame()
+    table = SimpleGPTProcessor.format_ascii_table(df, list(df.columns), "sample")
+
+    assert "Апрель" in table
+    assert "Сидоров" in table
+    assert "779 |" in table  # строка выброса (iloc 777 -> строка листа 779)
+    assert "... |" in table
+    assert "[Показано 10 из 1000 строк (репрезентативная выборка). Режим: SAMPLE]" in table
+
+
+def test_schema_prompt_includes_sketch_for_large_sheets():
+    extractor = SchemaExtractor()
+    _, prompt = extractor.get_schema_and_prompt(sales_frame())
+    assert "медиана=" in prompt
+    assert '"Январь" 25%' in prompt
+
+    _, small_prompt = extractor.get_schema_and_prompt(sales_frame().head(100))
+    assert "медиана=" not in small_prompt
@@ -0,0 +1,132 @@
+"""
+Тесты спекулятивного режима SimpleGPTProcessor (SmartGPT || схема + генерация кода)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.code_plan_cache import CodePlanCache
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+DELAY = 0.2
+CODE_REPLY = "```python\nresult = df['Сумма'].sum()\nexplanation = 'Сумма'\n```"
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"Менеджер": ["Иванов", "Петров"], "Сумма": [100, 200]})
+
+
+@pytest.fixture
+def processor():
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc.llm_cache = MagicMock()
+    proc.llm_cache.should_cache.return_value = False
+    proc.code_plans = CodePlanCache(enabled=False)
+
+    async def chat(model, messages, temperature, max_tokens, cache=None, **kwargs):
+        if max_tokens == 10:  # post-validation
+            return "OK"
+        await asyncio.sleep(DELAY)
+        return CODE_REPLY
+
+    proc._chat = AsyncMock(side_effect=chat)
+    proc._execute_code_isolated = AsyncMock(return_value={"result": 300, "explanation": "Сумма"})
+    return proc
+
+
+async def slow_chat(*args, **kwargs):
+    await asyncio.sleep(10)
+
+
+def smart_action(result):
+    async def action(*args, **kwargs):
+        await asyncio.sleep(DELAY)
+        return result
+    return action
+
+
+def test_speculation_overlaps_smart_gpt(processor, df):
+    processor._gpt_smart_action = smart_action(None)
+
+    start = time.perf_counter()
+    response = asyncio.run(processor.process("сумма продаж", df, list(df.columns), speculative=True))
+    elapsed = time.perf_counter() - start
+
+    assert response["success"]
+    assert response["result"] == 300
+    # SmartGPT и генерация кода шли параллельно: ~1 задержка вместо 2
+    assert elapsed < DELAY * 1.8
+    stats = processor.speculation_stats.to_dict()
+    assert stats["started"] == 1
+    assert stats["hits"] == 1
+    assert stats["saved_ms_total"] > 0
+    # Код сгенерирован один раз (спекулятивно), не повторно
+    code_calls = [c for c in processor._chat.await_args_list if c.kwargs["max_tokens"] != 10]
+    assert len(code_calls) == 1
+
+
+def test_serial_without_speculation(processor, df):
+    processor._gpt_smart_action = smart_action(None)
+
+    start = time.perf_counter()
+    response = asyncio.run(processor.process("сумма продаж", df, list(df.columns), speculative=False))
+    elapsed = time.perf_counter() - start
+
+    assert response["success"]
+    assert elapsed >= DELAY * 2
+    assert processor.speculation_stats.to_dict()["started"] == 0
+
+
+def test_speculation_cancelled_when_smart_gpt_acts(processor, df):
+    action = {"action_type": "sort", "summary": "Сортирую"}
+    processor._gpt_smart_action = smart_action(action)
+    processor._chat = AsyncMock(side_effect=slow_chat)
+
+    start = time.perf_counter()
+    response = asyncio.run(processor.process("отсортируй", df, list(df.columns), speculative=True))
+
+    assert response["action_type"] == "sort"
+    assert time.perf_counter() - start < 2
+    stats = processor.speculation_stats.to_dict()
+    assert stats["cancelled"] == 1
+    assert stats["hits"] == 0
+
+
+def test_failed_speculation_falls_back(processor, df):
+    processor._gpt_smart_action = smart_action(None)
+    replies = iter(["не код", CODE_REPLY])
+
+    async def chat(model, messages, temperature, max_tokens, cache=None, **kwargs):
+        return "OK" if max_tokens == 10 else next(replies)
+
+    processor._chat = AsyncMock(side_effect=chat)
+    response = asyncio.run(processor.process("сумма продаж", df, list(df.columns), speculative=True))
+
+    assert response["success"]
+    assert processor.speculation_stats.to_dict()["failed"] == 1
+
+
+def test_smart_gpt_error_cancels_speculation(processor, df):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("SmartGPT down")
+
+    processor._gpt_smart_action = broken
+    processor._chat = AsyncMock(side_effect=slow_chat)
+
+    response = asyncio.run(asyncio.wait_for(
+        processor.process("сумма продаж", df, list(df.columns), speculative=True), timeout=5
+    ))
+
+    assert response["success"] is False
+    assert processor.speculation_stats.to_dict()["cancelled"] == 1
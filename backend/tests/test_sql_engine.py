@@ -0,0 +1,120 @@
+"""
+Тесты движка "sql": один SELECT в DuckDB вместо exec() pandas-кода
+"""
+
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+pytest.importorskip("duckdb")
+
+from app.config import settings
+from app.services.code_plan_cache import CodePlanCache
+from app.services.simple_gpt_processor import SimpleGPTProcessor
+
+GROUP_SQL = '```sql\nSELECT "Менеджер", SUM("Сумма") AS "Итого" FROM df GROUP BY 1 ORDER BY 2 DESC\n```'
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        "Менеджер": ["Иванов", "Петров", "Иванов", "Сидоров"],
+        "Сумма": [100.0, 250.5, 300.0, 50.0],
+        "Город": ["Москва", "Казань", "Москва", "Омск"],
+    })
+
+
+@pytest.fixture
+def processor():
+    proc = SimpleGPTProcessor(client=MagicMock())
+    proc.code_plans = CodePlanCache(enabled=False)
+    proc._gpt_smart_action = AsyncMock(return_value=None)
+    proc._validate_result = AsyncMock(return_value="OK")
+    proc._generate_code = AsyncMock(return_value="result = 'pandas'")
+    return proc
+
+
+def answer_with(processor, *contents):
+    processor._chat = AsyncMock(side_effect=list(contents))
+
+
+def run(processor, df, engine="sql", query="выручка по менеджерам", **kwargs):
+    return asyncio.run(processor.process(query, df, list(df.columns), engine=engine, **kwargs))
+
+
+def test_result_shapes_match_pandas_path(processor, df):
+    engine = processor.sql_engine
+    assert engine.execute('SELECT SUM("Сумма") FROM df', df)["result"] == pytest.approx(700.5)
+    assert engine.execute('SELECT DISTINCT "Город" FROM df ORDER BY 1', df)["result"] == ["Казань", "Москва", "Омск"]
+    table = engine.execute('SELECT "Менеджер", COUNT(*) AS n FROM df GROUP BY 1 ORDER BY 1', df)["result"]
+    assert isinstance(table, pd.DataFrame)
+    assert table.to_dict(orient="records")[0] == {"Менеджер": "Иванов", "n": 2}
+
+    reference = pd.DataFrame({"Город": ["Москва", "Казань"], "Регион": ["ЦФО", "ПФО"]})
+    joined = engine.execute(
+        'SELECT d."Менеджер", r."Регион" FROM df d JOIN reference_df r USING ("Город") ORDER BY 1, 2', df, reference
+    )["result"]
+    assert joined["Регион"].tolist() == ["ЦФО", "ЦФО", "ПФО"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; DROP TABLE df",
+    "COPY df TO 'out.csv'",
+    "CREATE TABLE t AS SELECT * FROM df",
+    "SELEC * FROM df",
+])
+def test_only_single_select_allowed(processor, sql):
+    ok, error = processor.sql_engine.validate_sql(sql)
+    assert not ok and error
+
+
+def test_no_file_access(processor, df):
+    with pytest.raises(Exception, match="Permission"):
+        processor.sql_engine.execute("SELECT * FROM read_csv('/etc/passwd')", df)
+
+
+def test_request_answered_by_sql(processor, df):
+    answer_with(processor, GROUP_SQL)
+    response = run(processor, df)
+
+    assert response["success"] and response["engine"] == "sql"
+    assert response["result_type"] == "table"
+    assert response["result"][0] == {"Менеджер": "Иванов", "Итого": 400.0}
+    assert response["structured_data"]["headers"] == ["Менеджер", "Итого"]
+    assert response["code"].startswith('SELECT "Менеджер"')
+    processor._generate_code.assert_not_called()
+    assert processor.sql_engine.stats.to_dict()["answered"] == 1
+
+
+def test_sql_error_is_retried_then_falls_back_to_pandas(processor, df):
+    bad = "```sql\nSELECT \"Нет такой\" FROM df\n```"
+    answer_with(processor, bad, bad, bad)
+    response = run(processor, df)
+
+    assert processor._chat.await_count == processor.MAX_RETRIES + 1
+    assert response["success"] and response["engine"] == "pandas"
+    assert response["result"] == "pandas"
+    assert processor.sql_engine.stats.to_dict()["fallbacks_by_reason"] == {"execution": 1}
+
+
+def test_engine_default_from_settings(processor, df, monkeypatch):
+    answer_with(processor, GROUP_SQL)
+    assert run(processor, df, engine=None)["engine"] == "pandas"
+
+    monkeypatch.setattr(settings, "SQL_ENGINE_DEFAULT", "sql")
+    assert run(processor, df, engine=None)["engine"] == "sql"
+
+
+def test_missing_duckdb_uses_pandas(processor, df, monkeypatch):
+    monkeypatch.setattr("app.services.sql_engine.DUCKDB_AVAILABLE", False)
+    response = run(processor, df)
+    assert response["engine"] == "pandas"
+    assert processor.sql_engine.stats.to_dict()["fallbacks_by_reason"] == {"unavailable": 1}
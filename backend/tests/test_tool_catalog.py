@@ -0,0 +1,76 @@
+"""
+Тесты каталога function definitions (ToolCatalog): собирается один раз,
+подмножества по намерению мемоизируются, pack() соблюдает бюджет токенов
+"""
+
+import json
+import os
+import sys
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-dummy-key-for-testing")
+
+from app.services.function_registry import FunctionRegistry
+from app.services.tool_catalog import BASE_FUNCTIONS, ToolCatalog, get_tool_catalog
+from app.services.two_stage_processor import TwoStageProcessor
+from app.utils.prompt_budget import estimate_tokens
+
+
+def test_catalog_matches_registry_definitions():
+    catalog = get_tool_catalog()
+    registry = FunctionRegistry()
+
+    assert catalog is get_tool_catalog()
+    assert registry.get_function_definitions() == FunctionRegistry._function_definitions()
+    assert registry.get_function_definitions() is not registry.get_function_definitions()
+    for entry in catalog.entries:
+        assert entry.name in registry.functions
+        assert json.loads(entry.json) == entry.definition
+        assert entry.tokens == estimate_tokens(entry.json) > 0
+    assert catalog.total_tokens == sum(entry.tokens for entry in catalog.entries)
+
+
+def test_intent_subsets_are_memoized():
+    catalog = ToolCatalog(FunctionRegistry._function_definitions())
+
+    first = catalog.for_intent("filter", aggregation="sum", group_by=True)
+    again = catalog.for_intent("filter", aggregation="sum", group_by=True)
+    names = {entry.name for entry in first}
+
+    assert again is first
+    assert {"filter_rows", "calculate_sum", "aggregate_by_group", "top_n_per_group"} <= names
+    assert [entry.name for entry in catalog.for_intent("top_n")] == ["filter_top_n", "filter_bottom_n"]
+    assert {entry.name for entry in catalog.for_intent("unknown")} == set(BASE_FUNCTIONS)
+    assert catalog.stats()["intent_hits"] == 1 and catalog.stats()["intent_misses"] == 3
+
+
+def test_pack_respects_budget_and_preference():
+    catalog = get_tool_catalog()
+    preferred = ["highlight_rows", "filter_rows", "not_a_function", "filter_rows"]
+
+    assert [d["name"] for d in catalog.pack(preferred)] == ["highlight_rows", "filter_rows"]
+    assert len(catalog.pack(None)) == len(catalog)
+
+    budget = catalog.total_tokens // 4
+    packed = catalog.pack(preferred, budget=budget, fill=True)
+    assert [d["name"] for d in packed[:2]] == ["highlight_rows", "filter_rows"]
+    assert catalog.tokens_for(packed) <= budget
+    assert len(catalog) > len(packed) > 2
+
+    tiny = catalog.get("filter_null").tokens
+    assert [d["name"] for d in catalog.pack(["pivot_table", "filter_null"], budget=tiny)] == ["filter_null"]
+
+
+def test_two_stage_selection_uses_catalog():
+    processor = TwoStageProcessor(client=MagicMock())
+    understanding = {"action_type": "sort", "aggregation": "none", "limit": 5, "output_type": "highlight"}
+
+    selected = {d["name"] for d in processor.select_functions_for_intent(understanding)}
+    assert selected == {"sort_data", "calculate_rank", "filter_top_n", "filter_bottom_n", "highlight_rows"}
+
+    # Переданный список ограничивает выбор, как и раньше
+    subset = [d for d in FunctionRegistry().get_function_definitions() if d["name"] in ("sort_data", "filter_rows")]
+    assert [d["name"] for d in processor.select_functions_for_intent(understanding, subset)] == ["sort_data"]
+    assert [d["name"] for d in processor.select_functions_for_intent({"action_type": "top_n"}, subset)] == ["filter_rows", "sort_data"]
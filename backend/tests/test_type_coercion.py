@@ -0,0 +1,112 @@
+"""
+Тесты для векторизованной конвертации колонок (app.utils.type_coercion)
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.type_coercion import (
+    auto_convert_numeric_columns,
+    parse_numeric_series,
+    should_skip_convert,
+)
+
+
+def convert_russian_number(val):
+    """Старый per-cell конвертер из main.py - эталон для режима "ru"."""
+    if pd.isna(val):
+        return None
+    s = str(val).strip()
+    if not s:
+        return None
+    s = s.replace(' ', '').replace('\u00a0', '').replace(',', '.')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+LEGACY_VALUES = [
+    '11 838 336,22', '1,5', 'abc', '', None, np.nan, '  12 ', '1e3', '1,234',
+    '12,6', 5, 2.5, 1e-05, '1.2.3', '-3', 'inf', '10\u00a0000,5', 'Иванов',
+]
+
+
+class TestRussianMode:
+    """Режим "ru" совпадает со старым convert_russian_number."""
+
+    def test_matches_legacy_per_cell(self):
+        series = pd.Series(LEGACY_VALUES, dtype=object)
+        expected = series.apply(convert_russian_number).astype(float)
+        result = parse_numeric_series(series, mode="ru")
+        np.testing.assert_array_equal(result.to_numpy(), expected.to_numpy())
+
+    def test_percent_and_currency(self):
+        series = pd.Series(['15%', '1 200 ₽', '500 руб.', '$300', 'р.857'], dtype=object)
+        result = parse_numeric_series(series, mode="ru")
+        assert result.tolist() == [15.0, 1200.0, 500.0, 300.0, 857.0]
+
+    def test_repeated_values_and_index(self):
+        series = pd.Series(['1,5', 'x', '1,5', None] * 3, index=range(10, 22), dtype=object)
+        result = parse_numeric_series(series, mode="ru")
+        assert list(result.index) == list(range(10, 22))
+        assert result.iloc[0] == 1.5 and result.iloc[8] == 1.5
+        assert result.isna().sum() == 6
+
+    def test_multiline_cell_does_not_shift_rows(self):
+        series = pd.Series(['1', 'строка\nвторая', '3'], dtype=object)
+        result = parse_numeric_series(series, mode="ru")
+        assert result.iloc[0] == 1.0 and np.isnan(result.iloc[1]) and result.iloc[2] == 3.0
+
+    def test_bool_column_is_not_numeric(self):
+        result = parse_numeric_series(pd.Series([True, False]), mode="ru")
+        assert result.isna().all()
+
+
+class TestRegistryMode:
+    """Режим "auto" повторяет FunctionRegistry._parse_numeric_column."""
+
+    @pytest.mark.parametrize("value,expected", [
+        ("$1,234.56", 1234.56),
+        ("12,6", 12.6),
+        ("1,234", 1234.0),
+        ("100 000", 100000.0),
+        ("abc", 0.0),
+        (5, 5.0),
+        (1e-05, 1e-05),
+    ])
+    def test_values(self, value, expected):
+        result = parse_numeric_series(pd.Series([value], dtype=object), mode="auto")
+        assert result.iloc[0] == pytest.approx(expected)
+
+    def test_unparseable_becomes_nan(self):
+        result = parse_numeric_series(pd.Series(['1.2.3', None], dtype=object), mode="auto")
+        assert result.isna().all()
+
+
+class TestAutoConvert:
+    def test_converts_numeric_and_forces_ids_to_text(self):
+        df = pd.DataFrame({
+            'Сумма': ['1 000,5', '2 000', '3,25'],
+            'Телефон': ['79001234567', '79007654321', None],
+            'Менеджер': ['Иванов', 'Петров', 'Сидоров'],
+        })
+        auto_convert_numeric_columns(df)
+        assert df['Сумма'].tolist() == [1000.5, 2000.0, 3.25]
+        assert df['Телефон'].tolist() == ['79001234567', '79007654321', 'None']
+        assert df['Менеджер'].dtype == object
+
+    def test_threshold(self):
+        df = pd.DataFrame({'Смешанная': ['1', 'a', 'b', 'c']})
+        auto_convert_numeric_columns(df)
+        assert df['Смешанная'].tolist() == ['1', 'a', 'b', 'c']
+
+    def test_skip_patterns(self):
+        assert should_skip_convert('Артикул товара')
+        assert not should_skip_convert('Выручка')
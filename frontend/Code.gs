@@ -1165,80 +1165,56 @@ function processBatchQuery(query, range) {
     const sheet = SpreadsheetApp.getActiveSheet();
     const rangeData = sheet.getRange(range);
     const values = rangeData.getValues();
+    const firstRow = rangeData.getRow();
 
     console.log('Rows to process:', values.length);
 
     // Get context from full sheet
     const sheetData = getSheetData();
     const columnNames = sheetData.columnNames;
-
-    const results = [];
     const totalRows = values.length;
 
-    // Process each row
-    for (let i = 0; i < values.length; i++) {
-      const row = values[i];
-      const rowNumber = rangeData.getRow() + i;
-
-      console.log(`Processing row ${i + 1}/${totalRows}:`, row);
-
-      try {
-        // Create payload with single row context
-        const payload = {
-          query: query,
-          column_names: columnNames,
-          sheet_data: [row],  // Send only this row
-          context_data: sheetData.data.slice(0, 10),  // Full context for reference
-          history: []
-        };
-
-        const options = {
-          method: 'post',
-          contentType: 'application/json',
-          payload: JSON.stringify(payload),
-          muteHttpExceptions: true
-        };
+    // v11.14.0: Один запрос на весь диапазон вместо UrlFetchApp на каждую строку.
+    // Сервер сам убирает дубликаты строк и упаковывает строки в промпты.
+    const payload = {
+      query: query,
+      column_names: columnNames,
+      rows: values,
+      row_numbers: values.map((_, i) => firstRow + i),
+      context_data: sheetData.data.slice(0, 10)  // Full context for reference
+    };
 
-        const response = UrlFetchApp.fetch(API_URL + '/api/v1/formula', options);
-        const result = JSON.parse(response.getContentText());
-
-        if (response.getResponseCode() === 200) {
-          results.push({
-            row: rowNumber,
-            success: true,
-            summary: result.summary || result.explanation || 'OK',
-            data: result
-          });
-        } else {
-          results.push({
-            row: rowNumber,
-            success: false,
-            error: result.detail || 'Unknown error'
-          });
-        }
+    const options = {
+      method: 'post',
+      contentType: 'application/json',
+      payload: JSON.stringify(payload),
+      muteHttpExceptions: true
+    };
 
-      } catch (error) {
-        results.push({
-          row: rowNumber,
-          success: false,
-          error: error.toString()
-        });
-      }
+    const response = UrlFetchApp.fetch(API_URL + '/api/v1/formula/batch', options);
+    const result = JSON.parse(response.getContentText());
 
-      // Progress update (можно добавить callback)
-      console.log(`Progress: ${i + 1}/${totalRows} (${Math.round((i + 1) / totalRows * 100)}%)`);
+    if (response.getResponseCode() !== 200) {
+      const detail = result.detail || {};
+      throw new Error(detail.user_message || detail.message || JSON.stringify(detail) || 'Unknown error');
     }
 
+    const results = result.results.map(r => r.success
+      ? { row: r.row, success: true, summary: r.summary || 'OK', data: r }
+      : { row: r.row, success: false, error: r.error || 'Unknown error' });
+
     console.log('=== BATCH QUERY COMPLETE ===');
-    console.log('Success:', results.filter(r => r.success).length);
-    console.log('Failed:', results.filter(r => !r.success).length);
+    console.log('Success:', result.succeeded);
+    console.log('Failed:', result.failed);
+    console.log('Stats:', JSON.stringify(result.stats));
 
     return {
       success: true,
       total: totalRows,
       processed: results.length,
-      succeeded: results.filter(r => r.success).length,
-      failed: results.filter(r => !r.success).length,
+      succeeded: result.succeeded,
+      failed: result.failed,
+      stats: result.stats,
       results: results
     };
 